@@ -3,6 +3,10 @@ from dotenv import load_dotenv
 import click
 from backup.mysql_backup import mysql_backup
 from backup.pgsql_backup import pgsql_backup
+from backup.clone import clone_database
+from backup.daemon import serve_backups
+from backup.fleet import check_backup_options, fleet_backup, format_report
+from backup.verify import format_differences, verify_database
 from restore.mysql_restore import mysql_restore
 from restore.pgsql_restore import pgsql_restore
 
@@ -41,7 +45,26 @@ def cli():
 @click.option('--structure', is_flag=True, help='Backup database structure only.')
 @click.option('--data', is_flag=True, help='Backup database data only.')
 @click.option('--full', is_flag=True, help='Backup full database (structure and data).')
-def backup(dbtype, structure, data, full):
+@click.option('--fetch-size', type=click.IntRange(min=1), default=10000, show_default=True, help='Number of rows fetched per batch while streaming table data.')
+@click.option('--format', 'data_format', type=click.Choice(['insert', 'copy', 'copy-binary', 'tsv']), default='insert', show_default=True, help='Format of the data backup. COPY formats are PostgreSQL only, tsv is MySQL only.')
+@click.option('--jobs', type=click.IntRange(min=1), default=None, help='Dump tables concurrently over N connections sharing one snapshot, one file per table.')
+@click.option('--chunks', type=click.IntRange(min=1), default=1, show_default=True, help='Split large tables with an integer primary key into N key ranges dumped as separate files.')
+@click.option('--chunk-min-rows', type=click.IntRange(min=0), default=1000000, show_default=True, help='Estimated row count above which a table is split into chunks.')
+@click.option('--compress', type=click.Choice(['gzip', 'zstd', 'lz4']), default=None, help='Compress backup files in parallel blocks. zstd and lz4 need the zstandard and lz4 packages.')
+@click.option('--compress-level', type=int, default=None, help='Compression level (codec default if omitted).')
+@click.option('--incremental', is_flag=True, help='Only dump tables that changed since the previous backup and reference the others from it.')
+@click.option('--dedup', is_flag=True, help='Store backup files as deduplicated content-defined chunks in BACKUP_DIR/chunks.')
+@click.option('--archive', is_flag=True, help='Write a single seekable archive with one section per table, for single-table restores.')
+@click.option('--progress', is_flag=True, help='Show a live progress line with rows, throughput and ETA.')
+@click.option('--prometheus-dir', type=click.Path(file_okay=False), default=None, help='Write the run metrics as a Prometheus textfile to this directory (node_exporter textfile collector).')
+@click.option('--max-rows-per-second', type=click.FloatRange(min=0, min_open=True), default=None, help='Cap the rows fetched per second over all workers.')
+@click.option('--max-mib-per-second', type=click.FloatRange(min=0, min_open=True), default=None, help='Cap the MiB of backup data produced per second over all workers.')
+@click.option('--max-lag', type=click.FloatRange(min=0, min_open=True), default=None, help='Slow down, or pause, fetching while the replication lag exceeds N seconds.')
+@click.option('--max-latency', type=click.FloatRange(min=0, min_open=True), default=None, help='Slow down, or pause, fetching while a probe query takes longer than N milliseconds.')
+@click.option('--lag-host', default=None, help='MySQL replica whose SHOW REPLICA STATUS is read for --max-lag (defaults to the backup host).')
+@click.option('--resume', is_flag=True, help='Continue the latest per-table data backup a failed run left unfinished, skipping the files it completed.')
+@click.option('--checksums', is_flag=True, help='Record a checksum of the rows of every table or chunk file, so restores can be checked with verify. Implies one file per table.')
+def backup(dbtype, structure, data, full, fetch_size, data_format, jobs, chunks, chunk_min_rows, compress, compress_level, incremental, dedup, archive, progress, prometheus_dir, max_rows_per_second, max_mib_per_second, max_lag, max_latency, lag_host, resume, checksums):
     """
     Backup the specified database.
 
@@ -49,21 +72,79 @@ def backup(dbtype, structure, data, full):
     :param structure: Flag to indicate if only the structure should be backed up.
     :param data: Flag to indicate if only the data should be backed up.
     :param full: Flag to indicate if the full database (structure and data) should be backed up.
+    :param fetch_size: Number of rows fetched per batch while streaming table data.
+    :param data_format: Format of the data backup ('insert', 'copy', 'copy-binary' or 'tsv').
+    :param jobs: Number of tables dumped concurrently (one file per table).
+    :param chunks: Number of primary key ranges large tables are split into.
+    :param chunk_min_rows: Estimated row count above which a table is split into chunks.
+    :param compress: Codec backup files are compressed with ('gzip', 'zstd', 'lz4' or None).
+    :param compress_level: Compression level (codec default if None).
+    :param incremental: Flag to only dump tables that changed since the previous backup.
+    :param dedup: Flag to store backup files in the deduplicated chunk store.
+    :param archive: Flag to write a single seekable archive with one section per table.
+    :param progress: Flag to show a live progress line.
+    :param prometheus_dir: Directory the Prometheus textfile of the run metrics is written to (optional).
+    :param max_rows_per_second: Cap of the rows fetched per second (optional).
+    :param max_mib_per_second: Cap of the MiB of backup data produced per second (optional).
+    :param max_lag: Replication lag, in seconds, above which fetching slows down (optional).
+    :param max_latency: Probe query latency, in milliseconds, above which fetching slows down (optional).
+    :param lag_host: MySQL replica probed for the replication lag (defaults to the backup host).
+    :param resume: Flag to continue the latest unfinished per-table data backup.
+    :param checksums: Flag to record a checksum of the rows of every file.
     """
+    try:
+        check_backup_options(dbtype, data_format, jobs, chunks, incremental, dedup, archive, lag_host, checksums)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    backup_type = 'structure' if structure else 'data' if data else 'full' if full else None
+    if backup_type is None:
+        return
+    options = dict(fetch_size=fetch_size, data_format=data_format, jobs=jobs, chunks=chunks, chunk_min_rows=chunk_min_rows, compress=compress, compress_level=compress_level, incremental=incremental, dedup=dedup, archive=archive, progress=progress, prometheus_dir=prometheus_dir, max_rows_per_second=max_rows_per_second, max_mib_per_second=max_mib_per_second, max_lag=max_lag, max_latency=max_latency, resume=resume, checksums=checksums)
     if dbtype == 'mysql':
-        if structure:
-            mysql_backup(MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, BACKUP_DIR, LOG_DIR, 'structure', MYSQL_DATABASE)
-        elif data:
-            mysql_backup(MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, BACKUP_DIR, LOG_DIR, 'data', MYSQL_DATABASE)
-        elif full:
-            mysql_backup(MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, BACKUP_DIR, LOG_DIR, 'full', MYSQL_DATABASE)
+        mysql_backup(MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, BACKUP_DIR, LOG_DIR, backup_type, MYSQL_DATABASE, lag_host=lag_host, **options)
     elif dbtype == 'pgsql':
-        if structure:
-            pgsql_backup(POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, BACKUP_DIR, LOG_DIR, 'structure', POSTGRES_DATABASE)
-        elif data:
-            pgsql_backup(POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, BACKUP_DIR, LOG_DIR, 'data', POSTGRES_DATABASE)
-        elif full:
-            pgsql_backup(POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, BACKUP_DIR, LOG_DIR, 'full', POSTGRES_DATABASE)
+        pgsql_backup(POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, BACKUP_DIR, LOG_DIR, backup_type, POSTGRES_DATABASE, **options)
+
+@cli.command('backup-fleet')
+@click.option('--inventory', type=click.Path(exists=True, dir_okay=False), required=True, help='JSON inventory of the databases to back up.')
+@click.option('--concurrency', type=click.IntRange(min=1), default=4, show_default=True, help='Maximum number of backups running at once.')
+@click.option('--per-host', type=click.IntRange(min=1), default=1, show_default=True, help='Maximum number of backups running at once against the same host.')
+@click.option('--report', type=click.Path(dir_okay=False), default=None, help='Write the results of every backup to this JSON file.')
+def backup_fleet(inventory, concurrency, per_host, report):
+    """
+    Backup every database of an inventory from a single process.
+
+    :param inventory: Path to the JSON inventory of the databases to back up.
+    :param concurrency: Maximum number of backups running at once.
+    :param per_host: Maximum number of backups running at once against the same host.
+    :param report: Path the JSON report is written to (optional).
+    """
+    try:
+        results = fleet_backup(inventory, BACKUP_DIR, LOG_DIR, concurrency, per_host, report)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    click.echo(format_report(results))
+    if any(result['status'] != 'ok' for result in results):
+        raise SystemExit(1)
+
+@cli.command()
+@click.option('--config', type=click.Path(exists=True, dir_okay=False), required=True, help='JSON schedule of the databases to back up: a fleet inventory whose entries add a cron schedule and retention.')
+@click.option('--run-now', is_flag=True, help='Back up every entry once right away, applying retention, then exit.')
+def serve(config, run_now):
+    """
+    Run scheduled backups from a long-running process until interrupted.
+
+    :param config: Path to the JSON schedule file.
+    :param run_now: Flag to back up every entry once and exit instead of following the schedule.
+    """
+    try:
+        results = serve_backups(config, BACKUP_DIR, LOG_DIR, run_now)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    if results:
+        click.echo(format_report(results))
+        if any(result['status'] != 'ok' for result in results):
+            raise SystemExit(1)
 
 @cli.command()
 @click.option('--dbtype', type=click.Choice(['mysql', 'pgsql']), required=True, help='Type of the database to restore.')
@@ -71,7 +152,16 @@ def backup(dbtype, structure, data, full):
 @click.option('--data', is_flag=True, help='Restore database data only.')
 @click.option('--full', is_flag=True, help='Restore full database (structure and data).')
 @click.option('--new-database', default=None, help='Name of the new database to restore to.')
-def restore(dbtype, structure, data, full, new_database):
+@click.option('--jobs', type=click.IntRange(min=1), default=None, help='Load the tables of a per-table backup concurrently over N connections.')
+@click.option('--backup-id', type=int, default=None, help='Catalog id of the backup to restore (defaults to the latest one).')
+@click.option('--table', 'tables', multiple=True, help='Only restore this table (repeatable). Needs an archive or per-table backup.')
+@click.option('--fast', is_flag=True, help='Use bulk-load session settings (MySQL: no FK/unique checks or binary log; PostgreSQL: asynchronous commit, more maintenance_work_mem) and commit in batches.')
+@click.option('--commit-every', type=click.IntRange(min=1), default=None, help='Commit every N statements (rows of a COPY on PostgreSQL). Defaults to 10000 with --fast.')
+@click.option('--commit-bytes', type=click.IntRange(min=1), default=None, help='Commit every N bytes of SQL or COPY data. Defaults to 64 MiB with --fast.')
+@click.option('--progress', is_flag=True, help='Show a live progress line with rows, throughput and ETA.')
+@click.option('--prometheus-dir', type=click.Path(file_okay=False), default=None, help='Write the run metrics as a Prometheus textfile to this directory (node_exporter textfile collector).')
+@click.option('--resume', is_flag=True, help='Continue the restore a failed run left a checkpoint for in LOG_DIR, skipping the work it completed.')
+def restore(dbtype, structure, data, full, new_database, jobs, backup_id, tables, fast, commit_every, commit_bytes, progress, prometheus_dir, resume):
     """
     Restore the specified database.
 
@@ -80,21 +170,115 @@ def restore(dbtype, structure, data, full, new_database):
     :param data: Flag to indicate if only the data should be restored.
     :param full: Flag to indicate if the full database (structure and data) should be restored.
     :param new_database: The name of the new database to restore to.
+    :param jobs: Number of connections loading table data concurrently.
+    :param backup_id: Catalog id of the backup to restore (latest if None).
+    :param tables: Names of the tables to restore (all tables if empty).
+    :param fast: Flag to use bulk-load session settings and commit in batches.
+    :param commit_every: Number of statements (or COPY rows) per transaction.
+    :param commit_bytes: Number of bytes of SQL (or COPY data) per transaction.
+    :param progress: Flag to show a live progress line.
+    :param prometheus_dir: Directory the Prometheus textfile of the run metrics is written to (optional).
+    :param resume: Flag to continue the restore a failed run left a checkpoint for.
     """
     if dbtype == 'mysql':
         if structure:
-            mysql_restore(MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, BACKUP_DIR, LOG_DIR, 'structure', new_database)
+            mysql_restore(MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, BACKUP_DIR, LOG_DIR, 'structure', new_database, jobs, backup_id, tables or None, fast, commit_every, commit_bytes, progress, prometheus_dir, resume)
         elif data:
-            mysql_restore(MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, BACKUP_DIR, LOG_DIR, 'data', new_database)
+            mysql_restore(MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, BACKUP_DIR, LOG_DIR, 'data', new_database, jobs, backup_id, tables or None, fast, commit_every, commit_bytes, progress, prometheus_dir, resume)
         elif full:
-            mysql_restore(MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, BACKUP_DIR, LOG_DIR, 'full', new_database)
+            mysql_restore(MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, BACKUP_DIR, LOG_DIR, 'full', new_database, jobs, backup_id, tables or None, fast, commit_every, commit_bytes, progress, prometheus_dir, resume)
     elif dbtype == 'pgsql':
         if structure:
-            pgsql_restore(POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, BACKUP_DIR, LOG_DIR, 'structure', new_database if new_database else POSTGRES_DATABASE)
+            pgsql_restore(POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, BACKUP_DIR, LOG_DIR, 'structure', new_database if new_database else POSTGRES_DATABASE, jobs, backup_id, tables or None, fast, commit_every, commit_bytes, progress, prometheus_dir, resume)
         elif data:
-            pgsql_restore(POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, BACKUP_DIR, LOG_DIR, 'data', new_database if new_database else POSTGRES_DATABASE)
+            pgsql_restore(POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, BACKUP_DIR, LOG_DIR, 'data', new_database if new_database else POSTGRES_DATABASE, jobs, backup_id, tables or None, fast, commit_every, commit_bytes, progress, prometheus_dir, resume)
         elif full:
-            pgsql_restore(POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, BACKUP_DIR, LOG_DIR, 'full', new_database if new_database else POSTGRES_DATABASE)
+            pgsql_restore(POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, BACKUP_DIR, LOG_DIR, 'full', new_database if new_database else POSTGRES_DATABASE, jobs, backup_id, tables or None, fast, commit_every, commit_bytes, progress, prometheus_dir, resume)
+
+@cli.command()
+@click.option('--dbtype', type=click.Choice(['mysql', 'pgsql']), required=True, help='Type of the database to verify.')
+@click.option('--new-database', default=None, help='Name of the restored database to check (defaults to the configured database).')
+@click.option('--backup-id', type=int, default=None, help='Catalog id of the backup the database was restored from (defaults to the latest one).')
+@click.option('--table', 'tables', multiple=True, help='Only check this table (repeatable).')
+@click.option('--jobs', type=click.IntRange(min=1), default=None, help='Check tables and chunks concurrently over N connections.')
+@click.option('--fetch-size', type=click.IntRange(min=1), default=10000, show_default=True, help='Number of rows fetched per batch.')
+@click.option('--progress', is_flag=True, help='Show a live progress line with rows, throughput and ETA.')
+@click.option('--prometheus-dir', type=click.Path(file_okay=False), default=None, help='Write the run metrics as a Prometheus textfile to this directory (node_exporter textfile collector).')
+def verify(dbtype, new_database, backup_id, tables, jobs, fetch_size, progress, prometheus_dir):
+    """
+    Check a restored database against the row checksums recorded by a backup taken with --checksums.
+
+    :param dbtype: The type of database to verify ('mysql' or 'pgsql').
+    :param new_database: The name of the restored database (the configured database if None).
+    :param backup_id: Catalog id of the backup the database was restored from (latest if None).
+    :param tables: Names of the tables to check (all tables if empty).
+    :param jobs: Number of tables and chunks checked concurrently.
+    :param fetch_size: Number of rows fetched per batch.
+    :param progress: Flag to show a live progress line.
+    :param prometheus_dir: Directory the Prometheus textfile of the run metrics is written to (optional).
+    """
+    if dbtype == 'mysql':
+        host, user, password, database = MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE
+    else:
+        host, user, password, database = POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_DATABASE
+    try:
+        backup_id, results = verify_database(dbtype, host, user, password, BACKUP_DIR, LOG_DIR, new_database or database, backup_id, tables or None, jobs, fetch_size, progress, prometheus_dir)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    click.echo(f"Backup {backup_id}: " + format_differences(results))
+    if any(result['status'] != 'ok' for result in results):
+        raise SystemExit(1)
+
+@cli.command()
+@click.option('--dbtype', type=click.Choice(['mysql', 'pgsql']), required=True, help='Type of the database to clone.')
+@click.option('--new-database', required=True, help='Name of the database created on the target host.')
+@click.option('--target-host', default=None, help='Host the new database is created on (defaults to the source host).')
+@click.option('--target-user', default=None, help='User name on the target host (defaults to the source user).')
+@click.option('--target-password-env', default=None, help='Environment variable holding the password on the target host (defaults to the source password).')
+@click.option('--format', 'data_format', type=click.Choice(['insert', 'copy', 'copy-binary', 'tsv']), default='insert', show_default=True, help='Format the rows are streamed in. COPY formats are PostgreSQL only, tsv is MySQL only.')
+@click.option('--jobs', type=click.IntRange(min=1), default=None, help='Copy tables concurrently over N source connections sharing one snapshot and N target connections.')
+@click.option('--chunks', type=click.IntRange(min=1), default=1, show_default=True, help='Split large tables with an integer primary key into N key ranges copied separately.')
+@click.option('--chunk-min-rows', type=click.IntRange(min=0), default=1000000, show_default=True, help='Estimated row count above which a table is split into chunks.')
+@click.option('--fetch-size', type=click.IntRange(min=1), default=10000, show_default=True, help='Number of rows fetched per batch from the source.')
+@click.option('--fast', is_flag=True, help='Use the bulk-load session settings of restore --fast on the target and commit in batches.')
+@click.option('--commit-every', type=click.IntRange(min=1), default=None, help='Commit every N statements (rows of a COPY on PostgreSQL). Defaults to 10000 with --fast.')
+@click.option('--commit-bytes', type=click.IntRange(min=1), default=None, help='Commit every N bytes of SQL or COPY data. Defaults to 64 MiB with --fast.')
+@click.option('--buffer-mib', type=click.IntRange(min=1), default=8, show_default=True, help='MiB of rows held in memory per table being copied before the source waits for the target.')
+@click.option('--progress', is_flag=True, help='Show a live progress line with rows, throughput and ETA.')
+@click.option('--prometheus-dir', type=click.Path(file_okay=False), default=None, help='Write the run metrics as a Prometheus textfile to this directory (node_exporter textfile collector).')
+def clone(dbtype, new_database, target_host, target_user, target_password_env, data_format, jobs, chunks, chunk_min_rows, fetch_size, fast, commit_every, commit_bytes, buffer_mib, progress, prometheus_dir):
+    """
+    Copy the configured database into a new database, streaming the rows without a backup file.
+
+    :param dbtype: The type of database to clone ('mysql' or 'pgsql').
+    :param new_database: The name of the database created on the target host.
+    :param target_host: Host the new database is created on (the source host if None).
+    :param target_user: User name on the target host (the source user if None).
+    :param target_password_env: Environment variable holding the target password (the source password if None).
+    :param data_format: Format the rows are streamed in ('insert', 'copy', 'copy-binary' or 'tsv').
+    :param jobs: Number of tables copied concurrently.
+    :param chunks: Number of primary key ranges large tables are split into.
+    :param chunk_min_rows: Estimated row count above which a table is split into chunks.
+    :param fetch_size: Number of rows fetched per batch from the source.
+    :param fast: Flag to use bulk-load session settings on the target and commit in batches.
+    :param commit_every: Number of statements (or COPY rows) per transaction.
+    :param commit_bytes: Number of bytes of SQL (or COPY data) per transaction.
+    :param buffer_mib: MiB of rows buffered per table being copied.
+    :param progress: Flag to show a live progress line.
+    :param prometheus_dir: Directory the Prometheus textfile of the run metrics is written to (optional).
+    """
+    try:
+        check_backup_options(dbtype, data_format)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    if dbtype == 'mysql':
+        host, user, password, database = MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE
+    else:
+        host, user, password, database = POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_DATABASE
+    if (target_host or host) == host and new_database == database:
+        raise click.UsageError("--new-database must differ from the source database when cloning on the same host.")
+    target_password = os.getenv(target_password_env) if target_password_env else password
+    clone_database(dbtype, host, user, password, target_host or host, target_user or user, target_password, database, new_database, LOG_DIR, data_format, jobs, chunks, chunk_min_rows, fetch_size, fast, commit_every, commit_bytes, buffer_mib * 1024 * 1024, progress, prometheus_dir)
 
 if __name__ == '__main__':
     cli()
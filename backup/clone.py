@@ -0,0 +1,243 @@
+import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from backup.mysql_backup import MySQLBackup
+from backup.pgsql_backup import PgSQLBackup
+from common.log import add_file_handler
+from common.parallel import run_with_connections
+from common.pipe import PIPE_BUFFER_SIZE, BytePipe, open_pipe
+from restore.mysql_restore import MySQLRestore
+from restore.pgsql_restore import PgSQLRestore
+
+
+class DatabaseClone:
+    """
+    A class to copy a database into another one without writing a backup to disk.
+
+    The structure is dumped into memory and replayed on the target with its
+    post-data statements held back. Every table, or primary key range of a
+    large table, is then dumped by a producer thread into a bounded in-memory
+    pipe while the target loads it from the other end, so the dump and the
+    load overlap and a unit never holds more than ``buffer_size`` bytes in
+    memory: a producer running ahead of the target waits for it. With more
+    than one job, units are copied concurrently, each over a source
+    connection reading the shared snapshot and a target connection of its
+    own. The indexes, constraints and triggers are built once the rows are in.
+
+    Attributes:
+        backup (MySQLBackup or PgSQLBackup): Backup reading the source database.
+        restore (MySQLRestore or PgSQLRestore): Restore loading the target database.
+        db_type (str): Type of both databases ('mysql' or 'pgsql').
+        log_dir (str): Directory where log files will be stored.
+        jobs (int): Number of units copied concurrently (optional).
+        buffer_size (int): Number of bytes a pipe holds before its producer waits for the target.
+    """
+    def __init__(self, backup, restore, db_type, log_dir, jobs=None, buffer_size=PIPE_BUFFER_SIZE):
+        """
+        Initialize the DatabaseClone class.
+
+        :param backup: MySQLBackup or PgSQLBackup reading the source database.
+        :param restore: MySQLRestore or PgSQLRestore loading the target database.
+        :param db_type: Type of both databases ('mysql' or 'pgsql').
+        :param log_dir: Directory where log files will be stored.
+        :param jobs: Number of units copied concurrently (optional).
+        :param buffer_size: Number of bytes a pipe holds before its producer waits for the target.
+        """
+        self.backup = backup
+        self.restore = restore
+        self.db_type = db_type
+        self.log_dir = log_dir
+        self.jobs = jobs
+        self.buffer_size = buffer_size
+        self.setup_logging()
+
+    def setup_logging(self):
+        """
+        Set up logging for the clone.
+        """
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
+
+        formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
+        self.logger = logging.getLogger('clone')
+        self.logger.setLevel(logging.INFO)
+        add_file_handler(self.logger, os.path.join(self.log_dir, 'clone.log'), formatter)
+
+    def clone(self):
+        """
+        Copy the structure, then the rows, then build the post-data objects.
+        """
+        self.logger.info(f"Starting {self.db_type} clone")
+        self.clone_structure()
+        self.clone_data()
+        self.restore.restore_post_data()
+        self.logger.info(f"{self.db_type} clone completed")
+
+    def clone_structure(self):
+        """
+        Create the tables and views of the source on the target, keeping the post-data statements for later.
+        """
+        text = io.StringIO()
+        self.backup.write_structure(text)
+        dump = lambda: io.StringIO(text.getvalue())
+        if self.db_type == 'mysql':
+            self.restore.restore_structure(defer_post_data=True, dump=dump)
+        else:
+            self.restore.restore_sequences(dump)
+            self.restore.restore_tables(defer_post_data=True, dump=dump)
+
+    def clone_data(self):
+        """
+        Copy the rows of every table, over ``jobs`` pairs of source and target connections.
+
+        The units are planned like the ones of a per-table backup, largest first.
+        """
+        backup = self.backup
+        restore = self.restore
+        tables = backup.load_schema().tables if self.db_type == 'mysql' else backup.get_tables()
+        units = backup.plan_units(tables)
+        backup.expect_rows(tables)
+        if backup.metrics.expected_rows is not None:
+            restore.metrics.expect(backup.metrics.expected_rows)
+        jobs = self.jobs or 1
+        if jobs > 1:
+            if self.db_type == 'mysql':
+                sources = backup.open_snapshot_workers(jobs)
+                targets = [restore.connect(restore.new_database) for _ in range(jobs)]
+            else:
+                _, sources = backup.open_snapshot_workers(jobs)
+                targets = [restore.connect() for _ in range(jobs)]
+            if restore.fast:
+                for conn in targets:
+                    restore.apply_session_settings(conn)
+        else:
+            sources = [backup.conn]
+            targets = [restore.conn]
+        self.logger.info(f"Copying {len(units)} units of {len(tables)} tables over {jobs} connection pairs")
+        try:
+            run_with_connections(list(zip(sources, targets)), units, self.clone_unit)
+        finally:
+            if jobs > 1:
+                for conn in sources + targets:
+                    conn.close()
+                if self.db_type == 'pgsql':
+                    backup.conn.commit()
+                    backup.conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
+
+    def clone_unit(self, connections, unit):
+        """
+        Copy one unit, dumping it in a producer thread while loading it in the calling thread.
+
+        When either side fails the pipe is hung up, so the other one stops
+        instead of waiting, and the error is raised.
+
+        :param connections: Tuple of the source connection and the target connection.
+        :param unit: Unit dictionary produced by ``plan_units``.
+        """
+        source, target = connections
+        pipe = BytePipe(self.buffer_size)
+        errors = []
+
+        def produce():
+            try:
+                f = open_pipe(pipe, self.backup.unit_mode())
+                self.backup.write_unit(source, unit, f)
+                f.close()
+            except Exception as e:
+                errors.append(e)
+                pipe.close(e)
+
+        producer = threading.Thread(target=produce, name=f"clone-{unit['file']}", daemon=True)
+        producer.start()
+        try:
+            self.load_unit(target, unit, pipe)
+        finally:
+            pipe.hang_up()
+            producer.join()
+        if errors:
+            raise errors[0]
+        self.logger.info(f"Unit {unit['file']} of table {unit['table']} copied")
+
+    def load_unit(self, conn, unit, pipe):
+        """
+        Load the rows of one unit from the reading end of its pipe.
+
+        :param conn: Target connection to load the rows with.
+        :param unit: Unit dictionary produced by ``plan_units``.
+        :param pipe: BytePipe the producer writes the unit to.
+        """
+        data_format = self.backup.data_format
+        if self.db_type == 'mysql':
+            self.restore.load_stream(conn, unit['table'], data_format, lambda mode: open_pipe(pipe, mode),
+                                     self.restore.backup_dir, 'the source database')
+        elif data_format == 'copy-binary':
+            with open_pipe(pipe, 'rb') as f:
+                self.restore.restore_binary_sections(f, conn)
+        else:
+            with open_pipe(pipe, 'r') as f:
+                self.restore.restore_sql_stream(f, conn)
+
+
+def clone_database(db_type, source_host, source_user, source_password, target_host, target_user, target_password,
+                   database, new_database, log_dir, data_format='insert', jobs=None, chunks=1, chunk_min_rows=1000000,
+                   fetch_size=10000, fast=False, commit_every=None, commit_bytes=None, buffer_size=PIPE_BUFFER_SIZE,
+                   progress=False, prometheus_dir=None):
+    """
+    Function to copy a database into a new one, streaming the rows from the source to the target.
+
+    Nothing is staged on disk: the catalog files of the backup and restore
+    classes and the named pipes of tab-delimited loads live in a temporary
+    directory removed at the end.
+
+    :param db_type: Type of both databases ('mysql' or 'pgsql').
+    :param source_host: Host of the source database.
+    :param source_user: User name on the source host.
+    :param source_password: Password on the source host.
+    :param target_host: Host the new database is created on.
+    :param target_user: User name on the target host.
+    :param target_password: Password on the target host.
+    :param database: Name of the database to copy.
+    :param new_database: Name of the database to create on the target host.
+    :param log_dir: Directory where log files will be stored.
+    :param data_format: Format the rows are streamed in ('insert', MySQL 'tsv', PostgreSQL 'copy' or 'copy-binary').
+    :param jobs: Number of units copied concurrently over their own connections (optional).
+    :param chunks: Number of primary key ranges large tables are split into.
+    :param chunk_min_rows: Estimated row count above which a table is split into chunks.
+    :param fetch_size: Number of rows fetched per batch from the source.
+    :param fast: Use the bulk-load session settings of the fast restore mode on the target.
+    :param commit_every: Number of statements or COPY rows loaded per transaction (fast mode default if None).
+    :param commit_bytes: Size of the data loaded per transaction (fast mode default if None).
+    :param buffer_size: Number of bytes a pipe holds before its producer waits for the target.
+    :param progress: Draw a live progress line of the load on standard error.
+    :param prometheus_dir: Directory of the Prometheus textfile collector the run metrics are written to (optional).
+    :raises ValueError: If the clone would load into its own source.
+    """
+    if source_host == target_host and database == new_database:
+        raise ValueError(f"Cloning {database} onto itself on {source_host}; choose another database or target host")
+    work_dir = tempfile.mkdtemp(prefix='clone_')
+    try:
+        if db_type == 'mysql':
+            backup = MySQLBackup(source_host, source_user, source_password, database, work_dir, log_dir, fetch_size,
+                                 data_format, jobs, chunks, chunk_min_rows, prometheus_dir=prometheus_dir)
+            restore_class = MySQLRestore
+        else:
+            backup = PgSQLBackup(source_host, source_user, source_password, database, work_dir, log_dir, fetch_size,
+                                 data_format, jobs, chunks, chunk_min_rows, prometheus_dir=prometheus_dir)
+            restore_class = PgSQLRestore
+        status = 'failed'
+        try:
+            restore = restore_class(target_host, target_user, target_password, work_dir, log_dir, new_database, jobs,
+                                    fast=fast, commit_every=commit_every, commit_bytes=commit_bytes,
+                                    progress=progress, prometheus_dir=prometheus_dir)
+            try:
+                DatabaseClone(backup, restore, db_type, log_dir, jobs, buffer_size).clone()
+                status = 'ok'
+            finally:
+                restore.close(status)
+        finally:
+            backup.close(status)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,361 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import mysql.connector
+import psycopg2
+from backup.fleet import ENTRY_OPTIONS, backup_entry, load_inventory
+from common.cron import CronSchedule
+from common.log import add_file_handler
+from common.metrics import write_atomically
+from common.pool import ConnectionPool
+from common.retention import prune_backups
+
+# Options a schedule entry may set on top of the fleet backup options, with their defaults.
+SCHEDULE_OPTIONS = dict(ENTRY_OPTIONS, schedule=None, keep_last=None, keep_days=None)
+
+# Settings of the daemon, at the top level of the schedule file, with their defaults.
+DAEMON_SETTINGS = {'workers': 4, 'per_host': 1, 'pool_size': 2}
+
+# Longest sleep of the scheduling loop, so idle connections are evicted and clock changes are noticed.
+MAX_SLEEP = 60
+
+# Name of the status file written to the log directory after every run.
+STATUS_NAME = 'backup_daemon_status.json'
+
+
+def load_schedule(path, backup_dir):
+    """
+    Read the schedule file of the backup daemon.
+
+    The file is a fleet inventory (see ``load_inventory``) whose entries also
+    give a cron ``schedule`` and optionally a retention policy: ``keep_last``
+    completed backups and backups younger than ``keep_days`` days are kept.
+    The top level may set the ``workers``, ``per_host`` and ``pool_size``
+    settings of the daemon.
+
+    :param path: Path to the schedule file.
+    :param backup_dir: Directory holding one backup directory per entry.
+    :return: A tuple of the settings dictionary and the list of entries, each with its parsed ``schedule``.
+    :raises ValueError: If the file or one of its entries is invalid.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    unknown = set(config) - {'defaults', 'databases'} - set(DAEMON_SETTINGS)
+    if unknown:
+        raise ValueError(f"Schedule file has unknown keys: {', '.join(sorted(unknown))}")
+    settings = {key: config.get(key, default) for key, default in DAEMON_SETTINGS.items()}
+    for key, value in settings.items():
+        if not isinstance(value, int) or value < 1:
+            raise ValueError(f"Schedule setting {key} must be a positive integer")
+    entries = load_inventory(path, backup_dir, SCHEDULE_OPTIONS)
+    for entry in entries:
+        if not entry['schedule']:
+            raise ValueError(f"Schedule entry {entry['name']} lacks a schedule")
+        try:
+            entry['schedule'] = CronSchedule(entry['schedule'])
+        except ValueError as e:
+            raise ValueError(f"Schedule entry {entry['name']}: {e}") from None
+        for key in ('keep_last', 'keep_days'):
+            if entry[key] is not None and (not isinstance(entry[key], (int, float)) or entry[key] <= 0):
+                raise ValueError(f"Schedule entry {entry['name']}: {key} must be a positive number")
+    return settings, entries
+
+
+def connect_entry(entry):
+    """
+    Open a connection to the database of a schedule entry.
+
+    :param entry: Schedule entry.
+    :return: A mysql.connector or psycopg2 connection.
+    """
+    if entry['dbtype'] == 'mysql':
+        return mysql.connector.connect(host=entry['host'], user=entry['user'], password=entry['password'],
+                                       database=entry['database'])
+    return psycopg2.connect(host=entry['host'], user=entry['user'], password=entry['password'],
+                            dbname=entry['database'])
+
+
+def reset_mysql_connection(conn):
+    """
+    Put a MySQL connection returned to its pool back in a fresh session state.
+
+    :param conn: mysql.connector connection.
+    """
+    conn.rollback()
+    conn.reset_session()
+
+
+def reset_pgsql_connection(conn):
+    """
+    Put a PostgreSQL connection returned to its pool back in a fresh session state.
+
+    :param conn: psycopg2 connection.
+    """
+    conn.reset()
+    conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT', autocommit=False)
+
+
+class BackupDaemon:
+    """
+    A class to run scheduled backups from one long-running process.
+
+    Every entry is backed up whenever its cron schedule comes due, by the
+    regular MySQL or PostgreSQL backup running in a worker thread, so the
+    interpreter, the drivers and the log handlers are set up once. The
+    connections of every database are kept warm in a pool shared by its
+    runs and checked before reuse. As in the fleet backup, a global limit
+    bounds the backups running at once and a per-host limit protects each
+    server; entries sharing a backup directory run one at a time. A run due
+    while the previous run of the same entry is still going on is skipped.
+    After a successful run the backups the entry's retention policy no
+    longer keeps are deleted, along with the chunks only they used.
+
+    Attributes:
+        entries (list): Schedule entries produced by ``load_schedule``.
+        log_dir (str): Directory where log files will be stored.
+        workers (int): Maximum number of backups running at once.
+        per_host (int): Maximum number of backups running at once against the same host.
+        pool_size (int): Number of idle connections kept per database.
+        backup (callable): Function backing up one entry, given the entry, the log directory and a ConnectionPool.
+        pools (dict): Connection pool of every (dbtype, host, user, database) target.
+        next_runs (dict): Entry name to the datetime of its next run.
+        running (set): Names of the entries being backed up.
+        results (dict): Entry name to the result dictionary of its last run.
+        executor (ThreadPoolExecutor): Worker threads the blocking backups run in.
+    """
+    def __init__(self, entries, log_dir, workers=4, per_host=1, pool_size=2, backup=backup_entry):
+        """
+        Initialize the BackupDaemon class.
+
+        :param entries: Schedule entries produced by ``load_schedule``.
+        :param log_dir: Directory where log files will be stored.
+        :param workers: Maximum number of backups running at once.
+        :param per_host: Maximum number of backups running at once against the same host.
+        :param pool_size: Number of idle connections kept per database.
+        :param backup: Function backing up one entry, given the entry, the log directory and a ConnectionPool.
+        """
+        self.entries = entries
+        self.log_dir = log_dir
+        self.workers = workers
+        self.per_host = per_host
+        self.pool_size = pool_size
+        self.backup = backup
+        self.pools = {}
+        self.next_runs = {}
+        self.running = set()
+        self.results = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backup')
+        self.setup_logging()
+
+    def setup_logging(self):
+        """
+        Set up logging for the backup daemon.
+        """
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
+
+        formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
+        self.logger = logging.getLogger('backup_daemon')
+        self.logger.setLevel(logging.INFO)
+        add_file_handler(self.logger, os.path.join(self.log_dir, 'backup_daemon.log'), formatter)
+
+    def pool_for(self, entry):
+        """
+        Return the connection pool of the database of an entry, creating it on first use.
+
+        :param entry: Schedule entry.
+        :return: A ConnectionPool.
+        """
+        key = (entry['dbtype'], entry['host'], entry['user'], entry['database'])
+        if key not in self.pools:
+            reset = reset_mysql_connection if entry['dbtype'] == 'mysql' else reset_pgsql_connection
+            self.pools[key] = ConnectionPool(lambda: connect_entry(entry), reset, size=self.pool_size)
+        return self.pools[key]
+
+    def open_limits(self):
+        """
+        Create the limits of the concurrent runs, on the running event loop.
+        """
+        self.global_limit = asyncio.Semaphore(self.workers)
+        self.host_limits = {}
+        self.directory_locks = {}
+
+    def schedule(self, now):
+        """
+        Plan the first run of every entry.
+
+        :param now: Current time.
+        """
+        self.next_runs = {entry['name']: entry['schedule'].next_after(now) for entry in self.entries}
+        for entry in self.entries:
+            self.logger.info(f"{entry['name']} ({entry['schedule'].expression}) first runs at "
+                             f"{self.next_runs[entry['name']]:%Y-%m-%d %H:%M}")
+
+    def due_entries(self, now):
+        """
+        Pick the entries whose run is due and plan their next run.
+
+        Runs missed while the daemon was busy are not made up for one by one:
+        an overdue entry runs once. An entry whose previous run is still going
+        on is skipped until its next run.
+
+        :param now: Current time.
+        :return: The entries to back up now.
+        """
+        due = []
+        for entry in self.entries:
+            name = entry['name']
+            if self.next_runs[name] > now:
+                continue
+            self.next_runs[name] = entry['schedule'].next_after(now)
+            if name in self.running:
+                self.logger.warning(f"Skipping the run of {name}: the previous one is still going on")
+                continue
+            due.append(entry)
+        return due
+
+    def launch(self, entry):
+        """
+        Start the run of an entry on the event loop.
+
+        :param entry: Schedule entry.
+        :return: The asyncio task of the run.
+        """
+        self.running.add(entry['name'])
+        return asyncio.ensure_future(self.run_job(entry))
+
+    async def run_job(self, entry):
+        """
+        Back up one entry once its backup directory, its host and the daemon have a free slot.
+
+        :param entry: Schedule entry.
+        :return: The result dictionary of the run.
+        """
+        name = entry['name']
+        directory_lock = self.directory_locks.setdefault(entry['backup_dir'], asyncio.Lock())
+        host_limit = self.host_limits.setdefault(entry['host'], asyncio.Semaphore(self.per_host))
+        pool = self.pool_for(entry)
+        try:
+            async with directory_lock, host_limit, self.global_limit:
+                self.logger.info(f"Backup of {name} ({entry['dbtype']} {entry['host']}) started")
+                started = time.monotonic()
+                status, error = 'ok', None
+                try:
+                    await asyncio.get_running_loop().run_in_executor(self.executor, self.job, entry, pool)
+                except Exception as e:
+                    status, error = 'failed', f"{type(e).__name__}: {e}"
+                seconds = round(time.monotonic() - started, 3)
+        finally:
+            self.running.discard(name)
+        if error:
+            self.logger.error(f"Backup of {name} failed after {seconds}s: {error}")
+        else:
+            self.logger.info(f"Backup of {name} completed in {seconds}s")
+        result = {'name': name, 'dbtype': entry['dbtype'], 'host': entry['host'], 'database': entry['database'],
+                  'status': status, 'seconds': seconds, 'error': error,
+                  'finished_at': datetime.now().isoformat(timespec='seconds')}
+        self.results[name] = result
+        self.write_status()
+        return result
+
+    def job(self, entry, pool):
+        """
+        Back up an entry, then apply its retention policy. Runs in a worker thread.
+
+        :param entry: Schedule entry.
+        :param pool: Connection pool of the entry's database.
+        """
+        self.backup(entry, self.log_dir, pool)
+        if entry['keep_last'] is not None or entry['keep_days'] is not None:
+            prune_backups(entry['backup_dir'], entry['dbtype'], entry['database'], entry['keep_last'],
+                          entry['keep_days'], self.logger)
+
+    def write_status(self):
+        """
+        Write the next run and the last result of every entry to the status file in the log directory.
+        """
+        status = {'updated_at': datetime.now().isoformat(timespec='seconds'), 'entries': [
+            {'name': entry['name'], 'schedule': entry['schedule'].expression,
+             'next_run': self.next_runs[entry['name']].isoformat() if entry['name'] in self.next_runs else None,
+             'running': entry['name'] in self.running, 'last_result': self.results.get(entry['name'])}
+            for entry in self.entries]}
+        write_atomically(os.path.join(self.log_dir, STATUS_NAME), json.dumps(status, indent=2))
+
+    async def serve(self):
+        """
+        Run the schedule until SIGINT or SIGTERM, then wait for the runs going on.
+        """
+        self.open_limits()
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stopping.set)
+            except (NotImplementedError, RuntimeError):
+                # Not the main thread, or a platform without signal handlers on the event loop.
+                pass
+        self.logger.info(f"Backup daemon started with {len(self.entries)} entries "
+                         f"({self.workers} at once, {self.per_host} per host)")
+        self.schedule(datetime.now())
+        self.write_status()
+        tasks = set()
+        while not stopping.is_set():
+            for entry in self.due_entries(datetime.now()):
+                task = self.launch(entry)
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            for pool in self.pools.values():
+                pool.evict_idle()
+            wait = (min(self.next_runs.values()) - datetime.now()).total_seconds()
+            try:
+                await asyncio.wait_for(stopping.wait(), max(0.0, min(wait, MAX_SLEEP)))
+            except asyncio.TimeoutError:
+                pass
+        self.logger.info(f"Backup daemon stopping, waiting for {len(tasks)} running backups")
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def run_now(self, entries=None):
+        """
+        Back up entries right away, within the same limits as scheduled runs, and wait for them.
+
+        :param entries: Schedule entries to back up (all of them if None).
+        :return: The result dictionaries, in entry order.
+        """
+        self.open_limits()
+        return await asyncio.gather(*[self.launch(entry) for entry in entries or self.entries])
+
+    def close(self):
+        """
+        Stop the worker threads and close the pooled connections.
+        """
+        self.executor.shutdown(wait=True)
+        for pool in self.pools.values():
+            pool.close()
+        self.logger.info("Backup daemon stopped")
+
+
+def serve_backups(config, backup_dir, log_dir, run_now=False):
+    """
+    Function to run the backup daemon until it is stopped.
+
+    :param config: Path to the schedule file.
+    :param backup_dir: Directory holding one backup directory per entry.
+    :param log_dir: Directory where log files will be stored.
+    :param run_now: Back up every entry once right away and return instead of following the schedule.
+    :return: The result dictionaries of the entries backed up right away (an empty list when serving).
+    """
+    settings, entries = load_schedule(config, backup_dir)
+    daemon = BackupDaemon(entries, log_dir, settings['workers'], settings['per_host'], settings['pool_size'])
+    try:
+        if run_now:
+            return asyncio.run(daemon.run_now())
+        asyncio.run(daemon.serve())
+        return []
+    finally:
+        daemon.close()
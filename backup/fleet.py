@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from backup.mysql_backup import mysql_backup
+from backup.pgsql_backup import pgsql_backup
+from common.log import add_file_handler
+
+# Backup options an inventory entry may set, with their defaults.
+ENTRY_OPTIONS = {
+    'backup_type': 'full',
+    'fetch_size': 10000,
+    'format': 'insert',
+    'jobs': None,
+    'chunks': 1,
+    'chunk_min_rows': 1000000,
+    'compress': None,
+    'compress_level': None,
+    'incremental': False,
+    'dedup': False,
+    'archive': False,
+    'prometheus_dir': None,
+    'max_rows_per_second': None,
+    'max_mib_per_second': None,
+    'max_lag': None,
+    'max_latency': None,
+    'lag_host': None,
+    'resume': False,
+    'checksums': False,
+}
+
+# Connection settings every inventory entry needs.
+REQUIRED_KEYS = ('name', 'dbtype', 'host', 'user', 'database')
+
+
+def check_backup_options(dbtype, data_format='insert', jobs=None, chunks=1, incremental=False, dedup=False,
+                         archive=False, lag_host=None, checksums=False):
+    """
+    Check that backup options can be used together, for the command line and inventory entries alike.
+
+    :param dbtype: Type of the database ('mysql' or 'pgsql').
+    :param data_format: Format of the data backup.
+    :param jobs: Number of tables dumped concurrently (optional).
+    :param chunks: Number of primary key ranges large tables are split into.
+    :param incremental: Flag to only dump the tables changed since the previous backup.
+    :param dedup: Flag to store the backup files in the chunk store.
+    :param archive: Flag to write a single seekable archive.
+    :param lag_host: MySQL replica probed for the replication lag (optional).
+    :param checksums: Flag to record a checksum of the rows of every file.
+    :raises ValueError: If the options are inconsistent.
+    """
+    if dbtype == 'mysql' and data_format.startswith('copy'):
+        raise ValueError(f"format {data_format} is only supported for PostgreSQL")
+    if dbtype == 'pgsql' and data_format == 'tsv':
+        raise ValueError("format tsv is only supported for MySQL")
+    if archive and (jobs or chunks > 1 or incremental or dedup or checksums):
+        raise ValueError("archive cannot be combined with jobs, chunks, incremental, dedup or checksums")
+    if dbtype == 'pgsql' and lag_host:
+        raise ValueError("lag_host is only supported for MySQL; PostgreSQL reads pg_stat_replication")
+
+
+def load_inventory(path, backup_dir, options=ENTRY_OPTIONS):
+    """
+    Read the inventory of databases to back up.
+
+    The inventory is a JSON object with a ``databases`` list and optional
+    ``defaults`` applied to every entry. Each entry names its database type,
+    host, user and database, gives the password inline (``password``) or
+    through an environment variable (``password_env``), and may set any of
+    the backup options. Entries are backed up to ``backup_dir/<name>``
+    unless they set their own ``backup_dir``.
+
+    :param path: Path to the inventory file.
+    :param backup_dir: Directory holding one backup directory per entry.
+    :param options: Options an entry may set, with their defaults.
+    :return: A list of entry dictionaries with every option resolved.
+    :raises ValueError: If an entry is incomplete, duplicated or inconsistent.
+    """
+    with open(path) as f:
+        inventory = json.load(f)
+    defaults = inventory.get('defaults', {})
+    entries = []
+    names = set()
+    for position, item in enumerate(inventory.get('databases', [])):
+        entry = dict(options, **defaults)
+        entry.update(item)
+        missing = [key for key in REQUIRED_KEYS if not entry.get(key)]
+        if missing:
+            raise ValueError(f"Inventory entry {position} lacks {', '.join(missing)}")
+        name = entry['name']
+        if name in names:
+            raise ValueError(f"Inventory entry {name} is listed twice")
+        names.add(name)
+        unknown = set(entry) - set(options) - set(REQUIRED_KEYS) - {'password', 'password_env', 'backup_dir'}
+        if unknown:
+            raise ValueError(f"Inventory entry {name} has unknown keys: {', '.join(sorted(unknown))}")
+        if entry['dbtype'] not in ('mysql', 'pgsql'):
+            raise ValueError(f"Inventory entry {name} has unknown dbtype {entry['dbtype']}")
+        if entry['backup_type'] not in ('structure', 'data', 'full'):
+            raise ValueError(f"Inventory entry {name} has unknown backup_type {entry['backup_type']}")
+        try:
+            check_backup_options(entry['dbtype'], entry['format'], entry['jobs'], entry['chunks'],
+                                 entry['incremental'], entry['dedup'], entry['archive'], entry['lag_host'],
+                                 entry['checksums'])
+        except ValueError as e:
+            raise ValueError(f"Inventory entry {name}: {e}") from None
+        if 'password_env' in entry:
+            entry['password'] = os.getenv(entry.pop('password_env'))
+        entry.setdefault('password', None)
+        entry.setdefault('backup_dir', os.path.join(backup_dir, name))
+        entries.append(entry)
+    return entries
+
+
+def backup_entry(entry, log_dir, pool=None):
+    """
+    Back up the database of one inventory entry, blocking until it is done.
+
+    :param entry: Inventory entry produced by ``load_inventory``.
+    :param log_dir: Directory where log files will be stored.
+    :param pool: Pool the database connections are borrowed from (optional).
+    """
+    throttle = {key: entry[key] for key in ('max_rows_per_second', 'max_mib_per_second', 'max_lag', 'max_latency')}
+    if entry['dbtype'] == 'mysql':
+        backup = mysql_backup
+        throttle['lag_host'] = entry['lag_host']
+    else:
+        backup = pgsql_backup
+    backup(entry['host'], entry['user'], entry['password'], entry['backup_dir'], log_dir, entry['backup_type'],
+           entry['database'], entry['fetch_size'], entry['format'], entry['jobs'], entry['chunks'],
+           entry['chunk_min_rows'], entry['compress'], entry['compress_level'], entry['incremental'],
+           entry['dedup'], entry['archive'], False, entry['prometheus_dir'], resume=entry['resume'], pool=pool,
+           checksums=entry['checksums'], **throttle)
+
+
+class FleetBackup:
+    """
+    A class to back up many databases from one process.
+
+    Backups run concurrently on an asyncio event loop, each in a worker
+    thread with the regular MySQL or PostgreSQL backup, so the interpreter
+    and the backup code are loaded once for the whole fleet. A global limit
+    bounds the number of backups running at once and a per-host limit keeps
+    a single server from being hit by too many of them. A backup failing
+    does not stop the others; every outcome is collected into one report.
+
+    Attributes:
+        entries (list): Inventory entries to back up.
+        log_dir (str): Directory where log files will be stored.
+        concurrency (int): Maximum number of backups running at once.
+        per_host (int): Maximum number of backups running at once against the same host.
+        backup (callable): Function backing up one entry, given the entry and the log directory.
+    """
+    def __init__(self, entries, log_dir, concurrency=4, per_host=1, backup=backup_entry):
+        """
+        Initialize the FleetBackup class.
+
+        :param entries: Inventory entries to back up.
+        :param log_dir: Directory where log files will be stored.
+        :param concurrency: Maximum number of backups running at once.
+        :param per_host: Maximum number of backups running at once against the same host.
+        :param backup: Function backing up one entry, given the entry and the log directory.
+        """
+        self.entries = entries
+        self.log_dir = log_dir
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.backup = backup
+        self.setup_logging()
+
+    def setup_logging(self):
+        """
+        Set up logging for the fleet backup.
+        """
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
+
+        formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
+        self.logger = logging.getLogger('fleet_backup')
+        self.logger.setLevel(logging.INFO)
+        add_file_handler(self.logger, os.path.join(self.log_dir, 'fleet_backup.log'), formatter)
+
+    def run(self):
+        """
+        Back up every entry of the fleet.
+
+        :return: One result dictionary per entry, in inventory order, with its ``status`` ('ok' or 'failed'),
+            duration in ``seconds`` and ``error`` message.
+        """
+        self.logger.info(f"Starting fleet backup of {len(self.entries)} databases "
+                         f"({self.concurrency} at once, {self.per_host} per host)")
+        results = asyncio.run(self.run_all())
+        failed = sum(1 for result in results if result['status'] != 'ok')
+        self.logger.info(f"Fleet backup completed: {len(results) - failed} succeeded, {failed} failed")
+        return results
+
+    async def run_all(self):
+        """
+        Run the backups of all entries on the event loop, within the concurrency limits.
+
+        :return: The result dictionaries, in inventory order.
+        """
+        global_limit = asyncio.Semaphore(self.concurrency)
+        host_limits = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            tasks = []
+            for entry in self.entries:
+                host_limit = host_limits.setdefault(entry['host'], asyncio.Semaphore(self.per_host))
+                tasks.append(self.run_entry(entry, executor, global_limit, host_limit))
+            return await asyncio.gather(*tasks)
+
+    async def run_entry(self, entry, executor, global_limit, host_limit):
+        """
+        Back up one entry once both its host and the fleet have a free slot.
+
+        The host slot is taken first, so backups queued behind a busy host do
+        not hold global slots other hosts could use.
+
+        :param entry: Inventory entry to back up.
+        :param executor: Thread pool the blocking backup runs in.
+        :param global_limit: Semaphore bounding the backups of the whole fleet.
+        :param host_limit: Semaphore bounding the backups of the entry's host.
+        :return: The result dictionary of the entry.
+        """
+        async with host_limit:
+            async with global_limit:
+                self.logger.info(f"Backup of {entry['name']} ({entry['dbtype']} {entry['host']}) started")
+                started = time.monotonic()
+                status, error = 'ok', None
+                try:
+                    await asyncio.get_running_loop().run_in_executor(executor, self.backup, entry, self.log_dir)
+                except Exception as e:
+                    status, error = 'failed', f"{type(e).__name__}: {e}"
+                seconds = round(time.monotonic() - started, 3)
+                if error:
+                    self.logger.error(f"Backup of {entry['name']} failed after {seconds}s: {error}")
+                else:
+                    self.logger.info(f"Backup of {entry['name']} completed in {seconds}s")
+        return {'name': entry['name'], 'dbtype': entry['dbtype'], 'host': entry['host'],
+                'database': entry['database'], 'status': status, 'seconds': seconds, 'error': error}
+
+
+def format_report(results):
+    """
+    Format the results of a fleet backup as a plain text table.
+
+    :param results: Result dictionaries returned by ``FleetBackup.run``.
+    :return: The report, one line per database followed by a summary line.
+    """
+    width = max([len(result['name']) for result in results] + [4])
+    lines = [f"{'NAME':<{width}}  STATUS  SECONDS  ERROR"]
+    for result in results:
+        lines.append(f"{result['name']:<{width}}  {result['status']:<6}  {result['seconds']:>7.1f}  "
+                     f"{' '.join((result['error'] or '').split())}".rstrip())
+    failed = sum(1 for result in results if result['status'] != 'ok')
+    lines.append(f"{len(results) - failed} succeeded, {failed} failed")
+    return "\n".join(lines)
+
+
+def fleet_backup(inventory, backup_dir, log_dir, concurrency=4, per_host=1, report=None):
+    """
+    Function to back up every database of an inventory file.
+
+    :param inventory: Path to the inventory file.
+    :param backup_dir: Directory holding one backup directory per database.
+    :param log_dir: Directory where log files will be stored.
+    :param concurrency: Maximum number of backups running at once.
+    :param per_host: Maximum number of backups running at once against the same host.
+    :param report: Path the JSON report is written to (optional).
+    :return: The result dictionaries, in inventory order.
+    """
+    fleet = FleetBackup(load_inventory(inventory, backup_dir), log_dir, concurrency, per_host)
+    results = fleet.run()
+    if report:
+        with open(report, 'w') as f:
+            json.dump({'results': results}, f, indent=2)
+    return results
@@ -1,7 +1,43 @@
+import hashlib
 import os
+import time
 import mysql.connector
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import logging
+from common.archive import ARCHIVE_SUFFIX, ArchiveWriter
+from common.catalog import BackupCatalog, describe_file
+from common.checkpoint import CHECKPOINT_NAME, Checkpoint, atomic_output, find_unfinished_backup, remove_partial_files
+from common.checksum import new_checksum
+from common.chunk_store import STORE_NAME, ChunkStore
+from common.chunking import key_range_predicates
+from common.compression import compressed_name, open_backup_file
+from common.log import add_file_handler
+from common.incremental import load_base_manifest, reuse_unchanged
+from common.manifest import write_manifest
+from common.metrics import ProgressLine, RunMetrics, summary_lines
+from common.parallel import run_with_connections
+from common.pool import close_quietly
+from common.post_data import POST_DATA_HEADER
+from common.row_encoder import build_insert_encoder, format_interval
+from common.throttle import Throttle
+from backup.mysql_schema import MySQLSchema
+
+# Column types a table can be split into primary key ranges on.
+INTEGER_TYPES = ('tinyint', 'smallint', 'mediumint', 'int', 'bigint')
+
+# Row encoder kind of each column data type; other types use the generic encoder.
+COLUMN_KINDS = {
+    'tinyint': 'int', 'smallint': 'int', 'mediumint': 'int', 'int': 'int', 'bigint': 'int', 'year': 'int',
+    'float': 'float', 'double': 'float',
+    'decimal': 'decimal',
+    'char': 'text', 'varchar': 'text', 'tinytext': 'text', 'text': 'text', 'mediumtext': 'text',
+    'longtext': 'text', 'enum': 'text',
+    'binary': 'bytes', 'varbinary': 'bytes', 'tinyblob': 'bytes', 'blob': 'bytes', 'mediumblob': 'bytes',
+    'longblob': 'bytes',
+    'date': 'temporal', 'datetime': 'temporal', 'timestamp': 'temporal',
+    'json': 'json',
+}
 
 class MySQLBackup:
     """
@@ -14,8 +50,32 @@ class MySQLBackup:
         database (str): Name of the MySQL database to backup.
         backup_dir (str): Directory where backup files will be stored.
         log_dir (str): Directory where log files will be stored.
+        fetch_size (int): Number of rows fetched per batch while streaming table data.
+        data_format (str): Format of the data backup ('insert' or 'tsv').
+        jobs (int): Number of tables dumped concurrently (None for a single-file backup).
+        chunks (int): Number of primary key ranges large tables are split into.
+        chunk_min_rows (int): Estimated row count above which a table is split into chunks.
+        compress (str): Codec backup files are compressed with ('gzip', 'zstd', 'lz4' or None).
+        compress_level (int): Compression level (codec default if None).
+        incremental (bool): Reuse the files of the previous backup for tables that have not changed.
+        dedup (bool): Store backup files as content-defined chunks in the shared chunk store.
+        archive (bool): Write a single seekable archive with one section per table schema and data.
+        schema (MySQLSchema): Table definitions, loaded once by ``load_schema`` and reused for the whole run.
+        prometheus_dir (str): Directory of the Prometheus textfile collector the run metrics are written to (optional).
+        metrics (RunMetrics): Per-table throughput counters of the run, reported when the backup is closed.
+        max_lag (float): Replication lag, in seconds, above which the data fetch slows down (None to ignore the lag).
+        lag_host (str): Replica whose ``SHOW REPLICA STATUS`` is probed for the lag (defaults to ``host``).
+        throttle (Throttle): Pacing of the data fetch loops (None when no limit is set).
+        resume (bool): Continue the latest per-table data backup a failed run left unfinished.
+        pool (ConnectionPool): Pool the database connections are borrowed from (None to open new ones).
+        checksums (bool): Record an order-independent checksum of the rows of every file of a per-table data backup.
+        checkpoint (Checkpoint): Progress of the per-table data backup being written (None until it starts).
     """
-    def __init__(self, host, user, password, database, backup_dir, log_dir):
+    def __init__(self, host, user, password, database, backup_dir, log_dir, fetch_size=10000, data_format='insert',
+                 jobs=None, chunks=1, chunk_min_rows=1000000, compress=None, compress_level=None, incremental=False,
+                 dedup=False, archive=False, progress=False, prometheus_dir=None, max_rows_per_second=None,
+                 max_mib_per_second=None, max_lag=None, max_latency=None, lag_host=None, resume=False, pool=None,
+                 checksums=False):
         """
         Initialize the MySQLBackup class with connection details and directories.
 
@@ -25,6 +85,26 @@ class MySQLBackup:
         :param database: Name of the MySQL database to backup.
         :param backup_dir: Directory where backup files will be stored.
         :param log_dir: Directory where log files will be stored.
+        :param fetch_size: Number of rows fetched per batch while streaming table data.
+        :param data_format: Format of the data backup ('insert' or 'tsv').
+        :param jobs: Number of tables dumped concurrently (None for a single-file backup).
+        :param chunks: Number of primary key ranges large tables are split into.
+        :param chunk_min_rows: Estimated row count above which a table is split into chunks.
+        :param compress: Codec backup files are compressed with ('gzip', 'zstd', 'lz4' or None).
+        :param compress_level: Compression level (codec default if None).
+        :param incremental: Reuse the files of the previous backup for tables that have not changed.
+        :param dedup: Store backup files as content-defined chunks in the shared chunk store.
+        :param archive: Write a single seekable archive with one section per table schema and data.
+        :param progress: Draw a live progress line with the throughput and ETA on standard error.
+        :param prometheus_dir: Directory of the Prometheus textfile collector the run metrics are written to (optional).
+        :param max_rows_per_second: Cap of the rows fetched per second over all workers (optional).
+        :param max_mib_per_second: Cap of the MiB of backup data produced per second over all workers (optional).
+        :param max_lag: Replication lag, in seconds, above which the data fetch slows down (optional).
+        :param max_latency: Latency of a probe query, in milliseconds, above which the data fetch slows down (optional).
+        :param lag_host: Replica whose ``SHOW REPLICA STATUS`` is probed for the lag (defaults to ``host``).
+        :param resume: Continue the latest per-table data backup a failed run left unfinished.
+        :param pool: Pool the database connections are borrowed from, such as the warm pools of ``serve`` (optional).
+        :param checksums: Record a checksum of the rows of every file, for ``verify``; implies the per-table layout.
         """
         self.host = host
         self.user = user
@@ -32,10 +112,95 @@ class MySQLBackup:
         self.database = database
         self.backup_dir = backup_dir
         self.log_dir = log_dir
-        self.conn = mysql.connector.connect(host=host, user=user, password=password, database=database)
+        self.fetch_size = fetch_size
+        self.data_format = data_format
+        self.jobs = jobs
+        self.chunks = chunks
+        self.chunk_min_rows = chunk_min_rows
+        self.compress = compress
+        self.compress_level = compress_level
+        self.incremental = incremental
+        self.dedup = dedup
+        self.archive = archive
+        self.prometheus_dir = prometheus_dir
+        self.metrics = RunMetrics('backup', 'mysql', database, ProgressLine() if progress else None, host)
+        self.chunk_store = ChunkStore(os.path.join(backup_dir, STORE_NAME), compress, compress_level) if dedup else None
+        self.max_lag = max_lag
+        self.lag_host = lag_host
+        self.resume = resume
+        self.pool = pool
+        self.checksums = checksums
+        self.checkpoint = None
+        self.conn = self.connect()
         self.cursor = self.conn.cursor()
         self.setup_logging()
+        self.probe_conn = None
+        self.throttle = None
+        if max_rows_per_second or max_mib_per_second or max_lag or max_latency:
+            self.throttle = Throttle(max_rows_per_second, max_mib_per_second * 1048576 if max_mib_per_second else None,
+                                     self.probe_lag if max_lag or max_latency else None, max_lag,
+                                     max_latency / 1000 if max_latency else None, logger=self.logger)
         self.ensure_directories_exist()
+        self.catalog = BackupCatalog(backup_dir)
+        self.backup_id = None
+        self.schema = None
+
+    def connect(self):
+        """
+        Open a new connection to the MySQL database.
+
+        A pooled connection goes back to the pool when it is closed.
+
+        :return: A mysql.connector connection.
+        """
+        if self.pool is not None:
+            return self.pool.acquire()
+        return mysql.connector.connect(host=self.host, user=self.user, password=self.password, database=self.database)
+
+    def probe_lag(self):
+        """
+        Read the replication lag for the throttle, over a dedicated autocommit connection.
+
+        The lag is the highest ``Seconds_Behind_Source`` of the replication
+        channels of ``lag_host``, read with ``SHOW SLAVE STATUS`` on servers
+        older than 8.0.22. Without ``max_lag`` only a ``SELECT 1`` is run,
+        whose latency the throttle measures.
+
+        :return: The lag in seconds (0.0 if the server is not a replica), or None if it is unknown.
+        """
+        try:
+            if self.probe_conn is None:
+                if self.lag_host:
+                    self.probe_conn = mysql.connector.connect(host=self.lag_host, user=self.user,
+                                                              password=self.password)
+                else:
+                    self.probe_conn = self.connect()
+                self.probe_conn.autocommit = True
+            cursor = self.probe_conn.cursor(dictionary=True)
+            try:
+                if not self.max_lag:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchall()
+                    return None
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except mysql.connector.Error:
+                    cursor.execute("SHOW SLAVE STATUS")
+                channels = cursor.fetchall()
+            finally:
+                cursor.close()
+        except mysql.connector.Error as e:
+            self.logger.warning(f"Replication lag probe failed: {e}")
+            if self.probe_conn is not None:
+                close_quietly(self.probe_conn)
+            self.probe_conn = None
+            return None
+        lags = [channel.get('Seconds_Behind_Source', channel.get('Seconds_Behind_Master')) for channel in channels]
+        if None in lags:
+            # A stopped replication thread reports no lag at all.
+            self.logger.warning("Replication is not running; the lag is unknown")
+            return None
+        return float(max(lags, default=0))
 
     def setup_logging(self):
         """
@@ -47,9 +212,7 @@ class MySQLBackup:
         formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
         self.logger = logging.getLogger('mysql_backup')
         self.logger.setLevel(logging.INFO)
-        file_handler = logging.FileHandler(os.path.join(self.log_dir, 'mysql_backup.log'))
-        file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
+        add_file_handler(self.logger, os.path.join(self.log_dir, 'mysql_backup.log'), formatter)
 
     def ensure_directories_exist(self):
         """
@@ -58,59 +221,620 @@ class MySQLBackup:
         if not os.path.exists(self.backup_dir):
             os.makedirs(self.backup_dir)
 
+    def load_schema(self):
+        """
+        Load the definitions of all tables in bulk, once per run.
+
+        :return: The MySQLSchema of the database.
+        """
+        if self.schema is None:
+            self.schema = MySQLSchema(self.cursor)
+            self.logger.info(f"Loaded the definitions of {len(self.schema.tables)} tables"
+                             + ("" if self.schema.bulk else ", rebuilding DDL with SHOW CREATE TABLE"))
+        return self.schema
+
+    def expect_rows(self, tables):
+        """
+        Tell the run metrics how many rows the tables hold, from the planner's estimates, for the ETA.
+
+        :param tables: Names of the tables about to be dumped.
+        """
+        estimated_rows = self.load_schema().estimated_rows
+        self.metrics.expect(sum([estimated_rows.get(table_name, 0) for table_name in tables]))
+
     def backup_structure(self):
         """
         Backup the structure of the MySQL database (schema only).
+
+        The CREATE statements of the tables and views come first, followed by
+        the post-data statements adding the secondary indexes and foreign keys,
+        which a restore runs after loading the rows.
         """
+        if self.archive:
+            self.backup_archive('structure')
+            return
         self.logger.info("Starting MySQL structure backup")
         timestamp = datetime.now().strftime('%Y%m%d%H%M')
-        backup_file = os.path.join(self.backup_dir, f'mysql_structure_{timestamp}.sql')
-        self.cursor.execute("SHOW TABLES")
-        tables = self.cursor.fetchall()
-        with open(backup_file, 'w') as f:
-            for table in tables:
-                table_name = table[0]
-                self.cursor.execute(f"SHOW CREATE TABLE {table_name}")
-                create_table_stmt = self.cursor.fetchone()[1]
-                f.write(f"{create_table_stmt};\n")
+        backup_file = os.path.join(self.backup_dir, self.file_name(f'mysql_structure_{timestamp}.sql'))
+        digest = hashlib.sha256()
+        with self.open_file(backup_file, 'w', digest) as f:
+            self.write_structure(f)
+        self.register_section('structure', backup_file, timestamp, [describe_file(backup_file, digest)])
         self.logger.info(f"MySQL structure backup completed: {backup_file}")
 
+    def write_structure(self, f):
+        """
+        Write the pre-data statements of every table and view, then the post-data statements.
+
+        :param f: Text file object to write to.
+        """
+        schema = self.load_schema()
+        for table_name in schema.tables + schema.views:
+            f.write(self.table_ddl(table_name))
+        f.write(POST_DATA_HEADER)
+        for table_name in schema.tables:
+            f.write(self.post_data_ddl(table_name))
+
     def backup_data(self):
         """
         Backup the data of the MySQL database (data only).
+
+        In 'insert' format all rows are written as INSERT statements to a single
+        file. In 'tsv' format, or when ``jobs`` or ``chunks`` is set, a directory
+        is created with one file per table (or per primary key range of a large
+        table) and a manifest tying them together. Tab-delimited files can be
+        loaded back with ``LOAD DATA LOCAL INFILE``. Incremental backups and
+        backups with ``checksums`` always use the directory layout, which is
+        checkpointed file by file, so that ``resume`` can continue it after a
+        failure.
         """
-        self.logger.info("Starting MySQL data backup")
+        if self.archive:
+            self.backup_archive('data')
+            return
+        self.logger.info(f"Starting MySQL data backup ({self.data_format} format)")
         timestamp = datetime.now().strftime('%Y%m%d%H%M')
-        backup_file = os.path.join(self.backup_dir, f'mysql_data_{timestamp}.sql')
-        self.cursor.execute("SHOW TABLES")
-        tables = self.cursor.fetchall()
-        with open(backup_file, 'w') as f:
-            for table in tables:
-                table_name = table[0]
-                self.cursor.execute(f"SELECT * FROM {table_name}")
-                rows = self.cursor.fetchall()
-                for row in rows:
-                    row_data = ', '.join([f"'{str(val)}'" for val in row])
-                    f.write(f"INSERT INTO {table_name} VALUES ({row_data});\n")
+        tables = self.load_schema().tables
+        if self.jobs or self.chunks > 1 or self.data_format == 'tsv' or self.incremental or self.checksums:
+            checkpoint = None
+            if self.resume:
+                checkpoint = find_unfinished_backup(self.backup_dir, 'mysql_data_', self.checkpoint_settings())
+                if checkpoint is None:
+                    self.logger.warning("No unfinished data backup to resume, starting a new one")
+            if checkpoint is not None:
+                backup_file = os.path.dirname(checkpoint.path)
+                timestamp = checkpoint.state['manifest']['timestamp']
+            else:
+                backup_file = os.path.join(self.backup_dir, f'mysql_data_{timestamp}')
+            entries = self.backup_data_directory(backup_file, tables, timestamp, checkpoint)
+            files = [dict(entry, path=os.path.join(backup_file, entry['file'])) for entry in entries]
+        else:
+            if self.resume:
+                self.logger.warning("Single-file data backups cannot be resumed, starting a new one")
+            backup_file = os.path.join(self.backup_dir, self.file_name(f'mysql_data_{timestamp}.sql'))
+            digest = hashlib.sha256()
+            rows = 0
+            self.expect_rows(tables)
+            with self.open_file(backup_file, 'w', digest) as f:
+                for table_name in tables:
+                    rows += self.write_table_data(table_name, f)
+            files = [describe_file(backup_file, digest, rows=rows)]
+        self.register_section('data', backup_file, timestamp, files)
         self.logger.info(f"MySQL data backup completed: {backup_file}")
 
+    def backup_archive(self, backup_type):
+        """
+        Backup the database into a single seekable archive.
+
+        Every table gets a schema section, a data section in the configured
+        format, or both for a full backup, so a restore can read back single
+        tables without scanning the rest of the archive. The archive is
+        recorded as the path of every section it holds.
+
+        :param backup_type: Type of backup ('structure', 'data' or 'full').
+        """
+        self.logger.info(f"Starting MySQL {backup_type} archive backup")
+        timestamp = datetime.now().strftime('%Y%m%d%H%M')
+        backup_file = os.path.join(self.backup_dir, f'mysql_{backup_type}_{timestamp}{ARCHIVE_SUFFIX}')
+        schema = self.load_schema()
+        metadata = {'db_type': 'mysql', 'database': self.database, 'timestamp': timestamp,
+                    'format': self.data_format}
+        if backup_type != 'structure':
+            self.expect_rows(schema.tables)
+        with atomic_output(backup_file) as temporary, \
+                ArchiveWriter(temporary, self.compress, self.compress_level, metadata) as archive:
+            for table_name in schema.tables + schema.views:
+                if backup_type != 'data':
+                    ddl = self.table_ddl(table_name) + self.post_data_ddl(table_name)
+                    archive.write_section(table_name, 'schema', 'w', lambda f: f.write(ddl))
+                if backup_type != 'structure' and table_name not in schema.views:
+                    if self.data_format == 'tsv':
+                        archive.write_section(table_name, 'data', 'wb', lambda f: self.write_table_tsv(table_name, f),
+                                              format='tsv')
+                    else:
+                        archive.write_section(table_name, 'data', 'w', lambda f: self.write_table_data(table_name, f),
+                                              format='insert')
+        for section, kind in (('structure', 'schema'), ('data', 'data')):
+            if backup_type in (section, 'full'):
+                files = [{'table': entry['table'], 'path': backup_file, 'size': entry['length'],
+                          'rows': entry.get('rows'), 'sha256': entry['sha256']}
+                         for entry in archive.sections if entry['kind'] == kind]
+                self.register_section(section, backup_file, timestamp, files)
+        self.logger.info(f"MySQL {backup_type} archive backup completed: {backup_file}")
+
+    def backup_data_directory(self, directory, tables, timestamp, checkpoint=None):
+        """
+        Dump every table into its own file inside a backup directory.
+
+        Large tables are split into primary key ranges, each dumped into its own
+        chunk file. With more than one job the tables and chunks are dumped
+        concurrently, each worker connection reading from the same consistent
+        snapshot. In incremental mode, tables whose fingerprint matches the
+        previous backup are not dumped again; their entries point at the
+        previous backup's files instead.
+
+        The plan and every completed file are recorded in a checkpoint inside
+        the directory, which is removed once the manifest is written. Resuming
+        from the checkpoint only dumps the files that were not completed, from
+        a new snapshot.
+
+        :param directory: Backup directory to create.
+        :param tables: Names of the tables to dump.
+        :param timestamp: Timestamp of the backup run.
+        :param checkpoint: Checkpoint of the failed run to resume (optional).
+        :return: The manifest entries of all table files, dumped or reused.
+        """
+        os.makedirs(directory, exist_ok=True)
+        jobs = self.jobs or 1
+        snapshot = jobs > 1 or (checkpoint is None and self.incremental)
+        workers = self.open_snapshot_workers(jobs) if snapshot else [self.conn]
+        try:
+            if checkpoint is None:
+                manifest = {
+                    'db_type': 'mysql',
+                    'database': self.database,
+                    'timestamp': timestamp,
+                    'format': self.data_format,
+                    'jobs': jobs,
+                    'compress': self.compress,
+                    'dedup': self.dedup,
+                }
+                reused = {}
+                if self.incremental:
+                    reused = self.plan_incremental(workers, directory, tables, manifest)
+                reused = [entry for table_entries in reused.values() for entry in table_entries]
+                reused_tables = {entry['table'] for entry in reused}
+                units = self.plan_units([table_name for table_name in tables if table_name not in reused_tables])
+                checkpoint = Checkpoint(os.path.join(directory, CHECKPOINT_NAME),
+                                        dict(self.checkpoint_settings(), manifest=manifest, reused=reused,
+                                             units=units, done=[]))
+                checkpoint.save()
+            else:
+                manifest = checkpoint.state['manifest']
+                manifest['resumed'] = True
+                reused = checkpoint.state['reused']
+                removed = remove_partial_files(directory)
+                self.logger.info(f"Resuming {directory}: {len(checkpoint.items('done'))} of "
+                                 f"{len(checkpoint.state['units'])} files done, {removed} partial files removed")
+                self.logger.warning("The remaining files are read from a new snapshot, "
+                                    "which may not be consistent with the files already done")
+            self.checkpoint = checkpoint
+            done = {entry['file'] for entry in checkpoint.items('done')}
+            units = [unit for unit in checkpoint.state['units'] if unit['file'] not in done]
+            self.expect_rows(sorted({unit['table'] for unit in units}))
+            run_with_connections(workers, units,
+                                 lambda conn, unit: checkpoint.add('done', self.dump_unit(conn, unit, directory)))
+        finally:
+            if snapshot:
+                for conn in workers:
+                    conn.close()
+        order = {table_name: position for position, table_name in enumerate(tables)}
+        entries = sorted(checkpoint.items('done') + reused,
+                         key=lambda entry: (order.get(entry['table'], len(order)), entry.get('chunk') or 0))
+        manifest['tables'] = entries
+        write_manifest(directory, manifest)
+        checkpoint.remove()
+        return entries
+
+    def checkpoint_settings(self):
+        """
+        Describe the settings a per-table data backup must keep to be resumed.
+
+        :return: Dictionary of the settings recorded in the checkpoint.
+        """
+        return {'database': self.database, 'format': self.data_format, 'compress': self.compress,
+                'dedup': self.dedup, 'chunks': self.chunks, 'incremental': self.incremental}
+
+    def plan_incremental(self, workers, directory, tables, manifest):
+        """
+        Fingerprint the tables and pick the ones the previous backup still covers.
+
+        The fingerprints are computed on the snapshot worker connections, so
+        they describe exactly the rows the dump reads: a table reused by the
+        next run is one whose committed rows have not changed since this
+        backup's snapshot, even if it was written to while the dump ran.
+
+        :param workers: Worker connections inside their snapshot transactions.
+        :param directory: Directory of the new backup.
+        :param tables: Names of the tables to back up.
+        :param manifest: Manifest of the new backup, completed with the fingerprints and base.
+        :return: Dictionary mapping each unchanged table to its rebased manifest entries.
+        """
+        fingerprints = self.table_fingerprints(workers, tables)
+        manifest['fingerprints'] = fingerprints
+        manifest['base'] = None
+        base_dir, base_manifest = load_base_manifest(self.catalog, 'mysql', self.database, self.data_format,
+                                                     self.compress)
+        if base_dir is None:
+            self.logger.info("No previous backup with table fingerprints found, dumping all tables")
+            return {}
+        reused = reuse_unchanged(base_dir, base_manifest, directory, fingerprints)
+        manifest['base'] = os.path.basename(base_dir)
+        self.logger.info(f"Incremental backup on {base_dir}: {len(reused)} of {len(tables)} tables unchanged")
+        return reused
+
+    def table_fingerprints(self, workers, tables):
+        """
+        Compute a change fingerprint for every table with ``CHECKSUM TABLE``.
+
+        The checksum covers every row, so unlike ``UPDATE_TIME`` (lost on
+        restart) or row counts (blind to updates) it cannot miss a change. On
+        InnoDB it is computed with a consistent read, so run on a worker
+        connection it checksums the rows of the worker's snapshot. It costs a
+        read of each table, but nothing is serialized or written.
+
+        :param workers: Worker connections inside their snapshot transactions.
+        :param tables: Names of the tables to fingerprint.
+        :return: Dictionary mapping a table to its checksum, or None if it could not be computed.
+        """
+        def checksum_table(conn, table_name):
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"CHECKSUM TABLE `{table_name}`")
+                _, checksum = cursor.fetchone()
+            finally:
+                cursor.close()
+            return str(checksum) if checksum is not None else None
+
+        checksums = run_with_connections(workers, tables, checksum_table)
+        return dict(zip(tables, checksums))
+
+    def open_snapshot_workers(self, jobs):
+        """
+        Open worker connections that all read from the same consistent snapshot.
+
+        Every worker starts a ``WITH CONSISTENT SNAPSHOT`` transaction while a
+        global read lock is briefly held, so no write can land between them.
+
+        :param jobs: Number of worker connections to open.
+        :return: A list of connections inside their snapshot transactions.
+        """
+        workers = []
+        locked = False
+        try:
+            self.cursor.execute("FLUSH TABLES WITH READ LOCK")
+            locked = True
+        except mysql.connector.Error as err:
+            self.logger.warning(f"Could not take a global read lock, worker snapshots may differ: {err}")
+        try:
+            for _ in range(jobs):
+                conn = self.connect()
+                cursor = conn.cursor()
+                cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+                cursor.close()
+                workers.append(conn)
+        finally:
+            if locked:
+                self.cursor.execute("UNLOCK TABLES")
+        self.logger.info(f"Opened {jobs} snapshot worker connections")
+        return workers
+
+    def plan_units(self, tables):
+        """
+        Split the tables into dump units, one per table or per primary key range.
+
+        A table is split when ``chunks`` is above one, its estimated row count
+        reaches ``chunk_min_rows`` and it has a single-column integer primary key.
+
+        :param tables: Names of the tables to dump.
+        :return: A list of unit dictionaries with ``table``, ``file``, ``chunk`` and ``where`` keys.
+        """
+        extension = 'tsv' if self.data_format == 'tsv' else 'sql'
+        keys = {}
+        if self.chunks > 1:
+            schema = self.load_schema()
+            for table_name in tables:
+                primary_key = schema.primary_keys.get(table_name, [])
+                if len(primary_key) != 1 or schema.estimated_rows.get(table_name, 0) < self.chunk_min_rows:
+                    continue
+                data_types = {column['name']: column['data_type'] for column in schema.columns[table_name]}
+                if data_types[primary_key[0]] in INTEGER_TYPES:
+                    keys[table_name] = primary_key[0]
+        units = []
+        for table_name in tables:
+            predicates = [None]
+            if table_name in keys:
+                column = f"`{keys[table_name]}`"
+                self.cursor.execute(f"SELECT MIN({column}), MAX({column}) FROM {table_name}")
+                low, high = self.cursor.fetchone()
+                predicates = key_range_predicates(column, low, high, self.chunks)
+            if len(predicates) == 1:
+                units.append({'table': table_name, 'file': self.file_name(f'{table_name}.{extension}'),
+                              'chunk': None, 'where': None})
+                continue
+            self.logger.info(f"Splitting table {table_name} into {len(predicates)} chunks on {keys[table_name]}")
+            for chunk, where in enumerate(predicates):
+                units.append({'table': table_name,
+                              'file': self.file_name(f'{table_name}.{chunk:04d}.{extension}'),
+                              'chunk': chunk, 'where': where})
+        return units
+
+    def dump_unit(self, conn, unit, directory):
+        """
+        Dump one table, or one primary key range of it, into its own file.
+
+        :param conn: Connection to read the table with.
+        :param unit: Unit dictionary produced by ``plan_units``.
+        :param directory: Backup directory the file is written to.
+        :return: The manifest entry for the unit, with its row count, size, SHA-256 and, with ``checksums``, the
+            checksum of its rows.
+        """
+        table_name = unit['table']
+        file_name = unit['file']
+        path = os.path.join(directory, file_name)
+        digest = hashlib.sha256()
+        checksum = new_checksum(self.data_format) if self.checksums else None
+        with self.open_file(path, self.unit_mode(), digest) as f:
+            rows = self.write_unit(conn, unit, f, checksum)
+        self.logger.info(f"Table {table_name} dumped to {file_name} ({rows} rows)")
+        entry = dict(unit, rows=rows, size=os.path.getsize(path), sha256=digest.hexdigest())
+        if checksum is not None:
+            entry['checksum'] = checksum.hexdigest()
+        return entry
+
+    def unit_mode(self):
+        """
+        Tell how the file of a dump unit is opened.
+
+        :return: 'wb' for tab-delimited data, 'w' for INSERT statements.
+        """
+        return 'wb' if self.data_format == 'tsv' else 'w'
+
+    def write_unit(self, conn, unit, f, checksum=None):
+        """
+        Write the rows of one table, or one primary key range of it, in the backup format.
+
+        :param conn: Connection to read the table with.
+        :param unit: Unit dictionary produced by ``plan_units``.
+        :param f: File object opened with ``unit_mode``.
+        :param checksum: RowChecksum fed with the rows as they are written (optional).
+        :return: The number of rows written.
+        """
+        if self.data_format == 'tsv':
+            return self.write_table_tsv(unit['table'], f, conn, unit['where'], checksum)
+        return self.write_table_data(unit['table'], f, conn, unit['where'], checksum)
+
+    def table_ddl(self, table_name):
+        """
+        Return the pre-data CREATE statement of a table or view, from the bulk-loaded definitions.
+
+        :param table_name: Name of the table or view.
+        :return: The statement, terminated by a semicolon and a newline.
+        """
+        return self.load_schema().table_ddl(table_name)
+
+    def post_data_ddl(self, table_name):
+        """
+        Return the post-data statements of a table, from the bulk-loaded definitions.
+
+        :param table_name: Name of the table or view.
+        :return: The statements, each terminated by a semicolon and a newline.
+        """
+        return self.load_schema().post_data_ddl(table_name)
+
+    def file_name(self, name):
+        """
+        Add the compression or deduplication suffix to a backup file name.
+
+        :param name: File name without suffix.
+        :return: The file name the backup is written to.
+        """
+        return compressed_name(name, self.compress, self.dedup)
+
+    @contextmanager
+    def open_file(self, path, mode, digest=None):
+        """
+        Open a backup file for writing, compressing or deduplicating it if requested.
+
+        The file only appears under ``path`` once it has been written completely.
+
+        :param path: Path to the backup file, including any compression suffix.
+        :param mode: 'w' for text or 'wb' for binary.
+        :param digest: hashlib object fed with the bytes written to disk (optional).
+        :return: Context manager yielding a writable file object.
+        """
+        with atomic_output(path) as temporary, \
+                open_backup_file(temporary, mode, self.compress, self.compress_level, digest, self.chunk_store) as f:
+            yield f
+
+    def register_section(self, section, path, timestamp, files):
+        """
+        Record a finished backup section in the backup catalog.
+
+        The structure and data sections of a full backup are recorded under
+        the same catalog entry.
+
+        :param section: Section name ('structure' or 'data').
+        :param path: Path of the section's file or directory.
+        :param timestamp: Timestamp of the backup run.
+        :param files: Catalog entries of the files making up the section.
+        """
+        if self.backup_id is None:
+            self.backup_id = self.catalog.add_backup('mysql', self.database, timestamp, self.data_format,
+                                                     self.compress, 'running')
+        self.catalog.add_section(self.backup_id, section, path, files)
+        self.logger.info(f"Backup {self.backup_id} {section} section recorded in the catalog")
+
+    def write_table_tsv(self, table_name, f, conn=None, where=None, checksum=None):
+        """
+        Stream the rows of a single table into a tab-delimited file.
+
+        The file uses the default ``LOAD DATA`` conventions: fields separated by
+        tabs, rows by newlines, special characters escaped with a backslash and
+        NULL written as ``\\N``.
+
+        :param table_name: Name of the table to dump.
+        :param f: Binary file object the rows are written to.
+        :param conn: Connection to read the table with (defaults to the main connection).
+        :param where: Optional predicate restricting the rows to dump.
+        :param checksum: RowChecksum fed with the rows as they are written (optional).
+        :return: Number of rows written.
+        """
+        cursor = (conn or self.conn).cursor(buffered=False)
+        count = 0
+        try:
+            cursor.execute(f"SELECT * FROM {table_name}" + (f" WHERE {where}" if where else ""))
+            while True:
+                started = time.perf_counter()
+                rows = cursor.fetchmany(self.fetch_size)
+                fetched = time.perf_counter()
+                if not rows:
+                    break
+                data = b''.join([b'\t'.join([tsv_field(val) for val in row]) + b'\n' for row in rows])
+                if checksum is not None:
+                    checksum.update(data)
+                encoded = time.perf_counter()
+                f.write(data)
+                count += len(rows)
+                self.metrics.add(table_name, len(rows), len(data), fetched - started, encoded - fetched,
+                                 time.perf_counter() - encoded)
+                if self.throttle is not None:
+                    self.throttle.pace(len(rows), len(data))
+        finally:
+            cursor.close()
+        return count
+
+    def write_table_data(self, table_name, f, conn=None, where=None, checksum=None):
+        """
+        Stream the rows of a single table into an open backup file.
+
+        Rows are read through an unbuffered cursor in batches of ``fetch_size``,
+        so only one batch is held in memory regardless of the table size. Each
+        batch is encoded by a row encoder built from the column types of the
+        loaded schema and written at once.
+
+        :param table_name: Name of the table to dump.
+        :param f: File object the INSERT statements are written to.
+        :param conn: Connection to read the table with (defaults to the main connection).
+        :param where: Optional predicate restricting the rows to dump.
+        :param checksum: RowChecksum fed with the rows as they are written (optional).
+        :return: Number of rows written.
+        """
+        cursor = (conn or self.conn).cursor(buffered=False)
+        count = 0
+        try:
+            cursor.execute(f"SELECT * FROM {table_name}" + (f" WHERE {where}" if where else ""))
+            encode_rows = self.row_encoder(table_name, len(cursor.description))
+            while True:
+                started = time.perf_counter()
+                rows = cursor.fetchmany(self.fetch_size)
+                fetched = time.perf_counter()
+                if not rows:
+                    break
+                data = encode_rows(rows)
+                if checksum is not None:
+                    checksum.update(data)
+                encoded = time.perf_counter()
+                f.write(data)
+                count += len(rows)
+                self.metrics.add(table_name, len(rows), len(data), fetched - started, encoded - fetched,
+                                 time.perf_counter() - encoded)
+                if self.throttle is not None:
+                    self.throttle.pace(len(rows), len(data))
+        finally:
+            cursor.close()
+        return count
+
+    def row_encoder(self, table_name, width):
+        """
+        Build the row encoder of a table from the column types of the loaded schema.
+
+        :param table_name: Name of the table.
+        :param width: Number of columns the query returns.
+        :return: A function encoding a batch of rows as INSERT statements.
+        """
+        kinds = [COLUMN_KINDS.get(column['data_type'], 'other')
+                 for column in self.load_schema().columns.get(table_name, [])]
+        if len(kinds) != width:
+            # The table changed since the schema was loaded.
+            kinds = ['other'] * width
+        return build_insert_encoder(table_name, kinds, 'mysql')
+
     def backup_full(self):
         """
         Backup the full MySQL database (both structure and data).
         """
         self.logger.info("Starting full MySQL backup")
+        if self.archive:
+            self.backup_archive('full')
+            return
         self.backup_structure()
         self.backup_data()
 
-    def close(self):
+    def close(self, status='ok'):
         """
-        Close the MySQL connection and logger.
+        Close the MySQL connection and logger, and report the metrics of the run.
+
+        The JSON report goes to the log directory, next to the log, and the
+        Prometheus metrics to ``prometheus_dir`` when set.
+
+        :param status: Outcome of the run ('ok' or 'failed').
         """
+        report = self.metrics.finish(status, self.log_dir, self.prometheus_dir)
+        if self.backup_id is not None:
+            self.catalog.finish_backup(self.backup_id, 'complete' if status == 'ok' else 'failed')
+        if status != 'ok' and self.checkpoint is not None and os.path.exists(self.checkpoint.path):
+            self.logger.info(f"Progress kept in {self.checkpoint.path}; run the backup with --resume to continue it")
+        if self.throttle is not None:
+            self.logger.info(self.throttle.summary())
+        if self.probe_conn is not None:
+            self.probe_conn.close()
+        for line in summary_lines(report):
+            self.logger.info(line)
+        self.logger.info(f"Backup {status}: {report['rows']} rows, {report['bytes']} bytes in {report['seconds']}s "
+                         f"({report['rows_per_second']} rows/s)")
         self.cursor.close()
         self.conn.close()
+        self.catalog.close()
         self.logger.info("MySQL backup connection closed")
 
-def mysql_backup(host, user, password, backup_dir, log_dir, backup_type, database):
+def tsv_field(value):
+    """
+    Encode a single value for a ``LOAD DATA`` tab-delimited file.
+
+    :param value: Value returned by the MySQL cursor.
+    :return: The escaped field as bytes.
+    """
+    if value is None:
+        return b'\\N'
+    if isinstance(value, (bytes, bytearray)):
+        data = bytes(value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+    elif isinstance(value, set):
+        data = ','.join(sorted(value)).encode('utf-8')
+    elif isinstance(value, timedelta):
+        return format_interval(value, 'mysql').encode('utf-8')
+    else:
+        return str(value).encode('utf-8')
+    return (data.replace(b'\\', b'\\\\').replace(b'\t', b'\\t').replace(b'\n', b'\\n')
+            .replace(b'\r', b'\\r').replace(b'\0', b'\\0'))
+
+def mysql_backup(host, user, password, backup_dir, log_dir, backup_type, database, fetch_size=10000, data_format='insert',
+                 jobs=None, chunks=1, chunk_min_rows=1000000, compress=None, compress_level=None, incremental=False,
+                 dedup=False, archive=False, progress=False, prometheus_dir=None, max_rows_per_second=None,
+                 max_mib_per_second=None, max_lag=None, max_latency=None, lag_host=None, resume=False, pool=None,
+                 checksums=False):
     """
     Function to perform MySQL backup based on the specified backup type.
 
@@ -121,12 +845,39 @@ def mysql_backup(host, user, password, backup_dir, log_dir, backup_type, databas
     :param log_dir: Directory where log files will be stored.
     :param backup_type: Type of backup ('structure', 'data', 'full').
     :param database: Name of the MySQL database to backup.
+    :param fetch_size: Number of rows fetched per batch while streaming table data.
+    :param data_format: Format of the data backup ('insert' or 'tsv').
+    :param jobs: Number of tables dumped concurrently (None for a single-file backup).
+    :param chunks: Number of primary key ranges large tables are split into.
+    :param chunk_min_rows: Estimated row count above which a table is split into chunks.
+    :param compress: Codec backup files are compressed with ('gzip', 'zstd', 'lz4' or None).
+    :param compress_level: Compression level (codec default if None).
+    :param incremental: Reuse the files of the previous backup for tables that have not changed.
+    :param dedup: Store backup files as content-defined chunks in the shared chunk store.
+    :param archive: Write a single seekable archive with one section per table schema and data.
+    :param progress: Draw a live progress line with the throughput and ETA on standard error.
+    :param prometheus_dir: Directory of the Prometheus textfile collector the run metrics are written to (optional).
+    :param max_rows_per_second: Cap of the rows fetched per second over all workers (optional).
+    :param max_mib_per_second: Cap of the MiB of backup data produced per second over all workers (optional).
+    :param max_lag: Replication lag, in seconds, above which the data fetch slows down (optional).
+    :param max_latency: Latency of a probe query, in milliseconds, above which the data fetch slows down (optional).
+    :param lag_host: Replica whose ``SHOW REPLICA STATUS`` is probed for the lag (defaults to ``host``).
+    :param resume: Continue the latest per-table data backup a failed run left unfinished.
+    :param pool: Pool the database connections are borrowed from (optional).
+    :param checksums: Record a checksum of the rows of every file, for ``verify``; implies the per-table layout.
     """
-    backup = MySQLBackup(host, user, password, database, backup_dir, log_dir)
-    if backup_type == 'structure':
-        backup.backup_structure()
-    elif backup_type == 'data':
-        backup.backup_data()
-    elif backup_type == 'full':
-        backup.backup_full()
-    backup.close()
+    backup = MySQLBackup(host, user, password, database, backup_dir, log_dir, fetch_size, data_format, jobs, chunks,
+                         chunk_min_rows, compress, compress_level, incremental, dedup, archive, progress,
+                         prometheus_dir, max_rows_per_second, max_mib_per_second, max_lag, max_latency, lag_host,
+                         resume, pool, checksums)
+    status = 'failed'
+    try:
+        if backup_type == 'structure':
+            backup.backup_structure()
+        elif backup_type == 'data':
+            backup.backup_data()
+        elif backup_type == 'full':
+            backup.backup_full()
+        status = 'ok'
+    finally:
+        backup.close(status)
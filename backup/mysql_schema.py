@@ -0,0 +1,296 @@
+import mysql.connector
+
+
+def quote_ident(name):
+    """
+    Quote a MySQL identifier.
+
+    :param name: Identifier to quote.
+    :return: The identifier between backticks.
+    """
+    return '`' + name.replace('`', '``') + '`'
+
+
+def quote_string(value):
+    """
+    Quote a MySQL string literal.
+
+    :param value: String to quote.
+    :return: The escaped literal, including the quotes.
+    """
+    return "'" + value.replace('\\', '\\\\').replace("'", "''") + "'"
+
+
+class MySQLSchema:
+    """
+    Definitions of all tables of a MySQL database, loaded in a few bulk queries.
+
+    Tables, columns, indexes and constraints are read from
+    ``information_schema`` for the whole database at once, instead of one
+    ``SHOW CREATE TABLE`` round trip per table, and the CREATE TABLE statements
+    are rebuilt from them, leaving the secondary indexes and foreign keys to
+    post-data ALTER TABLE statements. Partitioned tables and views, whose
+    definition cannot be rebuilt that way, still go through
+    ``SHOW CREATE TABLE`` in one piece, as do all tables on servers too old
+    for the bulk queries.
+
+    Attributes:
+        tables (list): Names of the base tables, in name order.
+        views (list): Names of the views, in name order.
+        columns (dict): Table name to its columns, each a dictionary in ordinal order.
+        primary_keys (dict): Table name to the names of its primary key columns.
+        estimated_rows (dict): Table name to its estimated row count.
+    """
+    def __init__(self, cursor):
+        """
+        Load the definitions of all tables of the current database.
+
+        :param cursor: Cursor of a connection to the database.
+        """
+        self.cursor = cursor
+        self.tables = []
+        self.views = []
+        self.options = {}
+        self.columns = {}
+        self.primary_keys = {}
+        self.estimated_rows = {}
+        self.indexes = {}
+        self.foreign_keys = {}
+        self.checks = {}
+        self.bulk = True
+        self.load_tables()
+        try:
+            self.load_indexes()
+            self.load_foreign_keys()
+            self.load_checks()
+        except mysql.connector.Error:
+            # Servers before 8.0.16 lack some of the columns and views queried.
+            self.bulk = False
+
+    def load_tables(self):
+        """
+        Load the tables, views and columns.
+        """
+        self.cursor.execute(
+            "SELECT TABLE_NAME, TABLE_TYPE, ENGINE, TABLE_ROWS, AUTO_INCREMENT, TABLE_COLLATION, TABLE_COMMENT, "
+            "CREATE_OPTIONS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME"
+        )
+        for name, table_type, engine, rows, auto_increment, collation, comment, create_options in self.cursor.fetchall():
+            if table_type == 'VIEW':
+                self.views.append(name)
+                continue
+            self.tables.append(name)
+            self.estimated_rows[name] = rows or 0
+            self.options[name] = {'engine': engine, 'auto_increment': auto_increment, 'collation': collation,
+                                  'comment': comment, 'partitioned': 'partitioned' in (create_options or '')}
+        self.cursor.execute(
+            "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, DATA_TYPE, IS_NULLABLE, COLUMN_DEFAULT, EXTRA, "
+            "COLLATION_NAME, COLUMN_COMMENT, COLUMN_KEY, GENERATION_EXPRESSION FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, ORDINAL_POSITION"
+        )
+        for (table, name, column_type, data_type, nullable, default, extra, collation, comment, key,
+             expression) in self.cursor.fetchall():
+            self.columns.setdefault(table, []).append({
+                'name': name, 'type': column_type, 'data_type': data_type, 'nullable': nullable == 'YES',
+                'default': default, 'extra': extra or '', 'collation': collation, 'comment': comment,
+                'expression': expression,
+            })
+            if key == 'PRI':
+                self.primary_keys.setdefault(table, []).append(name)
+
+    def load_indexes(self):
+        """
+        Load the indexes, including the primary keys.
+        """
+        self.cursor.execute(
+            "SELECT TABLE_NAME, INDEX_NAME, NON_UNIQUE, COLUMN_NAME, SUB_PART, INDEX_TYPE, COLLATION, EXPRESSION "
+            "FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() "
+            "ORDER BY TABLE_NAME, INDEX_NAME = 'PRIMARY' DESC, INDEX_NAME, SEQ_IN_INDEX"
+        )
+        for table, name, non_unique, column, sub_part, index_type, collation, expression in self.cursor.fetchall():
+            indexes = self.indexes.setdefault(table, {})
+            index = indexes.setdefault(name, {'unique': not int(non_unique), 'type': index_type, 'parts': []})
+            part = f"({expression})" if column is None else quote_ident(column)
+            if sub_part:
+                part += f"({sub_part})"
+            if collation == 'D':
+                part += " DESC"
+            index['parts'].append(part)
+
+    def load_foreign_keys(self):
+        """
+        Load the foreign keys.
+        """
+        self.cursor.execute(
+            "SELECT k.TABLE_NAME, k.CONSTRAINT_NAME, k.COLUMN_NAME, NULLIF(k.REFERENCED_TABLE_SCHEMA, k.TABLE_SCHEMA), "
+            "k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME, r.UPDATE_RULE, r.DELETE_RULE "
+            "FROM information_schema.KEY_COLUMN_USAGE k "
+            "JOIN information_schema.REFERENTIAL_CONSTRAINTS r ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA "
+            "AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME AND r.TABLE_NAME = k.TABLE_NAME "
+            "WHERE k.TABLE_SCHEMA = DATABASE() AND k.REFERENCED_TABLE_NAME IS NOT NULL "
+            "ORDER BY k.TABLE_NAME, k.CONSTRAINT_NAME, k.ORDINAL_POSITION"
+        )
+        for (table, name, column, referenced_schema, referenced_table, referenced_column, update_rule,
+             delete_rule) in self.cursor.fetchall():
+            foreign_keys = self.foreign_keys.setdefault(table, {})
+            foreign_key = foreign_keys.setdefault(name, {
+                'columns': [], 'referenced_schema': referenced_schema, 'referenced_table': referenced_table,
+                'referenced_columns': [], 'update_rule': update_rule, 'delete_rule': delete_rule,
+            })
+            foreign_key['columns'].append(column)
+            foreign_key['referenced_columns'].append(referenced_column)
+
+    def load_checks(self):
+        """
+        Load the check constraints.
+        """
+        self.cursor.execute(
+            "SELECT t.TABLE_NAME, c.CONSTRAINT_NAME, c.CHECK_CLAUSE FROM information_schema.TABLE_CONSTRAINTS t "
+            "JOIN information_schema.CHECK_CONSTRAINTS c ON c.CONSTRAINT_SCHEMA = t.CONSTRAINT_SCHEMA "
+            "AND c.CONSTRAINT_NAME = t.CONSTRAINT_NAME "
+            "WHERE t.TABLE_SCHEMA = DATABASE() AND t.CONSTRAINT_TYPE = 'CHECK' ORDER BY t.TABLE_NAME, c.CONSTRAINT_NAME"
+        )
+        for table, name, clause in self.cursor.fetchall():
+            self.checks.setdefault(table, []).append((name, clause))
+
+    def rebuilt(self, table):
+        """
+        Tell whether the DDL of a table is rebuilt from the bulk-loaded definitions.
+
+        :param table: Name of the table or view.
+        :return: False for views, partitioned tables and on servers too old for the bulk queries.
+        """
+        return self.bulk and table in self.options and not self.options[table]['partitioned']
+
+    def split_indexes(self, table):
+        """
+        Split the indexes of a table into the ones created with it and the ones built after the data load.
+
+        The primary key stays in CREATE TABLE, as InnoDB stores the rows in
+        its order, and so does the first index on an AUTO_INCREMENT column,
+        which the column cannot be declared without.
+
+        :param table: Name of the table.
+        :return: Tuple ``(inline, deferred)`` of lists of ``(name, index)`` pairs.
+        """
+        auto_increment = [quote_ident(column['name']) for column in self.columns.get(table, [])
+                          if 'auto_increment' in column['extra']]
+        inline = []
+        deferred = []
+        for name, index in self.indexes.get(table, {}).items():
+            if name == 'PRIMARY' or (auto_increment and index['parts'][0] == auto_increment[0]):
+                inline.append((name, index))
+                auto_increment = []
+            else:
+                deferred.append((name, index))
+        return inline, deferred
+
+    def index_ddl(self, name, index):
+        """
+        Build the definition of a single index.
+
+        :param name: Name of the index.
+        :param index: Index dictionary loaded from ``information_schema.STATISTICS``.
+        :return: The index definition as it appears inside CREATE TABLE or after ALTER TABLE ADD.
+        """
+        parts = ','.join(index['parts'])
+        if name == 'PRIMARY':
+            return f"PRIMARY KEY ({parts})"
+        if index['type'] in ('FULLTEXT', 'SPATIAL'):
+            return f"{index['type']} KEY {quote_ident(name)} ({parts})"
+        return f"{'UNIQUE ' if index['unique'] else ''}KEY {quote_ident(name)} ({parts})"
+
+    def table_ddl(self, table):
+        """
+        Return the pre-data CREATE statement of a table or view.
+
+        A rebuilt table is created with its columns, primary key and check
+        constraints only; ``post_data_ddl`` holds the rest.
+
+        :param table: Name of the table or view.
+        :return: The statement, terminated by a semicolon and a newline.
+        """
+        if not self.rebuilt(table):
+            self.cursor.execute(f"SHOW CREATE TABLE {quote_ident(table)}")
+            return f"{self.cursor.fetchone()[1]};\n"
+        lines = [self.column_ddl(column) for column in self.columns.get(table, [])]
+        lines += [self.index_ddl(name, index) for name, index in self.split_indexes(table)[0]]
+        for name, clause in self.checks.get(table, []):
+            lines.append(f"CONSTRAINT {quote_ident(name)} CHECK ({clause})")
+        options = self.options[table]
+        table_options = f"ENGINE={options['engine']}"
+        if options['auto_increment']:
+            table_options += f" AUTO_INCREMENT={options['auto_increment']}"
+        if options['collation']:
+            table_options += f" DEFAULT CHARSET={options['collation'].split('_')[0]} COLLATE={options['collation']}"
+        if options['comment']:
+            table_options += f" COMMENT={quote_string(options['comment'])}"
+        body = ',\n  '.join(lines)
+        return f"CREATE TABLE {quote_ident(table)} (\n  {body}\n) {table_options};\n"
+
+    def post_data_ddl(self, table):
+        """
+        Return the post-data statements of a table, which the restore runs after loading the rows.
+
+        The secondary indexes are added by a single ALTER TABLE, so InnoDB
+        builds them all in one pass over the rows; FULLTEXT and SPATIAL
+        indexes, which it builds one at a time, get one statement each. The
+        foreign keys are added by a last ALTER TABLE.
+
+        :param table: Name of the table or view.
+        :return: The statements, each terminated by a semicolon and a newline; empty if the CREATE statement
+            already holds everything.
+        """
+        if not self.rebuilt(table):
+            return ''
+        quoted = quote_ident(table)
+        deferred = self.split_indexes(table)[1]
+        indexes = [self.index_ddl(name, index) for name, index in deferred
+                   if index['type'] not in ('FULLTEXT', 'SPATIAL')]
+        ddl = f"ALTER TABLE {quoted} ADD " + ", ADD ".join(indexes) + ";\n" if indexes else ''
+        ddl += ''.join([f"ALTER TABLE {quoted} ADD {self.index_ddl(name, index)};\n" for name, index in deferred
+                        if index['type'] in ('FULLTEXT', 'SPATIAL')])
+        foreign_keys = []
+        for name, foreign_key in self.foreign_keys.get(table, {}).items():
+            referenced = quote_ident(foreign_key['referenced_table'])
+            if foreign_key['referenced_schema']:
+                referenced = f"{quote_ident(foreign_key['referenced_schema'])}.{referenced}"
+            foreign_keys.append(
+                f"CONSTRAINT {quote_ident(name)} FOREIGN KEY ({','.join(map(quote_ident, foreign_key['columns']))}) "
+                f"REFERENCES {referenced} ({','.join(map(quote_ident, foreign_key['referenced_columns']))}) "
+                f"ON DELETE {foreign_key['delete_rule']} ON UPDATE {foreign_key['update_rule']}"
+            )
+        if foreign_keys:
+            ddl += f"ALTER TABLE {quoted} ADD " + ", ADD ".join(foreign_keys) + ";\n"
+        return ddl
+
+    def column_ddl(self, column):
+        """
+        Build the definition of a single column.
+
+        :param column: Column dictionary loaded from ``information_schema.COLUMNS``.
+        :return: The column definition as it appears inside CREATE TABLE.
+        """
+        extra = column['extra']
+        ddl = f"{quote_ident(column['name'])} {column['type']}"
+        if column['collation']:
+            ddl += f" COLLATE {column['collation']}"
+        if column['expression']:
+            ddl += f" GENERATED ALWAYS AS ({column['expression']}) {'STORED' if 'STORED' in extra else 'VIRTUAL'}"
+        if not column['nullable']:
+            ddl += " NOT NULL"
+        default = column['default']
+        if default is not None:
+            if default.upper().startswith('CURRENT_TIMESTAMP') or column['data_type'] == 'bit':
+                ddl += f" DEFAULT {default}"
+            elif 'DEFAULT_GENERATED' in extra:
+                ddl += f" DEFAULT ({default})"
+            else:
+                ddl += f" DEFAULT {quote_string(default)}"
+        if 'auto_increment' in extra:
+            ddl += " AUTO_INCREMENT"
+        if 'on update' in extra.lower():
+            ddl += " " + extra[extra.lower().index('on update'):].upper()
+        if column['comment']:
+            ddl += f" COMMENT {quote_string(column['comment'])}"
+        return ddl
@@ -0,0 +1,275 @@
+class PgSQLSchema:
+    """
+    Definitions of all tables of the public schema, loaded in a few bulk queries.
+
+    Columns, constraints, indexes, triggers, sequences and views are read
+    from ``pg_catalog`` for the whole schema at once, instead of querying
+    every table on its own, and the DDL of each table is rebuilt from them,
+    split into the pre-data statements creating the bare table and the
+    post-data statements building its indexes, constraints and triggers.
+    Identifiers are quoted by the server's ``quote_ident``. Requires
+    PostgreSQL 12 or later.
+
+    Attributes:
+        tables (list): Names of the tables, partitioned tables before their partitions.
+        views (list): Names of the views, in creation order.
+        partitioned (set): Names of the partitioned tables, which hold no rows themselves.
+        columns (dict): Table name to its columns, each a dictionary in ordinal order.
+        primary_keys (dict): Table name to the names of its primary key columns.
+        estimated_rows (dict): Table name to its estimated row count.
+    """
+    def __init__(self, cursor):
+        """
+        Load the definitions of all tables of the public schema.
+
+        :param cursor: Cursor of a connection to the database.
+        """
+        self.cursor = cursor
+        self.tables = []
+        self.views = []
+        self.partitioned = set()
+        self.relations = {}
+        self.columns = {}
+        self.primary_keys = {}
+        self.estimated_rows = {}
+        self.checks = {}
+        self.index_constraints = {}
+        self.foreign_keys = {}
+        self.indexes = {}
+        self.triggers = {}
+        self.sequences = []
+        self.load_relations()
+        self.load_columns()
+        self.load_constraints()
+        self.load_indexes()
+        self.load_triggers()
+        self.load_sequences()
+
+    def load_relations(self):
+        """
+        Load the tables and views.
+        """
+        self.cursor.execute(
+            "SELECT c.relname, quote_ident(c.relname), c.relkind, c.reltuples, "
+            "CASE WHEN c.relkind = 'p' THEN pg_get_partkeydef(c.oid) END, "
+            "CASE WHEN c.relispartition THEN pg_get_expr(c.relpartbound, c.oid) END, "
+            "(SELECT quote_ident(p.relname) FROM pg_inherits h JOIN pg_class p ON p.oid = h.inhparent "
+            "WHERE c.relispartition AND h.inhrelid = c.oid), "
+            "CASE WHEN c.relkind = 'v' THEN pg_get_viewdef(c.oid) END "
+            "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v') "
+            "ORDER BY c.relkind = 'v', c.relispartition, CASE WHEN c.relkind = 'v' THEN c.oid::int8 END, c.relname"
+        )
+        for name, quoted, kind, rows, partition_key, bound, parent, view in self.cursor.fetchall():
+            self.relations[name] = {'quoted': quoted, 'partition_key': partition_key, 'bound': bound,
+                                    'parent': parent, 'view': view}
+            if kind == 'v':
+                self.views.append(name)
+                continue
+            self.tables.append(name)
+            self.estimated_rows[name] = max(int(rows), 0)
+            if kind == 'p':
+                self.partitioned.add(name)
+
+    def load_columns(self):
+        """
+        Load the columns of all tables.
+        """
+        self.cursor.execute(
+            "SELECT c.relname, a.attname, quote_ident(a.attname), format_type(a.atttypid, a.atttypmod), "
+            "a.atttypid, a.attnotnull, pg_get_expr(d.adbin, d.adrelid), a.attidentity, a.attgenerated, "
+            "CASE WHEN a.attcollation <> t.typcollation THEN quote_ident(co.collname) END "
+            "FROM pg_attribute a "
+            "JOIN pg_class c ON c.oid = a.attrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "JOIN pg_type t ON t.oid = a.atttypid "
+            "LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum "
+            "LEFT JOIN pg_collation co ON co.oid = a.attcollation "
+            "WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p') AND a.attnum > 0 AND NOT a.attisdropped "
+            "ORDER BY c.relname, a.attnum"
+        )
+        for (table, name, quoted, column_type, type_oid, not_null, default, identity, generated,
+             collation) in self.cursor.fetchall():
+            self.columns.setdefault(table, []).append({
+                'name': name, 'quoted': quoted, 'type': column_type, 'type_oid': type_oid, 'not_null': not_null,
+                'default': default, 'identity': identity, 'generated': generated, 'collation': collation,
+            })
+
+    def load_constraints(self):
+        """
+        Load the constraints declared on the tables themselves, not inherited from a partitioned table.
+        """
+        self.cursor.execute(
+            "SELECT c.relname, quote_ident(con.conname), con.contype, pg_get_constraintdef(con.oid), "
+            "ARRAY(SELECT a.attname::text FROM unnest(con.conkey) WITH ORDINALITY k(attnum, position) "
+            "JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum ORDER BY k.position) "
+            "FROM pg_constraint con "
+            "JOIN pg_class c ON c.oid = con.conrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = 'public' AND con.contype IN ('p', 'u', 'c', 'x', 'f') "
+            "AND con.conparentid = 0 AND con.conislocal "
+            "ORDER BY c.relname, con.contype, con.conname"
+        )
+        for table, name, kind, definition, columns in self.cursor.fetchall():
+            if kind == 'f':
+                self.foreign_keys.setdefault(table, []).append((name, definition))
+            elif kind == 'c':
+                self.checks.setdefault(table, []).append((name, definition))
+            else:
+                self.index_constraints.setdefault(table, []).append((name, definition))
+            if kind == 'p':
+                self.primary_keys[table] = columns
+
+    def load_indexes(self):
+        """
+        Load the indexes not backing a constraint nor inherited from a partitioned table.
+        """
+        self.cursor.execute(
+            "SELECT c.relname, pg_get_indexdef(i.indexrelid) "
+            "FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indrelid "
+            "JOIN pg_class ic ON ic.oid = i.indexrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p') "
+            "AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = i.indexrelid "
+            "AND con.contype IN ('p', 'u', 'x')) "
+            "AND NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhrelid = i.indexrelid) "
+            "ORDER BY c.relname, ic.relname"
+        )
+        for table, definition in self.cursor.fetchall():
+            self.indexes.setdefault(table, []).append(definition)
+
+    def load_triggers(self):
+        """
+        Load the triggers, except internal ones and the clones of a partitioned table's triggers.
+        """
+        self.cursor.execute(
+            "SELECT c.relname, pg_get_triggerdef(t.oid) "
+            "FROM pg_trigger t "
+            "JOIN pg_class c ON c.oid = t.tgrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p') AND NOT t.tgisinternal "
+            "AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.classid = 'pg_trigger'::regclass "
+            "AND d.objid = t.oid AND d.deptype = 'P') "
+            "ORDER BY c.relname, t.tgname"
+        )
+        for table, definition in self.cursor.fetchall():
+            self.triggers.setdefault(table, []).append(definition)
+
+    def load_sequences(self):
+        """
+        Load the sequences, except the ones backing identity columns.
+        """
+        self.cursor.execute(
+            "SELECT quote_ident(c.relname), format_type(s.seqtypid, NULL), s.seqstart, s.seqincrement, s.seqmin, "
+            "s.seqmax, s.seqcache, s.seqcycle, t.relname, quote_ident(t.relname), quote_ident(a.attname) "
+            "FROM pg_sequence s "
+            "JOIN pg_class c ON c.oid = s.seqrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "LEFT JOIN pg_depend d ON d.classid = 'pg_class'::regclass AND d.objid = c.oid "
+            "AND d.refclassid = 'pg_class'::regclass AND d.deptype = 'a' "
+            "LEFT JOIN pg_class t ON t.oid = d.refobjid "
+            "LEFT JOIN pg_attribute a ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid "
+            "WHERE n.nspname = 'public' AND NOT EXISTS (SELECT 1 FROM pg_depend i "
+            "WHERE i.classid = 'pg_class'::regclass AND i.objid = c.oid AND i.deptype = 'i') "
+            "ORDER BY c.relname"
+        )
+        for (quoted, sequence_type, start, increment, minimum, maximum, cache, cycle, table, quoted_table,
+             column) in self.cursor.fetchall():
+            self.sequences.append({
+                'quoted': quoted, 'table': table,
+                'owner': f"{quoted_table}.{column}" if table else None,
+                'ddl': f"CREATE SEQUENCE IF NOT EXISTS {quoted} AS {sequence_type} INCREMENT BY {increment} "
+                       f"MINVALUE {minimum} MAXVALUE {maximum} START WITH {start} CACHE {cache}"
+                       f"{' CYCLE' if cycle else ''};\n",
+            })
+
+    def data_tables(self):
+        """
+        List the tables holding rows, leaving out partitioned tables whose rows live in their partitions.
+
+        :return: A list of table names.
+        """
+        return [table for table in self.tables if table not in self.partitioned]
+
+    def table_sequences(self, table):
+        """
+        List the sequences a table needs: those it owns and those its column defaults draw from.
+
+        :param table: Name of the table.
+        :return: A list of sequence dictionaries.
+        """
+        defaults = [column['default'] for column in self.columns.get(table, []) if column['default']]
+        return [sequence for sequence in self.sequences
+                if sequence['table'] == table
+                or any(f"nextval('{sequence['quoted']}'" in default for default in defaults)]
+
+    def table_ddl(self, table):
+        """
+        Return the pre-data statements creating a table or view.
+
+        A table's statements are self-contained: the sequences it uses, the
+        table with its check constraints and the ownership of its sequences.
+        Sequences are created with IF NOT EXISTS as several tables may share
+        one. Sequence ownership is an ALTER statement, which the restore runs
+        once every table exists.
+
+        :param table: Name of the table or view.
+        :return: The statements, each terminated by a semicolon and a newline.
+        """
+        relation = self.relations[table]
+        if relation['view'] is not None:
+            return f"CREATE VIEW {relation['quoted']} AS\n{relation['view'].strip().rstrip(';')};\n"
+        sequences = self.table_sequences(table)
+        ddl = ''.join([sequence['ddl'] for sequence in sequences])
+        if relation['parent']:
+            ddl += f"CREATE TABLE {relation['quoted']} PARTITION OF {relation['parent']} {relation['bound']};\n"
+        else:
+            lines = [self.column_ddl(column) for column in self.columns.get(table, [])]
+            lines += [f"    CONSTRAINT {name} {definition}" for name, definition in self.checks.get(table, [])]
+            partition_by = f" PARTITION BY {relation['partition_key']}" if relation['partition_key'] else ""
+            ddl += f"CREATE TABLE {relation['quoted']} (\n" + ",\n".join(lines) + f"\n){partition_by};\n"
+        ddl += ''.join([f"ALTER SEQUENCE {sequence['quoted']} OWNED BY {sequence['owner']};\n"
+                        for sequence in sequences if sequence['table'] == table])
+        return ddl
+
+    def post_data_ddl(self, table):
+        """
+        Return the post-data statements of a table, which the restore runs after loading the rows.
+
+        Building an index once over all rows is much cheaper than maintaining
+        it row by row, and a foreign key is then validated in one join. The
+        statements come in build order: the primary key, unique and exclusion
+        constraints, the other indexes, the foreign keys and the triggers.
+
+        :param table: Name of the table or view.
+        :return: The statements, each terminated by a semicolon and a newline; empty for a view.
+        """
+        quoted = self.relations[table]['quoted']
+        ddl = ''.join([f"ALTER TABLE {quoted} ADD CONSTRAINT {name} {definition};\n"
+                       for name, definition in self.index_constraints.get(table, [])])
+        ddl += ''.join([f"{definition};\n" for definition in self.indexes.get(table, [])])
+        ddl += ''.join([f"ALTER TABLE {quoted} ADD CONSTRAINT {name} {definition};\n"
+                        for name, definition in self.foreign_keys.get(table, [])])
+        ddl += ''.join([f"{definition};\n" for definition in self.triggers.get(table, [])])
+        return ddl
+
+    def column_ddl(self, column):
+        """
+        Build the definition of a single column.
+
+        :param column: Column dictionary loaded from ``pg_attribute``.
+        :return: The column definition as it appears inside CREATE TABLE.
+        """
+        ddl = f"    {column['quoted']} {column['type']}"
+        if column['collation']:
+            ddl += f" COLLATE {column['collation']}"
+        if column['identity']:
+            ddl += f" GENERATED {'ALWAYS' if column['identity'] == 'a' else 'BY DEFAULT'} AS IDENTITY"
+        elif column['generated']:
+            ddl += f" GENERATED ALWAYS AS ({column['default']}) STORED"
+        elif column['default'] is not None:
+            ddl += f" DEFAULT {column['default']}"
+        if column['not_null']:
+            ddl += " NOT NULL"
+        return ddl
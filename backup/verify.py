@@ -0,0 +1,217 @@
+import logging
+import os
+import shutil
+import tempfile
+from backup.mysql_backup import MySQLBackup
+from backup.pgsql_backup import PgSQLBackup
+from common.catalog import BackupCatalog
+from common.checksum import new_checksum
+from common.log import add_file_handler
+from common.manifest import read_manifest, select_tables
+from common.metrics import ProgressLine, RunMetrics
+from common.parallel import run_with_connections
+
+
+class NullWriter:
+    """
+    File-like object discarding everything written to it; verification only keeps the checksums.
+    """
+    def write(self, data):
+        return len(data)
+
+
+class BackupVerifier:
+    """
+    A class to check a restored database against the row checksums recorded by a backup.
+
+    A backup taken with ``checksums`` records, for every file of its
+    per-table data directory, an order-independent checksum of the rows as
+    they were written. The verifier reads every table, or primary key range,
+    of the restored database back through the same dump code and format,
+    feeding a checksum instead of a file, and compares the checksums and row
+    counts. Nothing is encoded to disk or compressed, and with more than one
+    job the files are checked concurrently over their own connections.
+
+    Attributes:
+        reader (MySQLBackup or PgSQLBackup): Backup connected to the restored database, in the format of the backup.
+        db_type (str): Type of the database ('mysql' or 'pgsql').
+        manifest (dict): Manifest of the data backup holding the checksums.
+        log_dir (str): Directory where log files will be stored.
+        jobs (int): Number of files checked concurrently (optional).
+    """
+    def __init__(self, reader, db_type, manifest, log_dir, jobs=None):
+        """
+        Initialize the BackupVerifier class.
+
+        :param reader: MySQLBackup or PgSQLBackup connected to the restored database.
+        :param db_type: Type of the database ('mysql' or 'pgsql').
+        :param manifest: Manifest of the data backup holding the checksums.
+        :param log_dir: Directory where log files will be stored.
+        :param jobs: Number of files checked concurrently (optional).
+        """
+        self.reader = reader
+        self.db_type = db_type
+        self.manifest = manifest
+        self.log_dir = log_dir
+        self.jobs = jobs
+        self.setup_logging()
+
+    def setup_logging(self):
+        """
+        Set up logging for the verification.
+        """
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
+
+        formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
+        self.logger = logging.getLogger('verify')
+        self.logger.setLevel(logging.INFO)
+        add_file_handler(self.logger, os.path.join(self.log_dir, 'verify.log'), formatter)
+
+    def verify(self, tables=None):
+        """
+        Check every file of the backup that has a checksum.
+
+        :param tables: Names of the tables to check (all tables if None).
+        :return: A list of result dictionaries, one per file, in manifest order.
+        :raises ValueError: If a requested table is not in the backup, or no file has a checksum.
+        """
+        entries = select_tables(self.manifest['tables'], tables)
+        checked = [entry for entry in entries if entry.get('checksum')]
+        if not checked:
+            raise ValueError("The backup has no row checksums; take it with --checksums to verify restores of it")
+        skipped = sorted({entry['table'] for entry in entries if not entry.get('checksum')})
+        if skipped:
+            self.logger.warning(f"No checksums recorded for {', '.join(skipped)}; these tables are not checked")
+        self.reader.metrics.expect(sum([entry.get('rows') or 0 for entry in checked]))
+        jobs = min(self.jobs or 1, len(checked))
+        workers = [self.reader.connect() for _ in range(jobs)] if jobs > 1 else [self.reader.conn]
+        self.logger.info(f"Verifying {len(checked)} files of {len({entry['table'] for entry in checked})} tables "
+                         f"over {jobs} connections")
+        try:
+            results = run_with_connections(workers, checked, self.verify_unit)
+        finally:
+            if jobs > 1:
+                for conn in workers:
+                    conn.close()
+        differences = [result for result in results if result['status'] != 'ok']
+        self.logger.info(f"Verification done: {len(differences)} of {len(results)} files differ")
+        return results
+
+    def verify_unit(self, conn, entry):
+        """
+        Recompute the checksum of one file from the restored database and compare it with the backup.
+
+        :param conn: Connection to the restored database.
+        :param entry: Manifest entry of the file.
+        :return: Dictionary with the ``table``, ``file``, ``chunk``, expected and actual ``rows`` and ``checksum``,
+            and a ``status`` of 'ok' or 'differs'.
+        """
+        checksum = new_checksum(self.reader.data_format)
+        rows = self.reader.write_unit(conn, dict(entry, where=entry.get('where')), NullWriter(), checksum)
+        result = {'table': entry['table'], 'file': entry['file'], 'chunk': entry.get('chunk'),
+                  'expected_rows': entry.get('rows'), 'rows': rows, 'expected_checksum': entry['checksum'],
+                  'checksum': checksum.hexdigest()}
+        same = result['checksum'] == result['expected_checksum'] and rows == result['expected_rows']
+        result['status'] = 'ok' if same else 'differs'
+        if not same:
+            self.logger.warning(f"{describe_unit(result)} differs: {rows} rows, {result['expected_rows']} in the "
+                                f"backup, checksum {result['checksum']} instead of {result['expected_checksum']}")
+        return result
+
+
+def describe_unit(result):
+    """
+    Name the table, or primary key range, a verification result is about.
+
+    :param result: Result dictionary returned by ``BackupVerifier.verify_unit``.
+    :return: A short description such as ``orders chunk 3 (orders.0003.sql)``.
+    """
+    chunk = f" chunk {result['chunk']}" if result['chunk'] is not None else ""
+    return f"{result['table']}{chunk} ({result['file']})"
+
+
+def format_differences(results):
+    """
+    Format the outcome of a verification as text, listing only the files that differ.
+
+    :param results: Results returned by ``BackupVerifier.verify``.
+    :return: The report, one line per differing file followed by a summary line.
+    """
+    lines = []
+    for result in results:
+        if result['status'] != 'ok':
+            lines.append(f"DIFFERS {describe_unit(result)}: {result['rows']} rows "
+                         f"(backup: {result['expected_rows']}), checksum {result['checksum']} "
+                         f"(backup: {result['expected_checksum']})")
+    differing = len(lines)
+    tables = len({result['table'] for result in results})
+    lines.append(f"{len(results) - differing} of {len(results)} files of {tables} tables match the backup")
+    return "\n".join(lines)
+
+
+def find_data_manifest(backup_dir, db_type, backup_id=None):
+    """
+    Read the manifest of the latest completed data backup of a database type, or of a given backup.
+
+    :param backup_dir: Directory holding the backups and their catalog.
+    :param db_type: Type of the database ('mysql' or 'pgsql').
+    :param backup_id: Catalog id of the backup (latest if None).
+    :return: Tuple of the backup id and the manifest.
+    :raises ValueError: If there is no such backup or it is not a per-table data backup.
+    """
+    catalog = BackupCatalog(backup_dir)
+    try:
+        backup = catalog.find(db_type, 'data', backup_id)
+    finally:
+        catalog.close()
+    if backup is None:
+        raise ValueError(f"No completed {db_type} data backup" + (f" with id {backup_id}" if backup_id else "")
+                         + " in the catalog")
+    if not os.path.isdir(backup['path']):
+        raise ValueError(f"Backup {backup['id']} is not a per-table data backup and has no row checksums")
+    return backup['id'], read_manifest(backup['path'])
+
+
+def verify_database(db_type, host, user, password, backup_dir, log_dir, database, backup_id=None, tables=None,
+                    jobs=None, fetch_size=10000, progress=False, prometheus_dir=None, backup_class=None):
+    """
+    Function to check a restored database against the row checksums of a backup.
+
+    The backup classes read the restored database, but their catalog lives in
+    a temporary directory removed at the end, so verifying never registers a
+    backup. The throughput of the run is reported as a 'verify' run.
+
+    :param db_type: Type of the database ('mysql' or 'pgsql').
+    :param host: Host of the restored database.
+    :param user: User name.
+    :param password: Password.
+    :param backup_dir: Directory holding the backups and their catalog.
+    :param log_dir: Directory where log files will be stored.
+    :param database: Name of the restored database.
+    :param backup_id: Catalog id of the backup the database was restored from (latest if None).
+    :param tables: Names of the tables to check (all tables if None).
+    :param jobs: Number of files checked concurrently (optional).
+    :param fetch_size: Number of rows fetched per batch.
+    :param progress: Draw a live progress line with the throughput and ETA on standard error.
+    :param prometheus_dir: Directory of the Prometheus textfile collector the run metrics are written to (optional).
+    :param backup_class: Backup class reading the database (the one of ``db_type`` if None).
+    :return: Tuple of the backup id and the results of ``BackupVerifier.verify``.
+    :raises ValueError: If the backup cannot be verified against.
+    """
+    backup_id, manifest = find_data_manifest(backup_dir, db_type, backup_id)
+    backup_class = backup_class or (MySQLBackup if db_type == 'mysql' else PgSQLBackup)
+    work_dir = tempfile.mkdtemp(prefix='verify_')
+    try:
+        reader = backup_class(host, user, password, database, work_dir, log_dir, fetch_size, manifest['format'],
+                              prometheus_dir=prometheus_dir)
+        reader.metrics = RunMetrics('verify', db_type, database, ProgressLine() if progress else None, host)
+        status = 'failed'
+        try:
+            results = BackupVerifier(reader, db_type, manifest, log_dir, jobs).verify(tables)
+            status = 'ok'
+        finally:
+            reader.close(status)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return backup_id, results
@@ -0,0 +1,58 @@
+from backup.mysql_backup import MySQLBackup
+from backup.pgsql_backup import PgSQLBackup
+from benchmarks.synthetic import synthetic_class
+from restore.mysql_restore import MySQLRestore
+from restore.pgsql_restore import PgSQLRestore
+
+BACKUP_CLASSES = {'mysql': MySQLBackup, 'pgsql': PgSQLBackup}
+RESTORE_CLASSES = {'mysql': MySQLRestore, 'pgsql': PgSQLRestore}
+
+
+def synthetic_backup(database, backup_dir, log_dir, name='benchmark', backup_class=None, **options):
+    """
+    Create a backup of a synthetic database.
+
+    :param database: SyntheticDatabase to back up.
+    :param backup_dir: Directory where backups will be stored.
+    :param log_dir: Directory where log files will be stored.
+    :param name: Name of the database to back up.
+    :param backup_class: Backup class to derive from (the one of the database's dialect if None).
+    :param options: Keyword arguments of the backup class.
+    :return: A MySQLBackup or PgSQLBackup connected to the synthetic database.
+    """
+    cls = synthetic_class(backup_class or BACKUP_CLASSES[database.dialect], database)
+    return cls('synthetic', 'benchmark', None, name, backup_dir, log_dir, **options)
+
+
+def synthetic_restore(database, backup_dir, log_dir, new_database='restored', restore_class=None, **options):
+    """
+    Create a restore into a synthetic database.
+
+    :param database: SyntheticDatabase to restore into.
+    :param backup_dir: Directory holding the backups.
+    :param log_dir: Directory where log files will be stored.
+    :param new_database: Name of the database to restore into.
+    :param restore_class: Restore class to derive from (the one of the database's dialect if None).
+    :param options: Keyword arguments of the restore class.
+    :return: A MySQLRestore or PgSQLRestore connected to the synthetic database.
+    """
+    cls = synthetic_class(restore_class or RESTORE_CLASSES[database.dialect], database)
+    return cls('synthetic', 'benchmark', None, backup_dir, log_dir, new_database, **options)
+
+
+def run_and_close(runner, run):
+    """
+    Run a backup or restore method, then close the runner with the outcome of the run.
+
+    :param runner: Backup or restore to close.
+    :param run: Callable running the operation, such as ``runner.backup_data``.
+    :return: The result of ``run``.
+    """
+    status = 'failed'
+    try:
+        result = run()
+        status = 'ok'
+    finally:
+        runner.close(status)
+    return result
+
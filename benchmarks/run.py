@@ -0,0 +1,63 @@
+import json
+import click
+from benchmarks.suite import (BASELINE_PATH, CASES, DEFAULT_WORKLOAD, baseline_mismatch, compare, format_results,
+                              load_baseline, run_suite, save_baseline)
+from benchmarks.synthetic import COLUMN_TYPES
+from common.metrics import write_atomically
+
+@click.command()
+@click.option('--case', 'cases', multiple=True, type=click.Choice(list(CASES)), help='Only run this case (repeatable). Defaults to every case.')
+@click.option('--tables', type=click.IntRange(min=1), default=DEFAULT_WORKLOAD['tables'], show_default=True, help='Number of synthetic tables.')
+@click.option('--rows', type=click.IntRange(min=0), default=DEFAULT_WORKLOAD['rows'], show_default=True, help='Number of rows per table.')
+@click.option('--columns', default=','.join(DEFAULT_WORKLOAD['columns']), show_default=True, help=f"Comma-separated kinds of the columns after the id: {', '.join(COLUMN_TYPES)}.")
+@click.option('--value-size', type=click.IntRange(min=1), default=DEFAULT_WORKLOAD['value_size'], show_default=True, help='Length of the text, binary and JSON values.')
+@click.option('--null-fraction', type=click.FloatRange(0, 1), default=DEFAULT_WORKLOAD['null_fraction'], show_default=True, help='Share of NULL values.')
+@click.option('--repeat', type=click.IntRange(min=1), default=1, show_default=True, help='Run every case N times and keep the fastest run.')
+@click.option('--baseline', type=click.Path(dir_okay=False), default=BASELINE_PATH, show_default=True, help='Baseline file the results are compared with.')
+@click.option('--update-baseline', is_flag=True, help='Store the results as the new baseline instead of comparing them.')
+@click.option('--tolerance', type=click.FloatRange(min=0), default=0.2, show_default=True, help='Relative slowdown or memory growth reported as a regression.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Write the results to this JSON file.')
+def main(cases, tables, rows, columns, value_size, null_fraction, repeat, baseline, update_baseline, tolerance, output):
+    """
+    Benchmark the backup and restore paths offline, against synthetic databases.
+
+    :param cases: Names of the cases to run (all cases if empty).
+    :param tables: Number of synthetic tables.
+    :param rows: Number of rows per table.
+    :param columns: Comma-separated kinds of the columns after the id.
+    :param value_size: Length of the text, binary and JSON values.
+    :param null_fraction: Share of NULL values.
+    :param repeat: Number of runs of every case; the fastest one is kept.
+    :param baseline: Path to the baseline file.
+    :param update_baseline: Flag to store the results as the new baseline.
+    :param tolerance: Relative slowdown or memory growth reported as a regression.
+    :param output: Path the JSON results are written to (optional).
+    """
+    workload = {'tables': tables, 'rows': rows,
+                'columns': [kind.strip() for kind in columns.split(',') if kind.strip()],
+                'value_size': value_size, 'null_fraction': null_fraction}
+    unknown = [kind for kind in workload['columns'] if kind not in COLUMN_TYPES]
+    if unknown or not workload['columns']:
+        raise click.UsageError(f"--columns takes a list of {', '.join(COLUMN_TYPES)}.")
+    results = run_suite(list(cases or CASES), workload, repeat, click.echo)
+    if output:
+        write_atomically(output, json.dumps({'workload': workload, 'results': results}, indent=2) + "\n")
+    stored = load_baseline(baseline)
+    if update_baseline:
+        save_baseline(baseline, workload, results, stored)
+        click.echo(format_results(results))
+        click.echo(f"Baseline written to {baseline}")
+        return
+    comparisons = []
+    if stored is None:
+        click.echo(f"No baseline at {baseline}; run with --update-baseline to store one.")
+    elif baseline_mismatch(stored, workload):
+        click.echo(f"Results are not compared: {baseline_mismatch(stored, workload)}.")
+    else:
+        comparisons = compare(results, stored, tolerance)
+    click.echo(format_results(results, comparisons))
+    if any(comparison['regression'] for comparison in comparisons):
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
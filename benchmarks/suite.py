@@ -0,0 +1,325 @@
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks.fixtures import run_and_close, synthetic_backup, synthetic_restore
+from benchmarks.synthetic import DEFAULT_COLUMNS, SyntheticDatabase
+from common.catalog import CATALOG_NAME
+from common.metrics import write_atomically
+
+# Baseline the results are compared against, kept next to the suite.
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+OPERATIONS = ('backup', 'restore')
+
+DEFAULT_WORKLOAD = {
+    'tables': 4,
+    'rows': 20000,
+    'columns': list(DEFAULT_COLUMNS),
+    'value_size': 32,
+    'null_fraction': 0.05,
+}
+
+# Backup and restore paths measured, each a full backup followed by a full
+# restore of its output. Restores run with as many jobs as the backup.
+CASES = OrderedDict([
+    ('mysql-insert', {'db_type': 'mysql', 'format': 'insert'}),
+    ('mysql-insert-fast', {'db_type': 'mysql', 'format': 'insert', 'fast': True}),
+    ('mysql-tsv', {'db_type': 'mysql', 'format': 'tsv'}),
+    ('mysql-tsv-jobs4', {'db_type': 'mysql', 'format': 'tsv', 'jobs': 4}),
+    ('mysql-tsv-gzip', {'db_type': 'mysql', 'format': 'tsv', 'compress': 'gzip'}),
+    ('mysql-insert-archive', {'db_type': 'mysql', 'format': 'insert', 'archive': True}),
+    ('pgsql-insert', {'db_type': 'pgsql', 'format': 'insert'}),
+    ('pgsql-copy', {'db_type': 'pgsql', 'format': 'copy'}),
+    ('pgsql-copy-binary', {'db_type': 'pgsql', 'format': 'copy-binary'}),
+    ('pgsql-copy-jobs4', {'db_type': 'pgsql', 'format': 'copy', 'jobs': 4}),
+    ('pgsql-copy-gzip', {'db_type': 'pgsql', 'format': 'copy', 'compress': 'gzip'}),
+    ('pgsql-copy-archive', {'db_type': 'pgsql', 'format': 'copy', 'archive': True}),
+])
+
+# Seconds every measured operation runs for at least, repeating it over the same workload if needed.
+MIN_SECONDS = 1.0
+
+# Metrics compared with the baseline, and whether a higher value is better.
+COMPARED_METRICS = (('rows_per_second', True), ('peak_rss_mib', False))
+
+
+def peak_rss_mib():
+    """
+    Measure the peak resident set size of the current process.
+
+    :return: The peak RSS in MiB.
+    """
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes, macOS bytes.
+    return round(peak / (1048576 if sys.platform == 'darwin' else 1024), 1)
+
+
+def backup_size(backup_dir):
+    """
+    Add up the size of the backup files of a backup directory, leaving out the catalog.
+
+    :param backup_dir: The backup directory.
+    :return: The size in bytes.
+    """
+    size = 0
+    for directory, _, files in os.walk(backup_dir):
+        size += sum([os.path.getsize(os.path.join(directory, name)) for name in files
+                     if not name.startswith(CATALOG_NAME)])
+    return size
+
+
+def run_operation(name, operation, workload, directory, min_seconds=MIN_SECONDS):
+    """
+    Run the backup or restore of a case against a synthetic database, in this process.
+
+    The restore reads the backup a previous ``run_operation`` of the same case
+    left in ``directory``. The operation is run again until it has taken
+    ``min_seconds`` in total, so fast cases are not measured on a few
+    milliseconds of timer noise; every round processes the whole workload.
+    Later backup rounds write to their own directory, removed afterwards.
+
+    :param name: Name of the case, a key of ``CASES``.
+    :param operation: 'backup' or 'restore'.
+    :param workload: Tables to generate: keyword arguments of ``SyntheticDatabase``.
+    :param directory: Working directory holding the backup and the logs.
+    :param min_seconds: Time the rounds of the operation must add up to.
+    :return: Dictionary with the rounds run, the rows processed, the seconds taken, the rows per second, the size
+        of the backup and the MiB of it processed per second.
+    :raises RuntimeError: If a round did not process every generated row.
+    """
+    case = CASES[name]
+    database = SyntheticDatabase(case['db_type'], **workload)
+    backup_dir = os.path.join(directory, 'backups')
+    log_dir = os.path.join(directory, 'logs')
+    rounds = 0
+    rows = 0
+    started = time.perf_counter()
+    while not rounds or time.perf_counter() - started < min_seconds:
+        target_dir = backup_dir if operation == 'restore' or not rounds else f"{backup_dir}.{rounds}"
+        processed = run_round(case, operation, database, target_dir, log_dir)
+        if processed != database.total_rows:
+            raise RuntimeError(f"{name} {operation} processed {processed} rows instead of {database.total_rows}")
+        if target_dir != backup_dir:
+            shutil.rmtree(target_dir)
+        rounds += 1
+        rows += processed
+    seconds = time.perf_counter() - started
+    size = backup_size(backup_dir)
+    return {
+        'rounds': rounds, 'rows': rows, 'seconds': round(seconds, 3), 'rows_per_second': round(rows / seconds),
+        'bytes': size, 'mib_per_second': round(size * rounds / seconds / 1048576, 2),
+    }
+
+
+def run_round(case, operation, database, backup_dir, log_dir):
+    """
+    Run the backup or restore of a case once.
+
+    :param case: The case, a value of ``CASES``.
+    :param operation: 'backup' or 'restore'.
+    :param database: Synthetic database backed up or restored into.
+    :param backup_dir: Directory the backup is written to or read from.
+    :param log_dir: Directory where log files will be stored.
+    :return: The number of rows processed.
+    """
+    jobs = case.get('jobs')
+    if operation == 'backup':
+        runner = synthetic_backup(database, backup_dir, log_dir, data_format=case['format'], jobs=jobs,
+                                  compress=case.get('compress'), archive=case.get('archive', False))
+        run_and_close(runner, runner.backup_full)
+    else:
+        runner = synthetic_restore(database, backup_dir, log_dir, 'benchmark', jobs=jobs, fast=case.get('fast', False))
+        run_and_close(runner, runner.restore_full)
+    return runner.metrics.report()['rows']
+
+
+def measure_operation(name, operation, workload, directory):
+    """
+    Run an operation and add the peak memory of the process to its result.
+
+    Meant to run in a fresh process, whose peak RSS is then the operation's.
+
+    :param name: Name of the case.
+    :param operation: 'backup' or 'restore'.
+    :param workload: Tables to generate.
+    :param directory: Working directory holding the backup and the logs.
+    :return: The result of ``run_operation`` with ``peak_rss_mib``.
+    """
+    result = run_operation(name, operation, workload, directory)
+    result['peak_rss_mib'] = peak_rss_mib()
+    return result
+
+
+def run_case(name, workload, repeat=1):
+    """
+    Measure the backup and the restore of a case, each in a new interpreter.
+
+    :param name: Name of the case.
+    :param workload: Tables to generate.
+    :param repeat: Number of runs; the fastest run of each operation is kept.
+    :return: Dictionary mapping each operation to its result.
+    """
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for _ in range(repeat):
+        directory = tempfile.mkdtemp(prefix='backupapp-benchmark-')
+        try:
+            for operation in OPERATIONS:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(measure_operation, name, operation, workload, directory).result()
+                best = results.get(operation)
+                if best is None or result['rows_per_second'] > best['rows_per_second']:
+                    results[operation] = result
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def run_suite(names, workload, repeat=1, echo=None):
+    """
+    Measure several cases, one after the other.
+
+    :param names: Names of the cases.
+    :param workload: Tables to generate.
+    :param repeat: Number of runs of every case; the fastest one is kept.
+    :param echo: Callable told about every finished case (optional).
+    :return: Ordered dictionary mapping each case to its results per operation.
+    """
+    results = OrderedDict()
+    for name in names:
+        results[name] = run_case(name, workload, repeat)
+        if echo:
+            echo(f"{name}: " + ", ".join([f"{operation} {results[name][operation]['rows_per_second']} rows/s"
+                                          for operation in OPERATIONS]))
+    return results
+
+
+def environment():
+    """
+    Describe the interpreter and machine the suite runs on.
+
+    :return: Dictionary with the ``python`` version and the ``machine``.
+    """
+    return {
+        'python': platform.python_version(),
+        'machine': f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+    }
+
+
+def baseline_mismatch(baseline, workload):
+    """
+    Tell why results of a workload cannot be compared with a baseline.
+
+    Throughput depends on the interpreter and the machine as much as on the
+    code, so a baseline is only comparable on the same ones.
+
+    :param baseline: Stored baseline.
+    :param workload: Workload the results were measured on.
+    :return: The reason, or None if the results are comparable.
+    """
+    if baseline['workload'] != workload:
+        return "the baseline was measured on another workload"
+    current = environment()
+    for key in ('machine', 'python'):
+        if baseline.get(key) != current[key]:
+            return f"the baseline was measured on {key} {baseline.get(key)}, not {current[key]}"
+    return None
+
+
+def load_baseline(path):
+    """
+    Read a stored baseline.
+
+    :param path: Path to the baseline file.
+    :return: The baseline, or None if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, workload, results, baseline=None):
+    """
+    Store results as the new baseline.
+
+    Results of a subset of the cases are merged into the previous baseline
+    when it was measured on the same workload, interpreter and machine.
+
+    :param path: Path to the baseline file.
+    :param workload: Workload the results were measured on.
+    :param results: Results of ``run_suite``.
+    :param baseline: Previous baseline (optional).
+    :return: The baseline written.
+    """
+    cases = OrderedDict()
+    if baseline and baseline_mismatch(baseline, workload) is None:
+        cases.update(baseline['results'])
+    cases.update(results)
+    baseline = dict({'workload': workload}, **environment(), results=cases)
+    write_atomically(path, json.dumps(baseline, indent=2) + "\n")
+    return baseline
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline measured on the same workload, interpreter and machine.
+
+    :param results: Results of ``run_suite``.
+    :param baseline: Stored baseline.
+    :param tolerance: Relative slowdown (or memory growth) above which a change is a regression.
+    :return: A list of comparison dictionaries with the case, operation, metric, baseline and current values,
+        relative change and whether it is a regression; cases missing from the baseline are left out.
+    """
+    comparisons = []
+    for name, operations in results.items():
+        for operation, result in operations.items():
+            reference = baseline['results'].get(name, {}).get(operation)
+            if reference is None:
+                continue
+            for metric, higher_is_better in COMPARED_METRICS:
+                if not reference.get(metric):
+                    continue
+                change = result[metric] / reference[metric] - 1
+                regression = -change > tolerance if higher_is_better else change > tolerance
+                comparisons.append({'case': name, 'operation': operation, 'metric': metric,
+                                    'baseline': reference[metric], 'current': result[metric],
+                                    'change': round(change, 3), 'regression': regression})
+    return comparisons
+
+
+def format_results(results, comparisons=()):
+    """
+    Format benchmark results as a plain text table.
+
+    :param results: Results of ``run_suite``.
+    :param comparisons: Comparisons of ``compare`` (optional).
+    :return: The table, one line per case and operation, with the change against the baseline.
+    """
+    changes = {(comparison['case'], comparison['operation'], comparison['metric']): comparison
+               for comparison in comparisons}
+    width = max([len(name) for name in results] + [4])
+    lines = [f"{'CASE':<{width}}  OPERATION  {'ROWS/S':>10}  {'MIB/S':>7}  {'PEAK RSS MIB':>12}  VS BASELINE"]
+    for name, operations in results.items():
+        for operation, result in operations.items():
+            notes = []
+            for metric, label in (('rows_per_second', 'rows/s'), ('peak_rss_mib', 'rss')):
+                comparison = changes.get((name, operation, metric))
+                if comparison is not None:
+                    notes.append(f"{label} {comparison['change']:+.0%}" + (" REGRESSION" if comparison['regression']
+                                                                           else ""))
+            lines.append(f"{name:<{width}}  {operation:<9}  {result['rows_per_second']:>10}  "
+                         f"{result['mib_per_second']:>7.2f}  {result['peak_rss_mib']:>12.1f}  {', '.join(notes)}"
+                         .rstrip())
+    regressions = sum(1 for comparison in comparisons if comparison['regression'])
+    if comparisons:
+        lines.append(f"{regressions} regression(s) against the baseline")
+    return "\n".join(lines)
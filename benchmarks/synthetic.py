@@ -0,0 +1,643 @@
+import json
+import random
+import re
+import struct
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+# Column kinds a synthetic table can be made of, with their MySQL column type,
+# MySQL data type, PostgreSQL type and PostgreSQL type OID. ``{size}`` is
+# replaced by the configured value size.
+COLUMN_TYPES = {
+    'int': ('int', 'int', 'integer', 23),
+    'bigint': ('bigint', 'bigint', 'bigint', 20),
+    'float': ('double', 'double', 'double precision', 701),
+    'decimal': ('decimal(14,2)', 'decimal', 'numeric(14,2)', 1700),
+    'text': ('varchar({size})', 'varchar', 'character varying({size})', 1043),
+    'bytes': ('varbinary({size})', 'varbinary', 'bytea', 17),
+    'timestamp': ('datetime', 'datetime', 'timestamp without time zone', 1114),
+    'json': ('json', 'json', 'jsonb', 3802),
+}
+
+DEFAULT_COLUMNS = ('int', 'text', 'text', 'decimal', 'timestamp')
+
+# Number of distinct generated rows per table; the rows served cycle through
+# them with increasing ids, so generating values does not dominate the run.
+POOL_SIZE = 1000
+
+# Characters of the generated text values, including the ones every format
+# has to escape.
+TEXT_ALPHABET = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 ' * 4 + "\t\n'\"\\"
+
+_PG_EPOCH = datetime(2000, 1, 1)
+_BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+_BINARY_TRAILER = struct.pack('>h', -1)
+_SELECT = re.compile(r'\s*SELECT\s+\*\s+FROM\s+(\S+)(?:\s+WHERE\s+(.*))?$', re.IGNORECASE | re.DOTALL)
+_MIN_MAX = re.compile(r'\s*SELECT\s+MIN\(.*\)\s+FROM\s+(\S+)\s*$', re.IGNORECASE | re.DOTALL)
+_COPY_TO = re.compile(r'\s*COPY\s+(?:\((.*)\)|(\S+))\s+TO\s+STDOUT(.*)$', re.IGNORECASE | re.DOTALL)
+_FINGERPRINT = re.compile(r'\s*SELECT\s+count\(\*\),.*md5\(t::text\).*\sFROM\s+(\S+)\s+AS\s+t$', re.DOTALL)
+_LOAD_DATA = re.compile(r"\s*LOAD\s+DATA\s+LOCAL\s+INFILE\s+'((?:[^']|'')*)'", re.IGNORECASE)
+_PREDICATE = re.compile(r'(<|>=)\s*(-?\d+)')
+
+
+def key_range(table_rows, where):
+    """
+    Resolve the key range predicates of a chunked dump to a range of ids.
+
+    :param table_rows: Number of rows of the table, with ids 1 to ``table_rows``.
+    :param where: Predicate built by ``key_range_predicates`` (None for the whole table).
+    :return: Tuple ``(first, end)`` of the ids to serve, ``end`` excluded.
+    """
+    first, end = 1, table_rows + 1
+    for operator, value in _PREDICATE.findall(where or ''):
+        if operator == '<':
+            end = min(end, int(value))
+        else:
+            first = max(first, int(value))
+    return first, max(first, end)
+
+
+def copy_text(value):
+    """
+    Encode a value in the PostgreSQL COPY text format.
+
+    :param value: Value as psycopg2 returns it.
+    :return: The field, escaped.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bytes):
+        return '\\\\x' + value.hex()
+    if isinstance(value, dict):
+        value = json.dumps(value)
+    elif not isinstance(value, str):
+        return str(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_binary(value, kind):
+    """
+    Encode a value as a field of the PostgreSQL binary COPY format.
+
+    :param value: Value as psycopg2 returns it.
+    :param kind: Column kind of the value.
+    :return: The field, length included.
+    """
+    if value is None:
+        return struct.pack('>i', -1)
+    if kind == 'int':
+        data = struct.pack('>i', value)
+    elif kind == 'bigint':
+        data = struct.pack('>q', value)
+    elif kind == 'float':
+        data = struct.pack('>d', value)
+    elif kind == 'decimal':
+        data = numeric_binary(value)
+    elif kind == 'timestamp':
+        delta = value - _PG_EPOCH
+        data = struct.pack('>q', (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+    elif kind == 'bytes':
+        data = value
+    elif kind == 'json':
+        data = b'\x01' + json.dumps(value).encode()
+    else:
+        data = value.encode()
+    return struct.pack('>i', len(data)) + data
+
+
+def numeric_binary(value):
+    """
+    Encode a decimal with two fraction digits in the binary format of ``numeric``.
+
+    :param value: The decimal.
+    :return: The binary value: digit count, weight, sign, scale and base 10000 digits.
+    """
+    cents = int(value.scaleb(2))
+    sign = 0x4000 if cents < 0 else 0
+    integer, fraction = divmod(abs(cents), 100)
+    digits = []
+    while integer:
+        integer, digit = divmod(integer, 10000)
+        digits.insert(0, digit)
+    weight = len(digits) - 1
+    if fraction:
+        digits.append(fraction * 100)
+    return struct.pack(f'>hhHH{len(digits)}h', len(digits), weight, sign, 2, *digits)
+
+
+class SyntheticDatabase:
+    """
+    A database of generated tables, served in process by the synthetic driver.
+
+    Every table has a bigint ``id`` primary key numbered from 1, a secondary
+    index and one column per configured kind. Rows are drawn from a pool of
+    ``POOL_SIZE`` seeded random rows, so runs are reproducible. The catalog
+    queries of the backup classes are answered from the table definitions,
+    ``SELECT`` and ``COPY ... TO STDOUT`` serve the rows, and the loading
+    statements of the restore classes (INSERT, ``LOAD DATA LOCAL INFILE``
+    and ``COPY ... FROM STDIN``) read their data and count the rows without
+    storing them. The change fingerprints of incremental backups are derived
+    from the generated rows. Everything else is accepted and ignored.
+
+    Attributes:
+        dialect (str): Server the database imitates ('mysql' or 'pgsql').
+        tables (list): Names of the tables.
+        rows (int): Number of rows of every table.
+        columns (list): Kinds of the columns after ``id``.
+        value_size (int): Length of the text, binary and JSON values.
+        null_fraction (float): Share of NULL values in the columns after ``id``.
+        pool (list): The distinct rows, without their id.
+        text_pool (list): The rows of ``pool`` in the COPY text format (PostgreSQL only).
+        binary_pool (list): The rows of ``pool`` as binary COPY fields (PostgreSQL only).
+        statements (list): Connection and text of every statement run, if set to a list (None by default).
+    """
+    def __init__(self, dialect, tables=4, rows=10000, columns=DEFAULT_COLUMNS, value_size=32, null_fraction=0.05,
+                 seed=0):
+        """
+        Generate the tables.
+
+        :param dialect: Server the database imitates ('mysql' or 'pgsql').
+        :param tables: Number of tables.
+        :param rows: Number of rows of every table.
+        :param columns: Kinds of the columns after ``id``, keys of ``COLUMN_TYPES``.
+        :param value_size: Length of the text, binary and JSON values.
+        :param null_fraction: Share of NULL values in the columns after ``id``.
+        :param seed: Seed of the generated values.
+        :raises ValueError: If a column kind is unknown or no column is given.
+        """
+        unknown = [kind for kind in columns if kind not in COLUMN_TYPES]
+        if unknown:
+            raise ValueError(f"Unknown column kinds: {', '.join(unknown)}")
+        if not columns:
+            raise ValueError("A synthetic table needs at least one column besides id")
+        self.dialect = dialect
+        self.tables = [f't{number:03d}' for number in range(tables)]
+        self.rows = rows
+        self.columns = list(columns)
+        self.value_size = value_size
+        self.null_fraction = null_fraction
+        self.statements = None
+        generator = random.Random(seed)
+        self.pool = [tuple([None if generator.random() < null_fraction else self.generate(kind, generator)
+                            for kind in self.columns]) for _ in range(POOL_SIZE)]
+        # COPY rows are served from the pool already encoded, as the server does not run Python.
+        self.text_pool = []
+        self.binary_pool = []
+        if dialect == 'pgsql':
+            self.text_pool = ['\t'.join([copy_text(value) for value in row]) for row in self.pool]
+            self.binary_pool = [b''.join([copy_binary(value, kind) for value, kind in zip(row, self.columns)])
+                                for row in self.pool]
+
+    def generate(self, kind, generator):
+        """
+        Generate a value of a column kind, as the database driver would return it.
+
+        :param kind: Column kind.
+        :param generator: Random generator to draw from.
+        :return: The value.
+        """
+        if kind == 'int':
+            return generator.randint(-2 ** 31, 2 ** 31 - 1)
+        if kind == 'bigint':
+            return generator.getrandbits(62)
+        if kind == 'float':
+            return generator.uniform(-1e6, 1e6)
+        if kind == 'decimal':
+            return Decimal(generator.randint(-10 ** 11, 10 ** 11)).scaleb(-2)
+        if kind == 'timestamp':
+            return datetime(2020, 1, 1) + timedelta(seconds=generator.randrange(10 ** 8),
+                                                     microseconds=generator.randrange(10 ** 6))
+        if kind == 'bytes':
+            return generator.getrandbits(8 * self.value_size).to_bytes(self.value_size, 'big')
+        text = ''.join(generator.choices(TEXT_ALPHABET, k=self.value_size))
+        if kind == 'json':
+            # psycopg2 parses jsonb into Python objects; MySQL drivers return the text.
+            value = {'text': text[:max(self.value_size - 12, 0)]}
+            return value if self.dialect == 'pgsql' else json.dumps(value)
+        return text
+
+    @property
+    def total_rows(self):
+        """
+        Number of rows of all tables.
+        """
+        return self.rows * len(self.tables)
+
+    def connect(self, *args, **kwargs):
+        """
+        Open a connection, accepting and ignoring the arguments of the real drivers.
+
+        :return: A SyntheticConnection.
+        """
+        return SyntheticConnection(self)
+
+    def fingerprint(self):
+        """
+        Checksum the contents of a table; all tables hold the same generated rows.
+
+        :return: A 32-bit checksum of the row count and the row pool.
+        """
+        return zlib.crc32(repr((self.rows, self.pool)).encode('utf-8'))
+
+    def column_names(self):
+        """
+        Name the columns of every table.
+
+        :return: The names, ``id`` first.
+        """
+        return ['id'] + [f'c{number}' for number in range(1, len(self.columns) + 1)]
+
+    def column_type(self, kind, position):
+        """
+        Look up a type name of a column kind.
+
+        :param kind: Column kind.
+        :param position: Index into the ``COLUMN_TYPES`` tuple.
+        :return: The type, with the value size filled in.
+        """
+        value = COLUMN_TYPES[kind][position]
+        return value.format(size=self.value_size) if isinstance(value, str) else value
+
+    def catalog(self, query):
+        """
+        Answer a catalog or session query of the backup and restore classes.
+
+        :param query: The query.
+        :return: The result rows, or None if the query is not a catalog query.
+        """
+        names = self.column_names()
+        if self.dialect == 'mysql':
+            if 'FROM information_schema.TABLES WHERE' in query:
+                return [(table, 'BASE TABLE', 'InnoDB', self.rows, self.rows + 1, 'utf8mb4_0900_ai_ci', '', '')
+                        for table in self.tables]
+            if 'FROM information_schema.COLUMNS' in query:
+                return [row for table in self.tables for row in
+                        [(table, 'id', 'bigint', 'bigint', 'NO', None, '', None, '', 'PRI', '')] +
+                        [(table, name, self.column_type(kind, 0), self.column_type(kind, 1), 'YES', None, '',
+                          None, '', '', '') for name, kind in zip(names[1:], self.columns)]]
+            if 'FROM information_schema.STATISTICS' in query:
+                return [row for table in self.tables for row in
+                        [(table, 'PRIMARY', 0, 'id', None, 'BTREE', 'A', None)] +
+                        [(table, f'{table}_c1', 1, 'c1', None, 'BTREE', 'A', None)]]
+            if 'information_schema' in query:
+                return []
+            if query.startswith('SELECT @@SESSION.'):
+                return [(1,)]
+            if query.startswith('SHOW TABLES'):
+                return [(table,) for table in self.tables]
+            if query.startswith('CHECKSUM TABLE'):
+                return [(f'benchmark.{self.table(query.split()[2])}', self.fingerprint())]
+            if query.startswith('ANALYZE TABLE'):
+                return [(table, 'analyze', 'status', 'OK') for table in self.tables]
+            return None
+        if 'pg_get_partkeydef' in query:
+            return [(table, table, 'r', float(self.rows), None, None, None, None) for table in self.tables]
+        if 'format_type(a.atttypid' in query:
+            return [row for table in self.tables for row in
+                    [(table, 'id', 'id', 'bigint', 20, True, None, '', '', None)] +
+                    [(table, name, name, self.column_type(kind, 2), self.column_type(kind, 3), False, None, '', '',
+                      None) for name, kind in zip(names[1:], self.columns)]]
+        if 'pg_get_constraintdef' in query:
+            return [(table, f'{table}_pkey', 'p', 'PRIMARY KEY (id)', ['id']) for table in self.tables]
+        if 'pg_get_indexdef' in query:
+            return [(table, f'CREATE INDEX {table}_c1 ON public.{table} USING btree (c1)') for table in self.tables]
+        match = _FINGERPRINT.match(query)
+        if match:
+            self.table(match.group(1))
+            return [(self.rows, self.fingerprint())]
+        if 'pg_export_snapshot' in query:
+            return [('00000003-00000002-1',)]
+        if 'FROM pg_' in query:
+            return []
+        return None
+
+    def table(self, name):
+        """
+        Resolve a table name of a statement.
+
+        :param name: Name as it appears in the statement, quoted or not.
+        :return: The table name.
+        :raises ValueError: If there is no such table.
+        """
+        name = name.strip('`"')
+        if name not in self.tables:
+            raise ValueError(f"Table {name} does not exist")
+        return name
+
+    def select(self, table, where=None):
+        """
+        Iterate over the rows of a table, or of a key range of it.
+
+        :param table: Name of the table.
+        :param where: Key range predicate (None for the whole table).
+        :return: An iterator of row tuples.
+        """
+        first, end = key_range(self.rows, where)
+        pool = self.pool
+        size = len(pool)
+        return ((key,) + pool[key % size] for key in range(first, end))
+
+    def copy_to(self, statement, f):
+        """
+        Serve ``COPY ... TO STDOUT`` one row per write, as psycopg2 does.
+
+        :param statement: The COPY statement.
+        :param f: File object the rows are written to.
+        :return: Number of rows written.
+        """
+        match = _COPY_TO.match(statement)
+        if match.group(1):
+            select = _SELECT.match(match.group(1))
+            table, where = self.table(select.group(1)), select.group(2)
+        else:
+            table, where = self.table(match.group(2)), None
+        first, end = key_range(self.rows, where)
+        if 'binary' in match.group(3).lower():
+            fields = struct.pack('>h', len(self.columns) + 1)
+            pool = self.binary_pool
+            f.write(_BINARY_HEADER)
+            for key in range(first, end):
+                f.write(fields + struct.pack('>iq', 8, key) + pool[key % len(pool)])
+            f.write(_BINARY_TRAILER)
+        else:
+            pool = self.text_pool
+            for key in range(first, end):
+                f.write(f"{key}\t{pool[key % len(pool)]}\n")
+        return end - first
+
+    def copy_from(self, statement, f, size):
+        """
+        Consume ``COPY ... FROM STDIN`` data and count its rows.
+
+        :param statement: The COPY statement.
+        :param f: File-like object the data is read from.
+        :param size: Number of bytes or characters read at a time.
+        :return: Number of rows read.
+        """
+        if 'binary' in statement.lower():
+            counter = BinaryCopyCounter()
+            while True:
+                data = f.read(size)
+                if not data:
+                    return counter.rows
+                counter.feed(data)
+        rows = 0
+        while True:
+            data = f.read(size)
+            if not data:
+                return rows
+            rows += data.count('\n' if isinstance(data, str) else b'\n')
+
+    def load_data(self, statement):
+        """
+        Consume the file of a ``LOAD DATA LOCAL INFILE`` statement and count its lines.
+
+        :param statement: The statement.
+        :return: Number of rows read.
+        """
+        path = _LOAD_DATA.match(statement).group(1).replace("''", "'")
+        rows = 0
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(1024 * 1024)
+                if not data:
+                    return rows
+                rows += data.count(b'\n')
+
+
+class BinaryCopyCounter:
+    """
+    Counter of the tuples of a binary COPY stream fed in arbitrary pieces.
+
+    Attributes:
+        rows (int): Number of complete tuples seen so far.
+    """
+    def __init__(self):
+        """
+        Initialize an empty counter expecting the stream header.
+        """
+        self.buffer = bytearray()
+        self.header = True
+        self.rows = 0
+
+    def feed(self, data):
+        """
+        Count the complete tuples of the data received so far.
+
+        :param data: Next piece of the stream.
+        """
+        buffer = self.buffer
+        buffer += data
+        position = 0
+        if self.header:
+            if len(buffer) < 19:
+                return
+            position = 19 + struct.unpack_from('>i', buffer, 15)[0]
+            self.header = False
+        while len(buffer) - position >= 2:
+            fields = struct.unpack_from('>h', buffer, position)[0]
+            if fields < 0:
+                position = len(buffer)
+                break
+            end = position + 2
+            for _ in range(fields):
+                if len(buffer) - end < 4:
+                    end = None
+                    break
+                length = struct.unpack_from('>i', buffer, end)[0]
+                end += 4 + max(length, 0)
+            if end is None or end > len(buffer):
+                break
+            position = end
+            self.rows += 1
+        del buffer[:position]
+
+
+class SyntheticConnection:
+    """
+    DB-API connection of the synthetic driver, with the extras of mysql.connector and psycopg2 the repo uses.
+
+    Attributes:
+        server (SyntheticDatabase): Database the connection serves.
+        database (str): Current database name, which mysql.connector lets callers set.
+        settings (dict): Session settings changed through ``set_config``.
+        autocommit (bool): Accepted and ignored.
+    """
+    def __init__(self, database):
+        """
+        Initialize the SyntheticConnection.
+
+        :param database: Database the connection serves.
+        """
+        self.server = database
+        self.database = None
+        self.settings = {}
+        self.autocommit = False
+
+    def cursor(self, *args, **kwargs):
+        """
+        Open a cursor; named and unbuffered cursors behave the same.
+
+        :return: A SyntheticCursor.
+        """
+        return SyntheticCursor(self)
+
+    def set_session(self, **kwargs):
+        """
+        Accept and ignore psycopg2 session characteristics.
+        """
+
+    def commit(self):
+        """
+        Commit; the synthetic database keeps nothing.
+        """
+
+    def rollback(self):
+        """
+        Roll back; the synthetic database keeps nothing.
+        """
+
+    def close(self):
+        """
+        Close the connection.
+        """
+
+
+class SyntheticCursor:
+    """
+    DB-API cursor of the synthetic driver.
+
+    Attributes:
+        connection (SyntheticConnection): Connection the cursor belongs to.
+        description (tuple): Columns of the last SELECT, as 7-item sequences.
+        rowcount (int): Rows produced or affected by the last statement (-1 if unknown).
+        itersize (int): Accepted and ignored, as on psycopg2 named cursors.
+    """
+    def __init__(self, connection):
+        """
+        Initialize the SyntheticCursor.
+
+        :param connection: Connection the cursor belongs to.
+        """
+        self.connection = connection
+        self.description = None
+        self.rowcount = -1
+        self.itersize = 2000
+        self.rows = iter(())
+
+    def __enter__(self):
+        """
+        Use the cursor as a context manager, as psycopg2 cursors are.
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        Close the cursor when the block ends.
+        """
+        self.close()
+
+    def execute(self, query, params=None):
+        """
+        Run a statement against the synthetic database.
+
+        :param query: The statement.
+        :param params: Parameters of a psycopg2 ``set_config`` query, the only parameterized one answered.
+        """
+        database = self.connection.server
+        self.description = None
+        self.rowcount = -1
+        self.rows = iter(())
+        query = query.strip()
+        if database.statements is not None:
+            database.statements.append((self.connection, query))
+        if query.startswith('SELECT current_setting(%s)'):
+            name, _, value = params
+            previous = self.connection.settings.get(name, 'default')
+            self.connection.settings[name] = value
+            self.rows = iter([(previous, value)])
+            return
+        if query.startswith('SELECT set_config(%s'):
+            self.connection.settings[params[0]] = params[1]
+            self.rows = iter([(params[1],)])
+            return
+        rows = database.catalog(query)
+        if rows is not None:
+            self.rows = iter(rows)
+            self.rowcount = len(rows)
+            return
+        keyword = query[:16].upper()
+        if keyword.startswith('SELECT'):
+            match = _MIN_MAX.match(query)
+            if match:
+                database.table(match.group(1))
+                self.rows = iter([(1, database.rows) if database.rows else (None, None)])
+                return
+            match = _SELECT.match(query)
+            if match:
+                self.rows = database.select(database.table(match.group(1)), match.group(2))
+                self.description = tuple([(name, None, None, None, None, None, True)
+                                          for name in database.column_names()])
+            return
+        if keyword.startswith('INSERT'):
+            self.rowcount = 1
+        elif keyword.startswith('LOAD DATA'):
+            self.rowcount = database.load_data(query)
+
+    def copy_expert(self, sql, file, size=8192):
+        """
+        Run a ``COPY ... TO STDOUT`` or ``COPY ... FROM STDIN`` statement.
+
+        :param sql: The COPY statement.
+        :param file: File object the rows are written to or read from.
+        :param size: Number of bytes or characters read at a time.
+        """
+        if self.connection.server.statements is not None:
+            self.connection.server.statements.append((self.connection, sql))
+        if _COPY_TO.match(sql):
+            self.rowcount = self.connection.server.copy_to(sql, file)
+        else:
+            self.rowcount = self.connection.server.copy_from(sql, file, size)
+
+    def fetchone(self):
+        """
+        Fetch the next row of the result.
+
+        :return: The row, or None when the result is exhausted.
+        """
+        return next(self.rows, None)
+
+    def fetchmany(self, size=1):
+        """
+        Fetch the next rows of the result.
+
+        :param size: Maximum number of rows to fetch.
+        :return: A list of rows, empty when the result is exhausted.
+        """
+        return [row for _, row in zip(range(size), self.rows)]
+
+    def fetchall(self):
+        """
+        Fetch the remaining rows of the result.
+
+        :return: A list of rows.
+        """
+        return list(self.rows)
+
+    def close(self):
+        """
+        Discard the rest of the result.
+        """
+        self.rows = iter(())
+
+
+def synthetic_class(cls, database):
+    """
+    Derive a backup or restore class whose connections go to a synthetic database.
+
+    :param cls: MySQLBackup, PgSQLBackup, MySQLRestore or PgSQLRestore.
+    :param database: SyntheticDatabase to connect to.
+    :return: The subclass, overriding ``connect``.
+    """
+    return type(f'Synthetic{cls.__name__}', (cls,), {'connect': lambda self, *args, **kwargs: database.connect()})
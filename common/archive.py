@@ -0,0 +1,266 @@
+import hashlib
+import io
+import json
+import mmap
+import struct
+from common.compression import CompressedWriter, decompress_stream
+from common.manifest import select_tables
+
+# Suffix of single-file archive backups.
+ARCHIVE_SUFFIX = '.archive'
+
+# Magic bytes identifying an archive, followed by the offset and length of its index.
+ARCHIVE_MAGIC = b'DBARCH01'
+_HEADER = struct.Struct('>8sQQ')
+
+
+class ArchiveWriter:
+    """
+    Writer of a seekable single-file backup with one section per table schema and data.
+
+    Sections are appended one after the other as the tables are dumped, each
+    compressed on its own so it can be read without the rest of the file. The
+    index of all sections, with their offset, length and SHA-256 checksum, is
+    written after the last section, and the fixed-size header at the start of
+    the file is then rewritten to point at it. The header stays zeroed if the
+    backup fails, so an incomplete archive is never mistaken for a good one.
+
+    Attributes:
+        path (str): Path to the archive file.
+        compress (str): Codec sections are compressed with ('gzip', 'zstd', 'lz4' or None).
+        level (int): Compression level (codec default if None).
+        metadata (dict): Backup metadata stored in the index next to the sections.
+        sections (list): Index entries of the sections written so far.
+    """
+    def __init__(self, path, compress=None, level=None, metadata=None):
+        """
+        Initialize the ArchiveWriter and create the archive file.
+
+        :param path: Path to the archive file.
+        :param compress: Codec sections are compressed with ('gzip', 'zstd', 'lz4' or None).
+        :param level: Compression level (codec default if None).
+        :param metadata: Backup metadata stored in the index next to the sections.
+        """
+        self.path = path
+        self.compress = compress
+        self.level = level
+        self.metadata = metadata or {}
+        self.sections = []
+        self.f = open(path, 'wb')
+        self.f.write(_HEADER.pack(ARCHIVE_MAGIC, 0, 0))
+
+    def write_section(self, table, kind, mode, write, **fields):
+        """
+        Append one section to the archive.
+
+        :param table: Name of the table the section belongs to.
+        :param kind: Kind of section ('schema' or 'data').
+        :param mode: 'w' for text or 'wb' for binary.
+        :param write: Callable receiving the writable file object; for data sections it returns the row count.
+        :param fields: Extra fields recorded in the index entry, such as the data ``format``.
+        :return: The index entry of the section.
+        """
+        entry = dict(fields, table=table, kind=kind, compress=self.compress)
+        raw = SectionWriter(self.f, entry)
+        if self.compress:
+            raw = CompressedWriter(raw, self.compress, self.level)
+        stream = io.BufferedWriter(raw, buffer_size=1024 * 1024)
+        if 'b' not in mode:
+            stream = io.TextIOWrapper(stream, encoding='utf-8')
+        with stream as f:
+            rows = write(f)
+        if kind == 'data':
+            entry['rows'] = rows
+        self.sections.append(entry)
+        return entry
+
+    def close(self):
+        """
+        Write the index, point the header at it and close the file.
+        """
+        index = json.dumps(dict(self.metadata, sections=self.sections)).encode('utf-8')
+        offset = self.f.tell()
+        self.f.write(index)
+        self.f.seek(0)
+        self.f.write(_HEADER.pack(ARCHIVE_MAGIC, offset, len(index)))
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.f.close()
+        return False
+
+
+class SectionWriter(io.RawIOBase):
+    """
+    Writable stream appending one section to an archive file.
+
+    The section's offset, length and checksum are stored in its index entry
+    on close; the archive file itself is left open for the next section.
+
+    Attributes:
+        f: Binary file object of the archive.
+        entry (dict): Index entry of the section.
+    """
+    def __init__(self, f, entry):
+        """
+        Initialize the SectionWriter at the current end of the archive.
+
+        :param f: Binary file object of the archive.
+        :param entry: Index entry of the section.
+        """
+        super().__init__()
+        self.f = f
+        self.entry = entry
+        self.offset = f.tell()
+        self.length = 0
+        self.digest = hashlib.sha256()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.digest.update(data)
+        self.f.write(data)
+        self.length += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.entry.update(offset=self.offset, length=self.length, sha256=self.digest.hexdigest())
+            super().close()
+
+
+class ArchiveReader:
+    """
+    Reader of an archive written by ``ArchiveWriter``.
+
+    The archive is memory-mapped and only its header, its index and the
+    sections actually opened are read, so restoring a few tables out of a
+    large archive does not touch the rest of the file.
+
+    Attributes:
+        path (str): Path to the archive file.
+        index (dict): Backup metadata and ``sections`` entries of the archive.
+    """
+    def __init__(self, path):
+        """
+        Initialize the ArchiveReader and read the archive index.
+
+        :param path: Path to the archive file.
+        :raises ValueError: If the file is not an archive or its index was never written.
+        """
+        self.path = path
+        self.f = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, offset, length = _HEADER.unpack_from(self.map, 0)
+            if magic != ARCHIVE_MAGIC:
+                raise ValueError(f"{path} is not a backup archive")
+            if not offset:
+                raise ValueError(f"{path} is incomplete, its index was never written")
+            self.index = json.loads(self.map[offset:offset + length].decode('utf-8'))
+        except BaseException:
+            self.close()
+            raise
+
+    def sections(self, kind, tables=None):
+        """
+        List the sections of one kind, in archive order.
+
+        :param kind: Kind of section ('schema' or 'data').
+        :param tables: Names of the tables to keep, or None for all of them.
+        :return: A list of index entries.
+        :raises ValueError: If a requested table has no section of that kind.
+        """
+        return select_tables([entry for entry in self.index['sections'] if entry['kind'] == kind], tables)
+
+    def open_section(self, entry, mode='rb'):
+        """
+        Open one section for reading, decompressing it if needed.
+
+        :param entry: Index entry of the section.
+        :param mode: 'r' for text or 'rb' for binary.
+        :return: A readable file object; text mode uses UTF-8.
+        """
+        stream = SectionReader(self.map, entry, self.path)
+        if entry.get('compress'):
+            stream = decompress_stream(stream, entry['compress'])
+        else:
+            stream = io.BufferedReader(stream, buffer_size=1024 * 1024)
+        return stream if 'b' in mode else io.TextIOWrapper(stream, encoding='utf-8')
+
+    def close(self):
+        """
+        Unmap and close the archive file.
+        """
+        if getattr(self, 'map', None) is not None:
+            self.map.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class SectionReader(io.RawIOBase):
+    """
+    Readable stream over one section of a memory-mapped archive.
+
+    The bytes read are checked against the section checksum once the end of
+    the section is reached.
+
+    Attributes:
+        map: Memory map of the archive.
+        entry (dict): Index entry of the section.
+        path (str): Path to the archive file, for error messages.
+    """
+    def __init__(self, mapping, entry, path):
+        """
+        Initialize the SectionReader at the start of the section.
+
+        :param mapping: Memory map of the archive.
+        :param entry: Index entry of the section.
+        :param path: Path to the archive file, for error messages.
+        """
+        super().__init__()
+        self.map = mapping
+        self.entry = entry
+        self.path = path
+        self.position = entry['offset']
+        self.end = entry['offset'] + entry['length']
+        self.digest = hashlib.sha256()
+        self.verified = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        """
+        Copy the next bytes of the section into ``b``.
+
+        :param b: Writable buffer.
+        :return: Number of bytes copied, 0 at the end of the section.
+        :raises IOError: If the section does not match its checksum.
+        """
+        n = min(len(b), self.end - self.position)
+        if n <= 0:
+            if not self.verified:
+                if self.digest.hexdigest() != self.entry['sha256']:
+                    raise IOError(f"The {self.entry['kind']} section of table {self.entry['table']} "
+                                  f"in {self.path} is corrupt")
+                self.verified = True
+            return 0
+        data = self.map[self.position:self.position + n]
+        self.digest.update(data)
+        b[:n] = data
+        self.position += n
+        return n
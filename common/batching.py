@@ -0,0 +1,56 @@
+# Commit batch limits of the fast restore mode, used when no limit is given.
+FAST_COMMIT_EVERY = 10000
+FAST_COMMIT_BYTES = 64 * 1024 * 1024
+
+
+def batch_limits(fast, commit_every=None, commit_bytes=None):
+    """
+    Resolve the commit batch limits of a restore.
+
+    :param fast: Whether the fast restore mode is on.
+    :param commit_every: Number of statements (or rows) per commit, or None.
+    :param commit_bytes: Number of bytes of SQL (or COPY data) per commit, or None.
+    :return: Tuple ``(commit_every, commit_bytes)``; in fast mode unset limits get the fast defaults.
+    """
+    if fast and commit_every is None and commit_bytes is None:
+        return FAST_COMMIT_EVERY, FAST_COMMIT_BYTES
+    return commit_every, commit_bytes
+
+
+class CommitBatch:
+    """
+    Counter of the statements executed since the last commit.
+
+    Attributes:
+        max_statements (int): Number of statements after which the batch is full (no limit if None).
+        max_bytes (int): Size of the statements after which the batch is full (no limit if None).
+        statements (int): Number of statements in the current batch.
+        bytes (int): Size of the statements in the current batch.
+    """
+    def __init__(self, max_statements=None, max_bytes=None):
+        """
+        Initialize an empty CommitBatch.
+
+        :param max_statements: Number of statements after which the batch is full (no limit if None).
+        :param max_bytes: Size of the statements after which the batch is full (no limit if None).
+        """
+        self.max_statements = max_statements
+        self.max_bytes = max_bytes
+        self.statements = 0
+        self.bytes = 0
+
+    def add(self, size):
+        """
+        Count one executed statement.
+
+        :param size: Size of the statement.
+        :return: True when the batch is full and should be committed; the counters then start over.
+        """
+        self.statements += 1
+        self.bytes += size
+        if ((self.max_statements and self.statements >= self.max_statements)
+                or (self.max_bytes and self.bytes >= self.max_bytes)):
+            self.statements = 0
+            self.bytes = 0
+            return True
+        return False
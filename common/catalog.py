@@ -0,0 +1,222 @@
+import os
+import sqlite3
+from datetime import datetime
+
+# Name of the catalog database kept at the root of the backup directory.
+CATALOG_NAME = 'catalog.db'
+
+# Sections a backup run can contain, each stored under its own path column.
+SECTIONS = ('structure', 'data')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    db_type TEXT NOT NULL,
+    database TEXT,
+    timestamp TEXT NOT NULL,
+    format TEXT,
+    compress TEXT,
+    structure_path TEXT,
+    data_path TEXT,
+    created_at TEXT NOT NULL,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS backups_db_type ON backups (db_type, id);
+CREATE TABLE IF NOT EXISTS files (
+    backup_id INTEGER NOT NULL REFERENCES backups (id),
+    section TEXT NOT NULL,
+    table_name TEXT,
+    chunk INTEGER,
+    path TEXT NOT NULL,
+    size INTEGER,
+    rows INTEGER,
+    sha256 TEXT
+);
+CREATE INDEX IF NOT EXISTS files_backup_id ON files (backup_id);
+"""
+
+
+class BackupCatalog:
+    """
+    SQLite index of the backups stored in a backup directory.
+
+    Every backup run gets one row recording the database it was taken from,
+    its format and the path of its structure and data sections, plus one row
+    per file with the table it holds, its size, row count and SHA-256 checksum.
+    Restores look backups up here instead of scanning the backup directory.
+    Paths are stored relative to the backup directory. Runs record their
+    status, and a run that is still going on or that failed is never picked
+    up by a restore, even if some of its sections completed.
+
+    Attributes:
+        backup_dir (str): Directory holding the backups and the catalog.
+        path (str): Path to the catalog database.
+    """
+    def __init__(self, backup_dir):
+        """
+        Initialize the BackupCatalog, creating the catalog database if needed.
+
+        :param backup_dir: Directory holding the backups and the catalog.
+        """
+        self.backup_dir = backup_dir
+        self.path = os.path.join(backup_dir, CATALOG_NAME)
+        os.makedirs(backup_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+        columns = [row['name'] for row in self.conn.execute("PRAGMA table_info(backups)")]
+        if 'status' not in columns:
+            # Catalogs written before runs recorded their status.
+            with self.conn:
+                self.conn.execute("ALTER TABLE backups ADD COLUMN status TEXT")
+
+    def add_backup(self, db_type, database, timestamp, data_format=None, compress=None, status=None):
+        """
+        Register a new backup run.
+
+        :param db_type: Type of the database ('mysql' or 'pgsql').
+        :param database: Name of the database the backup was taken from.
+        :param timestamp: Timestamp of the backup run.
+        :param data_format: Format of the data section.
+        :param compress: Codec the backup files are compressed with.
+        :param status: Status of the run: 'running' until ``finish_backup`` is called, or None if not tracked.
+        :return: The id of the backup.
+        """
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO backups (db_type, database, timestamp, format, compress, created_at, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (db_type, database, timestamp, data_format, compress, datetime.now().isoformat(timespec='seconds'),
+                 status)
+            )
+        return cursor.lastrowid
+
+    def finish_backup(self, backup_id, status):
+        """
+        Record the outcome of a backup run.
+
+        :param backup_id: Id returned by ``add_backup``.
+        :param status: 'complete', or 'failed' to keep restores away from the run.
+        """
+        with self.conn:
+            self.conn.execute("UPDATE backups SET status = ? WHERE id = ?", (status, backup_id))
+
+    def add_section(self, backup_id, section, path, files):
+        """
+        Record a completed section of a backup run and the files it consists of.
+
+        :param backup_id: Id returned by ``add_backup``.
+        :param section: Section name ('structure' or 'data').
+        :param path: Path of the section's file or directory.
+        :param files: List of dictionaries with ``path``, ``size``, ``rows`` and ``sha256``
+                      keys, and optionally ``table`` and ``chunk``.
+        """
+        if section not in SECTIONS:
+            raise ValueError(f"Unknown backup section: {section}")
+        with self.conn:
+            self.conn.execute(f"UPDATE backups SET {section}_path = ? WHERE id = ?",
+                              (self.relative(path), backup_id))
+            self.conn.executemany(
+                "INSERT INTO files (backup_id, section, table_name, chunk, path, size, rows, sha256) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(backup_id, section, entry.get('table'), entry.get('chunk'), self.relative(entry['path']),
+                  entry.get('size'), entry.get('rows'), entry.get('sha256')) for entry in files]
+            )
+
+    def find(self, db_type, section, backup_id=None, database=None):
+        """
+        Find the latest completed backup of a database type containing a section, or a given backup.
+
+        :param db_type: Type of the database ('mysql' or 'pgsql').
+        :param section: Section that must be present ('structure' or 'data').
+        :param backup_id: Id of the backup to return instead of the latest one (optional).
+        :param database: Only consider backups of this database (optional).
+        :return: The backup row as a dictionary with an absolute ``path`` to the section, or None.
+        """
+        if section not in SECTIONS:
+            return None
+        query = (f"SELECT * FROM backups WHERE db_type = ? AND {section}_path IS NOT NULL "
+                 "AND (status IS NULL OR status = 'complete')")
+        params = [db_type]
+        if backup_id is not None:
+            query += " AND id = ?"
+            params.append(backup_id)
+        if database is not None:
+            query += " AND database = ?"
+            params.append(database)
+        row = self.conn.execute(query + " ORDER BY id DESC LIMIT 1", params).fetchone()
+        if row is None:
+            return None
+        backup = dict(row)
+        backup['path'] = os.path.join(self.backup_dir, backup[f'{section}_path'])
+        return backup
+
+    def files(self, backup_id, section=None):
+        """
+        List the files recorded for a backup.
+
+        :param backup_id: Id of the backup.
+        :param section: Restrict the list to one section (optional).
+        :return: A list of file rows as dictionaries.
+        """
+        query = "SELECT * FROM files WHERE backup_id = ?"
+        params = [backup_id]
+        if section:
+            query += " AND section = ?"
+            params.append(section)
+        return [dict(row) for row in self.conn.execute(query + " ORDER BY rowid", params)]
+
+    def backups(self, db_type, database=None):
+        """
+        List the backup runs of a database type, newest first.
+
+        :param db_type: Type of the database ('mysql' or 'pgsql').
+        :param database: Only list the backups of this database (optional).
+        :return: A list of backup rows as dictionaries, with the absolute ``paths`` of their sections.
+        """
+        query = "SELECT * FROM backups WHERE db_type = ?"
+        params = [db_type]
+        if database is not None:
+            query += " AND database = ?"
+            params.append(database)
+        backups = []
+        for row in self.conn.execute(query + " ORDER BY id DESC", params):
+            backup = dict(row)
+            backup['paths'] = [os.path.join(self.backup_dir, backup[f'{section}_path'])
+                               for section in SECTIONS if backup[f'{section}_path']]
+            backups.append(backup)
+        return backups
+
+    def remove_backup(self, backup_id):
+        """
+        Forget a backup run and its files. The files themselves are left to the caller.
+
+        :param backup_id: Id of the backup.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM files WHERE backup_id = ?", (backup_id,))
+            self.conn.execute("DELETE FROM backups WHERE id = ?", (backup_id,))
+
+    def relative(self, path):
+        """
+        Express a path relative to the backup directory.
+        """
+        return os.path.relpath(path, self.backup_dir)
+
+    def close(self):
+        """
+        Close the catalog database.
+        """
+        self.conn.close()
+
+
+def describe_file(path, digest, **fields):
+    """
+    Build the catalog entry of a file that has just been written.
+
+    :param path: Path to the file.
+    :param digest: hashlib object fed with the file's bytes while it was written.
+    :param fields: Extra entry fields such as ``table``, ``chunk`` and ``rows``.
+    :return: A dictionary suitable for ``BackupCatalog.add_section``.
+    """
+    return dict(fields, path=path, size=os.path.getsize(path), sha256=digest.hexdigest())
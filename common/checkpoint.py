@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from common.metrics import write_atomically
+
+# Name of the checkpoint file kept inside a backup directory while it is being written.
+CHECKPOINT_NAME = 'checkpoint.json'
+
+# Suffix of a file being written, renamed away once it is complete.
+PART_SUFFIX = '.part'
+
+
+@contextmanager
+def atomic_output(path):
+    """
+    Write a file under a temporary name and only give it its final name once it is complete.
+
+    The file is written to ``path + PART_SUFFIX`` in the same directory, then
+    renamed over ``path`` when the block exits normally. If the block raises,
+    the partial file is removed, so a failed run never leaves a truncated
+    file under a backup name.
+
+    :param path: Final path of the file.
+    :return: Context manager yielding the temporary path to write to.
+    """
+    temporary = path + PART_SUFFIX
+    try:
+        yield temporary
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    os.replace(temporary, path)
+
+
+def remove_partial_files(directory):
+    """
+    Remove the partial files a failed run left in a directory.
+
+    :param directory: Directory to clean up.
+    :return: Number of files removed.
+    """
+    names = [name for name in os.listdir(directory) if name.endswith(PART_SUFFIX)]
+    for name in names:
+        os.remove(os.path.join(directory, name))
+    return len(names)
+
+
+class Checkpoint:
+    """
+    JSON record of the progress of a long run, rewritten atomically after every completed unit.
+
+    The state is a dictionary of settings describing the run, plus lists of
+    the units (tables, chunks, statements) started and completed so far. A
+    resumed run reads it back to skip the completed units. Workers may
+    record units concurrently.
+
+    Attributes:
+        path (str): Path to the checkpoint file.
+        state (dict): Recorded state.
+    """
+    def __init__(self, path, state=None):
+        """
+        Initialize the Checkpoint.
+
+        :param path: Path to the checkpoint file.
+        :param state: Initial state (empty if None).
+        """
+        self.path = path
+        self.state = state or {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a checkpoint left by an earlier run.
+
+        :param path: Path to the checkpoint file.
+        :return: The Checkpoint, or None if there is no checkpoint at ``path``.
+        """
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return cls(path, json.load(f))
+
+    def save(self):
+        """
+        Write the state, replacing the previous checkpoint atomically.
+        """
+        with self.lock:
+            write_atomically(self.path, json.dumps(self.state) + "\n")
+
+    def update(self, **fields):
+        """
+        Set fields of the state and save it.
+
+        :param fields: Fields to set.
+        """
+        with self.lock:
+            self.state.update(fields)
+        self.save()
+
+    def add(self, key, item):
+        """
+        Append an item to a list of the state and save it.
+
+        :param key: Name of the list, such as 'done'.
+        :param item: Item to append.
+        """
+        with self.lock:
+            self.state.setdefault(key, []).append(item)
+        self.save()
+
+    def items(self, key):
+        """
+        Return a list of the state.
+
+        :param key: Name of the list.
+        :return: The items recorded under ``key`` (empty if none).
+        """
+        with self.lock:
+            return list(self.state.get(key, []))
+
+    def remove(self):
+        """
+        Delete the checkpoint file, once the run it tracks has completed.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def find_unfinished_backup(backup_dir, prefix, settings):
+    """
+    Find the latest backup directory a failed run left a checkpoint in.
+
+    :param backup_dir: Directory holding the backups.
+    :param prefix: Prefix of the data backup directories, such as ``mysql_data_``.
+    :param settings: Settings the checkpoint must have been written with, such as the database and format.
+    :return: The checkpoint of the latest matching directory, or None.
+    """
+    candidates = sorted([name for name in os.listdir(backup_dir) if name.startswith(prefix)
+                         and os.path.isfile(os.path.join(backup_dir, name, CHECKPOINT_NAME))], reverse=True)
+    for name in candidates:
+        checkpoint = Checkpoint.load(os.path.join(backup_dir, name, CHECKPOINT_NAME))
+        if all(checkpoint.state.get(key) == value for key, value in settings.items()):
+            return checkpoint
+    return None
+
+
+def is_unfinished(path):
+    """
+    Tell whether a backup file or directory was left behind by a run that did not complete.
+
+    :param path: Path to the backup file or directory.
+    :return: True for a partial file or a directory still holding a checkpoint.
+    """
+    return path.endswith(PART_SUFFIX) or os.path.isfile(os.path.join(path, CHECKPOINT_NAME))
+
+
+def statement_key(statement):
+    """
+    Identify a statement in a checkpoint without storing it.
+
+    :param statement: SQL statement.
+    :return: The SHA-256 hex digest of the statement.
+    """
+    return hashlib.sha256(statement.strip().encode('utf-8')).hexdigest()
+
+
+def restore_checkpoint_path(log_dir, db_type, database):
+    """
+    Name the checkpoint of a restore, next to its log, so restores of different databases do not share one.
+
+    :param log_dir: Directory where log files are stored.
+    :param db_type: Type of the database ('mysql' or 'pgsql').
+    :param database: Name of the database restored to (optional).
+    :return: Path to the checkpoint file.
+    """
+    return os.path.join(log_dir, f"{db_type}_restore_checkpoint" + (f"_{database}" if database else "") + ".json")
+
+
+def open_run_checkpoint(path, resume, settings, logger):
+    """
+    Pick up the checkpoint of an interrupted run, or start a new one.
+
+    :param path: Path to the checkpoint file.
+    :param resume: Continue from the checkpoint at ``path`` when there is one.
+    :param settings: Settings of the run, which a resumed checkpoint must have been written with.
+    :param logger: Logger the outcome is reported to.
+    :return: The Checkpoint.
+    :raises ValueError: If the checkpoint to resume was written by a run with other settings.
+    """
+    checkpoint = Checkpoint.load(path) if resume else None
+    if checkpoint is None:
+        if resume:
+            logger.warning(f"No checkpoint found at {path}, starting from the beginning")
+        checkpoint = Checkpoint(path, dict(settings))
+        checkpoint.save()
+        return checkpoint
+    changed = [key for key, value in settings.items() if checkpoint.state.get(key) != value]
+    if changed:
+        raise ValueError(f"The checkpoint {path} was written with other settings ({', '.join(changed)}); "
+                         "run without --resume to start over")
+    logger.info(f"Resuming from {path}: {len(checkpoint.items('done'))} units already done")
+    return checkpoint
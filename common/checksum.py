@@ -0,0 +1,171 @@
+import struct
+import zlib
+
+# Signature opening a binary COPY stream, followed by the flags and the header extension length.
+COPY_BINARY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+_COPY_BINARY_HEADER = struct.Struct('>11sii')
+_INT16 = struct.Struct('>h')
+_INT32 = struct.Struct('>i')
+
+
+class RowChecksum:
+    """
+    Order-independent checksum of the rows of a table, or of a primary key range of it.
+
+    The rows are hashed in the form the backup writes them: one line per
+    INSERT statement, tab-delimited row or text COPY row. Every line is hashed
+    with CRC-32 and Adler-32 on its own and the hashes are added up, so the
+    checksum does not depend on the order the server returns the rows in, nor
+    on how the stream is split into writes. Reading the same rows back from
+    a restored database with the same format gives the same checksum.
+
+    Attributes:
+        lines (int): Number of lines hashed so far.
+        crc (int): Sum of the CRC-32 of the lines.
+        adler (int): Sum of the Adler-32 of the lines.
+        tail (bytes): Incomplete last line of the data seen so far.
+    """
+    def __init__(self):
+        """
+        Initialize an empty checksum.
+        """
+        self.lines = 0
+        self.crc = 0
+        self.adler = 0
+        self.tail = b''
+
+    def update(self, data):
+        """
+        Hash the complete lines of a piece of the stream, keeping the incomplete one for the next piece.
+
+        :param data: Text or bytes written to the backup.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        lines = data.split(b'\n')
+        if self.tail:
+            lines[0] = self.tail + lines[0]
+        self.tail = lines.pop()
+        self.add(lines)
+
+    def add(self, rows):
+        """
+        Hash complete rows.
+
+        :param rows: List of the rows as bytes.
+        """
+        self.lines += len(rows)
+        self.crc += sum(map(zlib.crc32, rows))
+        self.adler += sum(map(zlib.adler32, rows))
+
+    def hexdigest(self):
+        """
+        Return the checksum of the rows hashed so far, including an unterminated last line.
+
+        :return: 16 hexadecimal digits.
+        """
+        crc, adler = self.crc, self.adler
+        if self.tail:
+            crc += zlib.crc32(self.tail)
+            adler += zlib.adler32(self.tail)
+        return f"{crc & 0xffffffff:08x}{adler & 0xffffffff:08x}"
+
+
+class CopyBinaryChecksum(RowChecksum):
+    """
+    Order-independent checksum of a binary COPY stream.
+
+    Binary tuples are not delimited by newlines, so the stream is parsed:
+    the header is skipped and every tuple, from its field count to the end of
+    its last field, is hashed as one row.
+
+    Attributes:
+        started (bool): Whether the stream header has been skipped.
+        ended (bool): Whether the trailer has been seen.
+    """
+    def __init__(self):
+        """
+        Initialize an empty checksum.
+        """
+        super().__init__()
+        self.started = False
+        self.ended = False
+
+    def update(self, data):
+        """
+        Hash the complete tuples of a piece of the stream, keeping the incomplete one for the next piece.
+
+        :param data: Bytes of the binary COPY stream.
+        :raises ValueError: If the stream does not start with the binary COPY signature.
+        """
+        buffer = self.tail + bytes(data) if self.tail else bytes(data)
+        size = len(buffer)
+        position = 0
+        if not self.started:
+            if size < _COPY_BINARY_HEADER.size:
+                self.tail = buffer
+                return
+            signature, _, extension = _COPY_BINARY_HEADER.unpack_from(buffer)
+            if signature != COPY_BINARY_SIGNATURE:
+                raise ValueError("Not a binary COPY stream")
+            position = _COPY_BINARY_HEADER.size + extension
+            self.started = True
+        rows = []
+        while not self.ended and position + 2 <= size:
+            fields, = _INT16.unpack_from(buffer, position)
+            if fields == -1:
+                self.ended = True
+                position += 2
+                break
+            end = position + 2
+            for _ in range(fields):
+                if end + 4 > size:
+                    end = size + 1
+                    break
+                length, = _INT32.unpack_from(buffer, end)
+                end += 4 + max(length, 0)
+            if end > size:
+                break
+            rows.append(buffer[position:end])
+            position = end
+        self.add(rows)
+        self.tail = buffer[position:]
+
+
+class ChecksumWriter:
+    """
+    File-like object feeding the data written through it to a checksum.
+
+    Attributes:
+        f: File object the data is written to.
+        checksum (RowChecksum): Checksum fed with the data.
+    """
+    def __init__(self, f, checksum):
+        """
+        Initialize the ChecksumWriter.
+
+        :param f: File object the data is written to.
+        :param checksum: Checksum fed with the data.
+        """
+        self.f = f
+        self.checksum = checksum
+
+    def write(self, data):
+        """
+        Hash data and write it to the wrapped file.
+
+        :param data: Data to write.
+        :return: The result of the wrapped ``write``.
+        """
+        self.checksum.update(data)
+        return self.f.write(data)
+
+
+def new_checksum(data_format):
+    """
+    Create the checksum of a dump unit written in a data format.
+
+    :param data_format: Format of the data backup.
+    :return: A CopyBinaryChecksum for 'copy-binary', a line-based RowChecksum otherwise.
+    """
+    return CopyBinaryChecksum() if data_format == 'copy-binary' else RowChecksum()
@@ -0,0 +1,358 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+import zlib
+from collections import deque
+from itertools import accumulate, compress, count, repeat
+from operator import le, rshift
+from common.checkpoint import PART_SUFFIX
+from common.compression import CHUNKS_SUFFIX, CODEC_SUFFIXES, compress_block, compression_executor, decompress_block
+
+# Name of the chunk store directory inside the backup directory.
+STORE_NAME = 'chunks'
+
+# Target average chunk size; chunks are at least a quarter and at most four times this.
+AVERAGE_CHUNK_SIZE = 1024 * 1024
+
+# Seconds during which an unreferenced chunk is kept by the garbage collection, as a backup may still be writing it.
+GC_GRACE = 6 * 3600
+
+
+class ChunkStore:
+    """
+    Content-addressed store of deduplicated backup chunks.
+
+    Every chunk is stored once, in ``<root>/<first two hex digits>/<sha256>``,
+    optionally compressed. Writing a chunk that is already present is a no-op,
+    so backups that share most of their content only add the chunks that
+    changed.
+
+    Attributes:
+        root (str): Directory of the store.
+        compress (str): Codec chunks are compressed with ('gzip', 'zstd', 'lz4' or None).
+        level (int): Compression level (codec default if None).
+    """
+    def __init__(self, root, compress=None, level=None):
+        """
+        Initialize the ChunkStore.
+
+        :param root: Directory of the store.
+        :param compress: Codec chunks are compressed with ('gzip', 'zstd', 'lz4' or None).
+        :param level: Compression level (codec default if None).
+        """
+        self.root = root
+        self.compress = compress
+        self.level = level
+
+    def path_for(self, digest):
+        """
+        Return the path a chunk is stored at.
+
+        :param digest: SHA-256 hex digest of the uncompressed chunk.
+        """
+        suffix = CODEC_SUFFIXES[self.compress] if self.compress else ''
+        return os.path.join(self.root, digest[:2], digest + suffix)
+
+    def put(self, digest, data):
+        """
+        Store a chunk unless it is already present.
+
+        The chunk is written to a temporary file and renamed into place, so a
+        chunk file is either complete or absent. A chunk already stored has its
+        modification time refreshed instead: the backup reusing it does not
+        reference it until its chunk list is written, and the garbage
+        collection only spares unreferenced chunks that are recent.
+
+        :param digest: SHA-256 hex digest of ``data``.
+        :param data: Uncompressed chunk bytes.
+        :return: True if the chunk was written, False if it was already stored.
+        """
+        path = self.path_for(digest)
+        try:
+            os.utime(path)
+            return False
+        except FileNotFoundError:
+            pass
+        if self.compress:
+            data = compress_block(self.compress, data, self.level)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.tmp_', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return True
+
+    def get(self, digest):
+        """
+        Read a chunk back and verify its checksum.
+
+        :param digest: SHA-256 hex digest of the chunk.
+        :return: Uncompressed chunk bytes.
+        :raises IOError: If the stored chunk does not match its digest.
+        """
+        with open(self.path_for(digest), 'rb') as f:
+            data = f.read()
+        if self.compress:
+            data = decompress_block(self.compress, data)
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise IOError(f"Chunk {digest} in {self.root} is corrupt")
+        return data
+
+
+class ChunkedWriter(io.RawIOBase):
+    """
+    Writable stream that splits its content into content-defined chunks.
+
+    Cut points are chosen from the content, so an inserted or deleted row only
+    changes the chunks around it and the rest of the stream deduplicates
+    against earlier backups. Dumps are line oriented, so cut points are placed
+    at line ends: a line ends a chunk when its CRC-32, scaled down to the
+    average size, does not exceed its length. The odds of a cut are thus
+    proportional to the bytes seen, which yields chunks of ``average_size`` on
+    average whatever the row width. Chunks are kept between a quarter and four
+    times the average; data without newlines is cut at the maximum size.
+    New chunks are compressed and written by the shared compression pool.
+    The chunk list is written to the underlying file on close.
+
+    Attributes:
+        f: Binary file object the chunk list is written to.
+        store (ChunkStore): Store the chunks are written to.
+        store_path (str): Path of the store relative to the chunk list file.
+    """
+    def __init__(self, f, store, store_path, average_size=AVERAGE_CHUNK_SIZE):
+        """
+        Initialize the ChunkedWriter.
+
+        :param f: Binary file object the chunk list is written to.
+        :param store: Store the chunks are written to.
+        :param store_path: Path of the store relative to the chunk list file.
+        :param average_size: Target average chunk size in bytes (a power of two).
+        """
+        if average_size & (average_size - 1):
+            raise ValueError("The average chunk size must be a power of two")
+        super().__init__()
+        self.f = f
+        self.store = store
+        self.store_path = store_path
+        self.average_size = average_size
+        self.min_size = average_size // 4
+        self.max_size = average_size * 4
+        self.shift = 32 - (average_size.bit_length() - 1)
+        self.buffer = bytearray()
+        self.scan = 0
+        self.chunks = []
+        self.size = 0
+        self.written = 0
+        self.pending = deque()
+        self.executor = compression_executor()
+        self.max_pending = 2 * self.executor._max_workers
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        """
+        Buffer data and emit every chunk that can already be cut.
+
+        :param data: Bytes to write.
+        :return: Number of bytes accepted.
+        """
+        self.buffer += data
+        self._cut()
+        return len(data)
+
+    def _cut(self, final=False):
+        """
+        Emit the complete chunks at the start of the buffer.
+
+        Candidate cut points are found for all complete lines at once with
+        C-level iterators; only the few candidates are looked at in Python.
+
+        :param final: Emit the remaining data as well, at the end of the stream.
+        """
+        buf = self.buffer
+        n = len(buf)
+        lines_end = buf.rfind(b'\n') + 1
+        ends = []
+        if lines_end > self.scan:
+            lines = buf[self.scan:lines_end - 1].split(b'\n')
+            lengths = list(map(len, lines))
+            hits = compress(count(), map(le, map(rshift, map(zlib.crc32, lines), repeat(self.shift)), lengths))
+            offsets = list(accumulate(lengths))
+            ends = [self.scan + offsets[i] + i + 1 for i in hits]
+        start = 0
+        with memoryview(buf) as view:
+            for end in ends:
+                while end - start > self.max_size:
+                    self._emit(view[start:start + self.max_size])
+                    start += self.max_size
+                if end - start >= self.min_size:
+                    self._emit(view[start:end])
+                    start = end
+            while n - start >= self.max_size or (final and n > start):
+                size = min(self.max_size, n - start)
+                self._emit(view[start:start + size])
+                start += size
+        del buf[:start]
+        self.scan = max(lines_end - start, 0)
+
+    def _emit(self, view):
+        data = bytes(view)
+        digest = hashlib.sha256(data).hexdigest()
+        self.chunks.append([digest, len(data)])
+        self.size += len(data)
+        self.pending.append(self.executor.submit(self.store.put, digest, data))
+        while len(self.pending) > self.max_pending:
+            self._finish(self.pending.popleft())
+
+    def _finish(self, future):
+        if future.result():
+            self.written += 1
+
+    def close(self):
+        """
+        Emit the last chunk, wait for all chunk writes and write the chunk list.
+        """
+        if self.closed:
+            return
+        try:
+            self._cut(final=True)
+            while self.pending:
+                self._finish(self.pending.popleft())
+            self.f.write(json.dumps({
+                'store': self.store_path,
+                'compress': self.store.compress,
+                'size': self.size,
+                'new_chunks': self.written,
+                'chunks': self.chunks,
+            }).encode('utf-8'))
+        finally:
+            self.f.close()
+            super().close()
+
+
+class ChunkedReader(io.RawIOBase):
+    """
+    Readable stream that reassembles a backup file from its chunks.
+
+    Chunks are loaded one at a time as the stream is consumed, with the next
+    one prefetched in the background, so memory use stays at about two chunks
+    whatever the size of the backup.
+
+    Attributes:
+        path (str): Path to the chunk list file.
+    """
+    def __init__(self, path):
+        """
+        Initialize the ChunkedReader.
+
+        :param path: Path to the chunk list file.
+        """
+        super().__init__()
+        self.path = path
+        manifest = read_chunk_list(path)
+        self.store = ChunkStore(os.path.normpath(os.path.join(os.path.dirname(path), manifest['store'])),
+                                manifest.get('compress'))
+        self.chunks = [digest for digest, _ in manifest['chunks']]
+        self.index = 0
+        self.current = b''
+        self.offset = 0
+        self.next = None
+        self.executor = compression_executor()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        """
+        Copy the next bytes of the stream into ``b``.
+
+        :param b: Writable buffer.
+        :return: Number of bytes copied, 0 at the end of the stream.
+        """
+        while self.offset >= len(self.current):
+            if self.index >= len(self.chunks):
+                return 0
+            if self.next is None:
+                self.next = self.executor.submit(self.store.get, self.chunks[self.index])
+            self.current = self.next.result()
+            self.offset = 0
+            self.index += 1
+            self.next = (self.executor.submit(self.store.get, self.chunks[self.index])
+                         if self.index < len(self.chunks) else None)
+        n = min(len(b), len(self.current) - self.offset)
+        b[:n] = self.current[self.offset:self.offset + n]
+        self.offset += n
+        return n
+
+
+def read_chunk_list(path):
+    """
+    Read the chunk list of a deduplicated backup file.
+
+    :param path: Path to the chunk list file.
+    :return: Dictionary with the ``store`` path, ``compress`` codec, total ``size`` and ``chunks``.
+    """
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def collect_garbage(backup_dir, grace=GC_GRACE):
+    """
+    Remove the chunks of the store of a backup directory that no chunk list references any more.
+
+    Chunk lists are only written once their backup file is complete, so the
+    chunks of a backup still being written are not referenced yet; chunks
+    written or reused within the last ``grace`` seconds are kept for that
+    reason. For
+    the same reason, a ``.part`` chunk list that is empty, not yet valid or
+    renamed away while the store is scanned is skipped.
+
+    :param backup_dir: Backup directory holding the store and the backups using it.
+    :param grace: Age in seconds under which unreferenced chunks are kept.
+    :return: A tuple of the number of chunks removed and the bytes freed.
+    """
+    root = os.path.abspath(os.path.join(backup_dir, STORE_NAME))
+    if not os.path.isdir(root):
+        return 0, 0
+    referenced = set()
+    for directory, dirnames, filenames in os.walk(backup_dir):
+        if os.path.abspath(directory) == root:
+            dirnames[:] = []
+            continue
+        for name in filenames:
+            if name.endswith(CHUNKS_SUFFIX + PART_SUFFIX):
+                try:
+                    chunk_list = read_chunk_list(os.path.join(directory, name))
+                except (OSError, ValueError):
+                    continue
+            elif name.endswith(CHUNKS_SUFFIX):
+                chunk_list = read_chunk_list(os.path.join(directory, name))
+            else:
+                continue
+            if os.path.abspath(os.path.join(directory, chunk_list['store'])) == root:
+                referenced.update([digest for digest, _ in chunk_list['chunks']])
+    removed = 0
+    freed = 0
+    deadline = time.time() - grace
+    for directory, _, filenames in os.walk(root):
+        for name in filenames:
+            # Chunks are named after their digest; temporary files start with a dot.
+            digest = name.split('.')[0]
+            if not digest or digest in referenced:
+                continue
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            if stat.st_mtime < deadline:
+                os.remove(path)
+                removed += 1
+                freed += stat.st_size
+    return removed, freed
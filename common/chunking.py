@@ -0,0 +1,22 @@
+def key_range_predicates(column, low, high, chunks):
+    """
+    Split an integer key range into WHERE predicates of roughly equal width.
+
+    The first and last predicates are open-ended, so together the predicates
+    cover every possible key value even if rows fall outside ``[low, high]``.
+
+    :param column: Quoted name of the key column.
+    :param low: Lowest key value in the table (None for an empty table).
+    :param high: Highest key value in the table.
+    :param chunks: Number of ranges to produce.
+    :return: A list of predicates, or ``[None]`` if the range cannot be split.
+    """
+    if low is None or high is None or chunks < 2 or high - low + 1 < chunks:
+        return [None]
+    low, high = int(low), int(high)
+    bounds = [low + (high - low + 1) * i // chunks for i in range(1, chunks)]
+    predicates = [f"{column} < {bounds[0]}"]
+    for start, end in zip(bounds, bounds[1:]):
+        predicates.append(f"{column} >= {start} AND {column} < {end}")
+    predicates.append(f"{column} >= {bounds[-1]}")
+    return predicates
@@ -0,0 +1,394 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# File name suffix for every supported codec.
+CODEC_SUFFIXES = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+    'lz4': '.lz4',
+}
+DEFAULT_LEVELS = {
+    'gzip': 6,
+    'zstd': 3,
+    'lz4': 0,
+}
+
+# Suffix of deduplicated backup files, which only list their chunks (see common.chunk_store).
+CHUNKS_SUFFIX = '.chunks'
+
+# Uncompressed bytes handed to a compression worker at a time.
+BLOCK_SIZE = 4 * 1024 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def compression_executor():
+    """
+    Return the thread pool shared by all compressed writers.
+
+    The codecs release the GIL while compressing, so blocks from every open
+    backup file are compressed concurrently on all cores.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix='compress')
+        return _executor
+
+
+def _import_codec(codec):
+    """
+    Import the module implementing a codec.
+
+    :param codec: Codec name ('gzip', 'zstd' or 'lz4').
+    :return: The imported module.
+    :raises ValueError: If the codec is unknown or its package is not installed.
+    """
+    if codec == 'gzip':
+        return gzip
+    try:
+        if codec == 'zstd':
+            import zstandard
+            return zstandard
+        if codec == 'lz4':
+            import lz4.frame
+            return lz4.frame
+    except ImportError:
+        package = 'zstandard' if codec == 'zstd' else 'lz4'
+        raise ValueError(f"{codec} compression requires the '{package}' package to be installed")
+    raise ValueError(f"Unsupported compression codec: {codec}")
+
+
+def compress_block(codec, data, level=None):
+    """
+    Compress a block of data into a self-contained frame.
+
+    Frames of each codec can be concatenated and still decompress as a single
+    stream, which is what allows blocks to be compressed in parallel.
+
+    :param codec: Codec name ('gzip', 'zstd' or 'lz4').
+    :param data: Bytes to compress.
+    :param level: Compression level (codec default if None).
+    :return: The compressed frame.
+    """
+    module = _import_codec(codec)
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if codec == 'zstd':
+        return module.ZstdCompressor(level=level).compress(data)
+    return module.compress(data, compression_level=level)
+
+
+def decompress_block(codec, data):
+    """
+    Decompress a frame produced by ``compress_block``.
+
+    :param codec: Codec name ('gzip', 'zstd' or 'lz4').
+    :param data: The compressed frame.
+    :return: The original bytes.
+    """
+    module = _import_codec(codec)
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    if codec == 'zstd':
+        return module.ZstdDecompressor().decompressobj().decompress(data)
+    return module.decompress(data)
+
+
+def decompress_stream(f, codec):
+    """
+    Wrap a binary stream of compressed frames in a decompressing reader.
+
+    :param f: Readable binary file object positioned at the first frame; it is not closed with the reader.
+    :param codec: Codec name ('gzip', 'zstd' or 'lz4').
+    :return: A readable binary file object of the decompressed data.
+    """
+    module = _import_codec(codec)
+    if codec == 'gzip':
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    if codec == 'zstd':
+        reader = module.ZstdDecompressor().stream_reader(f, read_across_frames=True, closefd=False)
+        return io.BufferedReader(reader, buffer_size=1024 * 1024)
+    return module.LZ4FrameFile(f, 'rb')
+
+
+def codec_for_path(path):
+    """
+    Detect the codec of a backup file from its name.
+
+    :param path: Path to the backup file.
+    :return: The codec name, or None for an uncompressed file.
+    """
+    for codec, suffix in CODEC_SUFFIXES.items():
+        if path.endswith(suffix):
+            return codec
+    return None
+
+
+def strip_codec_suffix(path):
+    """
+    Remove the compression or deduplication suffix from a backup file name.
+
+    :param path: Path to the backup file.
+    :return: The path as it would be without compression.
+    """
+    if path.endswith(CHUNKS_SUFFIX):
+        return path[:-len(CHUNKS_SUFFIX)]
+    codec = codec_for_path(path)
+    return path[:-len(CODEC_SUFFIXES[codec])] if codec else path
+
+
+def compressed_name(name, compress=None, dedup=False):
+    """
+    Add the codec suffix to a backup file name.
+
+    :param name: File name without compression suffix.
+    :param compress: Codec name, or None for no compression.
+    :param dedup: The file is stored in the chunk store; compression then applies per chunk.
+    :return: The file name the backup is written to.
+    """
+    if dedup:
+        return name + CHUNKS_SUFFIX
+    return name + CODEC_SUFFIXES[compress] if compress else name
+
+
+def data_size(path):
+    """
+    Return the size of the data held by a backup file.
+
+    :param path: Path to the backup file.
+    :return: The stored size, or the reassembled size of a deduplicated file.
+    """
+    if path.endswith(CHUNKS_SUFFIX):
+        from common.chunk_store import read_chunk_list
+        return read_chunk_list(path)['size']
+    return os.path.getsize(path)
+
+
+class CompressedWriter(io.RawIOBase):
+    """
+    Writable stream that compresses blocks in a background thread pool.
+
+    Data is cut into fixed-size blocks that are compressed concurrently while
+    the caller keeps producing rows. Compressed frames are written to the file
+    in order; once too many blocks are in flight, ``write`` waits for the
+    oldest one, which bounds memory use.
+
+    Attributes:
+        f: Underlying binary file object.
+        codec (str): Codec name ('gzip', 'zstd' or 'lz4').
+        level (int): Compression level.
+    """
+    def __init__(self, f, codec, level=None, block_size=BLOCK_SIZE):
+        """
+        Initialize the CompressedWriter.
+
+        :param f: Underlying binary file object.
+        :param codec: Codec name ('gzip', 'zstd' or 'lz4').
+        :param level: Compression level (codec default if None).
+        :param block_size: Uncompressed bytes per compressed frame.
+        """
+        super().__init__()
+        _import_codec(codec)
+        self.f = f
+        self.codec = codec
+        self.level = level
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.pending = deque()
+        self.executor = compression_executor()
+        self.max_pending = 2 * self.executor._max_workers
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        """
+        Buffer data and submit full blocks for compression.
+
+        :param data: Bytes to write.
+        :return: Number of bytes accepted.
+        """
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            block = bytes(self.buffer[:self.block_size])
+            del self.buffer[:self.block_size]
+            self._submit(block)
+        return len(data)
+
+    def _submit(self, block):
+        self.pending.append(self.executor.submit(compress_block, self.codec, block, self.level))
+        while len(self.pending) > self.max_pending:
+            self.f.write(self.pending.popleft().result())
+
+    def close(self):
+        """
+        Compress the remaining data, write all pending frames and close the file.
+        """
+        if self.closed:
+            return
+        try:
+            if self.buffer:
+                self._submit(bytes(self.buffer))
+                self.buffer = bytearray()
+            while self.pending:
+                self.f.write(self.pending.popleft().result())
+        finally:
+            self.f.close()
+            super().close()
+
+
+class HashingWriter(io.RawIOBase):
+    """
+    Writable stream that feeds everything written through it to a hash.
+
+    Attributes:
+        f: Underlying binary file object.
+        digest: hashlib object updated with the bytes written.
+    """
+    def __init__(self, f, digest):
+        """
+        Initialize the HashingWriter.
+
+        :param f: Underlying binary file object.
+        :param digest: hashlib object updated with the bytes written.
+        """
+        super().__init__()
+        self.f = f
+        self.digest = digest
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.f.write(data)
+
+    def close(self):
+        if not self.closed:
+            self.f.close()
+            super().close()
+
+
+def open_backup_file(path, mode='r', compress=None, level=None, digest=None, chunk_store=None):
+    """
+    Open a backup file, compressing or decompressing it transparently.
+
+    When writing, ``path`` must already carry the codec suffix (see
+    ``compressed_name``). When reading, the codec is detected from the suffix
+    and the file is decompressed as a stream. Deduplicated files are written
+    to and reassembled from their chunk store.
+
+    :param path: Path to the backup file.
+    :param mode: One of 'r', 'rb', 'w' or 'wb'.
+    :param compress: Codec used when writing, or None for no compression.
+    :param level: Compression level used when writing.
+    :param digest: hashlib object updated with the bytes stored in the file when writing (optional).
+    :param chunk_store: ChunkStore the content is deduplicated into when writing (optional).
+    :return: A file object; text modes use UTF-8.
+    """
+    binary = 'b' in mode
+    if mode.startswith('w'):
+        if not compress and digest is None and chunk_store is None:
+            return open(path, mode) if binary else open(path, mode, encoding='utf-8')
+        raw = open(path, 'wb')
+        if digest is not None:
+            raw = HashingWriter(raw, digest)
+        if chunk_store is not None:
+            from common.chunk_store import ChunkedWriter
+            raw = ChunkedWriter(raw, chunk_store, os.path.relpath(chunk_store.root, os.path.dirname(path)))
+        elif compress:
+            raw = CompressedWriter(raw, compress, level)
+        stream = io.BufferedWriter(raw, buffer_size=1024 * 1024)
+    elif path.endswith(CHUNKS_SUFFIX):
+        from common.chunk_store import ChunkedReader
+        stream = io.BufferedReader(ChunkedReader(path), buffer_size=1024 * 1024)
+    else:
+        codec = codec_for_path(path)
+        if codec is None:
+            return open(path, mode) if binary else open(path, mode, encoding='utf-8')
+        module = _import_codec(codec)
+        if codec == 'gzip':
+            stream = gzip.open(path, 'rb')
+        elif codec == 'zstd':
+            reader = module.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True,
+                                                             closefd=True)
+            stream = io.BufferedReader(reader, buffer_size=1024 * 1024)
+        else:
+            stream = module.open(path, 'rb')
+    return stream if binary else io.TextIOWrapper(stream, encoding='utf-8')
+
+
+class DecompressedFile:
+    """
+    Context manager exposing a compressed backup file under a plain path.
+
+    Tools that insist on opening a file by name, such as ``LOAD DATA LOCAL
+    INFILE``, get a named pipe that a background thread fills with the
+    decompressed stream, so nothing is written to disk. Where named pipes are
+    not available the file is decompressed to a temporary file instead.
+    Plain files are passed through unchanged, unless the content comes from
+    another ``source``, such as a section of an archive.
+
+    Attributes:
+        path (str): Path to the backup file.
+        directory (str): Directory the pipe or temporary file is created in.
+        source: Callable returning a readable binary stream of the content (reads ``path`` if None).
+    """
+    def __init__(self, path, directory, source=None):
+        """
+        Initialize the DecompressedFile.
+
+        :param path: Path to the backup file; the pipe is named after it.
+        :param directory: Directory the pipe or temporary file is created in.
+        :param source: Callable returning a readable binary stream of the content (reads ``path`` if None).
+        """
+        self.path = path
+        self.directory = directory
+        self.source = source
+        self.temp_dir = None
+        self.target = None
+        self.thread = None
+
+    def __enter__(self):
+        if self.source is None and strip_codec_suffix(self.path) == self.path:
+            return self.path
+        self.temp_dir = tempfile.mkdtemp(prefix='.load_', dir=self.directory)
+        target = self.target = os.path.join(self.temp_dir, os.path.basename(strip_codec_suffix(self.path)))
+        if hasattr(os, 'mkfifo'):
+            os.mkfifo(target)
+            self.thread = threading.Thread(target=self._feed, args=(target,), daemon=True)
+            self.thread.start()
+        else:
+            with self._open_source() as src, open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        return target
+
+    def _feed(self, target):
+        try:
+            with self._open_source() as src, open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        except BrokenPipeError:
+            pass
+
+    def _open_source(self):
+        return self.source() if self.source is not None else open_backup_file(self.path, 'rb')
+
+    def __exit__(self, exc_type, exc, tb):
+        while self.thread is not None and self.thread.is_alive():
+            # The pipe was not read to the end (the load failed early): briefly
+            # connect a reader so the feeding thread gets past opening the pipe,
+            # then hang up so its next write fails and it stops.
+            os.close(os.open(self.target, os.O_RDONLY | os.O_NONBLOCK))
+            self.thread.join(0.1)
+        if self.temp_dir:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+        return False
@@ -0,0 +1,372 @@
+import re
+import struct
+
+# Size of the frames a binary COPY stream is split into inside a backup file.
+FRAME_SIZE = 1024 * 1024
+
+# Number of characters handed to ``copy_expert`` per read when loading data.
+COPY_BUFFER_SIZE = 1024 * 1024
+
+_FRAME_HEADER = struct.Struct('>I')
+
+INSERT_PATTERN = re.compile(r'\s*INSERT\s+INTO\s+(\S+)\s+VALUES\s*(.*?);?\s*$', re.IGNORECASE | re.DOTALL)
+COPY_FROM_PATTERN = re.compile(r'\s*COPY\s+(\S+).*\sFROM\s+STDIN\b', re.IGNORECASE | re.DOTALL)
+
+
+class FramedWriter:
+    """
+    File-like object that stores a binary COPY stream as length-prefixed frames.
+
+    Binary COPY data has no terminator that can be found without parsing every
+    tuple, so each table's stream is written as a series of frames (4-byte
+    big-endian length followed by the payload) and closed with an empty frame.
+    This lets several tables share one backup file and lets the restore side
+    hand the payload back to the server without looking inside it.
+
+    Attributes:
+        f: Underlying binary file object.
+        frame_size (int): Number of bytes buffered before a frame is emitted.
+    """
+    def __init__(self, f, frame_size=FRAME_SIZE):
+        """
+        Initialize the FramedWriter.
+
+        :param f: Underlying binary file object.
+        :param frame_size: Number of bytes buffered before a frame is emitted.
+        """
+        self.f = f
+        self.frame_size = frame_size
+        self.buffer = bytearray()
+
+    def write(self, data):
+        """
+        Buffer data and emit full frames.
+
+        :param data: Bytes produced by ``copy_expert``.
+        :return: Number of bytes accepted.
+        """
+        self.buffer += data
+        if len(self.buffer) >= self.frame_size:
+            self.flush_frame()
+        return len(data)
+
+    def flush_frame(self):
+        """
+        Write the buffered bytes as a single frame.
+        """
+        if self.buffer:
+            self.f.write(_FRAME_HEADER.pack(len(self.buffer)))
+            self.f.write(self.buffer)
+            self.buffer = bytearray()
+
+    def close(self):
+        """
+        Flush the remaining bytes and write the end-of-section marker.
+        """
+        self.flush_frame()
+        self.f.write(_FRAME_HEADER.pack(0))
+
+
+class FramedReader:
+    """
+    File-like object that reads back a stream written by FramedWriter.
+
+    ``read`` returns ``b''`` once the end-of-section marker is reached, which
+    is what ``copy_expert`` expects at the end of a ``COPY ... FROM STDIN``.
+
+    Attributes:
+        f: Underlying binary file object positioned at the first frame.
+    """
+    def __init__(self, f):
+        """
+        Initialize the FramedReader.
+
+        :param f: Underlying binary file object positioned at the first frame.
+        """
+        self.f = f
+        self.remaining = 0
+        self.finished = False
+
+    def read(self, size=-1):
+        """
+        Read up to ``size`` bytes of the section payload.
+
+        :param size: Maximum number of bytes to return (-1 for the rest of the current frame).
+        :return: Payload bytes, or ``b''`` at the end of the section.
+        """
+        if self.finished:
+            return b''
+        if self.remaining == 0:
+            header = self.f.read(_FRAME_HEADER.size)
+            if len(header) < _FRAME_HEADER.size:
+                raise EOFError("Truncated binary COPY section")
+            self.remaining = _FRAME_HEADER.unpack(header)[0]
+            if self.remaining == 0:
+                self.finished = True
+                return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        if len(data) < size:
+            raise EOFError("Truncated binary COPY section")
+        self.remaining -= size
+        return data
+
+
+def escape_copy_value(value):
+    """
+    Encode a single value for the COPY text format.
+
+    :param value: Field value as a string, or None for SQL NULL.
+    :return: The escaped field.
+    """
+    if value is None:
+        return '\\N'
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def parse_insert_values(values_sql):
+    """
+    Parse the tuple list of an ``INSERT ... VALUES`` statement.
+
+    Quoted literals are unescaped (``''`` becomes ``'``) and anything outside
+    the quotes, such as a ``::type`` cast, is dropped. Unquoted ``NULL`` (and the
+    ``None`` written by older backups) becomes None, other unquoted values are
+    returned as they appear.
+
+    :param values_sql: The text following the ``VALUES`` keyword.
+    :return: A list of rows, each a list of field values.
+    """
+    rows = []
+    row = None
+    literal = None
+    bare = []
+    i = 0
+    n = len(values_sql)
+    while i < n:
+        c = values_sql[i]
+        if row is None:
+            if c == '(':
+                row = []
+            i += 1
+            continue
+        if c == "'":
+            parts = []
+            j = i + 1
+            while True:
+                k = values_sql.find("'", j)
+                if k == -1:
+                    raise ValueError("Unterminated string literal in INSERT statement")
+                parts.append(values_sql[j:k])
+                if values_sql.startswith("'", k + 1):
+                    parts.append("'")
+                    j = k + 2
+                else:
+                    j = k + 1
+                    break
+            literal = ''.join(parts) if literal is None else literal + ''.join(parts)
+            i = j
+            continue
+        if c == ',' or c == ')':
+            if literal is not None:
+                row.append(literal)
+            else:
+                value = ''.join(bare).strip()
+                row.append(None if value.upper() in ('NULL', 'NONE') else value)
+            literal = None
+            bare = []
+            if c == ')':
+                rows.append(row)
+                row = None
+            i += 1
+            continue
+        bare.append(c)
+        i += 1
+    if row is not None:
+        raise ValueError("Unterminated value list in INSERT statement")
+    return rows
+
+
+class CopySectionReader:
+    """
+    File-like object over the data lines of a text COPY section.
+
+    Reads lines from the dump until the ``\\.`` terminator and hands them out
+    in chunks, so ``copy_expert`` can load the section without it ever being
+    held in memory as a whole.
+
+    Attributes:
+        f: Text file object positioned at the first data line.
+    """
+    def __init__(self, f):
+        """
+        Initialize the CopySectionReader.
+
+        :param f: Text file object positioned at the first data line.
+        """
+        self.f = f
+        self.finished = False
+
+    def read(self, size=COPY_BUFFER_SIZE):
+        """
+        Read whole data lines up to roughly ``size`` characters.
+
+        :param size: Preferred chunk size in characters.
+        :return: The next chunk of COPY data, or an empty string at the end of the section.
+        """
+        if size is None or size < 0:
+            size = COPY_BUFFER_SIZE
+        lines = []
+        length = 0
+        while not self.finished and length < size:
+            line = self.f.readline()
+            if not line or line.rstrip('\r\n') == '\\.':
+                self.finished = True
+                break
+            lines.append(line)
+            length += len(line)
+        return ''.join(lines)
+
+    def readline(self, size=-1):
+        """
+        Read a single data line.
+
+        :return: The next line of COPY data, or an empty string at the end of the section.
+        """
+        if self.finished:
+            return ''
+        line = self.f.readline()
+        if not line or line.rstrip('\r\n') == '\\.':
+            self.finished = True
+            return ''
+        return line
+
+
+class InsertCopyReader:
+    """
+    File-like object that turns a run of INSERT statements into COPY text rows.
+
+    Statements are pulled from an iterator for as long as they insert into the
+    same table. The first statement that does not is kept in ``next_statement``
+    so the caller can continue with it after the COPY finishes.
+
+    Attributes:
+        table (str): Table the INSERT statements target.
+        statements: Iterator over the remaining statements of the dump.
+        next_statement (str): First statement after the run, or None at the end of the dump.
+    """
+    def __init__(self, table, values_sql, statements):
+        """
+        Initialize the InsertCopyReader.
+
+        :param table: Table the INSERT statements target.
+        :param values_sql: The VALUES part of the first INSERT statement of the run.
+        :param statements: Iterator over the remaining statements of the dump.
+        """
+        self.table = table
+        self.statements = statements
+        self.pending = [values_sql]
+        self.next_statement = None
+        self.finished = False
+        self.rows = 0
+
+    def read(self, size=COPY_BUFFER_SIZE):
+        """
+        Convert INSERT statements into COPY rows up to roughly ``size`` characters.
+
+        :param size: Preferred chunk size in characters.
+        :return: The next chunk of COPY data, or an empty string at the end of the run.
+        """
+        if size is None or size < 0:
+            size = COPY_BUFFER_SIZE
+        lines = []
+        length = 0
+        while length < size:
+            if self.pending:
+                values_sql = self.pending.pop()
+            elif self.finished:
+                break
+            else:
+                statement = next(self.statements, None)
+                match = INSERT_PATTERN.match(statement) if statement is not None else None
+                if match is None or match.group(1) != self.table:
+                    self.next_statement = statement
+                    self.finished = True
+                    break
+                values_sql = match.group(2)
+            for row in parse_insert_values(values_sql):
+                line = '\t'.join([escape_copy_value(value) for value in row]) + '\n'
+                lines.append(line)
+                length += len(line)
+                self.rows += 1
+        return ''.join(lines)
+
+
+class CopyBatchReader:
+    """
+    File-like object splitting a text COPY stream into batches of whole rows.
+
+    ``read`` returns an empty string once the current batch holds
+    ``max_rows`` rows or about ``max_bytes`` characters, which ends the COPY
+    loading it; ``next_batch`` then starts the next batch where the last one
+    stopped. Each batch can so be loaded and committed by its own COPY.
+
+    Attributes:
+        reader: File-like object supplying the COPY rows, one per line.
+        max_rows (int): Number of rows per batch (no limit if None).
+        max_bytes (int): Number of characters after which a batch ends (no limit if None).
+        rows (int): Number of rows read in the current batch.
+    """
+    def __init__(self, reader, max_rows=None, max_bytes=None):
+        """
+        Initialize the CopyBatchReader at the start of the first batch.
+
+        :param reader: File-like object supplying the COPY rows, one per line.
+        :param max_rows: Number of rows per batch (no limit if None).
+        :param max_bytes: Number of characters after which a batch ends (no limit if None).
+        """
+        self.reader = reader
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.leftover = ''
+        self.exhausted = False
+        self.rows = 0
+        self.size = 0
+
+    def next_batch(self):
+        """
+        Start the next batch.
+
+        :return: False if the stream has no rows left.
+        """
+        self.rows = 0
+        self.size = 0
+        return bool(self.leftover) or not self.exhausted
+
+    def read(self, size=COPY_BUFFER_SIZE):
+        """
+        Read whole rows of the current batch.
+
+        :param size: Preferred chunk size in characters.
+        :return: The next chunk of COPY data, or an empty string at the end of the batch.
+        """
+        if size is None or size < 0:
+            size = COPY_BUFFER_SIZE
+        if self.max_bytes:
+            if self.size >= self.max_bytes:
+                return ''
+            size = min(size, self.max_bytes - self.size)
+        if self.max_rows and self.rows >= self.max_rows:
+            return ''
+        data, self.leftover = self.leftover, ''
+        if not data and not self.exhausted:
+            data = self.reader.read(size)
+            self.exhausted = not data
+        if self.max_rows and data.count('\n') > self.max_rows - self.rows:
+            end = -1
+            for _ in range(self.max_rows - self.rows):
+                end = data.index('\n', end + 1)
+            data, self.leftover = data[:end + 1], data[end + 1:]
+        self.rows += data.count('\n')
+        self.size += len(data)
+        return data
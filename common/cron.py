@@ -0,0 +1,165 @@
+from datetime import datetime, timedelta
+
+# Shorthands accepted in place of the five fields.
+ALIASES = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+
+# Name, lowest value, highest value and value names of every field.
+FIELDS = (
+    ('minute', 0, 59, ()),
+    ('hour', 0, 23, ()),
+    ('day', 1, 31, ()),
+    ('month', 1, 12, ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')),
+    ('weekday', 0, 7, ('sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat')),
+)
+
+# A schedule that matches nothing within this many years (such as 30 February) is rejected;
+# 29 February can be eight years away around a century.
+SEARCH_YEARS = 9
+
+
+class CronSchedule:
+    """
+    Schedule given as a five-field cron expression: minute, hour, day of month, month and day of week.
+
+    Fields accept ``*``, values, ranges (``1-5``), steps (``*/15``, ``0-30/10``),
+    comma-separated lists of these, and month and weekday names (``jan``,
+    ``mon``). Sunday is 0 or 7. As in cron, when both the day of month and the
+    day of week are restricted, a day matching either of them matches. The
+    ``@hourly``, ``@daily``, ``@weekly``, ``@monthly`` and ``@yearly``
+    shorthands are accepted too. Times are local and have a one minute
+    resolution.
+
+    Attributes:
+        expression (str): The expression as given.
+        minutes (set): Minutes of the hour that match.
+        hours (set): Hours of the day that match.
+        days (set): Days of the month that match.
+        months (set): Months that match.
+        weekdays (set): Days of the week that match, Sunday being 0.
+        any_day (bool): The day of month field is ``*``.
+        any_weekday (bool): The day of week field is ``*``.
+    """
+    def __init__(self, expression):
+        """
+        Parse a cron expression.
+
+        :param expression: Five whitespace-separated fields, or one of the ``@`` shorthands.
+        :raises ValueError: If the expression is malformed or never matches.
+        """
+        self.expression = expression
+        fields = ALIASES.get(expression.strip().lower(), expression).split()
+        if len(fields) != len(FIELDS):
+            raise ValueError(f"Cron expression {expression!r} needs {len(FIELDS)} fields, got {len(fields)}")
+        values = [parse_field(text, *spec) for text, spec in zip(fields, FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = values
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+        self.next_after(datetime(2000, 1, 1))
+
+    def matches_day(self, moment):
+        """
+        Tell whether the schedule runs on the day of a moment.
+
+        :param moment: Datetime to check.
+        :return: True if the day of month and day of week fields allow the day.
+        """
+        day = moment.day in self.days
+        # datetime counts weekdays from Monday; cron from Sunday.
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def matches(self, moment):
+        """
+        Tell whether the schedule runs at the minute of a moment.
+
+        :param moment: Datetime to check.
+        :return: True if every field matches.
+        """
+        return (moment.minute in self.minutes and moment.hour in self.hours and moment.month in self.months
+                and self.matches_day(moment))
+
+    def next_after(self, moment):
+        """
+        Find the first minute after a moment at which the schedule runs.
+
+        Whole months, days and hours that do not match are skipped at once.
+
+        :param moment: Datetime to search from, exclusive.
+        :return: The datetime of the next run, at a whole minute.
+        :raises ValueError: If the schedule does not run within ``SEARCH_YEARS`` years.
+        """
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate.replace(year=candidate.year + SEARCH_YEARS, month=1, day=1)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.year * 12 + candidate.month, 12)
+                candidate = datetime(year, month + 1, 1)
+            elif not self.matches_day(candidate):
+                candidate = datetime(candidate.year, candidate.month, candidate.day) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression {self.expression!r} never matches")
+
+    def __repr__(self):
+        return f"CronSchedule({self.expression!r})"
+
+
+def parse_field(text, name, lowest, highest, names):
+    """
+    Expand one field of a cron expression into the values it matches.
+
+    :param text: The field.
+    :param name: Name of the field, for error messages.
+    :param lowest: Lowest value of the field.
+    :param highest: Highest value of the field.
+    :param names: Names of the values, starting at ``lowest`` (empty if the field has none).
+    :return: The set of matching values.
+    :raises ValueError: If the field is malformed or out of range.
+    """
+    values = set()
+    for part in text.lower().split(','):
+        span, _, step = part.partition('/')
+        try:
+            step = int(step) if step else 1
+            if span == '*':
+                first, last = lowest, highest
+            else:
+                start, _, end = span.partition('-')
+                first = field_value(start, lowest, names)
+                last = field_value(end, lowest, names) if end else (highest if '/' in part else first)
+        except ValueError:
+            raise ValueError(f"Invalid cron {name} field: {text!r}") from None
+        if step < 1 or not lowest <= first <= last <= highest:
+            raise ValueError(f"Cron {name} field {text!r} is out of range {lowest}-{highest}")
+        values.update(range(first, last + 1, step))
+    return values
+
+
+def field_value(text, lowest, names):
+    """
+    Read a single value of a cron field, given as a number or a name.
+
+    :param text: The value.
+    :param lowest: Lowest value of the field, the value of the first name.
+    :param names: Names of the values (empty if the field has none).
+    :return: The value as an integer.
+    :raises ValueError: If the value is neither a number nor a known name.
+    """
+    if text in names:
+        return names.index(text) + lowest
+    return int(text)
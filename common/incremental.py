@@ -0,0 +1,58 @@
+import os
+from common.manifest import read_manifest
+
+
+def load_base_manifest(catalog, db_type, database, data_format, compress):
+    """
+    Find the backup an incremental backup can build on.
+
+    Only the latest per-table data backup of the same database qualifies, and
+    only if it recorded table fingerprints and used the same format and
+    compression, so its files can be mixed with newly dumped ones.
+
+    :param catalog: BackupCatalog of the backup directory.
+    :param db_type: Type of the database ('mysql' or 'pgsql').
+    :param database: Name of the database being backed up.
+    :param data_format: Format of the new backup.
+    :param compress: Codec of the new backup.
+    :return: A ``(directory, manifest)`` pair, or ``(None, None)`` if there is no usable base.
+    """
+    base = catalog.find(db_type, 'data', database=database)
+    if base is None or not os.path.isdir(base['path']):
+        return None, None
+    manifest = read_manifest(base['path'])
+    if ('fingerprints' not in manifest or manifest.get('format') != data_format
+            or manifest.get('compress') != compress):
+        return None, None
+    return base['path'], manifest
+
+
+def reuse_unchanged(base_dir, base_manifest, directory, fingerprints):
+    """
+    Select the files of a base backup that still hold the current table contents.
+
+    A table is reused when its fingerprint is known and equal to the one
+    recorded by the base backup and all of its files still exist. The returned
+    entries point at the base files relative to the new backup directory, so
+    a restore of the new backup loads them from where they are.
+
+    :param base_dir: Directory of the base backup.
+    :param base_manifest: Manifest of the base backup.
+    :param directory: Directory of the new backup.
+    :param fingerprints: Dictionary mapping a table to its current fingerprint.
+    :return: Dictionary mapping each reused table to its rebased manifest entries.
+    """
+    base_fingerprints = base_manifest['fingerprints']
+    entries_by_table = {}
+    for entry in base_manifest['tables']:
+        entries_by_table.setdefault(entry['table'], []).append(entry)
+    reused = {}
+    for table, entries in entries_by_table.items():
+        fingerprint = fingerprints.get(table)
+        if fingerprint is None or fingerprint != base_fingerprints.get(table):
+            continue
+        paths = [os.path.normpath(os.path.join(base_dir, entry['file'])) for entry in entries]
+        if not all(os.path.exists(path) for path in paths):
+            continue
+        reused[table] = [dict(entry, file=os.path.relpath(path, directory)) for entry, path in zip(entries, paths)]
+    return reused
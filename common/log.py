@@ -0,0 +1,22 @@
+import logging
+import os
+
+
+def add_file_handler(logger, path, formatter):
+    """
+    Attach a file handler to a logger unless one already writes to the same file.
+
+    Loggers are process-wide, so when a backup class is instantiated once
+    per database in the same process, a handler added on every
+    instantiation would repeat each message once per database.
+
+    :param logger: Logger to attach the handler to.
+    :param path: Path to the log file.
+    :param formatter: Formatter of the log records.
+    """
+    path = os.path.abspath(path)
+    if any(getattr(handler, 'baseFilename', None) == path for handler in logger.handlers):
+        return
+    file_handler = logging.FileHandler(path)
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
@@ -0,0 +1,55 @@
+import json
+import os
+from common.metrics import write_atomically
+
+# Name of the file that describes the contents of a backup directory.
+MANIFEST_NAME = 'manifest.json'
+
+
+def write_manifest(directory, manifest):
+    """
+    Write the manifest of a backup directory, atomically.
+
+    :param directory: Backup directory the manifest describes.
+    :param manifest: Dictionary with the backup metadata and its ``tables`` entries.
+    """
+    write_atomically(os.path.join(directory, MANIFEST_NAME), json.dumps(manifest, indent=2))
+
+
+def read_manifest(directory):
+    """
+    Read the manifest of a backup directory.
+
+    Directories written before manifests existed are described by listing
+    their table files in name order.
+
+    :param directory: Backup directory to read.
+    :return: Dictionary with at least a ``tables`` list of ``{'table', 'file'}`` entries.
+    """
+    path = os.path.join(directory, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    tables = []
+    for file_name in sorted(os.listdir(directory)):
+        table, ext = os.path.splitext(file_name)
+        if ext in ('.sql', '.tsv', '.copy'):
+            tables.append({'table': table, 'file': file_name})
+    return {'tables': tables}
+
+
+def select_tables(entries, tables=None):
+    """
+    Keep the entries of the requested tables.
+
+    :param entries: Entries with a ``table`` key, such as manifest or archive index entries.
+    :param tables: Names of the tables to keep, or None to keep all of them.
+    :return: The entries of the requested tables, in their original order.
+    :raises ValueError: If a requested table has no entry.
+    """
+    if not tables:
+        return entries
+    missing = set(tables) - {entry['table'] for entry in entries}
+    if missing:
+        raise ValueError(f"Tables not found in the backup: {', '.join(sorted(missing))}")
+    return [entry for entry in entries if entry['table'] in tables]
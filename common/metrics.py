@@ -0,0 +1,458 @@
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# Time phases recorded per table: reading rows (from the database on backup,
+# from the backup file on restore), encoding them and writing them out (to the
+# backup file on backup, to the database on restore).
+PHASES = ('fetch', 'encode', 'write')
+
+# Minimum number of seconds between two redraws of the progress line.
+PROGRESS_INTERVAL = 0.5
+
+
+def write_atomically(path, text):
+    """
+    Write a text file so readers never see it half written.
+
+    The text goes to a temporary file in the same directory, which then
+    replaces the target, as the Prometheus textfile collector requires. The
+    temporary file has a unique name, so runs writing the same report at
+    once do not trip over each other.
+
+    :param path: Path to the file.
+    :param text: Content of the file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        # mkstemp creates the file readable by its owner only; the collector may run as another user.
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def format_duration(seconds):
+    """
+    Format a number of seconds as ``H:MM:SS``.
+
+    :param seconds: Number of seconds.
+    :return: The formatted duration.
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def prometheus_labels(labels):
+    """
+    Format the labels of a Prometheus sample.
+
+    :param labels: Dictionary of label names and values.
+    :return: The labels between braces, with the values escaped.
+    """
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for name, value in labels.items()]
+    return '{' + ','.join([f'{name}="{value}"' for name, value in escaped]) + '}'
+
+
+class ProgressLine:
+    """
+    A single status line redrawn in place on a terminal.
+
+    Attributes:
+        stream: Text stream the line is drawn on.
+        interval (float): Minimum number of seconds between two redraws.
+        width (int): Length of the line last drawn, blanked out by the next one.
+        drawn (float): Monotonic time of the last redraw.
+    """
+    def __init__(self, stream=None, interval=PROGRESS_INTERVAL):
+        """
+        Initialize the ProgressLine.
+
+        :param stream: Text stream the line is drawn on (standard error if None).
+        :param interval: Minimum number of seconds between two redraws.
+        """
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.width = 0
+        self.drawn = 0.0
+
+    def draw(self, text, force=False):
+        """
+        Replace the line with new text, unless it was redrawn too recently.
+
+        :param text: Text of the line.
+        :param force: Redraw even if the interval has not elapsed.
+        """
+        now = time.monotonic()
+        if not force and now - self.drawn < self.interval:
+            return
+        self.drawn = now
+        self.stream.write('\r' + text.ljust(self.width))
+        self.stream.flush()
+        self.width = len(text)
+
+    def close(self):
+        """
+        End the line, so later output starts on a fresh one.
+        """
+        if self.width:
+            self.stream.write('\n')
+            self.stream.flush()
+            self.width = 0
+
+
+class RunMetrics:
+    """
+    Per-table throughput counters of a backup or restore run.
+
+    Dump and load loops report every batch with ``add``: the rows and bytes
+    it held and the seconds spent fetching, encoding and writing it. The
+    counters are shared by the worker threads of a parallel run. They feed
+    an optional live progress line with an ETA, computed from the expected
+    row count when one is known, and, once the run is over, a JSON report
+    and a Prometheus textfile-collector file.
+
+    Attributes:
+        operation (str): Kind of run ('backup' or 'restore').
+        db_type (str): Type of the database ('mysql' or 'pgsql').
+        database (str): Name of the database.
+        host (str): Host of the database (None if unknown).
+        progress (ProgressLine): Live progress line (None to draw nothing).
+        expected_rows (int): Number of rows the run is expected to process (None if unknown).
+        tables (OrderedDict): Table name to its counters, in the order tables were first reported.
+        started (float): Wall-clock time the run started at.
+        clock (float): Monotonic time the run started at, which rates are computed from.
+        status (str): Outcome of the run ('running', 'ok' or 'failed').
+        lock (threading.Lock): Lock guarding the counters against concurrent workers.
+    """
+    def __init__(self, operation, db_type, database, progress=None, host=None):
+        """
+        Initialize empty counters.
+
+        :param operation: Kind of run ('backup' or 'restore').
+        :param db_type: Type of the database ('mysql' or 'pgsql').
+        :param database: Name of the database.
+        :param progress: Live progress line (None to draw nothing).
+        :param host: Host of the database, which tells apart the runs of databases of the same name (optional).
+        """
+        self.operation = operation
+        self.db_type = db_type
+        self.database = database
+        self.host = host
+        self.progress = progress
+        self.expected_rows = None
+        self.tables = OrderedDict()
+        self.started = time.time()
+        self.clock = time.monotonic()
+        self.status = 'running'
+        self.lock = threading.Lock()
+
+    def expect(self, rows):
+        """
+        Add to the number of rows the run is expected to process, for the ETA.
+
+        :param rows: Number of rows, usually the planner's estimate.
+        """
+        with self.lock:
+            self.expected_rows = (self.expected_rows or 0) + rows
+
+    def add(self, table, rows=0, size=0, fetch=0.0, encode=0.0, write=0.0):
+        """
+        Record a batch of a table.
+
+        :param table: Name of the table.
+        :param rows: Number of rows in the batch.
+        :param size: Size of the batch in bytes, before compression.
+        :param fetch: Seconds spent reading the batch.
+        :param encode: Seconds spent encoding the batch.
+        :param write: Seconds spent writing the batch.
+        """
+        with self.lock:
+            counters = self.tables.get(table)
+            if counters is None:
+                # The table started when its first batch started.
+                counters = self.tables[table] = {'rows': 0, 'bytes': 0, 'fetch': 0.0, 'encode': 0.0, 'write': 0.0,
+                                                 'started': time.monotonic() - fetch - encode - write,
+                                                 'finished': None}
+            counters['rows'] += rows
+            counters['bytes'] += size
+            counters['fetch'] += fetch
+            counters['encode'] += encode
+            counters['write'] += write
+            counters['finished'] = time.monotonic()
+            if self.progress is not None:
+                self.progress.draw(self.progress_text(table))
+
+    def totals(self):
+        """
+        Sum the counters of all tables.
+
+        :return: Tuple ``(rows, bytes)``.
+        """
+        return (sum([counters['rows'] for counters in self.tables.values()]),
+                sum([counters['bytes'] for counters in self.tables.values()]))
+
+    def progress_text(self, table=None):
+        """
+        Describe how far the run got.
+
+        :param table: Name of the table being processed (optional).
+        :return: A one-line summary with the row rate and, when the expected row count is known, the ETA.
+        """
+        rows, size = self.totals()
+        elapsed = max(time.monotonic() - self.clock, 1e-6)
+        rate = rows / elapsed
+        text = f"{self.operation} {self.database}: {rows:,} rows"
+        if self.expected_rows:
+            text += f" of ~{self.expected_rows:,} ({min(rows / self.expected_rows, 1.0):.0%})"
+        text += f", {size / elapsed / 1048576:.1f} MiB/s, {rate:,.0f} rows/s, {format_duration(elapsed)} elapsed"
+        if self.expected_rows and rate > 0:
+            text += f", ETA {format_duration(max(self.expected_rows - rows, 0) / rate)}"
+        if table:
+            text += f" [{table}]"
+        return text
+
+    def report(self):
+        """
+        Build the report of the run.
+
+        :return: A JSON-serializable dictionary with the totals and one entry per table.
+        """
+        with self.lock:
+            seconds = time.monotonic() - self.clock
+            rows, size = self.totals()
+            tables = []
+            for table, counters in self.tables.items():
+                elapsed = counters['finished'] - counters['started']
+                tables.append({
+                    'table': table, 'rows': counters['rows'], 'bytes': counters['bytes'],
+                    'fetch_seconds': round(counters['fetch'], 3), 'encode_seconds': round(counters['encode'], 3),
+                    'write_seconds': round(counters['write'], 3), 'seconds': round(elapsed, 3),
+                    'rows_per_second': round(counters['rows'] / elapsed, 1) if elapsed > 0 else None,
+                })
+        return {
+            'operation': self.operation, 'db_type': self.db_type, 'host': self.host, 'database': self.database,
+            'status': self.status, 'started': self.started, 'seconds': round(seconds, 3),
+            'rows': rows, 'bytes': size, 'rows_per_second': round(rows / seconds, 1) if seconds > 0 else None,
+            'tables': tables,
+        }
+
+    def prometheus_text(self, report=None):
+        """
+        Render the report in the Prometheus text exposition format.
+
+        :param report: Report built by ``report`` (built on the fly if None).
+        :return: The samples, one gauge per metric, labelled by run and table.
+        """
+        report = report or self.report()
+        run = {'operation': self.operation, 'dbtype': self.db_type}
+        if self.host:
+            run['host'] = self.host
+        run['database'] = self.database
+        samples = OrderedDict()
+
+        def sample(name, help_text, labels, value):
+            if value is not None:
+                samples.setdefault((name, help_text), []).append(f"{name}{prometheus_labels(labels)} {value}")
+
+        sample('backupapp_run_success', "Whether the last run completed (1) or failed (0).", run,
+               int(report['status'] == 'ok'))
+        sample('backupapp_run_timestamp_seconds', "Time the last run finished at.", run,
+               round(report['started'] + report['seconds'], 3))
+        sample('backupapp_run_seconds', "Duration of the last run.", run, report['seconds'])
+        sample('backupapp_run_rows', "Rows processed by the last run.", run, report['rows'])
+        sample('backupapp_run_bytes', "Bytes processed by the last run, before compression.", run, report['bytes'])
+        sample('backupapp_run_rows_per_second', "Row throughput of the last run.", run, report['rows_per_second'])
+        for table in report['tables']:
+            labels = dict(run, table=table['table'])
+            sample('backupapp_table_rows', "Rows processed per table by the last run.", labels, table['rows'])
+            sample('backupapp_table_bytes', "Bytes processed per table by the last run, before compression.",
+                   labels, table['bytes'])
+            for phase in PHASES:
+                sample('backupapp_table_phase_seconds', "Seconds spent per table and phase by the last run.",
+                       dict(labels, phase=phase), table[f'{phase}_seconds'])
+            sample('backupapp_table_rows_per_second', "Row throughput per table of the last run.", labels,
+                   table['rows_per_second'])
+        lines = []
+        for (name, help_text), values in samples.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"] + values
+        return "\n".join(lines) + "\n"
+
+    def file_name(self, extension):
+        """
+        Name the report files of the run, so runs of different databases, or of databases of the same name on
+        different hosts, do not overwrite each other.
+
+        :param extension: Extension of the file, with its dot.
+        :return: The file name.
+        """
+        parts = [f"{self.db_type}_{self.operation}_metrics"]
+        if self.host:
+            parts.append(re.sub(r'[^\w.-]', '_', self.host))
+        if self.database:
+            parts.append(self.database)
+        return '_'.join(parts) + extension
+
+    def finish(self, status, report_dir=None, prometheus_dir=None):
+        """
+        Close the run: end the progress line and write the reports.
+
+        :param status: Outcome of the run ('ok' or 'failed').
+        :param report_dir: Directory the JSON report is written to (optional).
+        :param prometheus_dir: Directory of the Prometheus textfile collector the metrics are written to (optional).
+        :return: The report of the run.
+        """
+        self.status = status
+        if self.progress is not None:
+            if self.tables:
+                self.progress.draw(self.progress_text(), force=True)
+            self.progress.close()
+        report = self.report()
+        if report_dir:
+            write_atomically(os.path.join(report_dir, self.file_name('.json')), json.dumps(report, indent=2) + "\n")
+        if prometheus_dir:
+            write_atomically(os.path.join(prometheus_dir, self.file_name('.prom')), self.prometheus_text(report))
+        return report
+
+
+def summary_lines(report):
+    """
+    Describe the throughput of every table of a run, for the log.
+
+    :param report: Report built by ``RunMetrics.report``.
+    :return: One line per table, slowest rate first.
+    """
+    tables = sorted(report['tables'], key=lambda table: table['rows_per_second'] or 0)
+    return [f"Table {table['table']}: {table['rows']} rows, {table['bytes']} bytes in {table['seconds']}s "
+            f"({table['rows_per_second']} rows/s; fetch {table['fetch_seconds']}s, "
+            f"encode {table['encode_seconds']}s, write {table['write_seconds']}s)" for table in tables]
+
+
+class MeteredWriter:
+    """
+    File wrapper reporting the data written through it to a RunMetrics.
+
+    Used where the driver writes the rows itself, as ``COPY ... TO STDOUT``
+    does: the time spent in ``write`` is the write phase and the rest of the
+    call is the fetch phase. Text COPY data holds one row per line, so its
+    rows are counted as they go by.
+
+    Attributes:
+        f: File object the data is written to.
+        metrics (RunMetrics): Counters the data is reported to.
+        table (str): Name of the table being written.
+        count_lines (bool): Count the newlines of the data as rows.
+        rows (int): Number of rows counted so far.
+        write_seconds (float): Seconds spent writing so far.
+    """
+    def __init__(self, f, metrics, table, count_lines=False):
+        """
+        Initialize the MeteredWriter.
+
+        :param f: File object the data is written to.
+        :param metrics: Counters the data is reported to.
+        :param table: Name of the table being written.
+        :param count_lines: Count the newlines of the data as rows.
+        """
+        self.f = f
+        self.metrics = metrics
+        self.table = table
+        self.count_lines = count_lines
+        self.rows = 0
+        self.write_seconds = 0.0
+
+    def write(self, data):
+        """
+        Write data to the wrapped file and report it.
+
+        :param data: Data to write.
+        :return: The result of the wrapped ``write``.
+        """
+        started = time.perf_counter()
+        result = self.f.write(data)
+        elapsed = time.perf_counter() - started
+        rows = data.count('\n' if isinstance(data, str) else b'\n') if self.count_lines else 0
+        self.rows += rows
+        self.write_seconds += elapsed
+        self.metrics.add(self.table, rows=rows, size=len(data), write=elapsed)
+        return result
+
+
+class MeteredTextWriter(MeteredWriter, io.TextIOBase):
+    """
+    Text flavour of MeteredWriter, counting rows by lines.
+
+    Deriving from ``io.TextIOBase`` makes psycopg2 hand it ``str`` data, as
+    it does for the text file being wrapped.
+    """
+    def __init__(self, f, metrics, table):
+        """
+        Initialize the MeteredTextWriter.
+
+        :param f: Text file object the data is written to.
+        :param metrics: Counters the data is reported to.
+        :param table: Name of the table being written.
+        """
+        MeteredWriter.__init__(self, f, metrics, table, count_lines=True)
+
+
+class MeteredReader:
+    """
+    File wrapper reporting the data read through it to a RunMetrics.
+
+    Used where the driver reads the rows itself, as ``COPY ... FROM STDIN``
+    does: the time spent in ``read`` is the fetch phase and the rest of the
+    call is the write phase.
+
+    Attributes:
+        f: File-like object the data is read from.
+        metrics (RunMetrics): Counters the data is reported to.
+        table (str): Name of the table being loaded.
+        count_lines (bool): Count the newlines of text data as rows.
+        rows (int): Number of rows counted so far.
+        read_seconds (float): Seconds spent reading so far.
+    """
+    def __init__(self, f, metrics, table, count_lines=True):
+        """
+        Initialize the MeteredReader.
+
+        :param f: File-like object the data is read from.
+        :param metrics: Counters the data is reported to.
+        :param table: Name of the table being loaded.
+        :param count_lines: Count the newlines of text data as rows.
+        """
+        self.f = f
+        self.metrics = metrics
+        self.table = table
+        self.count_lines = count_lines
+        self.rows = 0
+        self.read_seconds = 0.0
+
+    def read(self, size=-1):
+        """
+        Read data from the wrapped file and report it.
+
+        :param size: Maximum amount of data to read.
+        :return: The data read.
+        """
+        started = time.perf_counter()
+        data = self.f.read(size)
+        elapsed = time.perf_counter() - started
+        rows = data.count('\n') if self.count_lines and isinstance(data, str) else 0
+        self.rows += rows
+        self.read_seconds += elapsed
+        self.metrics.add(self.table, rows=rows, size=len(data), fetch=elapsed)
+        return data
@@ -0,0 +1,29 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_with_connections(connections, items, func):
+    """
+    Run ``func(conn, item)`` for every item over a pool of database connections.
+
+    Each connection is used by at most one worker thread at a time, so the
+    number of connections is also the degree of parallelism.
+
+    :param connections: Open connections to share between the workers.
+    :param items: Work items to process.
+    :param func: Callable taking a connection and an item.
+    :return: The results, in the order of ``items``.
+    """
+    pool = queue.Queue()
+    for conn in connections:
+        pool.put(conn)
+
+    def task(item):
+        conn = pool.get()
+        try:
+            return func(conn, item)
+        finally:
+            pool.put(conn)
+
+    with ThreadPoolExecutor(max_workers=len(connections)) as executor:
+        return list(executor.map(task, items))
@@ -0,0 +1,183 @@
+import io
+import threading
+from collections import deque
+
+# Bytes a pipe holds before its writer has to wait for the reader.
+PIPE_BUFFER_SIZE = 8 * 1024 * 1024
+
+# Size of the writes the buffered ends of a pipe pass on.
+PIPE_CHUNK_SIZE = 256 * 1024
+
+
+class BytePipe:
+    """
+    Bounded in-memory byte stream between a writer thread and a reader thread.
+
+    The writer blocks once ``capacity`` bytes are waiting, so a fast producer
+    never runs ahead of a slow consumer by more than that. Either side can
+    hang up: an error of the writer is raised in the reader, and a reader
+    that stopped reading makes further writes fail with ``BrokenPipeError``
+    instead of blocking forever.
+
+    Attributes:
+        capacity (int): Number of bytes the pipe holds before writes block.
+        size (int): Number of bytes waiting to be read.
+        closed (bool): The writer is done; reads return ``b''`` once the pipe is empty.
+        error (BaseException): Error the writer failed with, raised in the reader (None if none).
+        hung_up (bool): The reader is done; writes fail.
+    """
+    def __init__(self, capacity=PIPE_BUFFER_SIZE):
+        """
+        Initialize the BytePipe.
+
+        :param capacity: Number of bytes the pipe holds before writes block.
+        """
+        self.capacity = capacity
+        self.chunks = deque()
+        self.size = 0
+        self.closed = False
+        self.error = None
+        self.hung_up = False
+        self.condition = threading.Condition()
+
+    def write(self, data):
+        """
+        Append bytes, waiting while the pipe is full.
+
+        :param data: Bytes to append.
+        :return: The number of bytes written.
+        :raises BrokenPipeError: If the reader hung up.
+        """
+        data = bytes(data)
+        with self.condition:
+            while self.size >= self.capacity and not self.hung_up:
+                self.condition.wait()
+            if self.hung_up:
+                raise BrokenPipeError("The reader of the pipe hung up")
+            if data:
+                self.chunks.append(data)
+                self.size += len(data)
+                self.condition.notify_all()
+        return len(data)
+
+    def read(self, size=-1):
+        """
+        Take up to ``size`` bytes, waiting while the pipe is empty.
+
+        :param size: Maximum number of bytes to return (-1 for everything waiting).
+        :return: The bytes read, or ``b''`` once the writer closed the pipe and it is empty.
+        :raises BaseException: The error the writer failed with.
+        """
+        with self.condition:
+            while not self.chunks and not self.closed and self.error is None:
+                self.condition.wait()
+            if self.error is not None:
+                raise self.error
+            if not self.chunks:
+                return b''
+            if size is None or size < 0:
+                size = self.size
+            parts = []
+            taken = 0
+            while self.chunks and taken < size:
+                chunk = self.chunks.popleft()
+                if taken + len(chunk) > size:
+                    self.chunks.appendleft(chunk[size - taken:])
+                    chunk = chunk[:size - taken]
+                parts.append(chunk)
+                taken += len(chunk)
+            self.size -= taken
+            self.condition.notify_all()
+            return b''.join(parts)
+
+    def close(self, error=None):
+        """
+        End the stream from the writer side.
+
+        With an error, the data still waiting is dropped and later writes
+        fail, so the reader never mistakes a partial stream for a whole one.
+
+        :param error: Error the writer failed with, raised in the reader instead of ending the stream (optional).
+        """
+        with self.condition:
+            self.closed = True
+            if error is not None:
+                self.error = error
+                self.hung_up = True
+                self.chunks.clear()
+                self.size = 0
+            self.condition.notify_all()
+
+    def hang_up(self):
+        """
+        Stop reading, so the writer fails instead of waiting for room.
+        """
+        with self.condition:
+            self.hung_up = True
+            self.chunks.clear()
+            self.size = 0
+            self.condition.notify_all()
+
+
+class PipeWriter(io.RawIOBase):
+    """
+    Raw writable file object over the writer side of a BytePipe.
+    """
+    def __init__(self, pipe):
+        """
+        Initialize the PipeWriter.
+
+        :param pipe: BytePipe to write to.
+        """
+        super().__init__()
+        self.pipe = pipe
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.pipe.write(data)
+
+    def close(self):
+        if not self.closed:
+            self.pipe.close()
+        super().close()
+
+
+class PipeReader(io.RawIOBase):
+    """
+    Raw readable file object over the reader side of a BytePipe.
+    """
+    def __init__(self, pipe):
+        """
+        Initialize the PipeReader.
+
+        :param pipe: BytePipe to read from.
+        """
+        super().__init__()
+        self.pipe = pipe
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.pipe.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def open_pipe(pipe, mode):
+    """
+    Open one end of a pipe as a file object, like ``open_backup_file`` opens a backup file.
+
+    Closing the writing end ends the stream for the reader.
+
+    :param pipe: BytePipe to open.
+    :param mode: 'r' or 'rb' for the reading end, 'w' or 'wb' for the writing end.
+    :return: A buffered file object; text modes use UTF-8.
+    """
+    if mode.startswith('w'):
+        stream = io.BufferedWriter(PipeWriter(pipe), buffer_size=PIPE_CHUNK_SIZE)
+    else:
+        stream = io.BufferedReader(PipeReader(pipe), buffer_size=PIPE_CHUNK_SIZE)
+    return stream if 'b' in mode else io.TextIOWrapper(stream, encoding='utf-8')
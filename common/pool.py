@@ -0,0 +1,179 @@
+import threading
+import time
+
+# Seconds a connection may sit idle before it is checked again on checkout.
+CHECK_AFTER = 30
+
+# Seconds a connection may sit idle before it is closed instead of reused.
+MAX_IDLE = 600
+
+
+def check_connection(conn):
+    """
+    Run ``SELECT 1`` on a connection, raising if the connection is broken.
+
+    :param conn: DB-API connection to check.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+class ConnectionPool:
+    """
+    Pool of warm connections to one database, shared by the runs against it.
+
+    Connections handed out are wrapped in a PooledConnection, whose
+    ``close`` hands the connection back instead of closing it, so the backup
+    and restore classes use pooled connections unchanged. A returned
+    connection is reset, and one that fails to reset is closed. A connection
+    idle for more than ``check_after`` seconds is checked before it is handed
+    out again, one idle for more than ``max_idle`` seconds is closed, and
+    broken ones are replaced by new connections. At most ``size`` idle
+    connections are kept; the pool does not limit how many are in use.
+
+    Attributes:
+        connect (callable): Function opening a new connection.
+        reset (callable): Function putting a returned connection back in its initial state (optional).
+        check (callable): Function raising if a connection is broken.
+        size (int): Maximum number of idle connections kept.
+        check_after (float): Seconds of idleness after which a connection is checked on checkout.
+        max_idle (float): Seconds of idleness after which a connection is closed.
+        idle (list): Pairs of an idle connection and the monotonic time it was returned at, oldest first.
+        opened (int): Number of connections opened over the life of the pool.
+        lock (threading.Lock): Lock guarding the idle connections.
+    """
+    def __init__(self, connect, reset=None, check=check_connection, size=2, check_after=CHECK_AFTER,
+                 max_idle=MAX_IDLE):
+        """
+        Initialize an empty ConnectionPool.
+
+        :param connect: Function opening a new connection.
+        :param reset: Function putting a returned connection back in its initial state (optional).
+        :param check: Function raising if a connection is broken.
+        :param size: Maximum number of idle connections kept.
+        :param check_after: Seconds of idleness after which a connection is checked on checkout.
+        :param max_idle: Seconds of idleness after which a connection is closed.
+        """
+        self.connect = connect
+        self.reset = reset
+        self.check = check
+        self.size = size
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self.idle = []
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Hand out an idle connection that passes its check, or a new one.
+
+        :return: A PooledConnection.
+        """
+        self.evict_idle()
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                conn, returned = self.idle.pop()
+            if time.monotonic() - returned < self.check_after:
+                return PooledConnection(conn, self)
+            try:
+                self.check(conn)
+                return PooledConnection(conn, self)
+            except Exception:
+                close_quietly(conn)
+        conn = self.connect()
+        with self.lock:
+            self.opened += 1
+        return PooledConnection(conn, self)
+
+    def release(self, conn):
+        """
+        Take a connection back, resetting it, or close it if the pool is full or the reset fails.
+
+        :param conn: The underlying connection of a PooledConnection.
+        """
+        try:
+            if self.reset is not None:
+                self.reset(conn)
+        except Exception:
+            close_quietly(conn)
+            return
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append((conn, time.monotonic()))
+                return
+        close_quietly(conn)
+
+    def evict_idle(self):
+        """
+        Close the connections idle for longer than ``max_idle``.
+        """
+        deadline = time.monotonic() - self.max_idle
+        with self.lock:
+            expired = [conn for conn, returned in self.idle if returned < deadline]
+            self.idle = [(conn, returned) for conn, returned in self.idle if returned >= deadline]
+        for conn in expired:
+            close_quietly(conn)
+
+    def close(self):
+        """
+        Close every idle connection.
+        """
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn, _ in idle:
+            close_quietly(conn)
+
+
+class PooledConnection:
+    """
+    Connection borrowed from a ConnectionPool, handed back when closed.
+
+    Every other attribute, read or set, is the one of the underlying connection.
+
+    Attributes:
+        raw: The underlying connection.
+        pool (ConnectionPool): Pool the connection goes back to.
+    """
+    def __init__(self, raw, pool):
+        """
+        Initialize the PooledConnection.
+
+        :param raw: The underlying connection.
+        :param pool: Pool the connection goes back to.
+        """
+        object.__setattr__(self, 'raw', raw)
+        object.__setattr__(self, 'pool', pool)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.raw, name, value)
+
+    def close(self):
+        """
+        Hand the connection back to its pool; closing it again does nothing.
+        """
+        raw = self.raw
+        if raw is not None:
+            object.__setattr__(self, 'raw', None)
+            self.pool.release(raw)
+
+
+def close_quietly(conn):
+    """
+    Close a connection, ignoring the error of one that is already broken.
+
+    :param conn: Connection to close.
+    """
+    try:
+        conn.close()
+    except Exception:
+        pass
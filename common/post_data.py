@@ -0,0 +1,80 @@
+import re
+import time
+from common.parallel import run_with_connections
+from common.sql_splitter import strip_leading_comments
+
+# Phases of the post-data statements of a structure backup. A foreign key
+# needs the unique index of the columns it references (and, on MySQL, an
+# index on its own columns), so foreign keys and triggers are only built
+# once every index exists.
+INDEX_PHASE = 0
+REFERENCE_PHASE = 1
+
+# Comment separating the pre-data and post-data parts of a structure backup.
+POST_DATA_HEADER = "-- Post-data: indexes, constraints and triggers, built once the rows are loaded\n"
+
+_IDENTIFIER = r'(?:"(?:[^"]|"")*"|`(?:[^`]|``)*`|[^\s."`]+)'
+_ALTER_TABLE_ADD = re.compile(
+    rf'ALTER\s+TABLE\s+(?:ONLY\s+)?(?:{_IDENTIFIER}\.)?{_IDENTIFIER}\s+ADD\s+(?:CONSTRAINT\s+{_IDENTIFIER}\s+)?'
+    r'(PRIMARY\s+KEY|UNIQUE|EXCLUDE|KEY|INDEX|FULLTEXT|SPATIAL|FOREIGN\s+KEY)\b',
+    re.IGNORECASE
+)
+
+
+def post_data_phase(statement):
+    """
+    Tell whether a structure statement builds a post-data object, and in which phase.
+
+    Indexes and the primary key, unique and exclusion constraints backed by
+    one are built in the index phase; foreign keys and triggers in the
+    reference phase. Every other statement (tables, sequences, views) is
+    pre-data.
+
+    :param statement: A statement of a structure backup.
+    :return: ``INDEX_PHASE``, ``REFERENCE_PHASE`` or None for a pre-data statement.
+    """
+    statement = strip_leading_comments(statement)
+    start = ' '.join(statement[:32].upper().split())
+    if start.startswith(('CREATE INDEX', 'CREATE UNIQUE INDEX')):
+        return INDEX_PHASE
+    if start.startswith(('CREATE TRIGGER', 'CREATE CONSTRAINT TRIGGER')):
+        return REFERENCE_PHASE
+    match = _ALTER_TABLE_ADD.match(statement)
+    if match is None:
+        return None
+    return REFERENCE_PHASE if match.group(1).upper().startswith('FOREIGN') else INDEX_PHASE
+
+
+def build_post_data(connections, statements, execute, logger):
+    """
+    Run post-data statements concurrently, phase by phase.
+
+    The statements of a phase are spread over the connections, so several
+    indexes (or foreign keys) are built at once, and the next phase only
+    starts when the previous one is done. Concurrent statements may wait on
+    or deadlock over each other's table locks, so a failed statement is
+    retried once on its own before it is reported.
+
+    :param connections: Open connections to share between the workers.
+    :param statements: Post-data statements, in backup order.
+    :param execute: Callable running one statement on a connection and committing it, given the connection and
+        the statement; returns the error raised, or None.
+    :param logger: Logger the failed statements are reported to.
+    :return: The number of statements that failed.
+    """
+    phases = {}
+    for statement in statements:
+        phases.setdefault(post_data_phase(statement), []).append(statement)
+    failed = 0
+    for phase in sorted(phases):
+        started = time.monotonic()
+        errors = run_with_connections(connections, phases[phase], execute)
+        for statement, error in zip(phases[phase], errors):
+            if error is not None:
+                error = execute(connections[0], statement)
+            if error is not None:
+                failed += 1
+                logger.error(f"Error executing SQL: {statement.strip()} - {error}")
+        logger.info(f"Built {len(phases[phase])} post-data objects over {len(connections)} connections "
+                    f"in {time.monotonic() - started:.1f}s")
+    return failed
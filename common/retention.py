@@ -0,0 +1,114 @@
+import os
+import shutil
+from datetime import datetime, timedelta
+from common.catalog import BackupCatalog
+from common.chunk_store import collect_garbage
+from common.manifest import read_manifest
+
+
+def select_expired(backups, keep_last=None, keep_days=None, now=None):
+    """
+    Pick the backup runs a retention policy no longer keeps.
+
+    A completed run is kept while it is one of the ``keep_last`` newest
+    completed runs or younger than ``keep_days`` days. A failed run is kept
+    while no completed run is newer, as it may still be resumed, or while it
+    is younger than ``keep_days`` days. Runs still going on are always kept.
+    Without any limit nothing expires.
+
+    :param backups: Backup rows of one database, newest first, as listed by ``BackupCatalog.backups``.
+    :param keep_last: Number of completed runs to keep (optional).
+    :param keep_days: Age in days under which runs are kept (optional).
+    :param now: Current time (defaults to now).
+    :return: The expired backup rows, newest first.
+    """
+    if keep_last is None and keep_days is None:
+        return []
+    cutoff = (now or datetime.now()) - timedelta(days=keep_days) if keep_days is not None else None
+    expired = []
+    completed = 0
+    for backup in backups:
+        status = backup['status'] or 'complete'
+        if status == 'running':
+            continue
+        if cutoff is not None and datetime.fromisoformat(backup['created_at']) >= cutoff:
+            kept = True
+        elif status == 'complete':
+            kept = keep_last is not None and completed < keep_last
+        else:
+            kept = completed == 0
+        if status == 'complete':
+            completed += 1
+        if not kept:
+            expired.append(backup)
+    return expired
+
+
+def referenced_directories(backups):
+    """
+    List the directories holding files that the per-table data backups of some runs point at.
+
+    Incremental backups point at the unchanged files of earlier backups
+    instead of copying them, so those earlier backups must outlive them.
+
+    :param backups: Backup rows whose references are collected.
+    :return: A set of absolute directory paths.
+    """
+    directories = set()
+    for backup in backups:
+        for path in backup['paths']:
+            if not os.path.isdir(path):
+                continue
+            for entry in read_manifest(path)['tables']:
+                directory = os.path.dirname(os.path.abspath(os.path.join(path, entry['file'])))
+                if directory != os.path.abspath(path):
+                    directories.add(directory)
+    return directories
+
+
+def prune_backups(backup_dir, db_type, database, keep_last=None, keep_days=None, logger=None, now=None):
+    """
+    Delete the backups of a database that a retention policy no longer keeps.
+
+    Only backups recorded in the catalog are considered. A backup that a kept
+    incremental backup still points at is kept as well. Once backups are
+    deleted, the chunks only they used are removed from the chunk store.
+
+    :param backup_dir: Directory holding the backups and their catalog.
+    :param db_type: Type of the database ('mysql' or 'pgsql').
+    :param database: Name of the database.
+    :param keep_last: Number of completed runs to keep (optional).
+    :param keep_days: Age in days under which runs are kept (optional).
+    :param logger: Logger the deletions are reported to (optional).
+    :param now: Current time (defaults to now).
+    :return: The ids of the deleted backups.
+    """
+    catalog = BackupCatalog(backup_dir)
+    try:
+        backups = catalog.backups(db_type, database)
+        expired = select_expired(backups, keep_last, keep_days, now)
+        expired_ids = {backup['id'] for backup in expired}
+        protected = referenced_directories([backup for backup in backups if backup['id'] not in expired_ids])
+        removed = []
+        for backup in expired:
+            if any(os.path.abspath(path) in protected for path in backup['paths']):
+                if logger:
+                    logger.info(f"Keeping backup {backup['id']} of {database}: a newer incremental backup uses it")
+                continue
+            for path in backup['paths']:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+            catalog.remove_backup(backup['id'])
+            removed.append(backup['id'])
+            if logger:
+                logger.info(f"Removed {backup['status'] or 'complete'} backup {backup['id']} of {database} "
+                            f"from {backup['created_at']}")
+    finally:
+        catalog.close()
+    if removed:
+        chunks, size = collect_garbage(backup_dir)
+        if chunks and logger:
+            logger.info(f"Removed {chunks} unreferenced chunks ({size} bytes) from the chunk store")
+    return removed
@@ -0,0 +1,200 @@
+import json
+import math
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+# Python expression encoding a non-NULL value ``{v}`` of each column kind. Every
+# fast path checks the value type and hands anything unexpected to ``_value``.
+# The expressions are inlined in an f-string, which cannot contain backslashes
+# in Python 3.9, so string constants are referenced by name.
+_KIND_TEMPLATES = {
+    'int': "{v} if {v}.__class__ is int else _value({v})",
+    # x - x is 0 for finite floats only; NaN and infinities need quoting.
+    'float': "repr({v}) if {v}.__class__ is float and {v} - {v} == 0 else _value({v})",
+    'decimal': "{v} if {v}.__class__ is Decimal and {v}.is_finite() else _value({v})",
+    'text': "_Q + {v}{escape} + _Q if {v}.__class__ is str else _value({v})",
+    'bytes': "_X + {v}.hex() + _Q if {v}.__class__ in _BINARY else _value({v})",
+    'temporal': "_Q + str({v}) + _Q if {v}.__class__ in _TEMPORAL else _value({v})",
+    'bool': "_TRUE if {v} is True else _FALSE if {v} is False else _value({v})",
+    'json': "_json({v})",
+    'other': "_value({v})",
+}
+
+# Replacements escaping a string literal, per dialect.
+_TEXT_ESCAPES = {
+    'mysql': (('\\', '\\\\'), ("'", "\\'"), ('\0', '\\0')),
+    'postgresql': (("'", "''"),),
+}
+
+# Prefix of a hexadecimal binary string literal, per dialect.
+_BINARY_PREFIXES = {
+    'mysql': "X'",
+    'postgresql': "'\\x",
+}
+
+_TEMPORAL = (datetime, date, time)
+_BINARY = (bytes, bytearray, memoryview)
+
+
+def quote_text(value, dialect):
+    """
+    Quote a string as a SQL string literal.
+
+    :param value: String to quote.
+    :param dialect: SQL dialect ('mysql' or 'postgresql').
+    :return: The escaped literal, including the quotes.
+    """
+    for old, new in _TEXT_ESCAPES[dialect]:
+        value = value.replace(old, new)
+    return "'" + value + "'"
+
+
+def format_interval(value, dialect):
+    """
+    Format a time interval the way the database parses it back.
+
+    :param value: timedelta returned for a MySQL TIME or PostgreSQL interval column.
+    :param dialect: SQL dialect ('mysql' or 'postgresql').
+    :return: The interval as text, without quotes.
+    """
+    if dialect == 'postgresql':
+        return f"{value.days} days {value.seconds}.{value.microseconds:06d} seconds"
+    micros = (value.days * 86400 + value.seconds) * 1000000 + value.microseconds
+    sign = '-' if micros < 0 else ''
+    seconds, micros = divmod(abs(micros), 1000000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{sign}{hours}:{minutes:02d}:{seconds:02d}" + (f".{micros:06d}" if micros else "")
+
+
+def encode_value(value, dialect):
+    """
+    Encode any value returned by a database driver as a SQL literal.
+
+    This is the generic, slower path of the row encoders; it dispatches on the
+    value type so it is always correct, whatever the column type.
+
+    :param value: Value returned by the cursor.
+    :param dialect: SQL dialect ('mysql' or 'postgresql').
+    :return: The SQL literal.
+    """
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if math.isfinite(value):
+            return repr(value)
+        return quote_text('NaN' if value != value else ('Infinity' if value > 0 else '-Infinity'), dialect)
+    if isinstance(value, Decimal):
+        return str(value) if value.is_finite() else quote_text(str(value), dialect)
+    if isinstance(value, str):
+        return quote_text(value, dialect)
+    if isinstance(value, _BINARY):
+        return _BINARY_PREFIXES[dialect] + value.hex() + "'"
+    if isinstance(value, timedelta):
+        return quote_text(format_interval(value, dialect), dialect)
+    if isinstance(value, _TEMPORAL):
+        return "'" + str(value) + "'"
+    if isinstance(value, (set, frozenset)):
+        return quote_text(','.join(sorted(value)), dialect)
+    if isinstance(value, dict):
+        return quote_text(json.dumps(value), dialect)
+    if isinstance(value, (list, tuple)):
+        return quote_text(format_array(value), dialect)
+    return quote_text(str(value), dialect)
+
+
+def format_array(value):
+    """
+    Format a list returned for a PostgreSQL array column as an array literal.
+
+    A quoted literal rather than an ``ARRAY[...]`` constructor keeps the value
+    a single string, which the restore can turn into a COPY field.
+
+    :param value: List of elements, possibly nested.
+    :return: The array literal, without the enclosing SQL quotes.
+    """
+    elements = []
+    for item in value:
+        if item is None:
+            elements.append('NULL')
+        elif isinstance(item, (list, tuple)):
+            elements.append(format_array(item))
+        else:
+            if isinstance(item, bool):
+                item = 'true' if item else 'false'
+            elif isinstance(item, _BINARY):
+                item = '\\x' + item.hex()
+            item = str(item)
+            elements.append('"' + item.replace('\\', '\\\\').replace('"', '\\"') + '"')
+    return '{' + ','.join(elements) + '}'
+
+
+def encode_json(value, dialect):
+    """
+    Encode the value of a JSON column.
+
+    psycopg2 parses JSON columns into Python objects, which are serialized
+    again; MySQL drivers return the JSON text itself.
+
+    :param value: Value returned by the cursor.
+    :param dialect: SQL dialect ('mysql' or 'postgresql').
+    :return: The SQL literal.
+    """
+    if value is None:
+        return 'NULL'
+    if dialect == 'postgresql':
+        return quote_text(json.dumps(value), dialect)
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode('utf-8')
+    return quote_text(value if isinstance(value, str) else json.dumps(value), dialect)
+
+
+def build_insert_encoder(table, kinds, dialect):
+    """
+    Build a function encoding batches of rows as INSERT statements.
+
+    The function is generated once per table, with the encoding of each
+    column inlined according to its kind, so a batch is encoded in a single
+    list comprehension without per-value dispatch or intermediate lists.
+
+    :param table: Name of the table the statements insert into.
+    :param kinds: Kind of every column: 'int', 'float', 'decimal', 'text', 'bytes', 'temporal', 'bool', 'json'
+        or 'other' (generic encoding).
+    :param dialect: SQL dialect ('mysql' or 'postgresql').
+    :return: A function taking a list of row tuples and returning their statements as one string.
+    """
+    if not kinds:
+        statement = f"INSERT INTO {table} DEFAULT VALUES;\n"
+        return lambda rows: statement * len(rows)
+    escapes = _TEXT_ESCAPES[dialect]
+    escape = ''.join([f".replace(_E{i}, _R{i})" for i in range(len(escapes))])
+    names = [f'c{i}' for i in range(len(kinds))]
+    values = ', '.join(["{_NULL if %s is None else %s}" % (name, _KIND_TEMPLATES[kind].format(v=name, escape=escape))
+                        for name, kind in zip(names, kinds)])
+    source = (
+        "def encode_rows(rows):\n"
+        f"    return ''.join([f\"{{_INSERT}}{values});{{_NL}}\" for {', '.join(names)}, in rows])\n"
+    )
+    namespace = {
+        '_INSERT': f"INSERT INTO {table} VALUES (",
+        'Decimal': Decimal,
+        '_TEMPORAL': _TEMPORAL,
+        '_BINARY': _BINARY,
+        '_NULL': 'NULL',
+        '_TRUE': 'TRUE',
+        '_FALSE': 'FALSE',
+        '_NL': '\n',
+        '_Q': "'",
+        '_X': _BINARY_PREFIXES[dialect],
+        '_value': lambda value: encode_value(value, dialect),
+        '_json': lambda value: encode_json(value, dialect),
+    }
+    for i, (old, new) in enumerate(escapes):
+        namespace[f'_E{i}'] = old
+        namespace[f'_R{i}'] = new
+    exec(source, namespace)
+    return namespace['encode_rows']
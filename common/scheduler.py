@@ -0,0 +1,76 @@
+import logging
+import queue
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def run_dependency_ordered(connections, units, dependencies, func, logger=None):
+    """
+    Run work units over a pool of connections without breaking foreign keys.
+
+    A table's units are only started once every table it references has been
+    fully loaded. Among the tables that are ready, units are started in the
+    order given, so callers should list the largest units first. If the
+    remaining tables reference each other in a cycle, the table with the
+    fewest unloaded parents is released to break it.
+
+    :param connections: Open connections to share between the workers.
+    :param units: List of ``(table, item)`` pairs; a table may have several units.
+    :param dependencies: Dictionary mapping a table to the tables it references.
+    :param func: Callable taking a connection and an item.
+    :param logger: Logger used to report broken cycles.
+    :return: The results of ``func``, in completion order.
+    """
+    logger = logger or logging.getLogger(__name__)
+    pool = queue.Queue()
+    for conn in connections:
+        pool.put(conn)
+
+    def task(item):
+        conn = pool.get()
+        try:
+            return func(conn, item)
+        finally:
+            pool.put(conn)
+
+    units_by_table = OrderedDict()
+    for table, item in units:
+        units_by_table.setdefault(table, []).append(item)
+    remaining = {table: len(items) for table, items in units_by_table.items()}
+    waiting = OrderedDict(
+        (table, set(dependencies.get(table, ())) & set(units_by_table) - {table}) for table in units_by_table
+    )
+    results = []
+
+    with ThreadPoolExecutor(max_workers=len(connections)) as executor:
+        futures = {}
+
+        def submit_ready():
+            for table in [table for table, parents in waiting.items() if not parents]:
+                del waiting[table]
+                for item in units_by_table[table]:
+                    futures[executor.submit(task, item)] = table
+
+        submit_ready()
+        while futures or waiting:
+            if not futures:
+                table = min(waiting, key=lambda name: len(waiting[name]))
+                logger.warning(f"Foreign key cycle detected, loading {table} before {sorted(waiting[table])}")
+                waiting[table] = set()
+                submit_ready()
+                continue
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                table = futures.pop(future)
+                try:
+                    results.append(future.result())
+                except Exception:
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+                remaining[table] -= 1
+                if remaining[table] == 0:
+                    for parents in waiting.values():
+                        parents.discard(table)
+            submit_ready()
+    return results
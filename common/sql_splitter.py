@@ -0,0 +1,268 @@
+import re
+
+# Number of characters read from the dump file at a time.
+CHUNK_SIZE = 1024 * 1024
+
+_NORMAL, _QUOTE, _LINE_COMMENT, _BLOCK_COMMENT, _DOLLAR = range(5)
+
+_SPECIAL_CHARS = {
+    'mysql': re.compile(r"[;'\"`#/\-]"),
+    'postgresql': re.compile(r"[;'\"/\-$]"),
+}
+_DOLLAR_TAG = re.compile(r'\$(?:[A-Za-z_\u0080-\uffff][A-Za-z_0-9\u0080-\uffff]*)?\$')
+_NESTED_COMMENT = re.compile(r'/\*|\*/')
+_LEADING_COMMENTS = re.compile(r'(?:\s+|--[^\n]*(?:\n|$)|#[^\n]*(?:\n|$)|/\*.*?\*/)*', re.DOTALL)
+
+
+def _is_ident_char(c):
+    return c.isalnum() or c == '_'
+
+
+def strip_leading_comments(statement):
+    """
+    Remove whitespace and comments from the start of a statement.
+
+    :param statement: A statement returned by SQLStatementReader.
+    :return: The statement starting at its first keyword.
+    """
+    return statement[_LEADING_COMMENTS.match(statement).end():]
+
+
+class SQLStatementReader:
+    """
+    Incremental splitter that yields complete SQL statements from a dump file.
+
+    The file is read in fixed-size chunks and only the statement being scanned
+    is kept in memory. Semicolons inside string literals, quoted identifiers,
+    comments and (for PostgreSQL) dollar-quoted bodies do not end a statement.
+    The MySQL dialect also honours backslash escapes, backtick identifiers and
+    ``#`` comments; the PostgreSQL dialect honours ``E''`` strings and nested
+    block comments.
+
+    Attributes:
+        f: Text file object of the dump.
+        dialect (str): SQL dialect ('mysql' or 'postgresql').
+        chunk_size (int): Number of characters read from the file at a time.
+    """
+    def __init__(self, f, dialect='mysql', chunk_size=CHUNK_SIZE):
+        """
+        Initialize the SQLStatementReader.
+
+        :param f: Text file object of the dump.
+        :param dialect: SQL dialect ('mysql' or 'postgresql').
+        :param chunk_size: Number of characters read from the file at a time.
+        """
+        if dialect not in _SPECIAL_CHARS:
+            raise ValueError(f"Unsupported SQL dialect: {dialect}")
+        self.f = f
+        self.dialect = dialect
+        self.chunk_size = chunk_size
+        self.mysql = dialect == 'mysql'
+        self.special = _SPECIAL_CHARS[dialect]
+        self.buffer = ''
+        self.start = 0
+        self.pos = 0
+        self.eof = False
+        self.state = _NORMAL
+        self.has_code = False
+        self.quote = None
+        self.escapes = False
+        self.depth = 0
+        self.tag = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """
+        Return the next statement, including its terminating semicolon.
+
+        Whitespace and comments between statements are attached to the
+        statement that follows them; a trailing fragment made only of
+        whitespace and comments is dropped.
+        """
+        while True:
+            if self._advance():
+                statement = self.buffer[self.start:self.pos]
+                has_code = self.has_code
+                self.start = self.pos
+                self.has_code = False
+                if has_code:
+                    return statement
+            elif not self._fill():
+                statement = self.buffer[self.start:]
+                has_code = self.has_code
+                self.start = self.pos = len(self.buffer)
+                self.has_code = False
+                if has_code:
+                    return statement
+                raise StopIteration
+
+    def readline(self):
+        """
+        Read raw text up to and including the next newline.
+
+        Used to consume data that follows a statement without being SQL, such
+        as the rows after ``COPY ... FROM stdin;``.
+
+        :return: The next line, or an empty string at the end of the file.
+        """
+        while True:
+            k = self.buffer.find('\n', self.pos)
+            if k != -1:
+                line = self.buffer[self.pos:k + 1]
+                self.start = self.pos = k + 1
+                return line
+            if not self._fill():
+                line = self.buffer[self.pos:]
+                self.start = self.pos = len(self.buffer)
+                return line
+
+    def _fill(self):
+        """
+        Append the next chunk of the file to the buffer, dropping consumed text.
+
+        :return: False at the end of the file.
+        """
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        if self.start:
+            self.buffer = self.buffer[self.start:] + chunk
+            self.pos -= self.start
+            self.start = 0
+        else:
+            self.buffer += chunk
+        return True
+
+    def _need_more(self, k, count):
+        """
+        Check whether ``count`` characters from ``k`` are needed but not yet buffered.
+        """
+        return k + count > len(self.buffer) and not self.eof
+
+    def _advance(self):
+        """
+        Scan the buffer from the current position.
+
+        :return: True when a statement terminator was consumed, False when more input is needed.
+        """
+        buf = self.buffer
+        n = len(buf)
+        while self.pos < n:
+            state = self.state
+            if state == _NORMAL:
+                match = self.special.search(buf, self.pos)
+                k = match.start() if match else n
+                if not self.has_code and k > self.pos and not buf[self.pos:k].isspace():
+                    self.has_code = True
+                if match is None:
+                    self.pos = n
+                    return False
+                c = buf[k]
+                if c == ';':
+                    self.pos = k + 1
+                    return True
+                if c in '\'"`':
+                    self.state = _QUOTE
+                    self.quote = c
+                    if self.mysql:
+                        self.escapes = c != '`'
+                    else:
+                        self.escapes = (c == "'" and k > 0 and buf[k - 1] in 'eE'
+                                        and (k < 2 or not _is_ident_char(buf[k - 2])))
+                    self.has_code = True
+                    self.pos = k + 1
+                elif c == '-':
+                    if self._need_more(k, 3 if self.mysql else 2):
+                        self.pos = k
+                        return False
+                    if buf.startswith('--', k) and (not self.mysql or k + 2 >= n or buf[k + 2].isspace()):
+                        self.state = _LINE_COMMENT
+                        self.pos = k + 2
+                    else:
+                        self.has_code = True
+                        self.pos = k + 1
+                elif c == '#':
+                    self.state = _LINE_COMMENT
+                    self.pos = k + 1
+                elif c == '/':
+                    if self._need_more(k, 2):
+                        self.pos = k
+                        return False
+                    if buf.startswith('/*', k):
+                        self.state = _BLOCK_COMMENT
+                        self.depth = 1
+                        self.pos = k + 2
+                    else:
+                        self.has_code = True
+                        self.pos = k + 1
+                else:
+                    self.has_code = True
+                    tag = _DOLLAR_TAG.match(buf, k)
+                    if k > 0 and _is_ident_char(buf[k - 1]):
+                        self.pos = k + 1
+                    elif tag:
+                        self.state = _DOLLAR
+                        self.tag = tag.group()
+                        self.pos = tag.end()
+                    elif self._need_more(k, 64):
+                        self.pos = k
+                        return False
+                    else:
+                        self.pos = k + 1
+            elif state == _QUOTE:
+                if self.escapes:
+                    k1 = buf.find(self.quote, self.pos)
+                    k2 = buf.find('\\', self.pos, k1 if k1 != -1 else n)
+                    k = k2 if k2 != -1 else k1
+                else:
+                    k = buf.find(self.quote, self.pos)
+                if k == -1:
+                    self.pos = n
+                    return False
+                if self._need_more(k, 2):
+                    self.pos = k
+                    return False
+                if buf[k] == '\\':
+                    self.pos = k + 2
+                elif k + 1 < n and buf[k + 1] == self.quote:
+                    self.pos = k + 2
+                else:
+                    self.state = _NORMAL
+                    self.pos = k + 1
+            elif state == _LINE_COMMENT:
+                k = buf.find('\n', self.pos)
+                if k == -1:
+                    self.pos = n
+                    return False
+                self.state = _NORMAL
+                self.pos = k + 1
+            elif state == _BLOCK_COMMENT:
+                if self.mysql:
+                    k = buf.find('*/', self.pos)
+                    if k == -1:
+                        self.pos = max(self.pos, n - 1)
+                        return False
+                    self.state = _NORMAL
+                    self.pos = k + 2
+                else:
+                    match = _NESTED_COMMENT.search(buf, self.pos)
+                    if match is None:
+                        self.pos = max(self.pos, n - 1)
+                        return False
+                    self.depth += 1 if match.group() == '/*' else -1
+                    if self.depth == 0:
+                        self.state = _NORMAL
+                    self.pos = match.end()
+            else:
+                k = buf.find(self.tag, self.pos)
+                if k == -1:
+                    self.pos = max(self.pos, n - len(self.tag) + 1)
+                    return False
+                self.state = _NORMAL
+                self.pos = k + len(self.tag)
+        return False
@@ -0,0 +1,305 @@
+import io
+import threading
+import time
+
+# Seconds between two probes of the server's replication lag and latency.
+PROBE_INTERVAL = 1.0
+
+# Factors the adaptive rate is multiplied by when the server is under
+# pressure, and when it has recovered.
+DECREASE = 0.5
+INCREASE = 1.25
+
+# Pressure (the lag or latency over its limit) above which fetching pauses,
+# and below which the adaptive rate is raised again.
+PAUSE_PRESSURE = 2.0
+RECOVER_PRESSURE = 0.5
+
+# Lowest adaptive rate, in rows per second.
+MIN_RATE = 10.0
+
+# Amount of data a throttled COPY stream goes through between two pacing calls.
+PACE_BYTES = 64 * 1024
+
+
+class RateLimiter:
+    """
+    Token bucket limiting an amount per second, shared by several threads under the caller's lock.
+
+    Attributes:
+        rate (float): Amount allowed per second.
+        burst (float): Seconds worth of the rate that may be used at once after an idle period.
+        due (float): Monotonic time at which everything reserved so far is paid for.
+    """
+    def __init__(self, rate, burst=1.0):
+        """
+        Initialize the RateLimiter.
+
+        :param rate: Amount allowed per second.
+        :param burst: Seconds worth of the rate that may be used at once after an idle period.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.due = time.monotonic()
+
+    def reserve(self, amount, now):
+        """
+        Take an amount from the bucket.
+
+        :param amount: Amount consumed.
+        :param now: Current monotonic time.
+        :return: Seconds to wait before going on.
+        """
+        self.due = max(self.due, now - self.burst) + amount / self.rate
+        return max(self.due - now, 0.0)
+
+
+class Throttle:
+    """
+    Pacing of a backup's data fetch loops, shared by all dump workers.
+
+    Fixed caps limit the rows and bytes fetched per second. A feedback
+    controller additionally probes the server every ``interval`` seconds,
+    reading the replication lag and timing the probe query, and compares
+    both with their limits. The higher ratio is the pressure on the server.
+    Under pressure, the rows per second allowed are halved, starting from
+    the rate actually achieved. Once the pressure drops below half, they
+    are raised by a quarter per probe until the limit no longer binds.
+    When the pressure reaches ``PAUSE_PRESSURE`` every worker pauses until
+    it is back under the limit.
+
+    Attributes:
+        max_rows (float): Fixed cap of rows per second (None for no cap).
+        max_bytes (float): Fixed cap of bytes per second (None for no cap).
+        probe (callable): Returns the replication lag in seconds, or None if unknown (None for no feedback).
+        max_lag (float): Replication lag, in seconds, above which fetching slows down (None to ignore the lag).
+        max_latency (float): Probe latency, in seconds, above which fetching slows down (None to ignore it).
+        interval (float): Seconds between two probes.
+        logger (logging.Logger): Logger the rate changes and pauses are reported to.
+        adaptive_rate (float): Rows per second allowed by the feedback controller (None while not limiting).
+        waited (float): Seconds the workers spent waiting on the caps and the adaptive rate.
+        paused (float): Seconds fetching was paused for.
+    """
+    def __init__(self, max_rows=None, max_bytes=None, probe=None, max_lag=None, max_latency=None,
+                 interval=PROBE_INTERVAL, logger=None):
+        """
+        Initialize the Throttle.
+
+        :param max_rows: Fixed cap of rows per second (None for no cap).
+        :param max_bytes: Fixed cap of bytes per second (None for no cap).
+        :param probe: Callable returning the replication lag in seconds, or None if unknown (None for no feedback).
+        :param max_lag: Replication lag, in seconds, above which fetching slows down (None to ignore the lag).
+        :param max_latency: Probe latency, in seconds, above which fetching slows down (None to ignore it).
+        :param interval: Seconds between two probes.
+        :param logger: Logger the rate changes and pauses are reported to (optional).
+        """
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.probe = probe
+        self.max_lag = max_lag
+        self.max_latency = max_latency
+        self.interval = interval
+        self.logger = logger
+        self.adaptive_rate = None
+        self.waited = 0.0
+        self.paused = 0.0
+        self.limiters = {'rows': RateLimiter(max_rows) if max_rows else None,
+                         'bytes': RateLimiter(max_bytes) if max_bytes else None,
+                         'adaptive': None}
+        self.lock = threading.Lock()
+        self.probe_lock = threading.Lock()
+        self.running = threading.Event()
+        self.running.set()
+        self.rows = 0
+        self.probed_rows = 0
+        self.probed_at = time.monotonic()
+        self.next_probe = self.probed_at
+
+    def pace(self, rows, size=0):
+        """
+        Account for a fetched batch and wait as long as the caps and the server's load require.
+
+        :param rows: Number of rows in the batch.
+        :param size: Size of the batch in bytes.
+        """
+        if self.probe is not None and time.monotonic() >= self.next_probe:
+            self.check()
+        self.running.wait()
+        with self.lock:
+            now = time.monotonic()
+            self.rows += rows
+            delay = 0.0
+            for name, amount in (('rows', rows), ('bytes', size), ('adaptive', rows)):
+                if self.limiters[name] is not None:
+                    delay = max(delay, self.limiters[name].reserve(amount, now))
+            self.waited += delay
+        if delay > 0:
+            time.sleep(delay)
+
+    def check(self):
+        """
+        Probe the server and adjust the adaptive rate, pausing while the server is overloaded.
+
+        Only one worker probes at a time; the others go on meanwhile, unless
+        fetching is paused.
+        """
+        if not self.probe_lock.acquire(blocking=False):
+            return
+        try:
+            pressure, reason = self.measure()
+            self.adjust(pressure, reason)
+            if pressure >= PAUSE_PRESSURE:
+                self.pause(reason)
+            self.next_probe = time.monotonic() + self.interval
+        finally:
+            self.probe_lock.release()
+
+    def measure(self):
+        """
+        Run the probe and turn its lag and latency into a pressure.
+
+        :return: Tuple ``(pressure, reason)``: the highest ratio of a signal to its limit (0.0 if none is known) and
+            a description of the signals.
+        """
+        started = time.monotonic()
+        lag = self.probe()
+        latency = time.monotonic() - started
+        pressures = []
+        if self.max_lag and lag is not None:
+            pressures.append(lag / self.max_lag)
+        if self.max_latency:
+            pressures.append(latency / self.max_latency)
+        reason = (f"replication lag {lag:.1f}s, " if lag is not None else "") + f"latency {latency * 1000:.0f}ms"
+        return max(pressures, default=0.0), reason
+
+    def adjust(self, pressure, reason=''):
+        """
+        Move the adaptive rate according to the pressure on the server.
+
+        :param pressure: Highest ratio of a signal to its limit.
+        :param reason: Description of the signals, for the log.
+        :return: The new adaptive rate in rows per second (None while not limiting).
+        """
+        with self.lock:
+            now = time.monotonic()
+            achieved = (self.rows - self.probed_rows) / max(now - self.probed_at, 1e-6)
+            self.probed_rows = self.rows
+            self.probed_at = now
+            rate = self.adaptive_rate
+            known = [value for value in (rate, achieved) if value]
+            if pressure >= 1.0 and known:
+                rate = max(min(known) * DECREASE, MIN_RATE)
+                self.log(f"Throttling the backup to {rate:,.0f} rows/s ({reason})")
+            elif rate is not None and pressure < RECOVER_PRESSURE:
+                rate *= INCREASE
+                if rate > 2 * achieved:
+                    # The limit is far above what the backup fetches anyway.
+                    rate = None
+                    self.log(f"Backup throttling lifted ({reason})")
+            if rate != self.adaptive_rate:
+                self.adaptive_rate = rate
+                self.limiters['adaptive'] = RateLimiter(rate, burst=0.0) if rate else None
+            return rate
+
+    def pause(self, reason):
+        """
+        Stop every worker until the server is back under its limits.
+
+        :param reason: Description of the signals that caused the pause, for the log.
+        """
+        self.running.clear()
+        self.log(f"Pausing the backup ({reason})", warning=True)
+        started = time.monotonic()
+        try:
+            while True:
+                time.sleep(self.interval)
+                pressure, reason = self.measure()
+                if pressure < 1.0:
+                    break
+        finally:
+            with self.lock:
+                self.paused += time.monotonic() - started
+                # The pause must not count against the rate achieved.
+                self.probed_rows = self.rows
+                self.probed_at = time.monotonic()
+            self.running.set()
+        self.log(f"Resuming the backup after {time.monotonic() - started:.1f}s ({reason})")
+
+    def log(self, message, warning=False):
+        """
+        Report a change of pace, if a logger was given.
+
+        :param message: The message.
+        :param warning: Log at warning level instead of info.
+        """
+        if self.logger is not None:
+            (self.logger.warning if warning else self.logger.info)(message)
+
+    def summary(self):
+        """
+        Describe how much the backup was slowed down.
+
+        :return: A one-line summary of the time spent waiting and paused.
+        """
+        return f"Throttle waited {self.waited:.1f}s and paused {self.paused:.1f}s"
+
+
+class ThrottledWriter:
+    """
+    File wrapper pacing a stream the driver writes itself, as ``COPY ... TO STDOUT`` does.
+
+    psycopg2 writes one row per call, so every call counts as a row. The
+    throttle is called every ``PACE_BYTES``, and sleeping in ``write``
+    holds the COPY back on the server side.
+
+    Attributes:
+        f: File object the data is written to.
+        throttle (Throttle): Throttle the rows and bytes are reported to.
+        rows (int): Number of rows written since the last pacing call.
+        size (int): Amount of data written since the last pacing call.
+        waited (float): Seconds spent in the throttle, to leave out of the fetch time.
+    """
+    def __init__(self, f, throttle):
+        """
+        Initialize the ThrottledWriter.
+
+        :param f: File object the data is written to.
+        :param throttle: Throttle the rows and bytes are reported to.
+        """
+        self.f = f
+        self.throttle = throttle
+        self.rows = 0
+        self.size = 0
+        self.waited = 0.0
+
+    def write(self, data):
+        """
+        Write data to the wrapped file, pacing every ``PACE_BYTES``.
+
+        :param data: Data to write.
+        :return: The result of the wrapped ``write``.
+        """
+        result = self.f.write(data)
+        self.rows += 1
+        self.size += len(data)
+        if self.size >= PACE_BYTES:
+            started = time.perf_counter()
+            self.throttle.pace(self.rows, self.size)
+            self.waited += time.perf_counter() - started
+            self.rows = 0
+            self.size = 0
+        return result
+
+
+class ThrottledTextWriter(ThrottledWriter, io.TextIOBase):
+    """
+    Text flavour of ThrottledWriter, which psycopg2 hands ``str`` data.
+    """
+    def __init__(self, f, throttle):
+        """
+        Initialize the ThrottledTextWriter.
+
+        :param f: Text file object the data is written to.
+        :param throttle: Throttle the rows and bytes are reported to.
+        """
+        ThrottledWriter.__init__(self, f, throttle)
@@ -1,6 +1,26 @@
 import os
+import re
+import time
 import mysql.connector
 import logging
+from common.archive import ARCHIVE_SUFFIX, ArchiveReader
+from common.batching import CommitBatch, batch_limits
+from common.catalog import BackupCatalog
+from common.checkpoint import is_unfinished, open_run_checkpoint, restore_checkpoint_path, statement_key
+from common.compression import DecompressedFile, data_size, open_backup_file, strip_codec_suffix
+from common.log import add_file_handler
+from common.manifest import read_manifest, select_tables
+from common.metrics import ProgressLine, RunMetrics, summary_lines
+from common.post_data import build_post_data, post_data_phase
+from common.scheduler import run_dependency_ordered
+from common.sql_splitter import SQLStatementReader
+
+# Session settings of the fast restore mode. sql_log_bin needs the SUPER or
+# SYSTEM_VARIABLES_ADMIN privilege and is left alone without it.
+FAST_SETTINGS = (('foreign_key_checks', 0), ('unique_checks', 0), ('sql_log_bin', 0))
+
+# Table an INSERT statement of a data backup loads, for the run metrics.
+INSERT_TABLE = re.compile(r'\s*INSERT\s+INTO\s+`?((?:[^`\s(]|``)+)', re.IGNORECASE)
 
 class MySQLRestore:
     """
@@ -13,8 +33,20 @@ class MySQLRestore:
         backup_dir (str): Directory where backup files are stored.
         log_dir (str): Directory where log files are stored.
         new_database (str): Name of the new database to restore to (optional).
+        jobs (int): Number of connections loading table data concurrently (optional).
+        backup_id (int): Catalog id of the backup to restore (latest if None).
+        tables (list): Names of the tables to restore (all tables if None).
+        fast (bool): Turn off foreign key checks, unique checks and binary logging for the restore.
+        commit_every (int): Number of statements executed per transaction (whole file if None).
+        commit_bytes (int): Size of the statements executed per transaction (whole file if None).
+        post_data (list): Post-data statements of the restored structure that are not built yet.
+        prometheus_dir (str): Directory of the Prometheus textfile collector the run metrics are written to (optional).
+        metrics (RunMetrics): Per-table throughput counters of the run, reported when the restore is closed.
+        checkpoint (Checkpoint): Progress of the restore, in the log directory, kept when the restore fails.
     """
-    def __init__(self, host, user, password, backup_dir, log_dir, new_database=None):
+    def __init__(self, host, user, password, backup_dir, log_dir, new_database=None, jobs=None, backup_id=None,
+                 tables=None, fast=False, commit_every=None, commit_bytes=None, progress=False, prometheus_dir=None,
+                 resume=False):
         """
         Initialize the MySQLRestore class with connection details and directories.
 
@@ -24,6 +56,15 @@ class MySQLRestore:
         :param backup_dir: Directory where backup files are stored.
         :param log_dir: Directory where log files are stored.
         :param new_database: Name of the new database to restore to (optional).
+        :param jobs: Number of connections loading table data concurrently (optional).
+        :param backup_id: Catalog id of the backup to restore (latest if None).
+        :param tables: Names of the tables to restore (all tables if None).
+        :param fast: Turn off foreign key checks, unique checks and binary logging for the restore.
+        :param commit_every: Number of statements executed per transaction (fast mode default if None).
+        :param commit_bytes: Size of the statements executed per transaction (fast mode default if None).
+        :param progress: Draw a live progress line with the throughput and ETA on standard error.
+        :param prometheus_dir: Directory of the Prometheus textfile collector the run metrics are written to (optional).
+        :param resume: Continue the restore a failed run left a checkpoint for, skipping the work it completed.
         """
         self.host = host
         self.user = user
@@ -31,15 +72,41 @@ class MySQLRestore:
         self.backup_dir = backup_dir
         self.log_dir = log_dir
         self.new_database = new_database
-        self.conn = mysql.connector.connect(host=host, user=user, password=password)
+        self.jobs = jobs
+        self.backup_id = backup_id
+        self.tables = tables
+        self.fast = fast
+        self.commit_every, self.commit_bytes = batch_limits(fast, commit_every, commit_bytes)
+        self.post_data = []
+        self.prometheus_dir = prometheus_dir
+        self.metrics = RunMetrics('restore', 'mysql', new_database, ProgressLine() if progress else None, host)
+        self.conn = self.connect()
         self.cursor = self.conn.cursor()
         self.setup_logging()
+        self.checkpoint = open_run_checkpoint(restore_checkpoint_path(log_dir, 'mysql', new_database), resume,
+                                              {'database': new_database, 'backup_id': backup_id,
+                                               'tables': list(tables) if tables else None}, self.logger)
         self.ensure_directories_exist()
+        self.catalog = BackupCatalog(backup_dir)
+        self.saved_settings = self.apply_session_settings(self.conn) if fast else {}
 
         if new_database:
             self.create_database(new_database)
             self.conn.database = new_database
 
+    def connect(self, database=None):
+        """
+        Open a new connection to the MySQL server.
+
+        LOAD DATA LOCAL INFILE is only allowed for files inside the backup directory.
+
+        :param database: Database to select on the connection (optional).
+        :return: A mysql.connector connection.
+        """
+        kwargs = {'database': database} if database else {}
+        return mysql.connector.connect(host=self.host, user=self.user, password=self.password,
+                                       allow_local_infile_in_path=os.path.abspath(self.backup_dir), **kwargs)
+
     def setup_logging(self):
         """
         Set up logging for the restore process.
@@ -50,9 +117,7 @@ class MySQLRestore:
         formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
         self.logger = logging.getLogger('mysql_restore')
         self.logger.setLevel(logging.INFO)
-        file_handler = logging.FileHandler(os.path.join(self.log_dir, 'mysql_restore.log'))
-        file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
+        add_file_handler(self.logger, os.path.join(self.log_dir, 'mysql_restore.log'), formatter)
 
     def ensure_directories_exist(self):
         """
@@ -61,6 +126,42 @@ class MySQLRestore:
         if not os.path.exists(self.backup_dir):
             os.makedirs(self.backup_dir)
 
+    def apply_session_settings(self, conn):
+        """
+        Switch a connection to the bulk-load settings of the fast restore mode.
+
+        :param conn: Connection to configure.
+        :return: Dictionary of the previous value of every setting changed.
+        """
+        saved = {}
+        cursor = conn.cursor()
+        try:
+            for name, value in FAST_SETTINGS:
+                cursor.execute(f"SELECT @@SESSION.{name}")
+                previous = cursor.fetchone()[0]
+                try:
+                    cursor.execute(f"SET SESSION {name} = {value}")
+                    saved[name] = previous
+                except mysql.connector.Error as err:
+                    self.logger.warning(f"Fast restore keeps {name} = {previous}: {err}")
+        finally:
+            cursor.close()
+        return saved
+
+    def reset_session_settings(self, conn, saved):
+        """
+        Put back the session settings changed by ``apply_session_settings``.
+
+        :param conn: Connection to configure.
+        :param saved: Previous values returned by ``apply_session_settings``.
+        """
+        cursor = conn.cursor()
+        try:
+            for name, value in saved.items():
+                cursor.execute(f"SET SESSION {name} = {value}")
+        finally:
+            cursor.close()
+
     def create_database(self, db_name):
         """
         Create a new MySQL database.
@@ -73,72 +174,528 @@ class MySQLRestore:
         except mysql.connector.Error as err:
             self.logger.error(f"Failed creating database {db_name}: {err}")
 
-    def restore_structure(self):
+    def restore_structure(self, defer_post_data=False, dump=None):
         """
         Restore the structure of the MySQL database (schema only).
+
+        Only the schema sections of the requested tables are read from an
+        archive backup. Foreign key checks are off meanwhile, so tables can be
+        created before the tables they reference. The post-data statements
+        (secondary indexes and foreign keys) are then built concurrently by
+        ``build_post_data``, or kept for ``restore_post_data`` to build once
+        the rows are loaded. When a resumed restore already created the
+        structure, only the post-data statements are read back.
+
+        :param defer_post_data: Keep the post-data statements for after the data load.
+        :param dump: Callable returning the structure dump as a text stream, read instead of a backup (optional).
         """
         self.logger.info("Starting MySQL structure restore")
-        backup_file = self.get_latest_backup('structure')
-        with open(backup_file, 'r') as f:
-            sql_script = f.read()
-            sql_commands = sql_script.split(';')
-            for command in sql_commands:
-                if command.strip():
-                    try:
-                        self.cursor.execute(command)
-                    except mysql.connector.Error as err:
-                        self.logger.error(f"Error executing SQL: {command.strip()} - {err}")
+        backup_file = 'the source database' if dump else self.get_latest_backup('structure')
+        restored = self.checkpoint.state.get('structure')
+        if restored:
+            self.logger.info("Structure already restored by the resumed run, reading its post-data statements")
+            load = self.collect_post_data
+        else:
+            load = lambda f: self.execute_statements(f, post_data=self.post_data)
+        saved = self.disable_foreign_key_checks(self.conn)
+        try:
+            if dump is not None:
+                with dump() as f:
+                    load(f)
+            elif backup_file.endswith(ARCHIVE_SUFFIX):
+                with ArchiveReader(backup_file) as archive:
+                    for entry in archive.sections('schema', self.tables):
+                        with archive.open_section(entry, 'r') as f:
+                            load(f)
+            else:
+                self.check_single_file(backup_file)
+                with open_backup_file(backup_file, 'r') as f:
+                    load(f)
+        finally:
+            self.reset_session_settings(self.conn, saved)
+        if not restored:
+            self.checkpoint.update(structure=True)
         self.logger.info(f"MySQL structure restored from {backup_file}")
+        if not defer_post_data:
+            self.build_post_data()
+
+    def collect_post_data(self, f):
+        """
+        Keep the post-data statements of a structure dump without running the rest of it.
+
+        :param f: Text file object of the dump.
+        """
+        for command in SQLStatementReader(f, 'mysql'):
+            if post_data_phase(command) is not None:
+                self.post_data.append(command)
+
+    def disable_foreign_key_checks(self, conn):
+        """
+        Turn off the foreign key checks of a connection.
+
+        :param conn: Connection to configure.
+        :return: Dictionary of the previous value, for ``reset_session_settings``.
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT @@SESSION.foreign_key_checks")
+            saved = {'foreign_key_checks': cursor.fetchone()[0]}
+            cursor.execute("SET SESSION foreign_key_checks = 0")
+        finally:
+            cursor.close()
+        return saved
+
+    def build_post_data(self):
+        """
+        Build the secondary indexes and foreign keys of the restored structure.
+
+        The indexes are built first, over ``jobs`` connections when more than
+        one job is set, then the foreign keys. Foreign key checks are off, as
+        when loading a dump with the constraints in place, so adding a foreign
+        key does not copy the table to validate its rows. Statements a resumed
+        run already built are skipped.
+        """
+        statements, self.post_data = self.post_data, []
+        built = set(self.checkpoint.items('post_data'))
+        statements = [statement for statement in statements if statement_key(statement) not in built]
+        if not statements:
+            return
+        workers = [self.connect(self.new_database) for _ in range(self.jobs)] if self.jobs and self.jobs > 1 else []
+        saved = self.disable_foreign_key_checks(self.conn)
+        try:
+            for conn in workers:
+                self.disable_foreign_key_checks(conn)
+                if self.fast:
+                    self.apply_session_settings(conn)
+            failed = build_post_data(workers or [self.conn], statements, self.execute_post_data, self.logger)
+        finally:
+            for conn in workers:
+                conn.close()
+            self.reset_session_settings(self.conn, saved)
+        self.logger.info(f"MySQL post-data objects built ({failed} failed)")
+
+    def execute_post_data(self, conn, statement):
+        """
+        Run a single post-data statement and record it in the checkpoint.
+
+        :param conn: Connection to run the statement with.
+        :param statement: The statement.
+        :return: The error raised, or None.
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute(statement)
+        except mysql.connector.Error as err:
+            return err
+        finally:
+            cursor.close()
+        self.checkpoint.add('post_data', statement_key(statement))
+        return None
 
     def restore_data(self):
         """
         Restore the data of the MySQL database (data only).
+
+        A backup directory (one file per table) is loaded table by table:
+        tab-delimited files with ``LOAD DATA LOCAL INFILE``, SQL files statement
+        by statement. Archive sections are loaded the same way, seeking straight
+        to the requested tables. A single-file 'insert' backup is replayed as a
+        whole. The post-data steps run once all rows are loaded.
+
+        Every table file, section or single file is recorded in the checkpoint
+        once loaded. A resumed restore skips those, and empties a table whose
+        load was interrupted before loading it again.
         """
         self.logger.info("Starting MySQL data restore")
         backup_file = self.get_latest_backup('data')
-        with open(backup_file, 'r') as f:
-            sql_script = f.read()
-            sql_commands = sql_script.split(';')
-            for command in sql_commands:
-                if command.strip():
-                    try:
-                        self.cursor.execute(command)
-                    except mysql.connector.Error as err:
-                        self.logger.error(f"Error executing SQL: {command.strip()} - {err}")
+        if backup_file.endswith(ARCHIVE_SUFFIX):
+            self.restore_data_archive(backup_file)
+        elif os.path.isdir(backup_file):
+            self.restore_data_directory(backup_file)
+        else:
+            self.check_single_file(backup_file)
+
+            def load():
+                with open_backup_file(backup_file, 'r') as f:
+                    self.execute_statements(f)
+                self.conn.commit()
+
+            self.restore_unit(self.conn, os.path.basename(backup_file), load)
+        self.restore_post_data()
         self.logger.info(f"MySQL data restored from {backup_file}")
 
+    def check_single_file(self, backup_file):
+        """
+        Refuse to restore a subset of tables from a single-file backup.
+
+        :param backup_file: Path to the backup file.
+        :raises ValueError: If tables were requested, as the file cannot be split by table.
+        """
+        if self.tables:
+            raise ValueError(f"{backup_file} holds all tables in one file; "
+                             "restoring single tables needs an archive or per-table backup")
+
+    def execute_statements(self, f, conn=None, post_data=None):
+        """
+        Execute every statement of a SQL dump, reading it incrementally.
+
+        A commit is issued every ``commit_every`` statements or ``commit_bytes``
+        of SQL, when set; the caller commits the last batch. INSERT statements
+        are reported to the run metrics under the table they load.
+
+        :param f: Text file object of the dump.
+        :param conn: Connection to execute the statements with (defaults to the main connection).
+        :param post_data: List collecting the post-data statements instead of executing them (optional).
+        """
+        conn = conn or self.conn
+        cursor = conn.cursor()
+        batch = CommitBatch(self.commit_every, self.commit_bytes)
+        statements = SQLStatementReader(f, 'mysql')
+        try:
+            while True:
+                started = time.perf_counter()
+                command = next(statements, None)
+                if command is None:
+                    break
+                if post_data is not None and post_data_phase(command) is not None:
+                    post_data.append(command)
+                    continue
+                read = time.perf_counter()
+                try:
+                    cursor.execute(command)
+                except mysql.connector.Error as err:
+                    self.logger.error(f"Error executing SQL: {command.strip()} - {err}")
+                if batch.add(len(command)):
+                    conn.commit()
+                insert = INSERT_TABLE.match(command)
+                if insert:
+                    self.metrics.add(insert.group(1).replace('``', '`'), max(cursor.rowcount, 0), len(command),
+                                     read - started, write=time.perf_counter() - read)
+        finally:
+            cursor.close()
+
+    def restore_data_directory(self, backup_dir):
+        """
+        Load every table file of a data backup directory.
+
+        Tables are loaded in manifest order on the main connection, or
+        concurrently over ``jobs`` connections when more than one job is set.
+
+        :param backup_dir: Directory containing one file per table.
+        """
+        entries = self.pending_entries(select_tables(read_manifest(backup_dir)['tables'], self.tables))
+        self.expect_rows(entries)
+        if self.jobs and self.jobs > 1:
+            entries = sorted(entries, key=lambda entry: data_size(os.path.join(backup_dir, entry['file'])),
+                             reverse=True)
+            self.restore_data_parallel(entries, lambda conn, entry: self.restore_table_file(conn, backup_dir, entry))
+        else:
+            for entry in entries:
+                self.restore_table_file(self.conn, backup_dir, entry)
+
+    def expect_rows(self, entries):
+        """
+        Tell the run metrics how many rows the backup holds, for the ETA.
+
+        :param entries: Manifest or archive entries of the tables to load, which record their row counts.
+        """
+        if entries and all(entry.get('rows') is not None for entry in entries):
+            self.metrics.expect(sum([entry['rows'] for entry in entries]))
+
+    def pending_entries(self, entries):
+        """
+        Drop the entries a resumed restore already loaded.
+
+        :param entries: Manifest or archive entries of the tables to load.
+        :return: The entries still to load.
+        """
+        done = set(self.checkpoint.items('done'))
+        pending = [entry for entry in entries if unit_key(entry) not in done]
+        if len(pending) < len(entries):
+            self.logger.info(f"Skipping {len(entries) - len(pending)} table files already loaded")
+        return pending
+
+    def restore_unit(self, conn, key, load, table_name=None, where=None):
+        """
+        Load one table file, section or single file, recording it in the checkpoint.
+
+        A unit the resumed run started but did not complete is emptied first:
+        the rows of its key range, the whole table, or all tables for a single
+        file. A unit is only recorded as done once ``load`` has returned, so a
+        load that raised is retried by the next resumed run.
+
+        :param conn: Connection to load the unit with.
+        :param key: Name of the unit in the checkpoint.
+        :param load: Callable loading the unit.
+        :param table_name: Table the unit loads (None for all tables).
+        :param where: Primary key range of a chunk (optional).
+        """
+        if key in self.checkpoint.items('done'):
+            self.logger.info(f"Skipping {key}, already loaded")
+            return
+        if key in self.checkpoint.items('started'):
+            self.clear_rows(conn, table_name, where)
+        self.checkpoint.add('started', key)
+        load()
+        self.checkpoint.add('done', key)
+
+    def clear_rows(self, conn, table_name=None, where=None):
+        """
+        Delete the rows an interrupted load left behind.
+
+        :param conn: Connection to delete the rows with.
+        :param table_name: Table to empty (None for all tables).
+        :param where: Primary key range to delete instead of the whole table (optional).
+        """
+        saved = self.disable_foreign_key_checks(conn)
+        cursor = conn.cursor()
+        try:
+            tables = [table_name]
+            if table_name is None:
+                cursor.execute("SHOW FULL TABLES WHERE Table_type = 'BASE TABLE'")
+                tables = [row[0] for row in cursor.fetchall()]
+            for table in tables:
+                if where:
+                    cursor.execute(f"DELETE FROM `{table}` WHERE {where}")
+                else:
+                    cursor.execute(f"TRUNCATE TABLE `{table}`")
+            conn.commit()
+        finally:
+            cursor.close()
+            self.reset_session_settings(conn, saved)
+        self.logger.info(f"Removed the rows of the interrupted load of {table_name or 'all tables'}")
+
+    def restore_data_archive(self, backup_file):
+        """
+        Load the data sections of an archive backup.
+
+        Only the sections of the requested tables are read, in archive order on
+        the main connection or concurrently over ``jobs`` connections.
+
+        :param backup_file: Path to the archive.
+        """
+        with ArchiveReader(backup_file) as archive:
+            entries = self.pending_entries(archive.sections('data', self.tables))
+            self.expect_rows(entries)
+            if self.jobs and self.jobs > 1:
+                entries = sorted(entries, key=lambda entry: entry['length'], reverse=True)
+                self.restore_data_parallel(entries, lambda conn, entry: self.restore_section(conn, archive, entry))
+            else:
+                for entry in entries:
+                    self.restore_section(self.conn, archive, entry)
+
+    def restore_data_parallel(self, entries, restore_entry):
+        """
+        Load tables concurrently, parents before the tables referencing them.
+
+        The entries are expected largest first, so the total time is bound by
+        the largest table rather than the sum of all of them.
+
+        :param entries: Manifest or archive entries of the tables to load, largest first.
+        :param restore_entry: Callable loading one entry, given a connection and the entry.
+        """
+        dependencies = self.get_table_dependencies()
+        workers = [self.connect(self.new_database) for _ in range(self.jobs)]
+        if self.fast:
+            for conn in workers:
+                self.apply_session_settings(conn)
+        self.logger.info(f"Loading {len(entries)} table files over {self.jobs} connections")
+        try:
+            run_dependency_ordered(workers, [(entry['table'], entry) for entry in entries], dependencies,
+                                   restore_entry, self.logger)
+        finally:
+            for conn in workers:
+                conn.close()
+
+    def get_table_dependencies(self):
+        """
+        Read the foreign key dependencies between the tables of the target database.
+
+        :return: Dictionary mapping a table to the set of tables it references.
+        """
+        self.cursor.execute(
+            "SELECT TABLE_NAME, REFERENCED_TABLE_NAME FROM information_schema.KEY_COLUMN_USAGE "
+            "WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL"
+        )
+        dependencies = {}
+        for table_name, referenced_table in self.cursor.fetchall():
+            dependencies.setdefault(table_name, set()).add(referenced_table)
+        return dependencies
+
+    def restore_table_file(self, conn, backup_dir, entry):
+        """
+        Load a single table file of a data backup directory and commit it.
+
+        :param conn: Connection to load the table with.
+        :param backup_dir: Directory containing the table file.
+        :param entry: Manifest entry of the table.
+        """
+        path = os.path.join(backup_dir, entry['file'])
+
+        def load():
+            if strip_codec_suffix(path).endswith('.tsv'):
+                self.load_tsv_file(path, entry['table'], conn)
+            else:
+                with open_backup_file(path, 'r') as f:
+                    self.execute_statements(f, conn)
+                conn.commit()
+                self.logger.info(f"Table {entry['table']} restored from {path}")
+
+        self.restore_unit(conn, unit_key(entry), load, entry['table'], entry.get('where'))
+
+    def restore_section(self, conn, archive, entry):
+        """
+        Load a single data section of an archive backup and commit it.
+
+        :param conn: Connection to load the table with.
+        :param archive: ArchiveReader of the backup.
+        :param entry: Index entry of the section.
+        """
+        table_name = entry['table']
+        source = lambda mode: archive.open_section(entry, mode)
+        load = lambda: self.load_stream(conn, table_name, entry['format'], source, os.path.dirname(archive.path),
+                                        archive.path)
+        self.restore_unit(conn, unit_key(entry), load, table_name)
+
+    def load_stream(self, conn, table_name, data_format, source, directory, origin):
+        """
+        Load the rows of a table from a stream and commit them.
+
+        :param conn: Connection to load the table with.
+        :param table_name: Name of the table to load into.
+        :param data_format: Format of the stream ('tsv' or 'insert').
+        :param source: Callable returning the stream, given 'rb' or 'r' for text.
+        :param directory: Directory the named pipe of a tab-delimited load is created in.
+        :param origin: Where the stream comes from, for the log.
+        """
+        if data_format == 'tsv':
+            self.load_tsv_file(os.path.join(directory, f'{table_name}.tsv'), table_name, conn, lambda: source('rb'))
+        else:
+            with source('r') as f:
+                self.execute_statements(f, conn)
+            conn.commit()
+            self.logger.info(f"Table {table_name} restored from {origin}")
+
+    def load_tsv_file(self, path, table_name, conn=None, source=None):
+        """
+        Load a single tab-delimited file into a table and commit it.
+
+        A compressed file, or an archive section, is fed on the fly through a
+        named pipe inside the backup directory, the only place the server may
+        read from.
+
+        :param path: Path to the ``.tsv`` file, optionally compressed.
+        :param table_name: Name of the table to load into.
+        :param conn: Connection to load the table with (defaults to the main connection).
+        :param source: Callable returning the content as a binary stream, when not read from ``path``.
+        :raises mysql.connector.Error: If the load fails; the table is left as it was before.
+        """
+        conn = conn or self.conn
+        cursor = conn.cursor()
+        try:
+            started = time.perf_counter()
+            with DecompressedFile(path, os.path.dirname(os.path.abspath(path)), source) as load_path:
+                cursor.execute(
+                    f"LOAD DATA LOCAL INFILE '{os.path.abspath(load_path)}' INTO TABLE `{table_name}` "
+                    "CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n'"
+                )
+            conn.commit()
+            # The server reads the file itself, so the load is a single write phase.
+            self.metrics.add(table_name, max(cursor.rowcount, 0), write=time.perf_counter() - started)
+            self.logger.info(f"Table {table_name} restored ({cursor.rowcount} rows)")
+        except mysql.connector.Error as err:
+            conn.rollback()
+            self.logger.error(f"Error loading {path} into {table_name}: {err}")
+            raise
+        finally:
+            cursor.close()
+
+    def restore_post_data(self):
+        """
+        Run the steps that follow the data load.
+
+        Builds the post-data objects kept by ``restore_structure`` and
+        refreshes the index statistics of every restored table so the optimizer
+        does not plan queries against the empty tables it saw before the load.
+        """
+        self.build_post_data()
+        tables = self.tables
+        if not tables:
+            self.cursor.execute("SHOW TABLES")
+            tables = [table[0] for table in self.cursor.fetchall()]
+        if tables:
+            self.cursor.execute("ANALYZE TABLE " + ", ".join([f"`{table}`" for table in tables]))
+            self.cursor.fetchall()
+        self.logger.info(f"MySQL post-data steps completed for {len(tables)} tables")
+
     def restore_full(self):
         """
         Restore the full MySQL database (both structure and data).
         """
         self.logger.info("Starting full MySQL restore")
-        self.restore_structure()
+        self.restore_structure(defer_post_data=True)
         self.restore_data()
 
-    def close(self):
+    def close(self, status='ok'):
         """
-        Close the MySQL connection and logger.
+        Close the MySQL connection and logger, putting back the session settings of the fast mode.
+
+        The metrics of the run are reported first: the JSON report goes to the
+        log directory and the Prometheus metrics to ``prometheus_dir`` when set.
+
+        :param status: Outcome of the run ('ok' or 'failed').
         """
+        report = self.metrics.finish(status, self.log_dir, self.prometheus_dir)
+        for line in summary_lines(report):
+            self.logger.info(line)
+        self.logger.info(f"Restore {status}: {report['rows']} rows, {report['bytes']} bytes in {report['seconds']}s "
+                         f"({report['rows_per_second']} rows/s)")
+        if status == 'ok':
+            self.checkpoint.remove()
+        else:
+            self.logger.info(f"Progress kept in {self.checkpoint.path}; run the restore with --resume to continue it")
+        self.reset_session_settings(self.conn, self.saved_settings)
         self.cursor.close()
         self.conn.close()
+        self.catalog.close()
         self.logger.info("MySQL restore connection closed")
 
     def get_latest_backup(self, backup_type):
         """
         Get the latest backup file of the specified type.
 
+        The backup is looked up in the backup catalog, or taken by id when
+        ``backup_id`` is set. Backups taken before the catalog existed are
+        found by scanning the backup directory for MySQL files, leaving out
+        the ones a failed backup did not finish. The path is recorded in the
+        checkpoint, so a resumed restore reads the same backup.
+
         :param backup_type: Type of backup ('structure' or 'data').
         :return: Path to the latest backup file.
         :raises FileNotFoundError: If no backup files are found.
         """
-        files = os.listdir(self.backup_dir)
-        backup_files = [f for f in files if backup_type in f]
-        if not backup_files:
-            raise FileNotFoundError(f"No {backup_type} backup files found in {self.backup_dir}")
-        latest_backup = max(backup_files, key=lambda x: os.path.getctime(os.path.join(self.backup_dir, x)))
-        return os.path.join(self.backup_dir, latest_backup)
+        recorded = self.checkpoint.state.get(f'{backup_type}_path')
+        if recorded is not None:
+            return recorded
+        backup = self.catalog.find('mysql', backup_type, self.backup_id)
+        if backup is not None:
+            path = backup['path']
+        elif self.backup_id is not None:
+            raise FileNotFoundError(f"Backup {self.backup_id} has no {backup_type} section in the catalog")
+        else:
+            prefix = f'mysql_{backup_type}_'
+            backup_files = [f for f in os.listdir(self.backup_dir)
+                            if f.startswith(prefix) and not is_unfinished(os.path.join(self.backup_dir, f))]
+            if not backup_files:
+                raise FileNotFoundError(f"No {backup_type} backup files found in {self.backup_dir}")
+            latest_backup = max(backup_files, key=lambda x: os.path.getctime(os.path.join(self.backup_dir, x)))
+            path = os.path.join(self.backup_dir, latest_backup)
+        self.checkpoint.update(**{f'{backup_type}_path': path})
+        return path
 
-def mysql_restore(host, user, password, backup_dir, log_dir, restore_type, new_database=None):
+def mysql_restore(host, user, password, backup_dir, log_dir, restore_type, new_database=None, jobs=None,
+                  backup_id=None, tables=None, fast=False, commit_every=None, commit_bytes=None,
+                  progress=False, prometheus_dir=None, resume=False):
     """
     Function to perform MySQL restore based on the specified restore type.
 
@@ -149,12 +706,36 @@ def mysql_restore(host, user, password, backup_dir, log_dir, restore_type, new_d
     :param log_dir: Directory where log files are stored.
     :param restore_type: Type of restore ('structure', 'data', 'full').
     :param new_database: Name of the new database to restore to (optional).
+    :param jobs: Number of connections loading table data concurrently (optional).
+    :param backup_id: Catalog id of the backup to restore (latest if None).
+    :param tables: Names of the tables to restore (all tables if None).
+    :param fast: Turn off foreign key checks, unique checks and binary logging for the restore.
+    :param commit_every: Number of statements executed per transaction (fast mode default if None).
+    :param commit_bytes: Size of the statements executed per transaction (fast mode default if None).
+    :param progress: Draw a live progress line with the throughput and ETA on standard error.
+    :param prometheus_dir: Directory of the Prometheus textfile collector the run metrics are written to (optional).
+    :param resume: Continue the restore a failed run left a checkpoint for, skipping the work it completed.
+    """
+    restore = MySQLRestore(host, user, password, backup_dir, log_dir, new_database, jobs, backup_id, tables, fast,
+                           commit_every, commit_bytes, progress, prometheus_dir, resume)
+    status = 'failed'
+    try:
+        if restore_type == 'structure':
+            restore.restore_structure()
+        elif restore_type == 'data':
+            restore.restore_data()
+        elif restore_type == 'full':
+            restore.restore_full()
+        status = 'ok'
+    finally:
+        restore.close(status)
+
+
+def unit_key(entry):
+    """
+    Name a manifest or archive entry in the restore checkpoint.
+
+    :param entry: Manifest entry (keyed by its file) or archive index entry (keyed by its table).
+    :return: The key of the entry.
     """
-    restore = MySQLRestore(host, user, password, backup_dir, log_dir, new_database)
-    if restore_type == 'structure':
-        restore.restore_structure()
-    elif restore_type == 'data':
-        restore.restore_data()
-    elif restore_type == 'full':
-        restore.restore_full()
-    restore.close()
+    return entry.get('file') or entry['table']
@@ -1,6 +1,28 @@
 import os
+import time
 import psycopg2
 import logging
+from common.archive import ARCHIVE_SUFFIX, ArchiveReader
+from common.batching import CommitBatch, batch_limits
+from common.catalog import BackupCatalog
+from common.checkpoint import is_unfinished, open_run_checkpoint, restore_checkpoint_path, statement_key
+from common.compression import data_size, open_backup_file, strip_codec_suffix
+from common.copy_stream import (COPY_BUFFER_SIZE, COPY_FROM_PATTERN, INSERT_PATTERN, CopyBatchReader,
+                                CopySectionReader, FramedReader, InsertCopyReader)
+from common.log import add_file_handler
+from common.manifest import read_manifest, select_tables
+from common.metrics import MeteredReader, ProgressLine, RunMetrics, summary_lines
+from common.post_data import build_post_data, post_data_phase
+from common.scheduler import run_dependency_ordered
+from common.sql_splitter import SQLStatementReader, strip_leading_comments
+
+# Statements of a structure backup run when restoring the tables.
+TABLE_STATEMENTS = ('CREATE TABLE', 'CREATE INDEX', 'CREATE UNIQUE INDEX', 'CREATE VIEW', 'CREATE TRIGGER',
+                    'CREATE CONSTRAINT TRIGGER', 'ALTER TABLE', 'ALTER SEQUENCE', 'INSERT INTO')
+
+# Session settings of the fast restore mode: commits do not wait for the WAL
+# flush, and index builds and foreign key validation get more memory.
+FAST_SETTINGS = (('synchronous_commit', 'off'), ('maintenance_work_mem', '1GB'))
 
 class PgSQLRestore:
     """
@@ -13,8 +35,19 @@ class PgSQLRestore:
         backup_dir (str): Directory where backup files are stored.
         log_dir (str): Directory where log files are stored.
         database (str): Name of the database to restore.
+        jobs (int): Number of connections loading table data concurrently (optional).
+        backup_id (int): Catalog id of the backup to restore (latest if None).
+        tables (list): Names of the tables to restore (all tables if None).
+        fast (bool): Turn off synchronous commit and raise maintenance_work_mem for the restore.
+        commit_every (int): Number of rows or statements loaded per transaction (whole table if None).
+        commit_bytes (int): Size of the data loaded per transaction (whole table if None).
+        post_data (list): Post-data statements of the restored structure that are not built yet.
+        prometheus_dir (str): Directory of the Prometheus textfile collector the run metrics are written to (optional).
+        metrics (RunMetrics): Per-table throughput counters of the run, reported when the restore is closed.
+        checkpoint (Checkpoint): Progress of the restore, in the log directory, kept when the restore fails.
     """
-    def __init__(self, host, user, password, backup_dir, log_dir, database):
+    def __init__(self, host, user, password, backup_dir, log_dir, database, jobs=None, backup_id=None, tables=None,
+                 fast=False, commit_every=None, commit_bytes=None, progress=False, prometheus_dir=None, resume=False):
         """
         Initialize the PgSQLRestore class with connection details and directories.
 
@@ -24,6 +57,15 @@ class PgSQLRestore:
         :param backup_dir: Directory where backup files are stored.
         :param log_dir: Directory where log files are stored.
         :param database: Name of the database to restore.
+        :param jobs: Number of connections loading table data concurrently (optional).
+        :param backup_id: Catalog id of the backup to restore (latest if None).
+        :param tables: Names of the tables to restore (all tables if None).
+        :param fast: Turn off synchronous commit and raise maintenance_work_mem for the restore.
+        :param commit_every: Number of rows or statements loaded per transaction (fast mode default if None).
+        :param commit_bytes: Size of the data loaded per transaction (fast mode default if None).
+        :param progress: Draw a live progress line with the throughput and ETA on standard error.
+        :param prometheus_dir: Directory of the Prometheus textfile collector the run metrics are written to (optional).
+        :param resume: Continue the restore a failed run left a checkpoint for, skipping the work it completed.
         """
         self.host = host
         self.user = user
@@ -31,12 +73,25 @@ class PgSQLRestore:
         self.backup_dir = backup_dir
         self.log_dir = log_dir
         self.database = database
+        self.jobs = jobs
+        self.backup_id = backup_id
+        self.tables = tables
+        self.fast = fast
+        self.commit_every, self.commit_bytes = batch_limits(fast, commit_every, commit_bytes)
+        self.post_data = []
+        self.prometheus_dir = prometheus_dir
+        self.metrics = RunMetrics('restore', 'pgsql', database, ProgressLine() if progress else None, host)
         self.setup_logging()
+        self.checkpoint = open_run_checkpoint(restore_checkpoint_path(log_dir, 'pgsql', database), resume,
+                                              {'database': database, 'backup_id': backup_id,
+                                               'tables': list(tables) if tables else None}, self.logger)
         self.ensure_directories_exist()
+        self.catalog = BackupCatalog(backup_dir)
         self.create_database_if_not_exists()
 
         # Connect to the target database
         self.connect_to_database()
+        self.saved_settings = self.apply_session_settings(self.conn) if fast else {}
 
     def setup_logging(self):
         """
@@ -45,12 +100,10 @@ class PgSQLRestore:
         if not os.path.exists(self.log_dir):
             os.makedirs(self.log_dir)
 
-        formatter = logging.Formatter('%(asctime)s %(levellevel)s %(message)s')
+        formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
         self.logger = logging.getLogger('pgsql_restore')
         self.logger.setLevel(logging.INFO)
-        file_handler = logging.FileHandler(os.path.join(self.log_dir, 'pgsql_restore.log'))
-        file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
+        add_file_handler(self.logger, os.path.join(self.log_dir, 'pgsql_restore.log'), formatter)
 
     def ensure_directories_exist(self):
         """
@@ -64,19 +117,57 @@ class PgSQLRestore:
         Connect to the PostgreSQL database.
         """
         try:
-            self.conn = psycopg2.connect(host=self.host, user=self.user, password=self.password, dbname=self.database)
+            self.conn = self.connect()
             self.cursor = self.conn.cursor()
             self.logger.info(f"Connected to PostgreSQL database: {self.database}")
         except psycopg2.Error as e:
             self.logger.error(f"Error connecting to PostgreSQL database: {e}")
             raise
 
+    def connect(self, database=None):
+        """
+        Open a new connection to the PostgreSQL server.
+
+        :param database: Database to connect to (the target database if None).
+        :return: A psycopg2 connection.
+        """
+        return psycopg2.connect(host=self.host, user=self.user, password=self.password,
+                                dbname=database or self.database)
+
+    def apply_session_settings(self, conn):
+        """
+        Switch a connection to the bulk-load settings of the fast restore mode.
+
+        :param conn: Connection to configure.
+        :return: Dictionary of the previous value of every setting changed.
+        """
+        saved = {}
+        with conn.cursor() as cursor:
+            for name, value in FAST_SETTINGS:
+                cursor.execute("SELECT current_setting(%s), set_config(%s, %s, false)", (name, name, value))
+                saved[name] = cursor.fetchone()[0]
+        conn.commit()
+        return saved
+
+    def reset_session_settings(self, conn, saved):
+        """
+        Put back the session settings changed by ``apply_session_settings``.
+
+        :param conn: Connection to configure.
+        :param saved: Previous values returned by ``apply_session_settings``.
+        """
+        conn.rollback()
+        with conn.cursor() as cursor:
+            for name, value in saved.items():
+                cursor.execute("SELECT set_config(%s, %s, false)", (name, value))
+        conn.commit()
+
     def create_database_if_not_exists(self):
         """
         Create the PostgreSQL database if it does not already exist.
         """
         try:
-            conn = psycopg2.connect(host=self.host, user=self.user, password=self.password, dbname='postgres')
+            conn = self.connect('postgres')
             conn.autocommit = True
             cursor = conn.cursor()
             cursor.execute(f"SELECT 1 FROM pg_database WHERE datname='{self.database}'")
@@ -89,66 +180,472 @@ class PgSQLRestore:
             self.logger.error(f"Error creating PostgreSQL database: {e}")
             raise
 
-    def restore_sequences(self):
+    def restore_sequences(self, dump=None):
         """
         Restore the sequences of the PostgreSQL database.
+
+        The sequences are read from the structure backup, which holds the
+        sequence and table statements together.
+
+        :param dump: Callable returning the structure dump as a text stream, read instead of a backup (optional).
         """
         self.logger.info("Starting PostgreSQL sequences restore")
-        backup_file = self.get_latest_backup('sequences')
-        with open(backup_file, 'r') as f:
-            sql_script = f.read()
-            sequences_script = self.extract_sequences(sql_script)
-            try:
-                for sequence in sequences_script.split(';'):
-                    if sequence.strip():
-                        self.cursor.execute(sequence)
-            except psycopg2.errors.SyntaxError as e:
-                self.logger.error(f"Error restoring sequences: {e}")
-                raise
+        backup_file = 'the source database' if dump else self.get_latest_backup('structure')
+        if self.checkpoint.state.get('sequences'):
+            self.logger.info("Sequences already restored by the resumed run")
+            return
+        try:
+            for sequence in self.structure_statements(backup_file, self.extract_sequences, dump):
+                self.cursor.execute(sequence)
+        except psycopg2.errors.SyntaxError as e:
+            self.logger.error(f"Error restoring sequences: {e}")
+            raise
+        self.conn.commit()
+        self.checkpoint.update(sequences=True)
         self.logger.info(f"PostgreSQL sequences restored from {backup_file}")
 
-    def restore_tables(self):
+    def restore_tables(self, defer_post_data=False, dump=None):
         """
         Restore the tables of the PostgreSQL database.
+
+        Tables are created in backup order. Sequence ownership and views can
+        refer to any table, so these run once every table exists; one
+        referring to a table left out of a partial restore is logged and
+        skipped. The post-data statements (indexes, constraints and triggers)
+        are then built concurrently by ``build_post_data``, or kept for
+        ``restore_post_data`` to build once the rows are loaded. When a resumed
+        restore already created the tables, only the post-data statements are
+        read back.
+
+        :param defer_post_data: Keep the post-data statements for after the data load.
+        :param dump: Callable returning the structure dump as a text stream, read instead of a backup (optional).
         """
         self.logger.info("Starting PostgreSQL tables restore")
-        backup_file = self.get_latest_backup('structure')
-        with open(backup_file, 'r') as f:
-            sql_script = f.read()
-            tables_script = self.extract_tables(sql_script)
+        backup_file = 'the source database' if dump else self.get_latest_backup('structure')
+        if self.checkpoint.state.get('structure'):
+            self.logger.info("Tables already restored by the resumed run, reading their post-data statements")
+            statements = self.structure_statements(backup_file, self.extract_tables, dump)
+            self.post_data.extend([statement for statement in statements if post_data_phase(statement) is not None])
+            if not defer_post_data:
+                self.build_post_data()
+            return
+        deferred = []
+        try:
+            for table in self.structure_statements(backup_file, self.extract_tables, dump):
+                if post_data_phase(table) is not None:
+                    self.post_data.append(table)
+                elif strip_leading_comments(table).upper().startswith(('ALTER', 'CREATE VIEW')):
+                    deferred.append(table)
+                else:
+                    self.cursor.execute(table)
+        except psycopg2.errors.SyntaxError as e:
+            self.logger.error(f"Error restoring tables: {e}")
+            raise
+        for statement in deferred:
+            self.cursor.execute("SAVEPOINT deferred_statement")
             try:
-                for table in tables_script.split(';'):
-                    if table.strip():
-                        self.cursor.execute(table)
-            except psycopg2.errors.SyntaxError as e:
-                self.logger.error(f"Error restoring tables: {e}")
-                raise
+                self.cursor.execute(statement)
+            except psycopg2.Error as e:
+                self.cursor.execute("ROLLBACK TO SAVEPOINT deferred_statement")
+                self.logger.error(f"Error executing SQL: {statement.strip()} - {e}")
+        self.conn.commit()
+        self.checkpoint.update(structure=True)
         self.logger.info(f"PostgreSQL tables restored from {backup_file}")
+        if not defer_post_data:
+            self.build_post_data()
+
+    def build_post_data(self):
+        """
+        Build the indexes, constraints and triggers of the restored structure.
+
+        The indexes and the constraints backed by one are built first, over
+        ``jobs`` connections when more than one job is set, then the foreign
+        keys, validated against the loaded rows, and the triggers. Statements a
+        resumed run already built are skipped.
+        """
+        statements, self.post_data = self.post_data, []
+        built = set(self.checkpoint.items('post_data'))
+        statements = [statement for statement in statements if statement_key(statement) not in built]
+        if not statements:
+            return
+        workers = [self.connect() for _ in range(self.jobs)] if self.jobs and self.jobs > 1 else []
+        try:
+            if self.fast:
+                for conn in workers:
+                    self.apply_session_settings(conn)
+            failed = build_post_data(workers or [self.conn], statements, self.execute_post_data, self.logger)
+        finally:
+            for conn in workers:
+                conn.close()
+        self.logger.info(f"PostgreSQL post-data objects built ({failed} failed)")
+
+    def execute_post_data(self, conn, statement):
+        """
+        Run a single post-data statement, commit it and record it in the checkpoint.
+
+        :param conn: Connection to run the statement with.
+        :param statement: The statement.
+        :return: The error raised, or None.
+        """
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(statement)
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            return e
+        self.checkpoint.add('post_data', statement_key(statement))
+        return None
+
+    def structure_statements(self, backup_file, extract, dump=None):
+        """
+        Read statements out of a structure backup.
+
+        Only the schema sections of the requested tables are read from an
+        archive backup.
+
+        :param backup_file: Path to the structure backup.
+        :param extract: Function picking statements out of a text file object.
+        :param dump: Callable returning the structure dump as a text stream, read instead of the backup (optional).
+        :return: A generator of the picked statements.
+        """
+        if dump is not None:
+            with dump() as f:
+                yield from extract(f)
+        elif backup_file.endswith(ARCHIVE_SUFFIX):
+            with ArchiveReader(backup_file) as archive:
+                for entry in archive.sections('schema', self.tables):
+                    with archive.open_section(entry, 'r') as f:
+                        yield from extract(f)
+        else:
+            self.check_single_file(backup_file)
+            with open_backup_file(backup_file, 'r') as f:
+                yield from extract(f)
+
+    def check_single_file(self, backup_file):
+        """
+        Refuse to restore a subset of tables from a single-file backup.
+
+        :param backup_file: Path to the backup file.
+        :raises ValueError: If tables were requested, as the file cannot be split by table.
+        """
+        if self.tables:
+            raise ValueError(f"{backup_file} holds all tables in one file; "
+                             "restoring single tables needs an archive or per-table backup")
 
     def restore_data(self):
         """
         Restore the data of the PostgreSQL database.
+
+        COPY sections are streamed to the server with ``COPY ... FROM STDIN`` and
+        runs of INSERT statements for the same table are converted to COPY rows
+        on the fly, so rows are bulk loaded instead of executed one by one. Each
+        table is committed as soon as it has been loaded. A backup directory is
+        restored file by file, and an archive section by section, concurrently
+        when more than one job is set. Only the requested tables are read from
+        either. The post-data steps run once all rows are loaded.
+
+        Every table loaded from a file, section or single file is recorded in
+        the checkpoint once committed. A resumed restore skips those, and
+        empties a table (or the key range of a chunk) whose load was
+        interrupted before loading it again.
         """
         self.logger.info("Starting PostgreSQL data restore")
         backup_file = self.get_latest_backup('data')
-        with open(backup_file, 'r') as f:
-            sql_script = f.read()
-            try:
-                for command in sql_script.split(';'):
-                    if command.strip():
-                        self.cursor.execute(command)
-            except psycopg2.errors.SyntaxError as e:
-                self.logger.error(f"Error restoring data: {e}")
-                raise
+        if backup_file.endswith(ARCHIVE_SUFFIX):
+            self.restore_data_archive(backup_file)
+        elif os.path.isdir(backup_file):
+            entries = self.pending_entries(select_tables(read_manifest(backup_file)['tables'], self.tables))
+            self.expect_rows(entries)
+            if self.jobs and self.jobs > 1:
+                entries = sorted(entries, key=lambda entry: data_size(os.path.join(backup_file, entry['file'])),
+                                 reverse=True)
+                self.restore_data_parallel(entries, lambda conn, entry: self.restore_data_file(
+                    os.path.join(backup_file, entry['file']), conn, entry['file'], entry.get('where')))
+            else:
+                for entry in entries:
+                    self.restore_data_file(os.path.join(backup_file, entry['file']), source=entry['file'],
+                                           where=entry.get('where'))
+        else:
+            self.check_single_file(backup_file)
+            self.restore_data_file(backup_file, source=os.path.basename(backup_file))
+        self.restore_post_data()
         self.logger.info(f"PostgreSQL data restored from {backup_file}")
 
+    def expect_rows(self, entries):
+        """
+        Tell the run metrics how many rows the backup holds, for the ETA.
+
+        :param entries: Manifest or archive entries of the tables to load, which record their row counts.
+        """
+        if entries and all(entry.get('rows') is not None for entry in entries):
+            self.metrics.expect(sum([entry['rows'] for entry in entries]))
+
+    def restore_data_archive(self, backup_file):
+        """
+        Load the data sections of an archive backup.
+
+        Only the sections of the requested tables are read, in archive order on
+        the main connection or concurrently over ``jobs`` connections.
+
+        :param backup_file: Path to the archive.
+        """
+        with ArchiveReader(backup_file) as archive:
+            entries = self.pending_entries(archive.sections('data', self.tables))
+            self.expect_rows(entries)
+            if self.jobs and self.jobs > 1:
+                entries = sorted(entries, key=lambda entry: entry['length'], reverse=True)
+                self.restore_data_parallel(entries, lambda conn, entry: self.restore_section(archive, entry, conn))
+            else:
+                for entry in entries:
+                    self.restore_section(archive, entry)
+
+    def pending_entries(self, entries):
+        """
+        Drop the entries a resumed restore already loaded.
+
+        :param entries: Manifest or archive entries of the tables to load.
+        :return: The entries still to load.
+        """
+        done = set(self.checkpoint.items('done'))
+        pending = [entry for entry in entries
+                   if unit_key(entry.get('file') or entry['table'], entry['table']) not in done]
+        if len(pending) < len(entries):
+            self.logger.info(f"Skipping {len(entries) - len(pending)} table files already loaded")
+        return pending
+
+    def restore_data_parallel(self, entries, restore_entry):
+        """
+        Load tables concurrently, parents before the tables referencing them.
+
+        The entries are expected largest first, so the total time is bound by
+        the largest table rather than the sum of all of them.
+
+        :param entries: Manifest or archive entries of the tables to load, largest first.
+        :param restore_entry: Callable loading one entry, given a connection and the entry.
+        """
+        dependencies = self.get_table_dependencies()
+        workers = [self.connect() for _ in range(self.jobs)]
+        if self.fast:
+            for conn in workers:
+                self.apply_session_settings(conn)
+        self.logger.info(f"Loading {len(entries)} table files over {self.jobs} connections")
+        try:
+            run_dependency_ordered(workers, [(entry['table'], entry) for entry in entries], dependencies,
+                                   restore_entry, self.logger)
+        finally:
+            for conn in workers:
+                conn.close()
+
+    def get_table_dependencies(self):
+        """
+        Read the foreign key dependencies between the tables of the target database.
+
+        :return: Dictionary mapping a table to the set of tables it references.
+        """
+        self.cursor.execute(
+            "SELECT conrelid::regclass::text, confrelid::regclass::text FROM pg_constraint WHERE contype = 'f'"
+        )
+        dependencies = {}
+        for table, referenced_table in self.cursor.fetchall():
+            dependencies.setdefault(table, set()).add(referenced_table)
+        self.conn.commit()
+        return dependencies
+
+    def restore_data_file(self, path, conn=None, source=None, where=None):
+        """
+        Restore a single data file, binary COPY or text, decompressing it if needed.
+
+        :param path: Path to the data file.
+        :param conn: Connection to load the data with (defaults to the main connection).
+        :param source: Name of the file in the checkpoint (not checkpointed if None).
+        :param where: Primary key range of a chunk file (optional).
+        """
+        if strip_codec_suffix(path).endswith('.copy'):
+            with open_backup_file(path, 'rb') as f:
+                self.restore_binary_sections(f, conn, source, where)
+        else:
+            with open_backup_file(path, 'r') as f:
+                self.restore_sql_stream(f, conn, source, where)
+
+    def restore_section(self, archive, entry, conn=None):
+        """
+        Restore a single data section of an archive backup.
+
+        :param archive: ArchiveReader of the backup.
+        :param entry: Index entry of the section.
+        :param conn: Connection to load the data with (defaults to the main connection).
+        """
+        if entry['format'] == 'copy-binary':
+            with archive.open_section(entry, 'rb') as f:
+                self.restore_binary_sections(f, conn, entry['table'])
+        else:
+            with archive.open_section(entry, 'r') as f:
+                self.restore_sql_stream(f, conn, entry['table'])
+
+    def restore_sql_stream(self, f, conn=None, source=None, where=None):
+        """
+        Restore a text data backup containing COPY sections and/or INSERT statements.
+
+        Other statements are committed every ``commit_every`` statements or
+        ``commit_bytes`` of SQL, when set, and at the end of the stream.
+
+        :param f: Text file object of the data backup.
+        :param conn: Connection to load the data with (defaults to the main connection).
+        :param source: Name of the file or section in the checkpoint (not checkpointed if None).
+        :param where: Primary key range of a chunk file (optional).
+        """
+        conn = conn or self.conn
+        statements = SQLStatementReader(f, 'postgresql')
+        statement = next(statements, None)
+        batch = CommitBatch(self.commit_every, self.commit_bytes)
+        with conn.cursor() as cursor:
+            while statement is not None:
+                statement = strip_leading_comments(statement)
+                copy_match = COPY_FROM_PATTERN.match(statement)
+                insert_match = INSERT_PATTERN.match(statement)
+                if copy_match:
+                    # The rows start on the line after the COPY statement.
+                    statements.readline()
+                    table = copy_match.group(1)
+                    self.copy_from(table, statement.rstrip().rstrip(';'), CopySectionReader(statements), conn,
+                                   source and unit_key(source, table), where)
+                    statement = next(statements, None)
+                elif insert_match:
+                    table = insert_match.group(1)
+                    reader = InsertCopyReader(table, insert_match.group(2), statements)
+                    self.copy_from(table, f"COPY {table} FROM STDIN", reader, conn, source and unit_key(source, table),
+                                   where)
+                    statement = reader.next_statement
+                else:
+                    try:
+                        cursor.execute(statement)
+                    except psycopg2.errors.SyntaxError as e:
+                        self.logger.error(f"Error restoring data: {e}")
+                        raise
+                    if batch.add(len(statement)):
+                        conn.commit()
+                    statement = next(statements, None)
+        conn.commit()
+
+    def restore_binary_sections(self, f, conn=None, source=None, where=None):
+        """
+        Restore a binary COPY data backup.
+
+        :param f: Binary file object of the data backup.
+        :param conn: Connection to load the data with (defaults to the main connection).
+        :param source: Name of the file or section in the checkpoint (not checkpointed if None).
+        :param where: Primary key range of a chunk file (optional).
+        """
+        while True:
+            header = f.readline().decode().strip()
+            if not header:
+                break
+            match = COPY_FROM_PATTERN.match(header)
+            if not match:
+                raise ValueError(f"Unexpected section header in binary COPY backup: {header}")
+            table = match.group(1)
+            self.copy_from(table, header.rstrip(';'), FramedReader(f), conn, source and unit_key(source, table), where)
+
+    def copy_from(self, table, copy_sql, reader, conn=None, unit=None, where=None):
+        """
+        Load one table through ``COPY ... FROM STDIN`` and commit it.
+
+        When ``commit_every`` or ``commit_bytes`` is set, text COPY data is
+        loaded by several COPY statements of that many rows or bytes, each
+        committed on its own. Binary COPY data cannot be split without parsing
+        every tuple and is always loaded in one transaction.
+
+        A unit already loaded by a resumed run is read past without loading
+        it. One whose load was interrupted is emptied first, as some of its
+        batches may have been committed.
+
+        :param table: Name of the table being loaded.
+        :param copy_sql: The COPY statement to run.
+        :param reader: File-like object supplying the COPY data.
+        :param conn: Connection to load the data with (defaults to the main connection).
+        :param unit: Name of the load in the checkpoint (not checkpointed if None).
+        :param where: Primary key range of a chunk, the rows emptied instead of the whole table (optional).
+        """
+        conn = conn or self.conn
+        if unit is not None:
+            if unit in self.checkpoint.items('done'):
+                while reader.read(COPY_BUFFER_SIZE):
+                    pass
+                self.logger.info(f"Skipping {unit}, already loaded")
+                return
+            if unit in self.checkpoint.items('started'):
+                with conn.cursor() as cursor:
+                    cursor.execute(f"DELETE FROM {table} WHERE {where}" if where else f"TRUNCATE {table}")
+                conn.commit()
+                self.logger.info(f"Removed the rows of the interrupted load of {unit}")
+            self.checkpoint.add('started', unit)
+        text = not isinstance(reader, FramedReader)
+        batches = None
+        if (self.commit_every or self.commit_bytes) and text:
+            batches = CopyBatchReader(reader, self.commit_every, self.commit_bytes)
+        rows = 0
+        commits = 0
+        with conn.cursor() as cursor:
+            while True:
+                metered = MeteredReader(batches or reader, self.metrics, table, count_lines=text)
+                started = time.perf_counter()
+                try:
+                    cursor.copy_expert(copy_sql, metered, size=COPY_BUFFER_SIZE)
+                    conn.commit()
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    self.logger.error(f"Error restoring data for table {table}: {e}")
+                    raise
+                # Rows streamed by are counted as they are read; binary ones only once the COPY is over.
+                self.metrics.add(table, cursor.rowcount - metered.rows,
+                                 write=time.perf_counter() - started - metered.read_seconds)
+                rows += cursor.rowcount
+                commits += 1
+                if batches is None or not batches.next_batch():
+                    break
+        if unit is not None:
+            self.checkpoint.add('done', unit)
+        self.logger.info(f"Table {table} restored ({rows} rows" + (f", {commits} commits)" if commits > 1 else ")"))
+
+    def restore_post_data(self):
+        """
+        Run the steps that follow the data load.
+
+        Builds the post-data objects kept by ``restore_tables``, moves every
+        column-owned sequence past the highest value loaded into its column, so
+        new rows do not collide with restored ones, and refreshes the planner
+        statistics. The last two are limited to the requested tables when only
+        some tables were restored.
+        """
+        self.build_post_data()
+        self.cursor.execute(
+            "SELECT s.oid::regclass::text, t.oid::regclass::text, a.attname "
+            "FROM pg_class s "
+            "JOIN pg_depend d ON d.objid = s.oid AND d.classid = 'pg_class'::regclass AND d.deptype IN ('a', 'i') "
+            "JOIN pg_class t ON t.oid = d.refobjid "
+            "JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = d.refobjsubid "
+            "WHERE s.relkind = 'S'" + (" AND t.relname = ANY(%s)" if self.tables else ""),
+            (list(self.tables),) if self.tables else None
+        )
+        for sequence, table, column in self.cursor.fetchall():
+            self.cursor.execute(
+                f"SELECT setval('{sequence}', COALESCE(MAX(\"{column}\"), 0) + 1, false) FROM {table}"
+            )
+        if self.tables:
+            self.cursor.execute("ANALYZE " + ", ".join([f'"{table}"' for table in self.tables]))
+        else:
+            self.cursor.execute("ANALYZE")
+        self.conn.commit()
+        self.logger.info("PostgreSQL post-data steps completed")
+
     def restore_full(self):
         """
         Restore the full PostgreSQL database (both structure and data).
         """
         self.logger.info("Starting full PostgreSQL restore")
         self.restore_sequences()
-        self.restore_tables()
+        self.restore_tables(defer_post_data=True)
         self.restore_data()
         self.logger.info("Full PostgreSQL restore completed")
 
@@ -156,51 +653,85 @@ class PgSQLRestore:
         """
         Get the latest backup file of the specified type.
 
-        :param backup_type: Type of backup ('sequences', 'structure', 'data').
+        The backup is looked up in the backup catalog, or taken by id when
+        ``backup_id`` is set. Backups taken before the catalog existed are
+        found by scanning the backup directory for PostgreSQL files, leaving
+        out the ones a failed backup did not finish. The path is recorded in
+        the checkpoint, so a resumed restore reads the same backup.
+
+        :param backup_type: Type of backup ('structure' or 'data').
         :return: Path to the latest backup file.
         :raises FileNotFoundError: If no backup files are found.
         """
-        backup_files = [f for f in os.listdir(self.backup_dir) if backup_type in f]
-        if not backup_files:
-            raise FileNotFoundError(f"No {backup_type} backup files found in {self.backup_dir}")
-        latest_backup = max(backup_files, key=lambda f: os.path.getctime(os.path.join(self.backup_dir, f)))
-        return os.path.join(self.backup_dir, latest_backup)
+        recorded = self.checkpoint.state.get(f'{backup_type}_path')
+        if recorded is not None:
+            return recorded
+        backup = self.catalog.find('pgsql', backup_type, self.backup_id)
+        if backup is not None:
+            path = backup['path']
+        elif self.backup_id is not None:
+            raise FileNotFoundError(f"Backup {self.backup_id} has no {backup_type} section in the catalog")
+        else:
+            prefix = f'pgsql_{backup_type}_'
+            backup_files = [f for f in os.listdir(self.backup_dir)
+                            if f.startswith(prefix) and not is_unfinished(os.path.join(self.backup_dir, f))]
+            if not backup_files:
+                raise FileNotFoundError(f"No {backup_type} backup files found in {self.backup_dir}")
+            latest_backup = max(backup_files, key=lambda f: os.path.getctime(os.path.join(self.backup_dir, f)))
+            path = os.path.join(self.backup_dir, latest_backup)
+        self.checkpoint.update(**{f'{backup_type}_path': path})
+        return path
 
-    def close(self):
+    def close(self, status='ok'):
         """
-        Close the PostgreSQL connection and logger.
+        Close the PostgreSQL connection and logger, putting back the session settings of the fast mode.
+
+        The metrics of the run are reported first: the JSON report goes to the
+        log directory and the Prometheus metrics to ``prometheus_dir`` when set.
+
+        :param status: Outcome of the run ('ok' or 'failed').
         """
+        report = self.metrics.finish(status, self.log_dir, self.prometheus_dir)
+        for line in summary_lines(report):
+            self.logger.info(line)
+        self.logger.info(f"Restore {status}: {report['rows']} rows, {report['bytes']} bytes in {report['seconds']}s "
+                         f"({report['rows_per_second']} rows/s)")
+        if status == 'ok':
+            self.checkpoint.remove()
+        else:
+            self.logger.info(f"Progress kept in {self.checkpoint.path}; run the restore with --resume to continue it")
+        if self.saved_settings:
+            self.reset_session_settings(self.conn, self.saved_settings)
         self.cursor.close()
         self.conn.close()
+        self.catalog.close()
         self.logger.info("PostgreSQL restore connection closed")
 
-    def extract_sequences(self, sql_script):
+    def extract_sequences(self, f):
         """
-        Extract the sequences SQL commands from the script.
+        Extract the sequence statements from a dump file.
 
-        :param sql_script: The full SQL script containing sequences and tables.
-        :return: The SQL script with only the sequences.
+        :param f: Text file object of the dump containing sequences and tables.
+        :return: A generator of CREATE SEQUENCE statements.
         """
-        sequences_script = ""
-        for line in sql_script.splitlines():
-            if 'CREATE SEQUENCE' in line or 'ALTER SEQUENCE' in line:
-                sequences_script += line + "\n"
-        return sequences_script
+        for statement in SQLStatementReader(f, 'postgresql'):
+            if strip_leading_comments(statement).upper().startswith('CREATE SEQUENCE'):
+                yield statement
 
-    def extract_tables(self, sql_script):
+    def extract_tables(self, f):
         """
-        Extract the tables SQL commands from the script.
+        Extract the table statements from a dump file.
 
-        :param sql_script: The full SQL script containing sequences and tables.
-        :return: The SQL script with only the tables.
+        :param f: Text file object of the dump containing sequences and tables.
+        :return: A generator of table, index, view, ALTER and INSERT INTO statements.
         """
-        tables_script = ""
-        for line in sql_script.splitlines():
-            if 'CREATE TABLE' in line or 'INSERT INTO' in line:
-                tables_script += line + "\n"
-        return tables_script
+        for statement in SQLStatementReader(f, 'postgresql'):
+            if strip_leading_comments(statement).upper().startswith(TABLE_STATEMENTS):
+                yield statement
 
-def pgsql_restore(host, user, password, backup_dir, log_dir, restore_type, database):
+def pgsql_restore(host, user, password, backup_dir, log_dir, restore_type, database, jobs=None, backup_id=None,
+                  tables=None, fast=False, commit_every=None, commit_bytes=None, progress=False, prometheus_dir=None,
+                  resume=False):
     """
     Function to perform PostgreSQL restore based on the specified restore type.
 
@@ -211,13 +742,38 @@ def pgsql_restore(host, user, password, backup_dir, log_dir, restore_type, datab
     :param log_dir: Directory where log files are stored.
     :param restore_type: Type of restore ('structure', 'data', 'full').
     :param database: Name of the database to restore.
+    :param jobs: Number of connections loading table data concurrently (optional).
+    :param backup_id: Catalog id of the backup to restore (latest if None).
+    :param tables: Names of the tables to restore (all tables if None).
+    :param fast: Turn off synchronous commit and raise maintenance_work_mem for the restore.
+    :param commit_every: Number of rows or statements loaded per transaction (fast mode default if None).
+    :param commit_bytes: Size of the data loaded per transaction (fast mode default if None).
+    :param progress: Draw a live progress line with the throughput and ETA on standard error.
+    :param prometheus_dir: Directory of the Prometheus textfile collector the run metrics are written to (optional).
+    :param resume: Continue the restore a failed run left a checkpoint for, skipping the work it completed.
+    """
+    restore = PgSQLRestore(host, user, password, backup_dir, log_dir, database, jobs, backup_id, tables, fast,
+                           commit_every, commit_bytes, progress, prometheus_dir, resume)
+    status = 'failed'
+    try:
+        if restore_type == 'structure':
+            restore.restore_sequences()
+            restore.restore_tables()
+        elif restore_type == 'data':
+            restore.restore_data()
+        elif restore_type == 'full':
+            restore.restore_full()
+        status = 'ok'
+    finally:
+        restore.close(status)
+
+
+def unit_key(source, table):
+    """
+    Name the load of a table from a file or archive section in the restore checkpoint.
+
+    :param source: Name of the data file, or table of the archive section, the rows are read from.
+    :param table: Table the rows are loaded into.
+    :return: The key of the load.
     """
-    restore = PgSQLRestore(host, user, password, backup_dir, log_dir, database)
-    if restore_type == 'structure':
-        restore.restore_sequences()
-        restore.restore_tables()
-    elif restore_type == 'data':
-        restore.restore_data()
-    elif restore_type == 'full':
-        restore.restore_full()
-    restore.close()
+    return f"{source}:{table}"
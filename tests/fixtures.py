@@ -0,0 +1,26 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+# Small workload of the tests running backups and restores against synthetic databases.
+WORKLOAD = {'tables': 3, 'rows': 200, 'columns': ['int', 'text', 'timestamp'], 'value_size': 8,
+            'null_fraction': 0.1}
+
+
+class BackupTestCase(unittest.TestCase):
+    """
+    Test case working in a temporary directory, removed after every test.
+
+    Attributes:
+        directory (str): The temporary directory.
+        backup_dir (str): Backup directory inside it.
+        log_dir (str): Log directory inside it.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.backup_dir = os.path.join(self.directory, 'backups')
+        self.log_dir = os.path.join(self.directory, 'logs')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+from common.archive import ArchiveReader, ArchiveWriter
+from common.compression import DecompressedFile
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'mysql_full_202401010000.archive')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_rows(self, f, rows):
+        f.write(''.join(f'{i}\tzażółć\n' for i in range(rows)).encode('utf-8'))
+        return rows
+
+    def write_archive(self, compress=None):
+        with ArchiveWriter(self.path, compress, metadata={'db_type': 'mysql'}) as archive:
+            for table, rows in (('users', 3), ('orders', 50000)):
+                archive.write_section(table, 'schema', 'w', lambda f: f.write(f"CREATE TABLE {table} (id int);\n"))
+                archive.write_section(table, 'data', 'wb', lambda f: self.write_rows(f, rows), format='tsv')
+
+    def test_roundtrip_selected_tables(self):
+        for compress in (None, 'gzip'):
+            self.write_archive(compress)
+            with ArchiveReader(self.path) as archive:
+                self.assertEqual(archive.index['db_type'], 'mysql')
+                schema, = archive.sections('schema', ['orders'])
+                with archive.open_section(schema, 'r') as f:
+                    self.assertEqual(f.read(), "CREATE TABLE orders (id int);\n")
+                data, = archive.sections('data', ['orders'])
+                self.assertEqual(data['rows'], 50000)
+                with archive.open_section(data, 'r') as f:
+                    lines = f.read().splitlines()
+                self.assertEqual((len(lines), lines[-1]), (50000, '49999\tzażółć'))
+                self.assertEqual([entry['table'] for entry in archive.sections('data')], ['users', 'orders'])
+                with self.assertRaises(ValueError):
+                    archive.sections('data', ['missing'])
+
+    def test_corrupt_section_is_detected(self):
+        self.write_archive()
+        with ArchiveReader(self.path) as archive:
+            data, = archive.sections('data', ['users'])
+        with open(self.path, 'r+b') as f:
+            f.seek(data['offset'])
+            f.write(b'9')
+        with ArchiveReader(self.path) as archive:
+            with archive.open_section(data) as f:
+                with self.assertRaises(IOError):
+                    f.read()
+
+    def test_failed_backup_leaves_unreadable_archive(self):
+        with self.assertRaises(RuntimeError):
+            with ArchiveWriter(self.path) as archive:
+                archive.write_section('users', 'schema', 'w', lambda f: f.write("CREATE TABLE users (id int);\n"))
+                raise RuntimeError("connection lost")
+        with self.assertRaises(ValueError):
+            ArchiveReader(self.path)
+
+    def test_section_through_named_pipe(self):
+        self.write_archive('gzip')
+        with ArchiveReader(self.path) as archive:
+            data, = archive.sections('data', ['users'])
+            with DecompressedFile(os.path.join(self.directory, 'users.tsv'), self.directory,
+                                  lambda: archive.open_section(data)) as load_path:
+                with open(load_path, 'rb') as f:
+                    self.assertEqual(f.read().decode('utf-8'), '0\tzażółć\n1\tzażółć\n2\tzażółć\n')
+
+if __name__ == '__main__':
+    unittest.main()
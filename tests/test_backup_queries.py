@@ -0,0 +1,123 @@
+import io
+import unittest
+import mysql.connector
+from benchmarks.fixtures import synthetic_backup
+from benchmarks.synthetic import SyntheticDatabase
+from tests.fixtures import BackupTestCase
+
+class ScriptedCursor:
+    """
+    Cursor logging the statements run on its connection and serving rows in batches.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = [('id',), ('name',)]
+        self.itersize = None
+
+    def execute(self, query):
+        self.connection.log.append((self.connection.name, query))
+        if self.connection.fail_on and query.startswith(self.connection.fail_on):
+            raise mysql.connector.errors.ProgrammingError(msg="Access denied; you need the RELOAD privilege")
+
+    def fetchone(self):
+        return ('00000003-00000002-1',)
+
+    def fetchmany(self, size):
+        self.connection.batches.append(size)
+        rows, self.connection.rows = self.connection.rows[:size], self.connection.rows[size:]
+        return rows
+
+    def fetchall(self):
+        raise AssertionError("fetchall() buffers the whole result")
+
+    def close(self):
+        pass
+
+class ScriptedConnection:
+    """
+    Connection handing out ScriptedCursors, recording how they were opened.
+    """
+    def __init__(self, name, log, rows=(), fail_on=None):
+        self.name = name
+        self.log = log
+        self.rows = list(rows)
+        self.fail_on = fail_on
+        self.batches = []
+        self.cursor_options = []
+
+    def cursor(self, **options):
+        self.cursor_options.append(options)
+        return ScriptedCursor(self)
+
+    def set_session(self, isolation_level, readonly):
+        self.log.append((self.name, f"set_session {isolation_level} readonly={readonly}"))
+
+    def commit(self):
+        self.log.append((self.name, "commit"))
+
+    def close(self):
+        pass
+
+class TestStreamingReads(BackupTestCase):
+    def test_rows_are_fetched_in_batches(self):
+        for dialect, cursor_options in (('mysql', {'buffered': False}), ('pgsql', {'name': 'backup_orders'})):
+            with self.subTest(dialect=dialect):
+                backup = synthetic_backup(SyntheticDatabase(dialect, tables=1, rows=1), self.backup_dir,
+                                          self.log_dir, fetch_size=4)
+                conn = ScriptedConnection('worker', [], rows=[(number, f'row {number}') for number in range(10)])
+                try:
+                    rows = backup.write_table_data('orders', io.StringIO(), conn)
+                finally:
+                    backup.close()
+                self.assertEqual(rows, 10)
+                self.assertEqual(conn.cursor_options, [cursor_options])
+                self.assertEqual(conn.batches, [4, 4, 4, 4])
+                self.assertEqual(conn.log, [('worker', "SELECT * FROM orders")])
+
+class TestSnapshotWorkers(BackupTestCase):
+    def open_workers(self, dialect, fail_on=None):
+        log = []
+        backup = synthetic_backup(SyntheticDatabase(dialect, tables=1, rows=1), self.backup_dir, self.log_dir)
+        main = ScriptedConnection('main', log, fail_on=fail_on)
+        backup.conn, backup.cursor = main, main.cursor()
+        workers = iter([ScriptedConnection(f'worker{number}', log) for number in range(2)])
+        backup.connect = lambda: next(workers)
+        try:
+            with self.assertLogs(backup.logger) as logs:
+                backup.open_snapshot_workers(2)
+        finally:
+            backup.catalog.close()
+        return log, logs.output
+
+    def test_mysql_workers_start_under_the_global_read_lock(self):
+        log, _ = self.open_workers('mysql')
+        self.assertEqual(log, [
+            ('main', "FLUSH TABLES WITH READ LOCK"),
+            ('worker0', "SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ"),
+            ('worker0', "START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY"),
+            ('worker1', "SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ"),
+            ('worker1', "START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY"),
+            ('main', "UNLOCK TABLES"),
+        ])
+
+    def test_mysql_workers_without_the_reload_privilege(self):
+        log, output = self.open_workers('mysql', fail_on='FLUSH TABLES')
+        self.assertEqual([entry for entry in log if entry[0] == 'main'], [('main', "FLUSH TABLES WITH READ LOCK")])
+        self.assertEqual([query for name, query in log if name != 'main'].count(
+            "START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY"), 2)
+        self.assertTrue(any('Could not take a global read lock' in line for line in output))
+
+    def test_pgsql_workers_import_the_exported_snapshot(self):
+        log, _ = self.open_workers('pgsql')
+        self.assertEqual(log, [
+            ('main', "commit"),
+            ('main', "set_session REPEATABLE READ readonly=True"),
+            ('main', "SELECT pg_export_snapshot()"),
+            ('worker0', "set_session REPEATABLE READ readonly=True"),
+            ('worker0', "SET TRANSACTION SNAPSHOT '00000003-00000002-1'"),
+            ('worker1', "set_session REPEATABLE READ readonly=True"),
+            ('worker1', "SET TRANSACTION SNAPSHOT '00000003-00000002-1'"),
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
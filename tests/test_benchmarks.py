@@ -0,0 +1,72 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from benchmarks.suite import baseline_mismatch, compare, environment, format_results, run_operation
+from benchmarks.synthetic import BinaryCopyCounter, SyntheticDatabase, key_range
+
+WORKLOAD = {'tables': 2, 'rows': 300, 'columns': ['int', 'decimal', 'text', 'bytes', 'timestamp', 'json'],
+            'value_size': 16, 'null_fraction': 0.1}
+
+class TestSyntheticDriver(unittest.TestCase):
+    def test_key_range(self):
+        self.assertEqual(key_range(100, None), (1, 101))
+        self.assertEqual(key_range(100, '`id` >= 26 AND `id` < 51'), (26, 51))
+        self.assertEqual(key_range(100, 'id < 0'), (1, 1))
+
+    def test_binary_copy_round_trip(self):
+        database = SyntheticDatabase('pgsql', **WORKLOAD)
+        stream = io.BytesIO()
+        cursor = database.connect().cursor()
+        cursor.copy_expert('COPY (SELECT * FROM t001 WHERE "id" >= 101) TO STDOUT WITH (FORMAT binary)', stream)
+        self.assertEqual(cursor.rowcount, 200)
+        data = stream.getvalue()
+        counter = BinaryCopyCounter()
+        for start in range(0, len(data), 7):
+            counter.feed(data[start:start + 7])
+        self.assertEqual(counter.rows, 200)
+
+    def test_backup_and_restore_round_trip(self):
+        for name in ('mysql-insert', 'mysql-tsv-gzip', 'pgsql-insert', 'pgsql-copy-binary', 'pgsql-copy-jobs4'):
+            directory = tempfile.mkdtemp()
+            try:
+                backup = run_operation(name, 'backup', WORKLOAD, directory, min_seconds=0)
+                restore = run_operation(name, 'restore', WORKLOAD, directory, min_seconds=0)
+            finally:
+                shutil.rmtree(directory)
+            self.assertEqual((backup['rows'], restore['rows']), (600, 600), name)
+            self.assertGreater(backup['bytes'], 0, name)
+
+    def test_repeats_fast_operations(self):
+        directory = tempfile.mkdtemp()
+        try:
+            backup = run_operation('pgsql-copy', 'backup', WORKLOAD, directory, min_seconds=0.2)
+            restore = run_operation('pgsql-copy', 'restore', WORKLOAD, directory, min_seconds=0.2)
+            self.assertEqual(sorted(os.listdir(directory)), ['backups', 'logs'])
+        finally:
+            shutil.rmtree(directory)
+        for result in (backup, restore):
+            self.assertGreater(result['rounds'], 1)
+            self.assertGreaterEqual(result['seconds'], 0.2)
+            self.assertEqual(result['rows'], 600 * result['rounds'])
+
+class TestComparison(unittest.TestCase):
+    def test_compare_flags_regressions(self):
+        baseline = {'results': {'pgsql-copy': {'backup': {'rows_per_second': 1000, 'peak_rss_mib': 40.0}}}}
+        results = {'pgsql-copy': {'backup': {'rows_per_second': 700, 'mib_per_second': 1.0, 'peak_rss_mib': 41.0},
+                                  'restore': {'rows_per_second': 900, 'mib_per_second': 1.0, 'peak_rss_mib': 40.0}}}
+        comparisons = compare(results, baseline, 0.2)
+        self.assertEqual([(c['metric'], c['regression']) for c in comparisons],
+                         [('rows_per_second', True), ('peak_rss_mib', False)])
+        self.assertIn('rows/s -30% REGRESSION', format_results(results, comparisons))
+
+    def test_baseline_of_another_machine_is_not_compared(self):
+        baseline = dict({'workload': WORKLOAD, 'results': {}}, **environment())
+        self.assertIsNone(baseline_mismatch(baseline, WORKLOAD))
+        self.assertIn('workload', baseline_mismatch(baseline, dict(WORKLOAD, rows=1)))
+        self.assertIn('machine', baseline_mismatch(dict(baseline, machine='Linux aarch64, 64 CPUs'), WORKLOAD))
+        self.assertIn('python', baseline_mismatch(dict(baseline, python='2.7.18'), WORKLOAD))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from common.catalog import BackupCatalog, describe_file
+from common.compression import open_backup_file
+
+class TestCatalog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.catalog = BackupCatalog(self.directory)
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.directory)
+
+    def write_file(self, name, text):
+        path = os.path.join(self.directory, name)
+        digest = hashlib.sha256()
+        with open_backup_file(path, 'w', 'gzip', digest=digest) as f:
+            f.write(text)
+        return path, digest
+
+    def test_latest_backup_per_type_and_section(self):
+        full = self.catalog.add_backup('mysql', 'shop', '202401010000')
+        path, digest = self.write_file('mysql_structure_202401010000.sql.gz', 'CREATE TABLE t (id int);\n')
+        self.catalog.add_section(full, 'structure', path, [describe_file(path, digest)])
+        path, digest = self.write_file('mysql_data_202401010000.sql.gz', 'INSERT INTO t VALUES (1);\n')
+        self.catalog.add_section(full, 'data', path, [describe_file(path, digest, rows=1)])
+        data_only = self.catalog.add_backup('mysql', 'shop', '202401020000')
+        self.catalog.add_section(data_only, 'data', os.path.join(self.directory, 'mysql_data_202401020000'), [])
+        other = self.catalog.add_backup('pgsql', 'shop', '202401030000')
+        self.catalog.add_section(other, 'data', os.path.join(self.directory, 'pgsql_data_202401030000.sql'), [])
+
+        self.assertEqual(self.catalog.find('mysql', 'data')['id'], data_only)
+        self.assertEqual(self.catalog.find('mysql', 'structure')['id'], full)
+        self.assertEqual(self.catalog.find('mysql', 'data', full)['path'], path)
+        self.assertIsNone(self.catalog.find('mysql', 'data', other))
+        self.assertIsNone(self.catalog.find('pgsql', 'structure'))
+
+    def test_files_record_size_and_checksum(self):
+        backup_id = self.catalog.add_backup('pgsql', 'shop', '202401010000', 'copy', 'gzip')
+        path, digest = self.write_file('t.sql.gz', 'COPY t FROM stdin;\n1\n\\.\n')
+        self.catalog.add_section(backup_id, 'data', path, [describe_file(path, digest, table='t', rows=1)])
+        entry, = self.catalog.files(backup_id, 'data')
+        with open(path, 'rb') as f:
+            self.assertEqual(entry['sha256'], hashlib.sha256(f.read()).hexdigest())
+        self.assertEqual(entry['size'], os.path.getsize(path))
+        self.assertEqual((entry['table_name'], entry['path'], entry['rows']), ('t', 't.sql.gz', 1))
+
+    def test_unfinished_runs_are_not_restored(self):
+        complete = self.catalog.add_backup('mysql', 'shop', '202401010000', status='running')
+        self.catalog.add_section(complete, 'data', os.path.join(self.directory, 'mysql_data_202401010000'), [])
+        self.catalog.finish_backup(complete, 'complete')
+        failed = self.catalog.add_backup('mysql', 'shop', '202401020000', status='running')
+        self.catalog.add_section(failed, 'data', os.path.join(self.directory, 'mysql_data_202401020000'), [])
+        self.assertEqual(self.catalog.find('mysql', 'data')['id'], complete)
+        self.catalog.finish_backup(failed, 'failed')
+        self.assertEqual(self.catalog.find('mysql', 'data')['id'], complete)
+        self.assertIsNone(self.catalog.find('mysql', 'data', failed))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import logging
+import os
+import unittest
+import mysql.connector
+from backup.mysql_backup import MySQLBackup
+from benchmarks.fixtures import run_and_close, synthetic_backup, synthetic_restore
+from benchmarks.synthetic import SyntheticDatabase
+from common.catalog import BackupCatalog
+from common.checkpoint import (CHECKPOINT_NAME, PART_SUFFIX, Checkpoint, atomic_output, find_unfinished_backup,
+                               is_unfinished, open_run_checkpoint)
+from common.manifest import read_manifest
+from tests.fixtures import WORKLOAD, BackupTestCase
+
+class TestAtomicOutput(BackupTestCase):
+    def test_file_appears_only_when_complete(self):
+        path = os.path.join(self.directory, 't.sql')
+        with atomic_output(path) as temporary:
+            with open(temporary, 'w') as f:
+                f.write('INSERT INTO t VALUES (1);\n')
+            self.assertFalse(os.path.exists(path))
+            self.assertTrue(is_unfinished(temporary))
+        self.assertEqual(os.listdir(self.directory), ['t.sql'])
+
+        with self.assertRaises(RuntimeError):
+            with atomic_output(os.path.join(self.directory, 'u.sql')) as temporary:
+                with open(temporary, 'w') as f:
+                    f.write('INSERT INTO u')
+                raise RuntimeError('connection lost')
+        self.assertEqual(os.listdir(self.directory), ['t.sql'])
+
+class TestCheckpoint(BackupTestCase):
+    def setUp(self):
+        super().setUp()
+        self.logger = logging.getLogger('test_checkpoint')
+
+    def test_round_trip_and_settings(self):
+        path = os.path.join(self.directory, 'restore.json')
+        checkpoint = open_run_checkpoint(path, True, {'database': 'shop'}, self.logger)
+        checkpoint.add('done', 't001.sql')
+        checkpoint.update(structure=True)
+
+        resumed = open_run_checkpoint(path, True, {'database': 'shop'}, self.logger)
+        self.assertEqual(resumed.items('done'), ['t001.sql'])
+        self.assertTrue(resumed.state['structure'])
+        with self.assertRaises(ValueError):
+            open_run_checkpoint(path, True, {'database': 'crm'}, self.logger)
+        self.assertEqual(open_run_checkpoint(path, False, {'database': 'shop'}, self.logger).items('done'), [])
+        resumed.remove()
+        self.assertIsNone(Checkpoint.load(path))
+
+    def test_find_unfinished_backup(self):
+        for name, database in (('mysql_data_202401010000', 'shop'), ('mysql_data_202401020000', 'crm'),
+                               ('mysql_data_202401030000', None)):
+            os.makedirs(os.path.join(self.directory, name))
+            if database:
+                Checkpoint(os.path.join(self.directory, name, CHECKPOINT_NAME), {'database': database}).save()
+        checkpoint = find_unfinished_backup(self.directory, 'mysql_data_', {'database': 'shop'})
+        self.assertEqual(os.path.dirname(checkpoint.path), os.path.join(self.directory, 'mysql_data_202401010000'))
+        self.assertIsNone(find_unfinished_backup(self.directory, 'mysql_data_', {'database': 'erp'}))
+        self.assertFalse(is_unfinished(os.path.join(self.directory, 'mysql_data_202401030000')))
+
+class TestResumedBackup(BackupTestCase):
+    def setUp(self):
+        super().setUp()
+        self.database = SyntheticDatabase('mysql', **WORKLOAD)
+        self.dumped = []
+
+    def run_backup(self, fail_on=None, resume=False):
+        dumped = self.dumped
+
+        class FailingBackup(MySQLBackup):
+            def dump_unit(self, conn, unit, directory):
+                if unit['table'] == fail_on:
+                    raise RuntimeError('connection lost')
+                dumped.append(unit['table'])
+                return super().dump_unit(conn, unit, directory)
+
+        backup = synthetic_backup(self.database, self.backup_dir, self.log_dir, backup_class=FailingBackup,
+                                  data_format='tsv', resume=resume)
+        run_and_close(backup, backup.backup_data)
+
+    def test_resume_skips_completed_files(self):
+        with self.assertRaises(RuntimeError):
+            self.run_backup(fail_on='t001')
+        [directory] = [name for name in os.listdir(self.backup_dir) if name.startswith('mysql_data_')]
+        directory = os.path.join(self.backup_dir, directory)
+        self.assertTrue(is_unfinished(directory))
+        self.assertFalse([name for name in os.listdir(directory) if name.endswith(PART_SUFFIX)])
+        catalog = BackupCatalog(self.backup_dir)
+        self.assertIsNone(catalog.find('mysql', 'data'))
+        catalog.close()
+
+        done = list(self.dumped)
+        self.run_backup(resume=True)
+        self.assertEqual(self.dumped[len(done):], ['t001'])
+        self.assertFalse(is_unfinished(directory))
+        manifest = read_manifest(directory)
+        self.assertTrue(manifest['resumed'])
+        self.assertEqual([entry['table'] for entry in manifest['tables']], ['t000', 't001', 't002'])
+        self.assertEqual(sum([entry['rows'] for entry in manifest['tables']]), 600)
+        catalog = BackupCatalog(self.backup_dir)
+        self.assertEqual(catalog.find('mysql', 'data')['path'], directory)
+        catalog.close()
+
+class FailingLoadDatabase(SyntheticDatabase):
+    def __init__(self, fail_on, **workload):
+        super().__init__('mysql', **workload)
+        self.fail_on = fail_on
+        self.loaded = []
+
+    def load_data(self, statement):
+        if f'`{self.fail_on}`' in statement:
+            raise mysql.connector.Error("Loading local data is disabled")
+        self.loaded.append(statement.split('`')[1])
+        return super().load_data(statement)
+
+class TestResumedRestore(BackupTestCase):
+    def setUp(self):
+        super().setUp()
+        backup = synthetic_backup(SyntheticDatabase('mysql', **WORKLOAD), self.backup_dir, self.log_dir,
+                                  data_format='tsv')
+        run_and_close(backup, backup.backup_data)
+
+    def run_restore(self, database, resume=False):
+        restore = synthetic_restore(database, self.backup_dir, self.log_dir, resume=resume)
+        run_and_close(restore, restore.restore_data)
+
+    def test_failed_load_stays_pending(self):
+        database = FailingLoadDatabase('t001', **WORKLOAD)
+        with self.assertRaises(mysql.connector.Error):
+            self.run_restore(database)
+        self.assertEqual(database.loaded, ['t000'])
+
+        database.fail_on = None
+        self.run_restore(database, resume=True)
+        self.assertEqual(database.loaded, ['t000', 't001', 't002'])
+
+if __name__ == '__main__':
+    unittest.main()
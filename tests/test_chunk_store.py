@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from common.chunk_store import ChunkedWriter, ChunkStore, collect_garbage, read_chunk_list
+from common.compression import DecompressedFile, data_size, open_backup_file
+
+class TestChunkStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = ChunkStore(os.path.join(self.directory, 'chunks'), 'gzip')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data, average_size=4096):
+        path = os.path.join(self.directory, name)
+        writer = ChunkedWriter(open(path, 'wb'), self.store, 'chunks', average_size=average_size)
+        writer.write(data)
+        writer.close()
+        return path
+
+    def test_roundtrip(self):
+        data = b''.join(b'%d\trow number %d\n' % (i, i * i) for i in range(50000))
+        path = self.write('t.tsv.chunks', data)
+        self.assertGreater(len(read_chunk_list(path)['chunks']), 10)
+        self.assertEqual(data_size(path), len(data))
+        with open_backup_file(path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_insertion_only_adds_nearby_chunks(self):
+        rows = [b'%d\tvalue %d\n' % (i, i) for i in range(50000)]
+        first = read_chunk_list(self.write('a.tsv.chunks', b''.join(rows)))
+        rows.insert(25000, b'inserted\trow\n')
+        second = read_chunk_list(self.write('b.tsv.chunks', b''.join(rows)))
+        self.assertLessEqual(second['new_chunks'], 2)
+        self.assertEqual(second['size'], first['size'] + len(b'inserted\trow\n'))
+
+    def test_binary_data_without_newlines(self):
+        data = os.urandom(100000)
+        path = self.write('t.copy.chunks', data, average_size=1024)
+        self.assertTrue(all(size <= 4096 for _, size in read_chunk_list(path)['chunks']))
+        with open_backup_file(path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_text_backup_through_store(self):
+        path = os.path.join(self.directory, 'mysql_data_1.sql.chunks')
+        with open_backup_file(path, 'w', chunk_store=self.store) as f:
+            f.write("INSERT INTO t VALUES ('zażółć');\n")
+        with open_backup_file(path, 'r') as f:
+            self.assertEqual(f.read(), "INSERT INTO t VALUES ('zażółć');\n")
+        with DecompressedFile(path, self.directory) as plain_path:
+            with open(plain_path, 'rb') as f:
+                self.assertEqual(f.read().decode('utf-8'), "INSERT INTO t VALUES ('zażółć');\n")
+
+    def test_garbage_collection_skips_unfinished_chunk_lists(self):
+        path = self.write('a.tsv.chunks', b''.join(b'%d\tvalue\n' % i for i in range(5000)), average_size=1024)
+        kept = [digest for digest, _ in read_chunk_list(path)['chunks']]
+        self.store.put('f' * 64, b'orphan')
+        orphan_size = os.path.getsize(self.store.path_for('f' * 64))
+        for digest in kept + ['f' * 64]:
+            os.utime(self.store.path_for(digest), (0, 0))
+        with open(os.path.join(self.directory, 'b.tsv.chunks.part'), 'w'):
+            pass
+        with open(os.path.join(self.directory, 'c.tsv.chunks.part'), 'w') as f:
+            f.write('{"store": "chunks", "chu')
+        self.assertEqual(collect_garbage(self.directory), (1, orphan_size))
+        self.assertTrue(all(os.path.exists(self.store.path_for(digest)) for digest in kept))
+        self.assertFalse(os.path.exists(self.store.path_for('f' * 64)))
+
+    def test_garbage_collection_keeps_reused_chunks(self):
+        self.store.put('e' * 64, b'reused')
+        os.utime(self.store.path_for('e' * 64), (0, 0))
+        self.assertFalse(self.store.put('e' * 64, b'reused'))
+        self.assertEqual(collect_garbage(self.directory), (0, 0))
+        self.assertTrue(os.path.exists(self.store.path_for('e' * 64)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,17 @@
+import unittest
+from common.chunking import key_range_predicates
+
+class TestChunking(unittest.TestCase):
+    def test_ranges_cover_all_keys(self):
+        predicates = key_range_predicates('id', 1, 100, 4)
+        self.assertEqual(predicates, ['id < 26', 'id >= 26 AND id < 51', 'id >= 51 AND id < 76', 'id >= 76'])
+        for key in range(-5, 110):
+            matches = [p for p in predicates if eval(p.replace('AND', 'and'), {'id': key})]
+            self.assertEqual(len(matches), 1)
+
+    def test_small_or_empty_range_is_not_split(self):
+        self.assertEqual(key_range_predicates('id', 1, 2, 4), [None])
+        self.assertEqual(key_range_predicates('id', None, None, 4), [None])
+
+if __name__ == '__main__':
+    unittest.main()
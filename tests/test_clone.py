@@ -0,0 +1,102 @@
+import threading
+import unittest
+from backup.clone import DatabaseClone
+from backup.pgsql_backup import PgSQLBackup
+from benchmarks.fixtures import synthetic_backup, synthetic_restore
+from benchmarks.synthetic import SyntheticDatabase
+from common.pipe import BytePipe, open_pipe
+from tests.fixtures import WORKLOAD, BackupTestCase
+
+class TestBytePipe(unittest.TestCase):
+    def test_round_trip_with_back_pressure(self):
+        pipe = BytePipe(capacity=1024)
+        lines = [f'{number}\tvalue {number}\n' for number in range(5000)]
+        peak = []
+
+        def produce():
+            with open_pipe(pipe, 'w') as f:
+                for line in lines:
+                    f.write(line)
+                    peak.append(pipe.size)
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        with open_pipe(pipe, 'r') as f:
+            self.assertEqual(f.readlines(), lines)
+        producer.join()
+        # A write waits for room, but the buffered writer may pass on one chunk larger than the capacity.
+        self.assertLessEqual(max(peak), 1024 + 256 * 1024)
+
+    def test_writer_error_reaches_reader(self):
+        pipe = BytePipe()
+        pipe.write(b'partial row')
+        pipe.close(RuntimeError('connection lost'))
+        with self.assertRaises(RuntimeError):
+            open_pipe(pipe, 'rb').read()
+
+    def test_reader_hang_up_stops_writer(self):
+        pipe = BytePipe(capacity=4)
+        pipe.write(b'full')
+        errors = []
+
+        def produce():
+            try:
+                pipe.write(b'more')
+            except BrokenPipeError as e:
+                errors.append(e)
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        pipe.hang_up()
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(len(errors), 1)
+
+class TestDatabaseClone(BackupTestCase):
+    def run_clone(self, db_type, data_format, jobs=None):
+        backup = synthetic_backup(SyntheticDatabase(db_type, **WORKLOAD), self.directory, self.log_dir, 'source',
+                                  data_format=data_format, jobs=jobs)
+        restore = synthetic_restore(SyntheticDatabase(db_type, **WORKLOAD), self.directory, self.log_dir, 'copy',
+                                    jobs=jobs)
+        try:
+            DatabaseClone(backup, restore, db_type, self.log_dir, jobs, buffer_size=4096).clone()
+        finally:
+            restore.close()
+            backup.close()
+        return backup.metrics, restore.metrics
+
+    def test_mysql_tsv(self):
+        dumped, loaded = self.run_clone('mysql', 'tsv')
+        self.assertEqual(dumped.totals()[0], 600)
+        self.assertEqual(loaded.totals()[0], 600)
+        self.assertEqual(sorted(loaded.tables), ['t000', 't001', 't002'])
+
+    def test_pgsql_copy_in_parallel(self):
+        for data_format in ('copy', 'copy-binary'):
+            with self.subTest(data_format=data_format):
+                dumped, loaded = self.run_clone('pgsql', data_format, jobs=2)
+                self.assertEqual(dumped.totals()[0], 600)
+                self.assertEqual(loaded.totals()[0], 600)
+
+    def test_source_error_fails_the_unit(self):
+        class FailingBackup(PgSQLBackup):
+            def write_unit(self, conn, unit, f):
+                if unit['table'] == 't001':
+                    f.write('COPY t001 (id) FROM stdin;\n1\n')
+                    f.flush()
+                    raise RuntimeError('connection lost')
+                return super().write_unit(conn, unit, f)
+
+        backup = synthetic_backup(SyntheticDatabase('pgsql', **WORKLOAD), self.directory, self.log_dir, 'source',
+                                  backup_class=FailingBackup, data_format='copy')
+        restore = synthetic_restore(SyntheticDatabase('pgsql', **WORKLOAD), self.directory, self.log_dir, 'copy')
+        try:
+            with self.assertRaises(RuntimeError):
+                DatabaseClone(backup, restore, 'pgsql', self.log_dir).clone_data()
+        finally:
+            restore.close('failed')
+            backup.close('failed')
+        self.assertNotIn('t001', restore.metrics.tables)
+
+if __name__ == '__main__':
+    unittest.main()
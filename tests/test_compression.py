@@ -0,0 +1,53 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from common.compression import (DecompressedFile, codec_for_path, compressed_name, open_backup_file,
+                                strip_codec_suffix)
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_names(self):
+        self.assertEqual(compressed_name('t.tsv', 'zstd'), 't.tsv.zst')
+        self.assertEqual(compressed_name('t.tsv'), 't.tsv')
+        self.assertEqual(codec_for_path('t.sql.gz'), 'gzip')
+        self.assertIsNone(codec_for_path('t.sql'))
+        self.assertEqual(strip_codec_suffix('t.copy.lz4'), 't.copy')
+
+    def test_gzip_roundtrip_in_blocks(self):
+        path = os.path.join(self.directory, 'data.sql.gz')
+        text = ''.join(f"INSERT INTO t VALUES ({i}, 'zażółć');\n" for i in range(20000))
+        with open_backup_file(path, 'w', 'gzip', 1) as f:
+            f.buffer.raw.block_size = 4096
+            f.write(text)
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            self.assertEqual(f.read(), text)
+        with open_backup_file(path, 'r') as f:
+            self.assertEqual(f.read(), text)
+
+    def test_decompressed_file_through_pipe(self):
+        path = os.path.join(self.directory, 't.tsv.gz')
+        with open_backup_file(path, 'wb', 'gzip') as f:
+            f.write(b'1\ta\n2\tb\n')
+        with DecompressedFile(path, self.directory) as plain_path:
+            self.assertTrue(plain_path.endswith('t.tsv'))
+            with open(plain_path, 'rb') as f:
+                self.assertEqual(f.read(), b'1\ta\n2\tb\n')
+        self.assertEqual(os.listdir(self.directory), ['t.tsv.gz'])
+
+    def test_decompressed_file_unused_pipe(self):
+        path = os.path.join(self.directory, 't.tsv.gz')
+        with open_backup_file(path, 'wb', 'gzip') as f:
+            f.write(b'1\ta\n')
+        with DecompressedFile(path, self.directory):
+            pass
+        self.assertEqual(os.listdir(self.directory), ['t.tsv.gz'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import io
+import os
+import unittest
+from benchmarks.fixtures import run_and_close, synthetic_backup
+from benchmarks.synthetic import SyntheticDatabase
+from common.batching import CommitBatch
+from common.copy_stream import (CopyBatchReader, CopySectionReader, FramedReader, FramedWriter, InsertCopyReader,
+                                parse_insert_values)
+from tests.fixtures import BackupTestCase
+
+class ViewDatabase(SyntheticDatabase):
+    """
+    Synthetic PostgreSQL database that also has a view over its first table.
+    """
+    def catalog(self, query):
+        rows = super().catalog(query)
+        if 'pg_get_partkeydef' in query:
+            rows.append(('active', 'active', 'v', 0.0, None, None, None, ' SELECT id FROM t000;'))
+        return rows
+
+class TestCopyStream(unittest.TestCase):
+    def test_framed_roundtrip(self):
+        f = io.BytesIO()
+        writer = FramedWriter(f, frame_size=4)
+        writer.write(b'0123456789')
+        writer.close()
+        f.write(b'next section')
+        f.seek(0)
+        reader = FramedReader(f)
+        data = b''
+        while True:
+            chunk = reader.read(3)
+            if not chunk:
+                break
+            data += chunk
+        self.assertEqual(data, b'0123456789')
+        self.assertEqual(f.read(), b'next section')
+
+    def test_parse_insert_values(self):
+        rows = parse_insert_values("('it''s; fine', 42, NULL, None, '2024-01-01'::date), (1, 'x')")
+        self.assertEqual(rows, [["it's; fine", '42', None, None, '2024-01-01'], ['1', 'x']])
+
+    def test_copy_section_reader_stops_at_terminator(self):
+        f = io.StringIO("1\ta\n2\tb\n\\.\nSELECT 1;\n")
+        self.assertEqual(CopySectionReader(f).read(), "1\ta\n2\tb\n")
+        self.assertEqual(f.readline(), "SELECT 1;\n")
+
+    def test_insert_copy_reader(self):
+        statements = iter(["INSERT INTO t VALUES ('tab\there', NULL);", "INSERT INTO u VALUES (1);"])
+        reader = InsertCopyReader('t', "(1, 'a')", statements)
+        self.assertEqual(reader.read(), "1\ta\ntab\\there\t\\N\n")
+        self.assertEqual(reader.read(), "")
+        self.assertEqual(reader.next_statement, "INSERT INTO u VALUES (1);")
+
+    def test_copy_batch_reader_splits_on_rows(self):
+        f = io.StringIO(''.join(f"{i}\tx\n" for i in range(10)) + "\\.\n")
+        reader = CopyBatchReader(CopySectionReader(f), max_rows=4)
+        batches = []
+        while True:
+            batch = ''
+            while True:
+                chunk = reader.read(5)
+                if not chunk:
+                    break
+                batch += chunk
+            batches.append(batch)
+            if not reader.next_batch():
+                break
+        self.assertEqual([len(batch.splitlines()) for batch in batches if batch], [4, 4, 2])
+        self.assertEqual(''.join(batches), ''.join(f"{i}\tx\n" for i in range(10)))
+
+    def test_commit_batch(self):
+        batch = CommitBatch(max_statements=3, max_bytes=100)
+        self.assertEqual([batch.add(10) for _ in range(4)], [False, False, True, False])
+        self.assertTrue(batch.add(95))
+
+class TestCopyBackup(BackupTestCase):
+    def test_views_are_not_copied(self):
+        for data_format in ('copy', 'copy-binary'):
+            with self.subTest(data_format=data_format):
+                database = ViewDatabase('pgsql', tables=2, rows=10)
+                database.statements = []
+                backup = synthetic_backup(database, os.path.join(self.backup_dir, data_format), self.log_dir,
+                                          data_format=data_format)
+                run_and_close(backup, backup.backup_data)
+                copied = [query.split()[1] for _, query in database.statements if query.startswith('COPY')]
+                self.assertEqual(copied, ['t000', 't001'])
+
+if __name__ == '__main__':
+    unittest.main()
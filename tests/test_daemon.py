@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import unittest
+from datetime import datetime
+from backup.daemon import BackupDaemon, load_schedule
+from common.catalog import BackupCatalog
+from common.chunk_store import STORE_NAME, ChunkStore
+from common.cron import CronSchedule
+from common.manifest import write_manifest
+from common.pool import ConnectionPool
+from common.retention import prune_backups, select_expired
+from tests.fixtures import BackupTestCase
+
+class TestCronSchedule(unittest.TestCase):
+    def test_next_run(self):
+        now = datetime(2024, 5, 17, 10, 7, 30)  # a Friday
+        for expression, expected in (('*/15 * * * *', datetime(2024, 5, 17, 10, 15)),
+                                     ('0 2 * * *', datetime(2024, 5, 18, 2, 0)),
+                                     ('0 9-17/4 * * mon-fri', datetime(2024, 5, 17, 13, 0)),
+                                     ('30 4 1 * sun', datetime(2024, 5, 19, 4, 30)),
+                                     ('@monthly', datetime(2024, 6, 1, 0, 0)),
+                                     ('0 0 29 feb *', datetime(2028, 2, 29, 0, 0))):
+            with self.subTest(expression=expression):
+                schedule = CronSchedule(expression)
+                self.assertEqual(schedule.next_after(now), expected)
+                self.assertTrue(schedule.matches(expected))
+
+    def test_invalid_expressions(self):
+        for expression in ('* * * *', '60 * * * *', '0 0 30 feb *', '*/0 * * * *', '0 0 * * funday'):
+            with self.subTest(expression=expression), self.assertRaises(ValueError):
+                CronSchedule(expression)
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.broken = False
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.opened = []
+
+    def connect(self):
+        conn = FakeConnection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+    def check(self, conn):
+        if conn.broken:
+            raise ConnectionError("server has gone away")
+
+    def test_reuse_and_health_check(self):
+        pool = ConnectionPool(self.connect, check=self.check, size=1, check_after=0)
+        first = pool.acquire()
+        first.close()
+        first.close()
+        self.assertEqual(pool.acquire().number, 0)
+        self.assertEqual(len(self.opened), 1)
+
+        self.opened[0].broken = True
+        pool.release(self.opened[0])
+        conn = pool.acquire()
+        self.assertEqual(conn.number, 1)
+        self.assertTrue(self.opened[0].closed)
+
+        # Only `size` idle connections are kept.
+        other = pool.acquire()
+        conn.close()
+        other.close()
+        self.assertTrue(self.opened[2].closed)
+        pool.close()
+        self.assertTrue(self.opened[1].closed)
+
+    def test_failed_reset_discards_the_connection(self):
+        def reset(conn):
+            raise RuntimeError("unread result")
+
+        pool = ConnectionPool(self.connect, reset=reset, check=self.check)
+        pool.acquire().close()
+        self.assertTrue(self.opened[0].closed)
+        self.assertEqual(pool.acquire().number, 1)
+
+class TestRetention(BackupTestCase):
+    def add_backup(self, catalog, name, files, status='complete'):
+        directory = os.path.join(self.directory, name)
+        os.makedirs(directory)
+        entries = []
+        for table, digest in files:
+            if digest:
+                with open(os.path.join(directory, f'{table}.sql.chunks'), 'w') as f:
+                    json.dump({'store': os.path.join('..', STORE_NAME), 'compress': None, 'size': 1,
+                               'chunks': [[digest, 1]]}, f)
+                entries.append({'table': table, 'file': f'{table}.sql.chunks'})
+            else:
+                entries.append({'table': table, 'file': os.path.join('..', table)})
+        write_manifest(directory, {'tables': entries})
+        backup_id = catalog.add_backup('mysql', 'shop', name, status='running')
+        catalog.add_section(backup_id, 'data', directory, [])
+        catalog.finish_backup(backup_id, status)
+        return directory
+
+    def test_select_expired(self):
+        now = datetime(2024, 5, 17)
+        backups = [{'id': number, 'status': status, 'created_at': f'2024-05-{17 - number:02d}T00:00:00'}
+                   for number, status in enumerate(['running', 'failed', 'complete', 'complete', 'failed',
+                                                    'complete', None])]
+        self.assertEqual(select_expired(backups), [])
+        self.assertEqual([backup['id'] for backup in select_expired(backups, keep_last=2, now=now)], [4, 5, 6])
+        self.assertEqual([backup['id'] for backup in select_expired(backups, keep_days=4, now=now)], [5, 6])
+
+    def test_prune_keeps_referenced_backups_and_collects_chunks(self):
+        store = ChunkStore(os.path.join(self.directory, STORE_NAME))
+        digests = [f'{number}' * 64 for number in range(3)]
+        for digest in digests:
+            store.put(digest, b'x')
+            os.utime(store.path_for(digest), (0, 0))
+        catalog = BackupCatalog(self.directory)
+        oldest = self.add_backup(catalog, 'data_1', [('orders', digests[0])])
+        base = self.add_backup(catalog, 'data_2', [('users', digests[1])])
+        failed = self.add_backup(catalog, 'data_3', [('orders', None)], status='failed')
+        latest = self.add_backup(catalog, 'data_4', [('orders', digests[2]), ('data_2/users.sql.chunks', None)])
+        catalog.close()
+
+        self.assertEqual(prune_backups(self.directory, 'mysql', 'shop', keep_last=1), [3, 1])
+        self.assertEqual([os.path.exists(path) for path in (oldest, base, failed, latest)],
+                         [False, True, False, True])
+        self.assertEqual([os.path.exists(store.path_for(digest)) for digest in digests], [False, True, True])
+        catalog = BackupCatalog(self.directory)
+        self.assertEqual([backup['id'] for backup in catalog.backups('mysql', 'shop')], [4, 2])
+        catalog.close()
+
+class TestBackupDaemon(BackupTestCase):
+    def setUp(self):
+        super().setUp()
+        self.config = os.path.join(self.directory, 'schedule.json')
+
+    def write_config(self, config):
+        with open(self.config, 'w') as f:
+            json.dump(config, f)
+
+    def test_load_schedule(self):
+        self.write_config({'workers': 2, 'defaults': {'user': 'backup', 'keep_last': 7}, 'databases': [
+            {'name': 'shop', 'dbtype': 'mysql', 'host': 'db1', 'database': 'shop', 'schedule': '@daily'},
+        ]})
+        settings, [shop] = load_schedule(self.config, '/backups')
+        self.assertEqual(settings, {'workers': 2, 'per_host': 1, 'pool_size': 2})
+        self.assertEqual((shop['schedule'].expression, shop['keep_last'], shop['backup_dir']),
+                         ('@daily', 7, '/backups/shop'))
+        for config in ({'databases': [{'name': 'a', 'dbtype': 'mysql', 'host': 'h', 'user': 'u', 'database': 'd'}]},
+                       {'databases': [{'name': 'a', 'dbtype': 'mysql', 'host': 'h', 'user': 'u', 'database': 'd',
+                                       'schedule': '0 25 * * *'}]},
+                       {'databases': [{'name': 'a', 'dbtype': 'mysql', 'host': 'h', 'user': 'u', 'database': 'd',
+                                       'schedule': '@daily', 'archive': True, 'dedup': True}]},
+                       {'workers': 0, 'databases': []}):
+            self.write_config(config)
+            with self.assertRaises(ValueError):
+                load_schedule(self.config, '/backups')
+
+    def test_runs_due_entries_within_limits(self):
+        entries = [{'name': f'db{i}', 'dbtype': 'mysql', 'host': f'host{i % 2}', 'user': 'backup',
+                    'database': f'db{i}', 'backup_dir': os.path.join(self.directory, f'db{i}'),
+                    'schedule': CronSchedule('0 * * * *'), 'keep_last': None, 'keep_days': None}
+                   for i in range(6)]
+        running = {'all': 0, 'host0': 0, 'host1': 0}
+        peaks = dict(running)
+        pools = []
+        lock = threading.Lock()
+
+        def backup(entry, log_dir, pool):
+            with lock:
+                pools.append(pool)
+                for key in ('all', entry['host']):
+                    running[key] += 1
+                    peaks[key] = max(peaks[key], running[key])
+            time.sleep(0.02)
+            with lock:
+                for key in ('all', entry['host']):
+                    running[key] -= 1
+            if entry['name'] == 'db3':
+                raise ConnectionError("host unreachable")
+
+        daemon = BackupDaemon(entries, self.directory, workers=3, per_host=2, backup=backup)
+        try:
+            daemon.schedule(datetime(2024, 5, 17, 10, 7))
+            self.assertEqual(daemon.due_entries(datetime(2024, 5, 17, 10, 59)), [])
+            daemon.running.add('db1')
+            due = daemon.due_entries(datetime(2024, 5, 17, 11, 0))
+            self.assertEqual([entry['name'] for entry in due], ['db0', 'db2', 'db3', 'db4', 'db5'])
+            self.assertEqual(daemon.next_runs['db1'], datetime(2024, 5, 17, 12, 0))
+            daemon.running.clear()
+
+            results = asyncio.run(daemon.run_now())
+            self.assertEqual([result['status'] for result in results], ['ok'] * 3 + ['failed'] + ['ok'] * 2)
+            self.assertLessEqual(peaks['all'], 3)
+            self.assertLessEqual(max(peaks['host0'], peaks['host1']), 2)
+            self.assertEqual(len({id(pool) for pool in pools}), 6)
+            with open(os.path.join(self.directory, 'backup_daemon_status.json')) as f:
+                status = json.load(f)
+            self.assertEqual(status['entries'][3]['last_result']['error'], "ConnectionError: host unreachable")
+        finally:
+            daemon.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from backup.fleet import FleetBackup, format_report, load_inventory
+
+class TestFleet(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.inventory = os.path.join(self.directory, 'inventory.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_inventory(self, inventory):
+        with open(self.inventory, 'w') as f:
+            json.dump(inventory, f)
+
+    def test_inventory_defaults_and_validation(self):
+        os.environ['FLEET_TEST_PASSWORD'] = 'secret'
+        self.write_inventory({
+            'defaults': {'compress': 'gzip', 'user': 'backup'},
+            'databases': [
+                {'name': 'shop', 'dbtype': 'mysql', 'host': 'db1', 'database': 'shop',
+                 'password_env': 'FLEET_TEST_PASSWORD'},
+                {'name': 'crm', 'dbtype': 'pgsql', 'host': 'db2', 'database': 'crm', 'format': 'copy',
+                 'backup_dir': '/srv/crm'},
+            ],
+        })
+        shop, crm = load_inventory(self.inventory, '/backups')
+        self.assertEqual((shop['password'], shop['compress'], shop['backup_dir'], shop['backup_type']),
+                         ('secret', 'gzip', '/backups/shop', 'full'))
+        self.assertEqual((crm['password'], crm['format'], crm['backup_dir']), (None, 'copy', '/srv/crm'))
+        for bad in ({'name': 'a', 'dbtype': 'mysql', 'host': 'h', 'user': 'u'},
+                    {'name': 'a', 'dbtype': 'mysql', 'host': 'h', 'user': 'u', 'database': 'd', 'format': 'copy'},
+                    {'name': 'a', 'dbtype': 'mysql', 'host': 'h', 'user': 'u', 'database': 'd', 'jbos': 2},
+                    {'name': 'a', 'dbtype': 'mysql', 'host': 'h', 'user': 'u', 'database': 'd', 'archive': True,
+                     'jobs': 4},
+                    {'name': 'a', 'dbtype': 'pgsql', 'host': 'h', 'user': 'u', 'database': 'd', 'archive': True,
+                     'checksums': True}):
+            self.write_inventory({'databases': [bad]})
+            with self.assertRaises(ValueError):
+                load_inventory(self.inventory, '/backups')
+
+    def test_limits_and_report(self):
+        entries = [{'name': f'db{i}', 'dbtype': 'mysql', 'host': f'host{i % 2}', 'database': f'db{i}'}
+                   for i in range(8)]
+        running = {'all': 0, 'host0': 0, 'host1': 0}
+        peaks = dict(running)
+        lock = threading.Lock()
+
+        def backup(entry, log_dir):
+            with lock:
+                for key in ('all', entry['host']):
+                    running[key] += 1
+                    peaks[key] = max(peaks[key], running[key])
+            time.sleep(0.02)
+            with lock:
+                for key in ('all', entry['host']):
+                    running[key] -= 1
+            if entry['name'] == 'db5':
+                raise ConnectionError("host unreachable")
+
+        results = FleetBackup(entries, self.directory, concurrency=3, per_host=2, backup=backup).run()
+        self.assertEqual([result['name'] for result in results], [entry['name'] for entry in entries])
+        self.assertEqual([result['name'] for result in results if result['status'] == 'failed'], ['db5'])
+        self.assertEqual(results[5]['error'], "ConnectionError: host unreachable")
+        self.assertLessEqual(peaks['all'], 3)
+        self.assertLessEqual(max(peaks['host0'], peaks['host1']), 2)
+        self.assertEqual(format_report(results).splitlines()[-1], "7 succeeded, 1 failed")
+
+if __name__ == '__main__':
+    unittest.main()
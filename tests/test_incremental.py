@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+from backup.verify import find_data_manifest
+from benchmarks.fixtures import run_and_close, synthetic_backup
+from benchmarks.synthetic import SyntheticDatabase
+from common.catalog import BackupCatalog
+from common.incremental import load_base_manifest, reuse_unchanged
+from common.manifest import write_manifest
+from tests.fixtures import BackupTestCase
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.catalog = BackupCatalog(self.directory)
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.directory)
+
+    def make_backup(self, name, entries, fingerprints, data_format='tsv'):
+        directory = os.path.join(self.directory, name)
+        os.makedirs(directory)
+        for entry in entries:
+            path = os.path.join(directory, entry['file'])
+            if not os.path.exists(path):
+                with open(path, 'w') as f:
+                    f.write('1\n')
+        write_manifest(directory, {'format': data_format, 'compress': None, 'fingerprints': fingerprints,
+                                   'tables': entries})
+        backup_id = self.catalog.add_backup('mysql', 'shop', name, data_format)
+        self.catalog.add_section(backup_id, 'data', directory, [])
+        return directory
+
+    def test_reuses_only_unchanged_tables(self):
+        base_dir = self.make_backup('mysql_data_1', [
+            {'table': 'a', 'file': 'a.tsv'},
+            {'table': 'b', 'file': 'b.0000.tsv', 'chunk': 0},
+            {'table': 'b', 'file': 'b.0001.tsv', 'chunk': 1},
+            {'table': 'c', 'file': 'c.tsv'},
+        ], {'a': '1', 'b': '2', 'c': '3'})
+        base_dir, manifest = load_base_manifest(self.catalog, 'mysql', 'shop', 'tsv', None)
+        directory = os.path.join(self.directory, 'mysql_data_2')
+        reused = reuse_unchanged(base_dir, manifest, directory, {'a': '1', 'b': '2', 'c': '4'})
+        self.assertEqual(sorted(reused), ['a', 'b'])
+        self.assertEqual([entry['file'] for entry in reused['b']],
+                         [os.path.join('..', 'mysql_data_1', 'b.0000.tsv'), os.path.join('..', 'mysql_data_1', 'b.0001.tsv')])
+
+    def test_chained_references_point_at_original_file(self):
+        self.make_backup('mysql_data_1', [{'table': 'a', 'file': 'a.tsv'}], {'a': '1'})
+        second = self.make_backup('mysql_data_2', [{'table': 'a', 'file': os.path.join('..', 'mysql_data_1', 'a.tsv')}],
+                                  {'a': '1'})
+        base_dir, manifest = load_base_manifest(self.catalog, 'mysql', 'shop', 'tsv', None)
+        self.assertEqual(base_dir, second)
+        directory = os.path.join(self.directory, 'mysql_data_3')
+        reused = reuse_unchanged(base_dir, manifest, directory, {'a': '1'})
+        self.assertEqual(reused['a'][0]['file'], os.path.join('..', 'mysql_data_1', 'a.tsv'))
+
+    def test_missing_files_and_other_formats_are_not_reused(self):
+        base_dir = self.make_backup('mysql_data_1', [{'table': 'a', 'file': 'a.tsv'}], {'a': '1'})
+        os.remove(os.path.join(base_dir, 'a.tsv'))
+        base_dir, manifest = load_base_manifest(self.catalog, 'mysql', 'shop', 'tsv', None)
+        self.assertEqual(reuse_unchanged(base_dir, manifest, self.directory, {'a': '1'}), {})
+        self.assertEqual(load_base_manifest(self.catalog, 'mysql', 'shop', 'insert', None), (None, None))
+        self.assertEqual(load_base_manifest(self.catalog, 'mysql', 'other', 'tsv', None), (None, None))
+
+class TestSnapshotFingerprints(BackupTestCase):
+    SNAPSHOT_STATEMENTS = {'mysql': 'START TRANSACTION WITH CONSISTENT SNAPSHOT', 'pgsql': 'SET TRANSACTION SNAPSHOT'}
+    FINGERPRINT_STATEMENTS = {'mysql': 'CHECKSUM TABLE', 'pgsql': 'SELECT count(*)'}
+
+    def run_backup(self, db_type, database, jobs):
+        backup = synthetic_backup(database, self.backup_dir, self.log_dir, jobs=jobs, incremental=True)
+        run_and_close(backup, backup.backup_data)
+        return find_data_manifest(self.backup_dir, db_type)[1]
+
+    def test_fingerprints_read_the_dump_snapshot(self):
+        for db_type in ('mysql', 'pgsql'):
+            for jobs in (1, 2):
+                with self.subTest(db_type=db_type, jobs=jobs):
+                    database = SyntheticDatabase(db_type, tables=3, rows=50)
+                    database.statements = []
+                    first = self.run_backup(db_type, database, jobs)
+                    in_snapshot = set()
+                    fingerprinted = []
+                    for conn, query in database.statements:
+                        if query.startswith(self.SNAPSHOT_STATEMENTS[db_type]):
+                            in_snapshot.add(conn)
+                        elif query.startswith(self.FINGERPRINT_STATEMENTS[db_type]):
+                            fingerprinted.append(conn)
+                    self.assertEqual(len(fingerprinted), 3)
+                    self.assertTrue(all(conn in in_snapshot for conn in fingerprinted))
+                    database.statements = []
+                    second = self.run_backup(db_type, database, jobs)
+                    self.assertEqual(second['fingerprints'], first['fingerprints'])
+                    self.assertFalse([query for _, query in database.statements if query.startswith('SELECT * FROM')])
+                    changed = self.run_backup(db_type, SyntheticDatabase(db_type, tables=3, rows=60), jobs)
+                    self.assertEqual([entry['rows'] for entry in changed['tables']], [60] * 3)
+                    shutil.rmtree(self.backup_dir)
+
+if __name__ == '__main__':
+    unittest.main()
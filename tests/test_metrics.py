@@ -0,0 +1,118 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from common.metrics import (MeteredReader, MeteredTextWriter, ProgressLine, RunMetrics, format_duration,
+                            prometheus_labels, summary_lines, write_atomically)
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_counters_and_report(self):
+        metrics = RunMetrics('backup', 'mysql', 'shop')
+        metrics.add('orders', 100, 4000, fetch=0.5, encode=0.25, write=0.25)
+        metrics.add('orders', 50, 2000, fetch=0.25)
+        metrics.add('users', 10, 300, write=0.1)
+        self.assertEqual(metrics.totals(), (160, 6300))
+        report = metrics.report()
+        self.assertEqual((report['operation'], report['db_type'], report['database']), ('backup', 'mysql', 'shop'))
+        orders = report['tables'][0]
+        self.assertEqual((orders['table'], orders['rows'], orders['bytes']), ('orders', 150, 6000))
+        self.assertEqual((orders['fetch_seconds'], orders['encode_seconds'], orders['write_seconds']),
+                         (0.75, 0.25, 0.25))
+        self.assertGreaterEqual(orders['seconds'], 1.0)
+        self.assertEqual([line.split(':')[0] for line in summary_lines(report)], ['Table users', 'Table orders'])
+
+    def test_progress_line_shows_eta(self):
+        stream = io.StringIO()
+        metrics = RunMetrics('restore', 'pgsql', 'crm', ProgressLine(stream, interval=0))
+        metrics.expect(1000)
+        metrics.add('events', 250, 1024)
+        self.assertIn('restore crm: 250 rows of ~1,000 (25%)', stream.getvalue())
+        self.assertIn('ETA', stream.getvalue())
+        self.assertIn('[events]', stream.getvalue())
+        metrics.finish('ok')
+        self.assertTrue(stream.getvalue().endswith('\n'))
+        self.assertEqual(format_duration(3725), '1:02:05')
+
+    def test_prometheus_text(self):
+        self.assertEqual(prometheus_labels({'table': 'a"b\\c'}), '{table="a\\"b\\\\c"}')
+        metrics = RunMetrics('backup', 'pgsql', 'crm')
+        metrics.add('events', 10, 100, fetch=0.1)
+        metrics.status = 'ok'
+        text = metrics.prometheus_text()
+        self.assertIn('# TYPE backupapp_run_success gauge\n'
+                      'backupapp_run_success{operation="backup",dbtype="pgsql",database="crm"} 1\n', text)
+        self.assertIn('backupapp_table_rows{operation="backup",dbtype="pgsql",database="crm",table="events"} 10\n',
+                      text)
+        self.assertIn('backupapp_table_phase_seconds{operation="backup",dbtype="pgsql",database="crm",'
+                      'table="events",phase="fetch"} 0.1\n', text)
+        self.assertEqual(text.count('# HELP backupapp_table_phase_seconds'), 1)
+
+    def test_finish_writes_reports(self):
+        metrics = RunMetrics('backup', 'mysql', 'shop')
+        metrics.add('orders', 5, 50)
+        prometheus_dir = os.path.join(self.directory, 'textfile')
+        metrics.finish('failed', self.directory, prometheus_dir)
+        with open(os.path.join(self.directory, 'mysql_backup_metrics_shop.json')) as f:
+            report = json.load(f)
+        self.assertEqual((report['status'], report['rows']), ('failed', 5))
+        with open(os.path.join(prometheus_dir, 'mysql_backup_metrics_shop.prom')) as f:
+            self.assertIn('backupapp_run_success{operation="backup",dbtype="mysql",database="shop"} 0\n', f.read())
+        self.assertEqual(os.listdir(prometheus_dir), ['mysql_backup_metrics_shop.prom'])
+
+    def test_same_database_on_two_hosts(self):
+        for host in ('shard-1', 'shard-2'):
+            metrics = RunMetrics('backup', 'mysql', 'app', host=host)
+            metrics.add('orders', 5, 50)
+            metrics.finish('ok', self.directory, self.directory)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['mysql_backup_metrics_shard-1_app.json', 'mysql_backup_metrics_shard-1_app.prom',
+                          'mysql_backup_metrics_shard-2_app.json', 'mysql_backup_metrics_shard-2_app.prom'])
+        with open(os.path.join(self.directory, 'mysql_backup_metrics_shard-2_app.prom')) as f:
+            self.assertIn('backupapp_run_success{operation="backup",dbtype="mysql",host="shard-2",database="app"} 1\n',
+                          f.read())
+
+    def test_concurrent_atomic_writes(self):
+        path = os.path.join(self.directory, 'report.prom')
+        errors = []
+
+        def write(text):
+            try:
+                for _ in range(200):
+                    write_atomically(path, text)
+            except OSError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(f"run {number}\n",)) for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(self.directory), ['report.prom'])
+        with open(path) as f:
+            self.assertRegex(f.read(), r'^run \d\n$')
+
+    def test_metered_files(self):
+        metrics = RunMetrics('backup', 'pgsql', 'crm')
+        target = io.StringIO()
+        writer = MeteredTextWriter(target, metrics, 'events')
+        self.assertIsInstance(writer, io.TextIOBase)
+        writer.write('1\ta\n2\tb\n')
+        self.assertEqual((writer.rows, target.getvalue()), (2, '1\ta\n2\tb\n'))
+        reader = MeteredReader(io.StringIO('1\ta\n2\tb\n3\tc\n'), metrics, 'loaded')
+        self.assertEqual(reader.read(8), '1\ta\n2\tb\n')
+        reader.read()
+        self.assertEqual(reader.rows, 3)
+        self.assertEqual([table['rows'] for table in metrics.report()['tables']], [2, 3])
+
+if __name__ == '__main__':
+    unittest.main()
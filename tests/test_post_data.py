@@ -0,0 +1,45 @@
+import logging
+import threading
+import unittest
+from common.post_data import INDEX_PHASE, REFERENCE_PHASE, build_post_data, post_data_phase
+
+class TestPostData(unittest.TestCase):
+    def test_post_data_phase(self):
+        self.assertEqual(post_data_phase('CREATE UNIQUE INDEX u ON public.t USING btree (a);'), INDEX_PHASE)
+        self.assertEqual(post_data_phase('-- Post-data\nALTER TABLE "my t" ADD CONSTRAINT "t pkey" PRIMARY KEY (a);'),
+                         INDEX_PHASE)
+        self.assertEqual(post_data_phase('ALTER TABLE `t` ADD UNIQUE KEY `u` (`a`), ADD KEY `k` (`b`);'), INDEX_PHASE)
+        self.assertEqual(post_data_phase('ALTER TABLE t ADD CONSTRAINT t_fkey FOREIGN KEY (a) REFERENCES u(id);'),
+                         REFERENCE_PHASE)
+        self.assertEqual(post_data_phase('CREATE TRIGGER audit AFTER UPDATE ON t FOR EACH ROW EXECUTE FUNCTION f();'),
+                         REFERENCE_PHASE)
+        for statement in ('CREATE TABLE t (a int);', 'ALTER SEQUENCE s OWNED BY t.a;', 'CREATE VIEW v AS SELECT 1;',
+                          'ALTER TABLE t ADD COLUMN k int;'):
+            self.assertIsNone(post_data_phase(statement))
+
+    def test_build_post_data_runs_phases_in_order_and_retries(self):
+        statements = ['ALTER TABLE a ADD CONSTRAINT a_fkey FOREIGN KEY (b) REFERENCES b(id);',
+                      'CREATE INDEX a_x ON a (x);', 'CREATE INDEX b_y ON b (y);', 'CREATE INDEX bad ON missing (z);',
+                      'ALTER TABLE b ADD CONSTRAINT b_fkey FOREIGN KEY (a) REFERENCES a(id);']
+        executed = []
+        attempts = {}
+        lock = threading.Lock()
+
+        def execute(conn, statement):
+            with lock:
+                attempts[statement] = attempts.get(statement, 0) + 1
+                if 'missing' in statement:
+                    return RuntimeError('relation "missing" does not exist')
+                if statement.startswith('ALTER TABLE b') and attempts[statement] == 1:
+                    return RuntimeError('deadlock detected')
+                executed.append(statement)
+            return None
+
+        failed = build_post_data(['conn1', 'conn2'], statements, execute, logging.getLogger('test_post_data'))
+        self.assertEqual(failed, 1)
+        self.assertEqual(sorted(executed[:2]), [statements[1], statements[2]])
+        self.assertEqual(sorted(executed[2:]), [statements[0], statements[4]])
+        self.assertEqual((attempts[statements[3]], attempts[statements[4]]), (2, 2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import io
+import re
+import unittest
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from backup.mysql_backup import tsv_field
+from common.copy_stream import INSERT_PATTERN, parse_insert_values
+from common.row_encoder import build_insert_encoder, encode_value
+from common.sql_splitter import SQLStatementReader
+
+class TestRowEncoder(unittest.TestCase):
+    def test_mysql_literals(self):
+        encode_rows = build_insert_encoder('t', ['int', 'text', 'text', 'temporal', 'decimal', 'other'], 'mysql')
+        rows = [(1, "O'Hara \\ x", bytearray(b'\x00\xff'), datetime(2024, 1, 2, 3, 4, 5), Decimal('9.50'),
+                 timedelta(hours=-1)),
+                (None, None, None, None, None, {'a', 'b'})]
+        self.assertEqual(encode_rows(rows),
+                         "INSERT INTO t VALUES (1, 'O\\'Hara \\\\ x', X'00ff', '2024-01-02 03:04:05', 9.50, '-1:00:00');\n"
+                         "INSERT INTO t VALUES (NULL, NULL, NULL, NULL, NULL, 'a,b');\n")
+
+    def test_statements_split_back(self):
+        encode_rows = build_insert_encoder('t', ['text', 'text'], 'mysql')
+        statements = list(SQLStatementReader(io.StringIO(encode_rows([("a\\';b", "x;y"), ("c\\", "'")])), 'mysql'))
+        self.assertEqual(len(statements), 2)
+
+    def test_postgresql_literals_convert_to_copy(self):
+        encode_rows = build_insert_encoder('t', ['int', 'text', 'bool', 'bytes', 'other', 'json', 'float', 'temporal'],
+                                           'postgresql')
+        rows = [(1, "it's", True, memoryview(b'\x00\x01'), [1, None, 'a"b'], {'k': "v'"}, float('nan'),
+                 date(2024, 1, 2))]
+        values = INSERT_PATTERN.match(encode_rows(rows)).group(2)
+        self.assertEqual(parse_insert_values(values),
+                         [['1', "it's", 'TRUE', '\\x0001', '{"1",NULL,"a\\"b"}', '{"k": "v\'"}', 'NaN', '2024-01-02']])
+
+    def test_unexpected_types_use_generic_encoding(self):
+        encode_rows = build_insert_encoder('t', ['int', 'text', 'float'], 'postgresql')
+        self.assertEqual(encode_rows([(True, 5, float('inf'))]), "INSERT INTO t VALUES (TRUE, 5, 'Infinity');\n")
+        self.assertEqual(encode_value(Decimal('NaN'), 'mysql'), "'NaN'")
+
+# Escape sequences of the default LOAD DATA field format.
+TSV_ESCAPES = {b'N': None, b't': b'\t', b'n': b'\n', b'r': b'\r', b'0': b'\0', b'\\': b'\\'}
+
+def load_tsv_field(field):
+    if field == b'\\N':
+        return None
+    return re.sub(rb'\\(.)', lambda match: TSV_ESCAPES.get(match.group(1), match.group(1)), field)
+
+class TestTsvField(unittest.TestCase):
+    def test_escapes(self):
+        self.assertEqual(tsv_field(None), b'\\N')
+        self.assertEqual(tsv_field('NULL'), b'NULL')
+        self.assertEqual(tsv_field('\\N'), b'\\\\N')
+        self.assertEqual(tsv_field('a\tb\nc\rd\0e\\f'), b'a\\tb\\nc\\rd\\0e\\\\f')
+        self.assertEqual(tsv_field(bytearray(b'\x00\t\xff')), b'\\0\\t\xff')
+        self.assertEqual(tsv_field('zażółć'), 'zażółć'.encode('utf-8'))
+        self.assertEqual(tsv_field(Decimal('9.50')), b'9.50')
+        self.assertEqual(tsv_field(timedelta(hours=-1)), b'-1:00:00')
+        self.assertEqual(tsv_field(timedelta(hours=25)), b'25:00:00')
+
+    def test_round_trip(self):
+        rows = [('tab\there', 'line\nbreak\r\n', None), ('NULL', '\\N', 'back\\slash\\'), (b'\x00\\\n\t', '', '\0'),
+                (timedelta(hours=-1), timedelta(hours=25), None)]
+        times = {timedelta(hours=-1): b'-1:00:00', timedelta(hours=25): b'25:00:00'}
+        data = b''.join([b'\t'.join([tsv_field(value) for value in row]) + b'\n' for row in rows])
+        loaded = [tuple([load_tsv_field(field) for field in line.split(b'\t')]) for line in data.split(b'\n')[:-1]]
+        self.assertEqual(loaded, [tuple([value.encode('utf-8') if isinstance(value, str) else times.get(value, value)
+                                         for value in row]) for row in rows])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import threading
+import unittest
+from common.scheduler import run_dependency_ordered
+
+class TestScheduler(unittest.TestCase):
+    def test_parents_are_loaded_before_children(self):
+        loaded = []
+        lock = threading.Lock()
+
+        def load(conn, item):
+            with lock:
+                loaded.append(item)
+            return item
+
+        units = [('orders', 'orders'), ('order_items', 'order_items'), ('customers', 'customers'), ('tags', 'tags')]
+        dependencies = {'orders': {'customers'}, 'order_items': {'orders', 'order_items'}}
+        results = run_dependency_ordered(['c1', 'c2'], units, dependencies, load)
+        self.assertEqual(sorted(results), ['customers', 'order_items', 'orders', 'tags'])
+        self.assertLess(loaded.index('customers'), loaded.index('orders'))
+        self.assertLess(loaded.index('orders'), loaded.index('order_items'))
+
+    def test_cycle_is_broken(self):
+        units = [('a', 'a'), ('b', 'b')]
+        results = run_dependency_ordered(['c1'], units, {'a': {'b'}, 'b': {'a'}}, lambda conn, item: item)
+        self.assertEqual(sorted(results), ['a', 'b'])
+
+if __name__ == '__main__':
+    unittest.main()
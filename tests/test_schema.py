@@ -0,0 +1,129 @@
+import unittest
+import mysql.connector
+from backup.mysql_schema import MySQLSchema
+from backup.pgsql_schema import PgSQLSchema
+
+class ScriptedCursor:
+    """
+    Cursor returning canned result sets, one per executed query, in order.
+    """
+    def __init__(self, results):
+        self.results = list(results)
+        self.queries = []
+        self.rows = None
+
+    def execute(self, query):
+        self.queries.append(query)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        self.rows = result
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0]
+
+class TestPgSQLSchema(unittest.TestCase):
+    def setUp(self):
+        self.cursor = ScriptedCursor([
+            [('events', 'events', 'p', -1, 'RANGE (at)', None, None, None),
+             ('users', 'users', 'r', 2500000.0, None, None, None, None),
+             ('events_2024', 'events_2024', 'r', 10.0, None, "FOR VALUES FROM ('2024-01-01') TO ('2025-01-01')",
+              'events', None),
+             ('active', 'active', 'v', 0.0, None, None, None, ' SELECT id FROM users;')],
+            [('events', 'at', 'at', 'date', 1082, True, None, '', '', None),
+             ('events', 'user_id', 'user_id', 'integer', 23, False, None, '', '', None),
+             ('users', 'id', 'id', 'integer', 23, True, "nextval('users_id_seq'::regclass)", '', '', None),
+             ('users', 'Name', '"Name"', 'text', 25, False, None, '', '', '"C"')],
+            [('events', 'events_user_id_fkey', 'f', 'FOREIGN KEY (user_id) REFERENCES users(id)', ['user_id']),
+             ('users', 'users_pkey', 'p', 'PRIMARY KEY (id)', ['id'])],
+            [('users', 'CREATE INDEX users_name ON public.users USING btree ("Name")')],
+            [('users', 'CREATE TRIGGER audit AFTER UPDATE ON public.users FOR EACH ROW EXECUTE FUNCTION audit()')],
+            [('users_id_seq', 'integer', 1, 1, 1, 2147483647, 1, False, 'users', 'users', 'id')],
+        ])
+        self.schema = PgSQLSchema(self.cursor)
+
+    def test_loads_in_bulk(self):
+        self.assertEqual(len(self.cursor.queries), 6)
+        self.assertEqual(self.schema.data_tables(), ['users', 'events_2024'])
+        self.assertEqual(self.schema.primary_keys, {'users': ['id']})
+        self.assertEqual(self.schema.estimated_rows['events'], 0)
+
+    def test_table_ddl(self):
+        self.assertEqual(self.schema.table_ddl('users'),
+                         "CREATE SEQUENCE IF NOT EXISTS users_id_seq AS integer INCREMENT BY 1 MINVALUE 1 "
+                         "MAXVALUE 2147483647 START WITH 1 CACHE 1;\n"
+                         "CREATE TABLE users (\n"
+                         "    id integer DEFAULT nextval('users_id_seq'::regclass) NOT NULL,\n"
+                         "    \"Name\" text COLLATE \"C\"\n"
+                         ");\n"
+                         "ALTER SEQUENCE users_id_seq OWNED BY users.id;\n")
+        self.assertEqual(self.schema.post_data_ddl('users'),
+                         "ALTER TABLE users ADD CONSTRAINT users_pkey PRIMARY KEY (id);\n"
+                         "CREATE INDEX users_name ON public.users USING btree (\"Name\");\n"
+                         "CREATE TRIGGER audit AFTER UPDATE ON public.users FOR EACH ROW "
+                         "EXECUTE FUNCTION audit();\n")
+        self.assertEqual(self.schema.table_ddl('events'),
+                         "CREATE TABLE events (\n    at date NOT NULL,\n    user_id integer\n) PARTITION BY RANGE (at);\n")
+        self.assertEqual(self.schema.post_data_ddl('events'),
+                         "ALTER TABLE events ADD CONSTRAINT events_user_id_fkey FOREIGN KEY (user_id) "
+                         "REFERENCES users(id);\n")
+        self.assertEqual(self.schema.table_ddl('events_2024'),
+                         "CREATE TABLE events_2024 PARTITION OF events "
+                         "FOR VALUES FROM ('2024-01-01') TO ('2025-01-01');\n")
+        self.assertEqual(self.schema.table_ddl('active'), "CREATE VIEW active AS\nSELECT id FROM users;\n")
+        self.assertEqual(self.schema.post_data_ddl('active'), "")
+
+class TestMySQLSchema(unittest.TestCase):
+    TABLES = [('orders', 'BASE TABLE', 'InnoDB', 120, 121, 'utf8mb4_0900_ai_ci', "it's", ''),
+              ('recent', 'VIEW', None, None, None, None, 'VIEW', None)]
+    COLUMNS = [
+        ('orders', 'id', 'bigint unsigned', 'bigint', 'NO', None, 'auto_increment', None, '', 'PRI', ''),
+        ('orders', 'note', 'varchar(20)', 'varchar', 'YES', 'n/a', '', 'utf8mb4_bin', '', '', ''),
+        ('orders', 'created', 'timestamp', 'timestamp', 'NO', 'CURRENT_TIMESTAMP',
+         'DEFAULT_GENERATED on update CURRENT_TIMESTAMP', None, '', '', ''),
+        ('orders', 'total', 'decimal(10,2)', 'decimal', 'YES', None, 'STORED GENERATED', None, '', '', '(1 + 1)'),
+    ]
+
+    def test_table_ddl(self):
+        cursor = ScriptedCursor([
+            self.TABLES, self.COLUMNS,
+            [('orders', 'PRIMARY', 0, 'id', None, 'BTREE', 'A', None),
+             ('orders', 'created', 0, 'created', None, 'BTREE', 'A', None),
+             ('orders', 'ft_note', 1, 'note', None, 'FULLTEXT', None, None),
+             ('orders', 'note', 1, 'note', 10, 'BTREE', 'D', None)],
+            [('orders', 'fk_user', 'id', 'shop', 'users', 'id', 'CASCADE', 'RESTRICT')],
+            [('orders', 'positive', '(`id` > 0)')],
+        ])
+        schema = MySQLSchema(cursor)
+        self.assertEqual((schema.tables, schema.views, schema.primary_keys), (['orders'], ['recent'], {'orders': ['id']}))
+        self.assertEqual(schema.table_ddl('orders'),
+                         "CREATE TABLE `orders` (\n"
+                         "  `id` bigint unsigned NOT NULL AUTO_INCREMENT,\n"
+                         "  `note` varchar(20) COLLATE utf8mb4_bin DEFAULT 'n/a',\n"
+                         "  `created` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,\n"
+                         "  `total` decimal(10,2) GENERATED ALWAYS AS ((1 + 1)) STORED,\n"
+                         "  PRIMARY KEY (`id`),\n"
+                         "  CONSTRAINT `positive` CHECK ((`id` > 0))\n"
+                         ") ENGINE=InnoDB AUTO_INCREMENT=121 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci "
+                         "COMMENT='it''s';\n")
+        self.assertEqual(schema.post_data_ddl('orders'),
+                         "ALTER TABLE `orders` ADD UNIQUE KEY `created` (`created`), "
+                         "ADD KEY `note` (`note`(10) DESC);\n"
+                         "ALTER TABLE `orders` ADD FULLTEXT KEY `ft_note` (`note`);\n"
+                         "ALTER TABLE `orders` ADD CONSTRAINT `fk_user` FOREIGN KEY (`id`) REFERENCES `shop`.`users` "
+                         "(`id`) ON DELETE RESTRICT ON UPDATE CASCADE;\n")
+        self.assertEqual(schema.post_data_ddl('recent'), "")
+
+    def test_old_server_falls_back_to_show_create_table(self):
+        cursor = ScriptedCursor([self.TABLES, self.COLUMNS, mysql.connector.Error("Unknown column 'EXPRESSION'"),
+                                 [('orders', 'CREATE TABLE `orders` (...)')]])
+        schema = MySQLSchema(cursor)
+        self.assertFalse(schema.bulk)
+        self.assertEqual(schema.table_ddl('orders'), "CREATE TABLE `orders` (...);\n")
+        self.assertEqual(cursor.queries[-1], "SHOW CREATE TABLE `orders`")
+
+if __name__ == '__main__':
+    unittest.main()
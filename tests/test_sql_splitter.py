@@ -0,0 +1,39 @@
+import io
+import unittest
+from common.sql_splitter import SQLStatementReader, strip_leading_comments
+
+def split(script, dialect, chunk_size=4):
+    return [s.strip() for s in SQLStatementReader(io.StringIO(script), dialect, chunk_size=chunk_size)]
+
+class TestSQLSplitter(unittest.TestCase):
+    def test_mysql_quotes_escapes_and_comments(self):
+        script = ("INSERT INTO t VALUES ('a;b', 'it\\'s;', \"x;y\");\n"
+                  "-- not; a statement\n"
+                  "SELECT `odd;name` FROM t; # trailing; comment\n"
+                  "/* only a comment; */\n")
+        self.assertEqual(split(script, 'mysql'), [
+            "INSERT INTO t VALUES ('a;b', 'it\\'s;', \"x;y\");",
+            "-- not; a statement\nSELECT `odd;name` FROM t;",
+        ])
+
+    def test_postgresql_dollar_quotes_and_nested_comments(self):
+        script = ("CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ LANGUAGE sql;\n"
+                  "SELECT 'c''d;', E'e\\';f' /* a /* b; */ c; */;\n")
+        self.assertEqual(split(script, 'postgresql'), [
+            "CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ LANGUAGE sql;",
+            "SELECT 'c''d;', E'e\\';f' /* a /* b; */ c; */;",
+        ])
+
+    def test_readline_after_copy_statement(self):
+        reader = SQLStatementReader(io.StringIO("COPY t FROM stdin;\n1\ta;b\n\\.\nSELECT 1;"), 'postgresql', 3)
+        self.assertEqual(next(reader), "COPY t FROM stdin;")
+        self.assertEqual(reader.readline(), "\n")
+        self.assertEqual(reader.readline(), "1\ta;b\n")
+        self.assertEqual(reader.readline(), "\\.\n")
+        self.assertEqual(list(reader), ["SELECT 1;"])
+
+    def test_strip_leading_comments(self):
+        self.assertEqual(strip_leading_comments("-- x\n/* y */\n  CREATE TABLE t"), "CREATE TABLE t")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import io
+import threading
+import time
+import unittest
+import psycopg2
+from benchmarks.fixtures import run_and_close, synthetic_backup
+from benchmarks.synthetic import SyntheticConnection, SyntheticDatabase
+from common.throttle import PACE_BYTES, RateLimiter, ThrottledWriter, Throttle
+from tests.fixtures import BackupTestCase
+
+class ClosingConnection(SyntheticConnection):
+    """
+    Synthetic connection recording when it is closed.
+    """
+    def close(self):
+        self.server.closed.append(self)
+
+class BrokenReplicaDatabase(SyntheticDatabase):
+    """
+    Synthetic PostgreSQL database whose replication lag query fails.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.closed = []
+
+    def connect(self, *args, **kwargs):
+        return ClosingConnection(self)
+
+    def catalog(self, query):
+        if 'pg_stat_replication' in query:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        return super().catalog(query)
+
+class TestRateLimiter(unittest.TestCase):
+    def test_burst_then_rate(self):
+        limiter = RateLimiter(100, burst=1.0)
+        limiter.due = 10.0
+        # A second's worth goes through at once after an idle period.
+        self.assertEqual(limiter.reserve(100, 20.0), 0.0)
+        self.assertAlmostEqual(limiter.reserve(50, 20.0), 0.5)
+        self.assertAlmostEqual(limiter.reserve(50, 20.25), 0.75)
+
+class TestThrottle(unittest.TestCase):
+    def test_adaptive_rate_decreases_and_recovers(self):
+        throttle = Throttle(probe=lambda: 0.0, max_lag=10)
+        throttle.probed_at = time.monotonic() - 1.0
+        throttle.rows = 1000
+        # About 1,000 rows/s were fetched over the last second.
+        rate = throttle.adjust(1.5)
+        self.assertLess(rate, 510)
+        self.assertGreater(rate, 400)
+        self.assertAlmostEqual(throttle.adjust(0.8), rate)
+        throttle.probed_at = time.monotonic() - 1.0
+        throttle.rows += 400
+        self.assertAlmostEqual(throttle.adjust(0.1), rate * 1.25)
+        # Far above the achieved rate, the limit is lifted.
+        throttle.probed_at = time.monotonic() - 1.0
+        throttle.rows += 10
+        self.assertIsNone(throttle.adjust(0.1))
+        self.assertIsNone(throttle.limiters['adaptive'])
+
+    def test_no_decrease_before_rows_were_fetched(self):
+        throttle = Throttle(probe=lambda: 0.0, max_lag=10)
+        self.assertIsNone(throttle.adjust(1.5))
+
+    def test_pauses_while_lag_is_high(self):
+        lags = [30.0, 30.0, 15.0, 1.0]
+        throttle = Throttle(probe=lambda: lags.pop(0) if lags else 0.0, max_lag=10, interval=0.05)
+        done = threading.Event()
+        worker = threading.Thread(target=lambda: (throttle.pace(10), done.set()))
+        worker.start()
+        worker.join(5)
+        self.assertTrue(done.is_set())
+        self.assertEqual(lags, [])
+        self.assertGreaterEqual(throttle.paused, 0.15)
+        self.assertTrue(throttle.running.is_set())
+
+    def test_throttled_writer_paces_by_volume(self):
+        paced = []
+        throttle = Throttle()
+        throttle.pace = lambda rows, size=0: paced.append((rows, size))
+        f = io.BytesIO()
+        writer = ThrottledWriter(f, throttle)
+        row = b'x' * 1024
+        for _ in range(PACE_BYTES // 1024 * 2 + 3):
+            writer.write(row)
+        self.assertEqual(paced, [(64, PACE_BYTES), (64, PACE_BYTES)])
+        self.assertEqual(len(f.getvalue()), (PACE_BYTES // 1024 * 2 + 3) * 1024)
+
+class TestThrottledBackup(BackupTestCase):
+    def test_backup_respects_rows_cap(self):
+        backup = synthetic_backup(SyntheticDatabase('pgsql', tables=2, rows=300), self.backup_dir, self.log_dir,
+                                  max_rows_per_second=400)
+        started = time.monotonic()
+        run_and_close(backup, backup.backup_data)
+        seconds = time.monotonic() - started
+        self.assertEqual(backup.metrics.report()['rows'], 600)
+        # 400 rows go through at once, the other 200 take half a second.
+        self.assertGreaterEqual(seconds, 0.4)
+        self.assertGreater(backup.throttle.waited, 0.4)
+
+    def test_failed_lag_probe_closes_its_connection(self):
+        database = BrokenReplicaDatabase('pgsql', tables=1, rows=10)
+        backup = synthetic_backup(database, self.backup_dir, self.log_dir, max_lag=10)
+        try:
+            self.assertIsNone(backup.probe_lag())
+            self.assertIsNone(backup.probe_lag())
+            self.assertIsNone(backup.probe_conn)
+            self.assertEqual(len(database.closed), 2)
+            self.assertNotIn(backup.conn, database.closed)
+        finally:
+            backup.close()
+
+if __name__ == '__main__':
+    unittest.main()
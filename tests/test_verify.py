@@ -0,0 +1,88 @@
+import os
+import random
+import struct
+import unittest
+from backup.pgsql_backup import PgSQLBackup
+from backup.verify import BackupVerifier, find_data_manifest, format_differences, verify_database
+from benchmarks.fixtures import run_and_close, synthetic_backup
+from benchmarks.synthetic import SyntheticDatabase, synthetic_class
+from common.checksum import COPY_BINARY_SIGNATURE, CopyBinaryChecksum, RowChecksum
+from tests.fixtures import WORKLOAD, BackupTestCase
+
+class TestRowChecksum(unittest.TestCase):
+    def test_independent_of_row_order_and_writes(self):
+        rows = [f"INSERT INTO t VALUES ({number}, 'line\nbreak {number}');\n" for number in range(100)]
+        first = RowChecksum()
+        first.update(''.join(rows))
+        second = RowChecksum()
+        shuffled = ''.join(random.Random(1).sample(rows, len(rows)))
+        for start in range(0, len(shuffled), 7):
+            second.update(shuffled[start:start + 7].encode('utf-8'))
+        self.assertEqual(first.hexdigest(), second.hexdigest())
+        third = RowChecksum()
+        third.update(''.join(rows[:-1]) + rows[-1].replace('99', '98'))
+        self.assertNotEqual(first.hexdigest(), third.hexdigest())
+
+    def test_binary_copy_tuples(self):
+        def stream(keys):
+            tuples = [struct.pack('>hiqi', 2, 8, key, -1) for key in keys]
+            return COPY_BINARY_SIGNATURE + struct.pack('>ii', 0, 0) + b''.join(tuples) + struct.pack('>h', -1)
+
+        first = CopyBinaryChecksum()
+        first.update(stream(range(50)))
+        second = CopyBinaryChecksum()
+        data = stream(reversed(range(50)))
+        for start in range(0, len(data), 5):
+            second.update(data[start:start + 5])
+        self.assertEqual((first.lines, first.hexdigest()), (50, second.hexdigest()))
+        third = CopyBinaryChecksum()
+        third.update(stream(range(1, 51)))
+        self.assertNotEqual(first.hexdigest(), third.hexdigest())
+
+class TestBackupVerifier(BackupTestCase):
+    def run_backup(self, db_type, data_format):
+        backup = synthetic_backup(SyntheticDatabase(db_type, **WORKLOAD), self.backup_dir, self.log_dir,
+                                  data_format=data_format, chunks=2, chunk_min_rows=100, checksums=True)
+        run_and_close(backup, backup.backup_data)
+        return find_data_manifest(self.backup_dir, db_type)
+
+    def run_verify(self, db_type, manifest, workload, jobs=None):
+        reader = synthetic_backup(SyntheticDatabase(db_type, **workload), os.path.join(self.directory, 'work'),
+                                  self.log_dir, 'restored', data_format=manifest['format'])
+        verifier = BackupVerifier(reader, db_type, manifest, self.log_dir, jobs)
+        return run_and_close(reader, verifier.verify)
+
+    def test_restored_database_matches(self):
+        for db_type, data_format in (('mysql', 'insert'), ('mysql', 'tsv'), ('pgsql', 'insert'), ('pgsql', 'copy'),
+                                     ('pgsql', 'copy-binary')):
+            with self.subTest(db_type=db_type, data_format=data_format):
+                _, manifest = self.run_backup(db_type, data_format)
+                self.assertEqual(len(manifest['tables']), 6)
+                self.assertTrue(all(len(entry['checksum']) == 16 for entry in manifest['tables']))
+                results = self.run_verify(db_type, manifest, WORKLOAD, jobs=2)
+                self.assertEqual([result['status'] for result in results], ['ok'] * 6)
+                self.assertEqual(format_differences(results), "6 of 6 files of 3 tables match the backup")
+
+    def test_reports_only_differing_chunks(self):
+        _, manifest = self.run_backup('pgsql', 'copy')
+        results = self.run_verify('pgsql', manifest, dict(WORKLOAD, rows=180))
+        self.assertEqual([(result['table'], result['chunk']) for result in results if result['status'] != 'ok'],
+                         [('t000', 1), ('t001', 1), ('t002', 1)])
+        self.assertEqual(results[1]['rows'], 80)
+        report = format_differences(results).splitlines()
+        self.assertEqual(len(report), 4)
+        self.assertTrue(report[0].startswith("DIFFERS t000 chunk 1 (t000.0001.sql): 80 rows (backup: 100)"))
+
+    def test_verify_database_writes_prometheus_metrics(self):
+        self.run_backup('pgsql', 'copy')
+        prometheus_dir = os.path.join(self.directory, 'textfile')
+        _, results = verify_database('pgsql', 'synthetic', 'benchmark', None, self.backup_dir, self.log_dir, 'restored',
+                                     prometheus_dir=prometheus_dir,
+                                     backup_class=synthetic_class(PgSQLBackup, SyntheticDatabase('pgsql', **WORKLOAD)))
+        self.assertEqual([result['status'] for result in results], ['ok'] * 6)
+        with open(os.path.join(prometheus_dir, 'pgsql_verify_metrics_synthetic_restored.prom')) as f:
+            self.assertIn('backupapp_run_success{operation="verify",dbtype="pgsql",host="synthetic",'
+                          'database="restored"} 1', f.read())
+
+if __name__ == '__main__':
+    unittest.main()